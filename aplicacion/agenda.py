@@ -0,0 +1,203 @@
+
+# agenda.py
+# Agenda de citas. Citas guarda fecha y hora como texto libre; la columna
+# generada `inicio` ('AAAA-MM-DD HH:MM') las normaliza y está indexada sola,
+# por enfermera y por lactante. El calendario del día o la semana, la
+# detección de empalmes y la carga diaria por enfermera son consultas por
+# rango sobre esos índices: su costo depende de la ventana consultada y no
+# de los años de historia.
+#
+# Las citas no tienen duración propia: cada una ocupa `duracion` minutos
+# (VINCULO_DURACION_CITA) y dos citas se empalman si sus inicios están a
+# menos de esa distancia.
+
+import datetime
+
+DURACION_POR_DEFECTO = 30
+FORMATO_INICIO = '%Y-%m-%d %H:%M'
+VISTAS = ('dia', 'semana')
+
+# Misma normalización que normalizar_cita(), en SQL (columna generada Citas.inicio)
+EXPRESION_INICIO = """COALESCE(
+    strftime('%Y-%m-%d %H:%M', substr(trim(fecha_cita), 1, 10) || ' ' ||
+             CASE WHEN length(trim(hora_de_entrada)) IN (4, 7) THEN '0' || trim(hora_de_entrada)
+                  ELSE trim(hora_de_entrada) END),
+    strftime('%Y-%m-%d %H:%M', trim(fecha_cita)))"""
+
+CAMPOS_CITA = """
+    c.id_citas, c.inicio, c.id_lactantes, c.atendido_por_id_usuario, c.subsecuente,
+    l.apellido_paterno AS lactante_apellido, l.apellido_materno AS lactante_apellido_materno,
+    m.nombre AS motivo, u.nombre AS atendido_por
+"""
+JOINS_CITA = """
+    LEFT JOIN Lactantes l ON l.id_lactantes = c.id_lactantes
+    LEFT JOIN Motivo m ON m.id_motivo = c.id_motivo
+    LEFT JOIN Usuarios u ON u.id_usuario = c.atendido_por_id_usuario
+"""
+
+
+def crear_columna_inicio(conn):
+    """Columna generada Citas.inicio con sus índices (migración)."""
+    conn.execute(f"ALTER TABLE Citas ADD COLUMN inicio TEXT GENERATED ALWAYS AS ({EXPRESION_INICIO}) VIRTUAL;")
+    # Las citas con hora se guardan ya normalizadas (9:30 -> 09:30)
+    conn.execute("""
+        UPDATE Citas SET fecha_cita = substr(inicio, 1, 10), hora_de_entrada = substr(inicio, 12, 5)
+        WHERE inicio IS NOT NULL AND hora_de_entrada IS NOT NULL AND trim(hora_de_entrada) <> ''
+          AND (fecha_cita <> substr(inicio, 1, 10) OR hora_de_entrada <> substr(inicio, 12, 5));
+    """)
+    # Calendario y carga diaria (cubre la enfermera para agrupar sin leer la tabla)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_citas_inicio ON Citas(inicio, atendido_por_id_usuario);")
+    # Agenda y empalmes por enfermera; también sirve a EliminarUsuario (reemplaza idx_citas_atendido_por)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_citas_enfermera_inicio ON Citas(atendido_por_id_usuario, inicio);")
+    conn.execute("DROP INDEX IF EXISTS idx_citas_atendido_por;")
+    # Empalmes por lactante
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_citas_lactante_inicio ON Citas(id_lactantes, inicio);")
+
+
+def normalizar_cita(fecha, hora):
+    """(fecha 'AAAA-MM-DD', hora 'HH:MM', inicio) a partir de lo capturado; ValueError si no es válida."""
+    hora = (hora or '').strip()
+    if len(hora) == 8:
+        # <input type="time"> puede enviar segundos
+        hora = hora[:5]
+    try:
+        momento = datetime.datetime.strptime(f"{(fecha or '').strip()} {hora}", '%Y-%m-%d %H:%M')
+    except ValueError:
+        raise ValueError("La fecha (AAAA-MM-DD) y la hora (HH:MM) de la cita no son válidas.") from None
+    return momento.strftime('%Y-%m-%d'), momento.strftime('%H:%M'), momento.strftime(FORMATO_INICIO)
+
+
+def leer_fecha(texto, por_defecto=None):
+    try:
+        return datetime.date.fromisoformat((texto or '').strip())
+    except ValueError:
+        return por_defecto or datetime.date.today()
+
+
+def rango(vista, fecha):
+    """Primer día y día siguiente al último de la vista ('dia' o la semana de lunes a domingo)."""
+    if vista == 'semana':
+        inicio = fecha - datetime.timedelta(days=fecha.weekday())
+        return inicio, inicio + datetime.timedelta(days=7)
+    return fecha, fecha + datetime.timedelta(days=1)
+
+
+def _limite(fecha):
+    return fecha.strftime('%Y-%m-%d 00:00')
+
+
+def _desplazar(inicio, minutos):
+    return (datetime.datetime.strptime(inicio, FORMATO_INICIO) + datetime.timedelta(minutes=minutos)).strftime(FORMATO_INICIO)
+
+
+def conflictos(conn, inicio, id_lactante=None, id_usuario=None, duracion=DURACION_POR_DEFECTO, excluir=None):
+    """Citas del mismo lactante o de la misma enfermera que se empalman con una cita en `inicio`."""
+    desde, hasta = _desplazar(inicio, -duracion), _desplazar(inicio, duracion)
+    encontrados = {}
+    for columna, valor, motivo in (('id_lactantes', id_lactante, 'lactante'),
+                                   ('atendido_por_id_usuario', id_usuario, 'enfermera')):
+        if valor in (None, ''):
+            continue
+        filas = conn.execute(f"""
+            SELECT {CAMPOS_CITA} FROM Citas c {JOINS_CITA}
+            WHERE c.{columna} = ? AND c.inicio > ? AND c.inicio < ? AND c.id_citas IS NOT ?
+            ORDER BY c.inicio
+        """, (valor, desde, hasta, excluir)).fetchall()
+        for fila in filas:
+            conflicto = encontrados.setdefault(fila['id_citas'], dict(fila, empalme=[]))
+            conflicto['empalme'].append(motivo)
+    return sorted(encontrados.values(), key=lambda cita: cita['inicio'])
+
+
+def calendario(conn, desde, hasta, id_usuario=None, duracion=DURACION_POR_DEFECTO):
+    """Citas entre dos fechas agrupadas por día, marcando las que se empalman con otra."""
+    if id_usuario:
+        condicion, parametros = "c.atendido_por_id_usuario = ? AND ", [id_usuario]
+    else:
+        condicion, parametros = "", []
+    filas = conn.execute(f"""
+        SELECT {CAMPOS_CITA} FROM Citas c {JOINS_CITA}
+        WHERE {condicion}c.inicio >= ? AND c.inicio < ?
+        ORDER BY c.inicio, c.id_citas
+    """, parametros + [_limite(desde), _limite(hasta)]).fetchall()
+    citas = [dict(fila, empalme=[]) for fila in filas]
+    marcar_empalmes(citas, duracion)
+
+    dias = {}
+    dia = desde
+    while dia < hasta:
+        dias[dia.isoformat()] = []
+        dia += datetime.timedelta(days=1)
+    for cita in citas:
+        dias.setdefault(cita['inicio'][:10], []).append(cita)
+    return [{"fecha": fecha, "citas": citas_dia} for fecha, citas_dia in dias.items()]
+
+
+def marcar_empalmes(citas, duracion=DURACION_POR_DEFECTO):
+    """Agrega a cada cita ('inicio' ordenado) los motivos de empalme con otra de la lista."""
+    momentos = [datetime.datetime.strptime(cita['inicio'], FORMATO_INICIO) for cita in citas]
+    ultima = {}
+    for i, cita in enumerate(citas):
+        for motivo, llave in (('lactante', cita['id_lactantes']), ('enfermera', cita['atendido_por_id_usuario'])):
+            if llave is None:
+                continue
+            anterior = ultima.get((motivo, llave))
+            if anterior is not None and momentos[i] - momentos[anterior] < datetime.timedelta(minutes=duracion):
+                for j in (anterior, i):
+                    if motivo not in citas[j]['empalme']:
+                        citas[j]['empalme'].append(motivo)
+            ultima[(motivo, llave)] = i
+    return citas
+
+
+def carga_diaria(conn, desde, hasta, id_usuario=None, duracion=DURACION_POR_DEFECTO):
+    """Citas por enfermera y día entre dos fechas, con primera y última hora y empalmes."""
+    if id_usuario:
+        condicion, parametros = "c.atendido_por_id_usuario = ? AND ", [id_usuario]
+    else:
+        condicion, parametros = "", []
+    # Sólo lee el índice (inicio, atendido_por_id_usuario) dentro de la ventana
+    filas = conn.execute(f"""
+        SELECT c.atendido_por_id_usuario, c.inicio FROM Citas c
+        WHERE {condicion}c.inicio >= ? AND c.inicio < ?
+        ORDER BY c.atendido_por_id_usuario, c.inicio
+    """, parametros + [_limite(desde), _limite(hasta)]).fetchall()
+
+    carga = {}
+    anterior = {}
+    for id_enfermera, inicio in filas:
+        dia = inicio[:10]
+        resumen = carga.setdefault((id_enfermera, dia), {
+            "id_usuario": id_enfermera, "fecha": dia, "citas": 0, "primera": inicio[11:], "ultima": inicio[11:],
+            "empalmes": 0,
+        })
+        resumen["citas"] += 1
+        resumen["ultima"] = inicio[11:]
+        momento = datetime.datetime.strptime(inicio, FORMATO_INICIO)
+        previo = anterior.get((id_enfermera, dia))
+        if previo is not None and momento - previo < datetime.timedelta(minutes=duracion):
+            resumen["empalmes"] += 1
+        anterior[(id_enfermera, dia)] = momento
+
+    nombres = dict(conn.execute("SELECT id_usuario, nombre FROM Usuarios").fetchall())
+    resultado = []
+    for (id_enfermera, _dia), resumen in sorted(carga.items(), key=lambda item: (item[0][1], str(item[0][0]))):
+        resumen["enfermera"] = nombres.get(id_enfermera, 'Sin asignar')
+        resumen["minutos_ocupados"] = resumen["citas"] * duracion
+        resultado.append(resumen)
+    return resultado
+
+
+def enfermeras(conn):
+    """Usuarios que pueden atender citas (filtro de la agenda)."""
+    return conn.execute("""
+        SELECT u.id_usuario, u.nombre FROM Usuarios u JOIN Rol r ON r.id_rol = u.id_rol
+        WHERE r.nombre = 'Enfermera' ORDER BY u.nombre
+    """).fetchall()
+
+
+def describir_empalmes(empalmes):
+    """Mensaje para el formulario con las citas que se empalman."""
+    detalles = [f"{cita['inicio']} ({', '.join(cita['empalme'])}: {cita['lactante_apellido'] or 'sin lactante'}, "
+                f"atiende {cita['atendido_por'] or 'sin asignar'})" for cita in empalmes[:5]]
+    return "La cita se empalma con: " + "; ".join(detalles) + ". Marca la casilla para guardarla de todos modos."
@@ -4,21 +4,54 @@
 # Confirma que tienes instalado web.py: pip install web.py
 
 
+# Primero: la medición del arranque empieza al importarse este módulo
+import arranque
 import web
 import os
 import json
 import sqlite3
 import hashlib
 import datetime
-# Agregar imports para generación de reportes
+# openpyxl y reportlab se importan en ReportesGenerales.POST, no al arrancar el worker
 import io
-from openpyxl import Workbook
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
-web.config.debug = True  # FIX: Habilitado para depuración
+from conexiones import PoolConexiones, PoolAgotado, abrir_conexion
+from migraciones import preparar_base, base_verificada, marcar_verificada
+import listados
+import exportaciones
+import reportes
+import estadisticas
+import busqueda
+import importaciones
+import etags
+import sincronizacion
+import crecimiento
+import linea_tiempo
+import agenda
+import archivo_historico
+import resumen_diario
+import madres_duplicadas
+import reportes_pdf
+from trabajos import ColaTrabajos, ColaLlena, consultar_trabajo
+from cache_resultados import CacheResultados
+from auditoria import Auditoria, ConexionAuditada
+from sesiones import AlmacenSesionesSQLite, AlmacenSesionesMemoria
+from catalogos import Catalogos
+from estaticos import ArchivosEstaticos
+from plantillas import Plantillas
+import perfilado
+from consultas_lentas import RegistroConsultasLentas, PresupuestoAgotado
+from replica import ReplicaReportes
+
+arranque.tiempos.marcar('importaciones')
+
+# VINCULO_ENTORNO=desarrollo activa la depuración de web.py y la recarga de plantillas
+DESARROLLO = os.environ.get('VINCULO_ENTORNO', 'produccion') == 'desarrollo'
+web.config.debug = DESARROLLO
 template_dir = os.path.join(os.path.dirname(__file__), 'templates')
-render = web.template.render(template_dir, globals={'static': '/static'})
+render = Plantillas(template_dir, produccion=not DESARROLLO, globals={'static': '/static'})
+if not DESARROLLO:
+    print("Plantillas precompiladas: %d en %.1f ms" % render.precompilar())
+arranque.tiempos.marcar('plantillas')
 
 # --- Rutas de la aplicación (URLS) ---
 urls = (
@@ -39,95 +72,219 @@ urls = (
     '/reportes', 'ReportesArea',
     '/reportes_generales', 'ReportesGenerales',
     '/reportes_por_lactante', 'ReportesPorLactante',
+    '/reportes_pdf/([0-9a-f]{40})', 'DescargaPDF',
     '/visualizacion_citas', 'VisualizacionCitas',
+    '/agenda', 'Agenda',
     '/visualizacion_lactantes', 'VisualizacionLactantes',
     '/visualizacion_usuarios', 'VisualizacionUsuarios',
     '/api/generate_report', 'ReportesAPI',
+    '/api/reportes/citas', 'ReporteCitasAPI',
+    '/api/metricas', 'MetricasAPI',
+    '/api/consultas_lentas', 'ConsultasLentasAPI',
+    '/metrics', 'MetricasPrometheus',
+    '/api/lactantes', 'LactantesAPI',
+    '/api/madres/duplicados', 'MadresDuplicadasAPI',
+    '/api/madres/fusionar', 'FusionMadresAPI',
+    r'/api/lactantes/(\d+)/linea_tiempo', 'LineaTiempoAPI',
+    '/api/citas', 'CitasAPI',
+    '/api/agenda', 'AgendaAPI',
+    '/api/agenda/carga', 'CargaEnfermerasAPI',
+    '/api/agenda/empalmes', 'EmpalmesAPI',
+    '/api/buscar', 'BusquedaAPI',
+    '/api/importar', 'ImportarAPI',
+    '/api/sync', 'SincronizacionAPI',
+    r'/api/crecimiento/lactante/(\d+)', 'CrecimientoLactanteAPI',
+    r'/api/crecimiento/area/(\d+)', 'CrecimientoAreaAPI',
+    r'/api/trabajos/(\d+)', 'TrabajoEstadoAPI',
+    r'/api/trabajos/(\d+)/resultado', 'TrabajoResultadoAPI',
     '/static/(.*)', 'Static',
     '/eliminar_lactante/(.*)', 'EliminarLactante'
 )
 
 # --- Manejador de Archivos Estáticos ---
+# En producción los sirve el middleware `archivos_estaticos` antes de llegar aquí;
+# esta ruta queda para app.request() y servidores que no usen `application`.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
 class Static:
     def GET(self, file):
-        try:
-            static_dir = os.path.join(os.path.dirname(__file__), 'static')
-            with open(os.path.join(static_dir, file), 'rb') as f:
-                return f.read()
-        except IOError:
+        status, encabezados, cuerpo = archivos_estaticos.respuesta(file, web.ctx.env)
+        if status.startswith('404'):
             raise web.notfound()
+        web.ctx.status = status
+        for nombre, valor in encabezados:
+            web.header(nombre, valor)
+        return cuerpo
 
 # --- Conexión y Configuración de la Base de Datos ---
-DB_FILE = 'vinculo_de_vida.db'
+DB_FILE = os.environ.get('VINCULO_BD', 'vinculo_de_vida.db')
+
+# Fracción de solicitudes perfiladas (1 = todas, 0 = perfilado desactivado)
+MUESTREO_PERFILADO = float(os.environ.get('VINCULO_PERFILADO', 1))
+
+# Sentencias más lentas que este umbral van al registro de consultas lentas (0 = desactivado)
+UMBRAL_CONSULTA_LENTA_MS = float(os.environ.get('VINCULO_CONSULTA_LENTA_MS', 200))
+
+# Tiempo máximo de las consultas de un reporte antes de interrumpirlas (0 = sin límite)
+PRESUPUESTO_REPORTES = float(os.environ.get('VINCULO_PRESUPUESTO_REPORTES', 30))
+
+# Minutos que ocupa cada cita en la agenda (las citas más cercanas entre sí se empalman)
+DURACION_CITA = int(os.environ.get('VINCULO_DURACION_CITA', agenda.DURACION_POR_DEFECTO))
+
+# Hilos que atienden solicitudes en cada worker (los mismos que usa gunicorn.conf.py)
+HILOS = int(os.environ.get('VINCULO_HILOS', 4))
+
+# Un pool por proceso: las conexiones se reutilizan entre solicitudes del mismo worker
+pool = PoolConexiones(
+    DB_FILE,
+    tamano=int(os.environ.get('VINCULO_POOL_TAMANO', 5)),
+    espera_max=float(os.environ.get('VINCULO_POOL_ESPERA', 5)),
+    busy_timeout_ms=int(os.environ.get('VINCULO_BUSY_TIMEOUT_MS', 5000)),
+    cache_sentencias=int(os.environ.get('VINCULO_CACHE_SENTENCIAS', 128)),
+    factory=(perfilado.conexion_medida(ConexionAuditada) if MUESTREO_PERFILADO > 0 or UMBRAL_CONSULTA_LENTA_MS > 0
+             else ConexionAuditada),
+)
+
+# Sentencias lentas con su plan de ejecución; la ruta se resuelve al registrar (ver ruta_de_consulta)
+consultas_lentas = RegistroConsultasLentas(
+    umbral_ms=UMBRAL_CONSULTA_LENTA_MS,
+    max_sentencias=int(os.environ.get('VINCULO_CONSULTAS_LENTAS_MAX', 200)),
+    ventana=float(os.environ.get('VINCULO_CONSULTAS_LENTAS_VENTANA', 86400)),
+    resolver_ruta=lambda: ruta_de_consulta(),
+)
+if UMBRAL_CONSULTA_LENTA_MS > 0:
+    perfilado.CursorMedido.observador = consultas_lentas.observar
+    perfilado.CursorMedido.umbral = consultas_lentas.umbral
+
+# Auditoría en la misma transacción del cambio ('transaccion') o por lotes en un hilo ('segundo_plano')
+auditoria = Auditoria(
+    os.path.abspath(DB_FILE),
+    modo=os.environ.get('VINCULO_AUDITORIA_MODO', 'transaccion'),
+    tamano_lote=int(os.environ.get('VINCULO_AUDITORIA_LOTE', 200)),
+    intervalo=float(os.environ.get('VINCULO_AUDITORIA_INTERVALO', 1)),
+)
+ConexionAuditada.auditoria = auditoria
+
+# Resúmenes diarios de citas (reportes por periodo); se ponen al día antes de cada copia de la réplica
+resumenes = resumen_diario.ResumenDiario(tamano_lote=int(os.environ.get('VINCULO_RESUMEN_LOTE', resumen_diario.MAX_CAMBIOS_POR_LOTE)))
+
+# Los reportes leen de una copia de solo lectura que se refresca cada VINCULO_REPLICA_INTERVALO
+# segundos (0 = leer directamente de la base principal)
+replica = ReplicaReportes(
+    os.path.abspath(DB_FILE),
+    os.environ.get('VINCULO_REPLICA', 'replica_reportes.db'),
+    intervalo=float(os.environ.get('VINCULO_REPLICA_INTERVALO', 300)),
+    paginas=int(os.environ.get('VINCULO_REPLICA_PAGINAS', 512)),
+    pausa=float(os.environ.get('VINCULO_REPLICA_PAUSA', 0.005)),
+    factory=perfilado.conexion_medida(sqlite3.Connection) if UMBRAL_CONSULTA_LENTA_MS > 0 else sqlite3.Connection,
+    preparar=resumenes.actualizar,
+    # Sin réplica, cada hilo lee a lo más un reporte a la vez de la principal
+    tamano_principal=HILOS,
+    espera_max=float(os.environ.get('VINCULO_POOL_ESPERA', 5)),
+)
+
+# Reportes asíncronos: procesos de cálculo y trabajos en espera permitidos por worker
+cola_trabajos = ColaTrabajos(
+    os.path.abspath(DB_FILE),
+    procesos=int(os.environ.get('VINCULO_TRABAJOS_PROCESOS', 2)),
+    max_cola=int(os.environ.get('VINCULO_TRABAJOS_COLA', 8)),
+    presupuesto=float(os.environ.get('VINCULO_PRESUPUESTO_TRABAJOS', 300)),
+    ruta_lectura=os.path.abspath(replica.ruta) if replica.activa else None,
+)
+
+# Resultados de reportes agregados, invalidados por la versión de las tablas de origen
+cache_reportes = CacheResultados(
+    max_entradas=int(os.environ.get('VINCULO_CACHE_ENTRADAS', 256)),
+    ttl=float(os.environ.get('VINCULO_CACHE_TTL', 300)),
+)
+
+# Rol, Area y Motivo en memoria; se recargan cuando cambia su versión en VersionDatos
+catalogos = Catalogos(ttl=float(os.environ.get('VINCULO_CATALOGOS_TTL', 3600)))
+
+# Curvas de crecimiento; VINCULO_TABLAS_OMS reemplaza las tablas LMS incluidas por las de un CSV
+motor_crecimiento = crecimiento.MotorCrecimiento(
+    referencia=crecimiento.Referencia(os.environ.get('VINCULO_TABLAS_OMS') or None),
+    cache=CacheResultados(max_entradas=int(os.environ.get('VINCULO_CACHE_CRECIMIENTO', 2048)),
+                          ttl=float(os.environ.get('VINCULO_CACHE_CRECIMIENTO_TTL', 3600))),
+)
+
+# Citas y auditoría anteriores al horizonte, en un archivo por año (`python comandos.py archivar`)
+archivo = archivo_historico.ArchivoHistorico(
+    os.environ.get('VINCULO_ARCHIVO_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), 'archivo'))
+
+# PDFs de varias páginas generados en la cola de trabajos y guardados por versión de los datos
+pdfs = reportes_pdf.PDFsGenerados(
+    os.environ.get('VINCULO_PDF_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), 'pdf_generados'),
+    cola_trabajos,
+    os.path.abspath(DB_FILE),
+    os.path.abspath(replica.ruta) if replica.activa else None,
+    archivo.directorio,
+    max_archivos=int(os.environ.get('VINCULO_PDF_MAX_ARCHIVOS', reportes_pdf.MAX_ARCHIVOS)),
+)
+
+# Segundos que la solicitud espera un PDF nuevo antes de responder 202 (la descarga sigue en /reportes_pdf/<llave>)
+ESPERA_PDF = float(os.environ.get('VINCULO_PDF_ESPERA', 10))
+
+# Madres posiblemente duplicadas: similitud mínima (0 a 1) entre nombres normalizados
+duplicados = madres_duplicadas.DetectorDuplicados(
+    umbral=float(os.environ.get('VINCULO_DUPLICADOS_UMBRAL', madres_duplicadas.UMBRAL_POR_DEFECTO)))
+
+# Línea de tiempo por lactante (citas, controles y auditoría), invalidada por sus escrituras
+lineas_tiempo = linea_tiempo.LineaTiempo(
+    CacheResultados(max_entradas=int(os.environ.get('VINCULO_CACHE_LINEA_TIEMPO', 512)),
+                    ttl=float(os.environ.get('VINCULO_CACHE_LINEA_TIEMPO_TTL', 3600))),
+    archivo)
+arranque.tiempos.marcar('subsistemas')
+
+def crear_almacen_sesiones():
+    """Backend de sesiones según VINCULO_SESIONES: 'sqlite' (por defecto), 'memoria' o 'disco'."""
+    backend = os.environ.get('VINCULO_SESIONES', 'sqlite')
+    if backend == 'disco':
+        return web.session.DiskStore('sessions')
+    if backend == 'memoria':
+        # Sólo para un único worker: cada proceso tendría sus propias sesiones
+        return AlmacenSesionesMemoria()
+    return AlmacenSesionesSQLite(
+        os.environ.get('VINCULO_SESIONES_BD', 'sesiones.db'),
+        timeout=web.config.session_parameters['timeout'],
+        cache_entradas=int(os.environ.get('VINCULO_SESIONES_CACHE', 1024)),
+        intervalo_toque=float(os.environ.get('VINCULO_SESIONES_TOQUE', 60)),
+        intervalo_barrido=float(os.environ.get('VINCULO_SESIONES_BARRIDO', 300)),
+        # Una conexión por hilo de solicitud más la del barrido
+        tamano_pool=int(os.environ.get('VINCULO_SESIONES_POOL', HILOS + 1)),
+        espera_max=float(os.environ.get('VINCULO_POOL_ESPERA', 5)),
+    )
 
 def get_db():
-    """Establece y devuelve una conexión a la base de datos."""
+    """Devuelve la conexión de la solicitud actual, tomándola del pool si aún no tiene una."""
     db = getattr(web.ctx, '_db', None)
     if db is None:
-        db = web.ctx._db = sqlite3.connect(DB_FILE)
-        db.row_factory = sqlite3.Row
+        db = web.ctx._db = pool.obtener()
     return db
 
 def setup_database():
-    """Crea las tablas y inserta los datos iniciales si la base de datos no existe."""
+    """Aplica las migraciones pendientes e inserta los datos iniciales si la base de datos está vacía."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
-
-        create_tables_sql = """
-            CREATE TABLE IF NOT EXISTS Rol (id_rol INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, permiso TEXT);
-            CREATE TABLE IF NOT EXISTS Usuarios (id_usuario INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, num_telefono TEXT UNIQUE, contraseña TEXT NOT NULL, id_rol INTEGER, FOREIGN KEY (id_rol) REFERENCES Rol(id_rol));
-            CREATE TABLE IF NOT EXISTS Auditoria (id_auditoria INTEGER PRIMARY KEY AUTOINCREMENT, id_usuario INTEGER, accion TEXT NOT NULL, tabla_afectada TEXT NOT NULL, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario));
-            CREATE TABLE IF NOT EXISTS Reportes (id_reportes INTEGER PRIMARY KEY AUTOINCREMENT, id_usuario INTEGER, tipo TEXT NOT NULL, fecha_generado TIMESTAMP DEFAULT CURRENT_TIMESTAMP, contenido TEXT, FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario));
-            CREATE TABLE IF NOT EXISTS Motivo (id_motivo INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, tipo_de_motivo TEXT);
-            CREATE TABLE IF NOT EXISTS Madres (id_madre INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, apellido_paterno TEXT NOT NULL, apellido_materno TEXT, discapacidad TEXT, id_motivo INTEGER, FOREIGN KEY (id_motivo) REFERENCES Motivo(id_motivo));
-            CREATE TABLE IF NOT EXISTS Area (id_area INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, tipo_de_area TEXT);
-            CREATE TABLE IF NOT EXISTS Lactantes (id_lactantes INTEGER PRIMARY KEY AUTOINCREMENT, id_madres INTEGER, id_area INTEGER, apellido_paterno TEXT NOT NULL, apellido_materno TEXT, fecha_nacimiento DATE, genero TEXT, estado TEXT, discapacidad TEXT, peso REAL, FOREIGN KEY (id_madres) REFERENCES Madres(id_madre), FOREIGN KEY (id_area) REFERENCES Area(id_area));
-            CREATE TABLE IF NOT EXISTS Citas (id_citas INTEGER PRIMARY KEY AUTOINCREMENT, id_lactantes INTEGER, id_motivo INTEGER, atendido_por_id_usuario INTEGER, fecha_cita TEXT NOT NULL, subsecuente INTEGER, justificacion TEXT, hora_de_entrada TEXT, FOREIGN KEY (id_lactantes) REFERENCES Lactantes(id_lactantes) ON DELETE CASCADE, FOREIGN KEY (id_motivo) REFERENCES Motivo(id_motivo), FOREIGN KEY (atendido_por_id_usuario) REFERENCES Usuarios(id_usuario));
-            CREATE TABLE IF NOT EXISTS Controles (id_controles INTEGER PRIMARY KEY AUTOINCREMENT, id_lactantes INTEGER, peso REAL, talla REAL, edad_meses INTEGER, estado_general TEXT, fecha_control TIMESTAMP DEFAULT CURRENT_TIMESTAMP, observaciones TEXT, FOREIGN KEY (id_lactantes) REFERENCES Lactantes(id_lactantes) ON DELETE CASCADE);
-        """
-        cursor.executescript(create_tables_sql)
-        conn.commit()
-        
-        # --- Inserción robusta de datos iniciales ---
-        cursor.execute("SELECT COUNT(id_rol) FROM Rol")
-        if cursor.fetchone()[0] == 0:
-            print("Insertando datos iniciales...")
-            contrasena_admin_hash = hashlib.sha256("12345".encode('utf-8')).hexdigest()
-            contrasena_enfermera_hash = hashlib.sha256("pass123".encode('utf-8')).hexdigest()
-            
-            initial_data = [
-                "INSERT INTO Rol (nombre, permiso) VALUES ('Administrador', 'all'), ('Enfermera', 'read_write_patients');",
-                "INSERT INTO Motivo (nombre, tipo_de_motivo) VALUES ('Chequeo de rutina', 'Control'), ('Donación de leche', 'Lactancia Materna'), ('Lactancia Materna', 'Apoyo');",
-                "INSERT INTO Area (nombre, tipo_de_area) VALUES ('UCIN', 'Médica'), ('UTIN', 'Médica'), ('Crecimiento y desarrollo', 'Médica'), ('Foraneos', 'No Médica');",
-                "INSERT INTO Madres (nombre, apellido_paterno, id_motivo) VALUES ('Desconocida', 'Desconocido', 1);",
-                f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('Admin', '555-0000', '{contrasena_admin_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Administrador'));",
-                f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('María López', '555-1234', '{contrasena_enfermera_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Enfermera'));",
-                f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('Ana Pérez', '555-5678', '{contrasena_enfermera_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Enfermera'));"
-            ]
-            
-            for statement in initial_data:
-                cursor.execute(statement)
-            conn.commit()
-            print("Datos iniciales insertados.")
-
+        conn = abrir_conexion(DB_FILE)
+        preparar_base(conn)
     except sqlite3.Error as e:
         print(f"Error de base de datos durante la configuración: {e}")
         raise
     finally:
         if conn:
             conn.close()
+    marcar_verificada(DB_FILE)
+
+def log_auditoria(accion, tabla_afectada, id_lactante=None):
+    """Registra el evento dentro de la transacción actual; se guarda al hacer commit.
 
-def log_auditoria(accion, tabla_afectada):
+    Con `id_lactante` el evento aparece en la línea de tiempo de ese lactante.
+    """
     try:
-        conn = web.ctx._db
         id_usuario = web.ctx.session.get('user_id')
         if id_usuario:
-            conn.execute("INSERT INTO Auditoria (id_usuario, accion, tabla_afectada) VALUES (?, ?, ?)",
-                         (id_usuario, accion, tabla_afectada))
-            conn.commit()
+            auditoria.registrar(web.ctx._db, id_usuario, accion, tabla_afectada, id_lactante)
     except sqlite3.Error as e:
         print(f"Error al registrar en auditoría: {e}")
 
@@ -147,6 +304,31 @@ def rol_requerido(*roles_permitidos):
         return wrapper
     return decorator
 
+def condicional(*tablas, usa_replica=False):
+    """GET con ETag débil según la versión de `tablas`, el usuario, su rol y los parámetros.
+
+    Va debajo de rol_requerido. Si If-None-Match coincide se responde 304 sin
+    ejecutar el handler (sin sus consultas ni el render). Las páginas que leen
+    de la réplica incluyen además qué copia está publicada.
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            session = web.ctx.session
+            # args[0] es la instancia del handler; sólo cuentan los grupos de la URL
+            etag = etags.etag_debil(get_db(), tablas, render.huella(), web.ctx.path, args[1:],
+                                    replica.generacion() if usa_replica else None,
+                                    session.get('user_id'), session.get('rol_nombre'),
+                                    etags.parametros_normalizados(web.ctx.query))
+            web.header('ETag', etag)
+            # Páginas por usuario: el navegador puede guardarlas, pero debe revalidar siempre
+            web.header('Cache-Control', 'private, no-cache')
+            web.header('Vary', 'Cookie')
+            if etags.coincide(web.ctx.env.get('HTTP_IF_NONE_MATCH'), etag):
+                raise web.notmodified()
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # --- Clases del Manejador de Solicitudes (GET y POST) ---
 class Welcome:
     def GET(self):
@@ -193,14 +375,14 @@ class AdminArea:
 class RegistroUsuario:
     @rol_requerido('Administrador')
     def GET(self):
-        roles = get_db().execute("SELECT id_rol, nombre FROM Rol").fetchall()
+        roles = catalogos.roles(get_db())
         return render.administrador_registrar_usuario(roles=roles, message="")
 
     @rol_requerido('Administrador')
     def POST(self):
         data = web.input(nombre=None, num_telefono=None, contrasena=None, id_rol=None)
         conn = get_db()
-        roles = conn.execute("SELECT id_rol, nombre FROM Rol").fetchall()
+        roles = catalogos.roles(conn)
         nombres = data.nombre
         if not all([nombres, data.num_telefono, data.contrasena, data.id_rol]):
             return render.administrador_registrar_usuario(roles=roles, message="Todos los campos son obligatorios.")
@@ -208,8 +390,8 @@ class RegistroUsuario:
             password_hash = hashlib.sha256(data.contrasena.encode('utf-8')).hexdigest()
             conn.execute("INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES (?, ?, ?, ?)",
                          (nombres, data.num_telefono, password_hash, data.id_rol))
-            conn.commit()
             log_auditoria("Registro de nuevo usuario", "Usuarios")
+            conn.commit()
             raise web.seeother('/visualizacion_usuarios')
         except sqlite3.IntegrityError:
             return render.administrador_registrar_usuario(roles=roles, message="El número de teléfono ya está registrado.")
@@ -225,8 +407,8 @@ class EnfermerasArea:
 class RegistroLactantes:
     @rol_requerido('Administrador', 'Enfermera')
     def GET(self):
-        areas = get_db().execute("SELECT id_area, nombre FROM Area").fetchall()
-        motivos = get_db().execute('select id_motivo, nombre FROM Motivo').fetchall()
+        areas = catalogos.areas(get_db())
+        motivos = catalogos.motivos(get_db())
 
         return_url = '/administrador' if web.ctx.session.get('rol_nombre') == 'Administrador' else '/enfermeras'
         return render.registro_lactantes(return_url=return_url, error_message="", areas=areas, motivos=motivos)
@@ -248,10 +430,9 @@ class RegistroLactantes:
                 raise ValueError("Los campos de apellido paterno, fecha, género y servicio del lactante son obligatorios.")
 
             # 3. Validar y obtener el ID del área
-            area_id_row = conn.execute("SELECT id_area FROM Area WHERE nombre = ?", (area_nombre,)).fetchone()
-            if not area_id_row:
+            id_area = catalogos.id_por_nombre(conn, 'Area', area_nombre)
+            if id_area is None:
                 raise ValueError(f"El área '{area_nombre}' no existe.")
-            id_area = area_id_row['id_area']
 
             # 4. Procesar datos de la madre (buscar o crear)
             nombre_madre = data.get('nombre_madre', '').strip()
@@ -260,11 +441,9 @@ class RegistroLactantes:
             
             id_madre = None
             if nombre_madre and paterno_madre and materno_madre:
-                # Buscar si la madre ya existe
-                madre_existente = conn.execute("SELECT id_madre FROM Madres WHERE nombre = ? AND apellido_paterno = ? AND apellido_materno = ?", (nombre_madre, paterno_madre, materno_madre)).fetchone()
-                if madre_existente:
-                    id_madre = madre_existente['id_madre']
-                else:
+                # Buscar si la madre ya existe (sin distinguir mayúsculas, acentos ni espacios de más)
+                id_madre = madres_duplicadas.buscar(conn, nombre_madre, paterno_madre, materno_madre)
+                if id_madre is None:
                     # Crear nueva madre si no existe
                     cursor = conn.cursor()
                     cursor.execute("INSERT INTO Madres (nombre, apellido_paterno, apellido_materno, discapacidad, id_motivo) VALUES (?, ?, ?, ?, 1)",
@@ -277,49 +456,49 @@ class RegistroLactantes:
                 id_madre = id_madre_row['id_madre']
 
             # 5. Insertar el nuevo lactante
-            conn.execute("""
+            cursor = conn.execute("""
                 INSERT INTO Lactantes (id_madres, id_area, apellido_paterno, apellido_materno, fecha_nacimiento, genero, estado, discapacidad, peso)  
                 VALUES (?, ?, ?, ?, ?, ?, 'Activo', ?, ?);
             """, (id_madre, id_area, paterno_lactante, materno_lactante, fecha_nac, genero, data.get('discapacidad_lactante', 'Ninguna'), data.get('peso_lactante')))
             
+            log_auditoria("Registro de nuevo lactante", "Lactantes", cursor.lastrowid)
             conn.commit()
-            log_auditoria("Registro de nuevo lactante", "Lactantes")
             raise web.seeother('/visualizacion_lactantes')
         
         except (sqlite3.Error, ValueError) as e:
             conn.rollback()
-            areas = conn.execute("SELECT id_area, nombre FROM Area").fetchall()
+            areas = catalogos.areas(conn)
             return_url = '/administrador' if web.ctx.session.get('rol_nombre') == 'Administrador' else '/enfermeras'
-            return render.registro_lactantes(return_url=return_url, error_message=f"Error al registrar: {e}", areas=areas, motivos=[])
+            return render.registro_lactantes(return_url=return_url, error_message=f"Error al registrar: {e}", areas=areas, motivos=catalogos.motivos(conn))
 
 # --- FIX: Lógica mejorada para el registro de citas ---
 class RegistroCitas:
     @rol_requerido('Administrador', 'Enfermera')
     def GET(self):
-        # En la página de citas, necesitamos los lactantes para que el usuario pueda seleccionarlos
-        madres = get_db().execute("SELECT id_madre, nombre, apellido_paterno, apellido_materno FROM Madres ORDER BY apellido_paterno").fetchall()
-        lactantes = ""
-        return render.registro_citas(message="", madres=madres, lactantes=lactantes, motivos="", encargado="")
-    
+        # La madre se elige con la búsqueda /api/buscar; ya no se carga la lista completa
+        return render.registro_citas(message="", madres=[], lactantes="", motivos="", encargado="")
+
+    def _formulario(self, conn, id_madre, message):
+        """Vuelve a mostrar el formulario sólo con la madre elegida y sus lactantes."""
+        madres = conn.execute("SELECT id_madre, nombre, apellido_paterno, apellido_materno FROM Madres WHERE id_madre = ?", (id_madre,)).fetchall()
+        lactantes = conn.execute("""SELECT id_lactantes, apellido_paterno, apellido_materno, fecha_nacimiento, genero
+            FROM Lactantes
+            WHERE id_madres = ?
+            ORDER BY apellido_paterno, apellido_materno;
+            """, (id_madre,)).fetchall()
+        encargado = conn.execute("SELECT nombre FROM usuarios WHERE id_usuario = ?", (web.ctx.session.get('user_id'),)).fetchone()
+        return render.registro_citas(message=message, madres=madres, lactantes=lactantes, motivos=catalogos.motivos(conn), encargado=encargado)
+
     @rol_requerido('Administrador', 'Enfermera')
     def POST(self):
         data = web.input()
         conn = get_db()
+        id_madre = data.get('id_madre')
 
         if 'buscar' in data:
-            atendido_por_id_usuario = web.ctx.session.get('user_id')
-            print(atendido_por_id_usuario)
-            id_madre = data.get('id_madre')
-            print(id_madre)
-            encargado = conn.execute("SELECT nombre FROM usuarios WHERE id_usuario = ?", (atendido_por_id_usuario,)).fetchone()
-            madre = conn.execute("SELECT id_madre, nombre, apellido_paterno, apellido_materno FROM Madres WHERE id_madre != ? ORDER BY apellido_paterno", (id_madre,)).fetchall()
-            lactantes = conn.execute("""SELECT id_lactantes, apellido_paterno, apellido_materno, fecha_nacimiento, genero
-            FROM Lactantes
-            WHERE id_madres = ?
-            ORDER BY apellido_paterno, apellido_materno;
-            """, (id_madre,)).fetchall()
-            motivos = conn.execute('select id_motivo, nombre FROM Motivo').fetchall()
-            return render.registro_citas(message="", madres=madre, lactantes=lactantes, motivos=motivos, encargado=encargado)
+            if not id_madre:
+                return render.registro_citas(message="Selecciona una madre de la búsqueda.", madres=[], lactantes="", motivos="", encargado="")
+            return self._formulario(conn, id_madre, "")
 
         # Registro de cita
         id_lactante = data.get('id_lactante')
@@ -330,63 +509,53 @@ class RegistroCitas:
         justificacion = data.get('justificacion', '')
         atendido_por_id_usuario = web.ctx.session.get('user_id')
 
-        print("DEBUG:", id_lactante, id_motivo, fecha, hora)
         if not (id_lactante and id_motivo and fecha and hora):
-            madres = conn.execute("SELECT id_madre, nombre, apellido_paterno, apellido_materno FROM Madres ORDER BY apellido_paterno").fetchall()
-            lactantes = conn.execute("SELECT id_lactantes, apellido_paterno, apellido_materno, fecha_nacimiento, genero FROM Lactantes ORDER BY apellido_paterno, apellido_materno").fetchall()
-            motivos = conn.execute('select id_motivo, nombre FROM Motivo').fetchall()
-            encargado = conn.execute("SELECT nombre FROM usuarios WHERE id_usuario = ?", (atendido_por_id_usuario,)).fetchone()
-            return render.registro_citas(message="Todos los campos obligatorios deben ser completados.", madres=madres, lactantes=lactantes, motivos=motivos, encargado=encargado)
+            return self._formulario(conn, id_madre, "Todos los campos obligatorios deben ser completados.")
+        try:
+            fecha, hora, inicio = agenda.normalizar_cita(fecha, hora)
+        except ValueError as e:
+            return self._formulario(conn, id_madre, str(e))
 
         # Guardar la cita
         try:
+            # La revisión de empalmes y el INSERT en la misma transacción de escritura:
+            # dos registros simultáneos no pueden tomar el mismo horario
+            conn.execute("BEGIN IMMEDIATE")
+            if not data.get('permitir_empalme'):
+                empalmes = agenda.conflictos(conn, inicio, id_lactante, atendido_por_id_usuario, DURACION_CITA)
+                if empalmes:
+                    conn.rollback()
+                    return self._formulario(conn, id_madre, agenda.describir_empalmes(empalmes))
             conn.execute(
                 "INSERT INTO Citas (id_lactantes, id_motivo, atendido_por_id_usuario, fecha_cita, subsecuente, justificacion, hora_de_entrada) VALUES (?, ?, ?, ?, ?, ?, ?)",
                 (id_lactante, id_motivo, atendido_por_id_usuario, fecha, subsecuente, justificacion, hora)
             )
+            log_auditoria("Registro de nueva cita", "Citas", id_lactante)
             conn.commit()
-            log_auditoria("Registro de nueva cita", "Citas")
             raise web.seeother('/visualizacion_citas')
         except sqlite3.Error as e:
-            madres = conn.execute("SELECT id_madre, nombre, apellido_paterno, apellido_materno FROM Madres ORDER BY apellido_paterno").fetchall()
-            lactantes = conn.execute("SELECT id_lactantes, apellido_paterno, apellido_materno, fecha_nacimiento, genero FROM Lactantes ORDER BY apellido_paterno, apellido_materno").fetchall()
-            motivos = conn.execute('select id_motivo, nombre FROM Motivo').fetchall()
-            encargado = conn.execute("SELECT nombre FROM usuarios WHERE id_usuario = ?", (web.ctx.session.get('user_id'),)).fetchone()
-            return render.registro_citas(message=f"Error al registrar la cita: {e}", madres=madres, lactantes=lactantes, motivos=motivos, encargado=encargado)
+            conn.rollback()
+            return self._formulario(conn, id_madre, f"Error al registrar la cita: {e}")
 
 # --- Clases de visualización (Sin cambios relevantes) ---
 class VisualizacionLactantes:
     @rol_requerido('Administrador', 'Enfermera')
+    @condicional('Lactantes', 'Madres', 'Area')
     def GET(self):
         conn = get_db()
-        areas = conn.execute("SELECT id_area, nombre FROM Area").fetchall()
-        lactantes = conn.execute("""
-                SELECT
-                    l.id_lactantes,
-                    l.apellido_paterno,
-                    l.apellido_materno,
-                    l.fecha_nacimiento,
-                    l.genero,
-                    l.discapacidad,
-                    l.peso,
-                    l.estado,
-                    (m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')) AS nombre_completo_madre,
-                    a.nombre AS area_nombre
-                FROM Lactantes l
-                LEFT JOIN Madres m ON l.id_madres = m.id_madre
-                LEFT JOIN Area a ON l.id_area = a.id_area
-                ORDER BY l.apellido_paterno, l.apellido_materno;
-            """).fetchall()
-        print(lactantes)
-        return render.visualizacion_lactantes(lactantes=lactantes, areas=areas)
+        filtros, cursor, limite = listados.leer_filtros(web.input())
+        areas = catalogos.areas(conn)
+        lactantes, siguiente = listados.consultar_lactantes(conn, filtros, cursor, limite)
+        url_siguiente = listados.url_pagina('/visualizacion_lactantes', filtros, siguiente, limite)
+        return render.visualizacion_lactantes(lactantes=lactantes, areas=areas, filtros=filtros, url_siguiente=url_siguiente)
 
     @rol_requerido('Administrador', 'Enfermera')
     def POST(self):
         data = web.input()
         conn = get_db()
         try:
-            area_row = conn.execute("SELECT id_area FROM Area WHERE nombre = ?", (data.area_nombre,)).fetchone()
-            if not area_row:
+            id_area = catalogos.id_por_nombre(conn, 'Area', data.area_nombre)
+            if id_area is None:
                 raise ValueError(f"El área '{data.area_nombre}' no es válida.")
             
             conn.execute("""
@@ -394,9 +563,9 @@ class VisualizacionLactantes:
                     apellido_paterno = ?, apellido_materno = ?, fecha_nacimiento = ?,
                     genero = ?, discapacidad = ?, peso = ?, id_area = ?
                 WHERE id_lactantes = ?
-            """, (data.apellido_paterno, data.apellido_materno, data.fecha_nacimiento, data.genero, data.discapacidad, data.peso, area_row['id_area'], data.id_lactantes))
+            """, (data.apellido_paterno, data.apellido_materno, data.fecha_nacimiento, data.genero, data.discapacidad, data.peso, id_area, data.id_lactantes))
+            log_auditoria(f"Actualización lactante ID {data.id_lactantes}", "Lactantes", data.id_lactantes)
             conn.commit()
-            log_auditoria(f"Actualización lactante ID {data.id_lactantes}", "Lactantes")
         except (sqlite3.Error, ValueError) as e:
             conn.rollback()
             print(f"Error al actualizar lactante: {e}")
@@ -421,7 +590,7 @@ class EditarLactante:
         if not lactante:
             return "Lactante no encontrado."
         # Obtener áreas para el select
-        areas = conn.execute("SELECT id_area, nombre FROM Area WHERE id_area != ?", (lactante[8],)).fetchall()
+        areas = catalogos.areas(conn, excluir=lactante[8])
         return render.editar_lactante(lactante=lactante, areas=areas)
 
     @rol_requerido('Administrador', 'Enfermera')
@@ -472,6 +641,7 @@ class EditarLactante:
                 data.get('discapacidad_madre', '').strip() or discapacidad_madre_actual,
                 id_madre
             ))
+        log_auditoria(f"Edición lactante ID {id_lactante}", "Lactantes", id_lactante)
         conn.commit()
         raise web.seeother('/visualizacion_lactantes')
     
@@ -483,8 +653,8 @@ class EliminarLactante:
         try:
             conn.execute("DELETE FROM Citas WHERE id_lactantes = ?", (id_lactante,))
             conn.execute("DELETE FROM Lactantes WHERE id_lactantes = ?", (id_lactante,))
+            log_auditoria(f"Eliminación lactante ID {id_lactante}", "Lactantes", id_lactante)
             conn.commit()
-            log_auditoria(f"Eliminación lactante ID {id_lactante}", "Lactantes")
         except sqlite3.Error as e:
             conn.rollback()
             print(f"Error al eliminar lactante: {e}")
@@ -497,8 +667,8 @@ class EliminarLactante:
         try:
             conn.execute("DELETE FROM Citas WHERE id_lactantes = ?", (id_lactante,))
             conn.execute("DELETE FROM Lactantes WHERE id_lactantes = ?", (id_lactante,))
+            log_auditoria(f"Eliminación lactante ID {id_lactante}", "Lactantes", id_lactante)
             conn.commit()
-            log_auditoria(f"Eliminación lactante ID {id_lactante}", "Lactantes")
         except sqlite3.Error as e:
             conn.rollback()
             print(f"Error al eliminar lactante: {e}")
@@ -506,44 +676,127 @@ class EliminarLactante:
 
 class VisualizacionCitas:
     @rol_requerido('Administrador', 'Enfermera')
+    @condicional('Citas', 'Lactantes', 'Motivo', 'Usuarios', 'Area')
     def GET(self):
-        citas = get_db().execute("""
-            SELECT c.id_citas, c.fecha_cita, c.hora_de_entrada, l.apellido_paterno AS lactante_apellido,
-                   m.nombre AS motivo_nombre, u.nombre AS atendido_por
-            FROM Citas c
-            JOIN Lactantes l ON c.id_lactantes = l.id_lactantes
-            JOIN Motivo m ON c.id_motivo = m.id_motivo
-            JOIN Usuarios u ON c.atendido_por_id_usuario = u.id_usuario
-            ORDER BY c.fecha_cita DESC;
-        """).fetchall()
-        return render.visualizacion_citas(citas=citas)
+        conn = get_db()
+        filtros, cursor, limite = listados.leer_filtros(web.input())
+        areas = catalogos.areas(conn)
+        citas, siguiente = listados.consultar_citas(conn, filtros, cursor, limite)
+        url_siguiente = listados.url_pagina('/visualizacion_citas', filtros, siguiente, limite)
+        return render.visualizacion_citas(citas=citas, areas=areas, filtros=filtros, url_siguiente=url_siguiente)
+
+def _leer_agenda(data):
+    """(vista, fecha, id de la enfermera o None) de los parámetros de la agenda."""
+    vista = data.get('vista') if data.get('vista') in agenda.VISTAS else 'semana'
+    fecha = agenda.leer_fecha(data.get('fecha'))
+    enfermera = (data.get('enfermera') or '').strip()
+    return vista, fecha, int(enfermera) if enfermera.isdigit() else None
+
+class Agenda:
+    # Sin ETag: sin `fecha` la página depende del día en curso
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        vista, fecha, id_enfermera = _leer_agenda(web.input())
+        desde, hasta = agenda.rango(vista, fecha)
+        conn = get_db()
+        dias = agenda.calendario(conn, desde, hasta, id_enfermera, DURACION_CITA)
+        carga = agenda.carga_diaria(conn, desde, hasta, id_enfermera, DURACION_CITA)
+        paso = datetime.timedelta(days=7 if vista == 'semana' else 1)
+        return render.agenda(vista=vista, fecha=fecha.isoformat(), anterior=(fecha - paso).isoformat(),
+                             siguiente=(fecha + paso).isoformat(), id_enfermera=id_enfermera,
+                             enfermeras=agenda.enfermeras(conn), dias=dias, carga=carga,
+                             duracion=DURACION_CITA)
+
+class AgendaAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        vista, fecha, id_enfermera = _leer_agenda(web.input())
+        desde, hasta = agenda.rango(vista, fecha)
+        dias = agenda.calendario(get_db(), desde, hasta, id_enfermera, DURACION_CITA)
+        web.header('Content-Type', 'application/json')
+        return json.dumps({"vista": vista, "desde": desde.isoformat(), "hasta": hasta.isoformat(),
+                           "duracion_minutos": DURACION_CITA, "dias": dias})
+
+class CargaEnfermerasAPI:
+    # Ventana máxima por consulta
+    MAX_DIAS = 92
+
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        data = web.input(desde='', hasta='', enfermera='')
+        _vista, _fecha, id_enfermera = _leer_agenda(data)
+        desde = agenda.leer_fecha(data.desde, agenda.rango('semana', datetime.date.today())[0])
+        # `hasta` es inclusivo en la API
+        hasta = agenda.leer_fecha(data.hasta, desde + datetime.timedelta(days=6)) + datetime.timedelta(days=1)
+        web.header('Content-Type', 'application/json')
+        if not desde < hasta or (hasta - desde).days > self.MAX_DIAS:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": f"El rango debe ser de 1 a {self.MAX_DIAS} días."})
+        carga = agenda.carga_diaria(get_db(), desde, hasta, id_enfermera, DURACION_CITA)
+        return json.dumps({"desde": desde.isoformat(), "hasta": (hasta - datetime.timedelta(days=1)).isoformat(),
+                           "duracion_minutos": DURACION_CITA, "carga": carga})
+
+class EmpalmesAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        data = web.input(fecha='', hora='', id_lactante='', id_usuario='', excluir='')
+        web.header('Content-Type', 'application/json')
+        try:
+            _fecha, _hora, inicio = agenda.normalizar_cita(data.fecha, data.hora)
+        except ValueError as e:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": str(e)})
+        enteros = {campo: int(data[campo]) if data[campo].isdigit() else None
+                   for campo in ('id_lactante', 'id_usuario', 'excluir')}
+        empalmes = agenda.conflictos(get_db(), inicio, enteros['id_lactante'], enteros['id_usuario'],
+                                     DURACION_CITA, excluir=enteros['excluir'])
+        return json.dumps({"inicio": inicio, "duracion_minutos": DURACION_CITA, "empalmes": empalmes})
 
 class EditarCita:
     def POST(self, id_citas):
         data = web.input()
         conn = get_db()
+        # Lectura, revisión de empalmes y UPDATE en la misma transacción de escritura
+        conn.execute("BEGIN IMMEDIATE")
         # Obtener los valores actuales de la cita
-        info_actual = conn.execute("SELECT id_motivo, fecha_cita, hora_de_entrada, subsecuente, justificacion FROM Citas WHERE id_citas = ?", (id_citas,)).fetchone()
+        info_actual = conn.execute("SELECT id_motivo, fecha_cita, hora_de_entrada, subsecuente, justificacion, id_lactantes, atendido_por_id_usuario FROM Citas WHERE id_citas = ?", (id_citas,)).fetchone()
         if not info_actual:
+            conn.rollback()
             return "Cita no encontrada."
-        (id_motivo_actual, fecha_cita_actual, hora_entrada_actual, subsecuente_actual, justificacion_actual) = info_actual
+        (id_motivo_actual, fecha_cita_actual, hora_entrada_actual, subsecuente_actual, justificacion_actual, id_lactante, id_enfermera) = info_actual
+        try:
+            fecha, hora, inicio = agenda.normalizar_cita(data.get('fecha_cita', '') or fecha_cita_actual,
+                                                         data.get('hora_cita', '') or hora_entrada_actual)
+        except ValueError as e:
+            return self._rechazar(conn, id_citas, str(e))
+        if not data.get('permitir_empalme'):
+            empalmes = agenda.conflictos(conn, inicio, id_lactante, id_enfermera, DURACION_CITA, excluir=int(id_citas))
+            if empalmes:
+                return self._rechazar(conn, id_citas, agenda.describir_empalmes(empalmes))
         # Actualizar con los datos recibidos o mantener los actuales si no se envían
         conn.execute(
             "UPDATE Citas SET id_motivo = ?, fecha_cita = ?, hora_de_entrada = ?, subsecuente = ?, justificacion = ? WHERE id_citas = ?",
             (
                 data.get('motivo', '') or id_motivo_actual,
-                data.get('fecha_cita', '') or fecha_cita_actual,
-                data.get('hora_cita', '') or hora_entrada_actual,
+                fecha,
+                hora,
                 data.get('subsecuente', 0) or subsecuente_actual,
                 data.get('justificacion', '').strip() or justificacion_actual,
                 id_citas
             )
         )
+        log_auditoria(f"Edición de cita ID {id_citas}", "Citas", id_lactante)
         conn.commit()
         raise web.seeother('/visualizacion_citas')
-    def GET(self, id_citas):
-        conn = get_db()
-        info_actual = conn.execute("""
+
+    def _rechazar(self, conn, id_citas, mensaje):
+        """Vuelve a mostrar el formulario con el mensaje, sin guardar cambios."""
+        conn.rollback()
+        info_actual = self._info(conn, id_citas)
+        return render.editar_cita(message=mensaje, info_actual=info_actual, motivos=catalogos.motivos(conn, excluir=info_actual[4]))
+
+    def _info(self, conn, id_citas):
+        return conn.execute("""
             SELECT 
                 c.id_citas,
                 c.id_lactantes,
@@ -560,12 +813,39 @@ class EditarCita:
             LEFT JOIN Motivo m ON c.id_motivo = m.id_motivo
             WHERE c.id_citas = ?
         """, (id_citas,)).fetchone()
-        
-        motivos = conn.execute('select id_motivo, nombre FROM Motivo WHERE id_motivo != ?', (info_actual[4],)).fetchall()
+
+    def GET(self, id_citas):
+        conn = get_db()
+        info_actual = self._info(conn, id_citas)
+        motivos = catalogos.motivos(conn, excluir=info_actual[4])
         return render.editar_cita(message="", info_actual=info_actual, motivos=motivos)
 
 
 # --- Reporte General: PDF y Excel ---
+def respuesta_pdf(llave, estado, nombre='reporte.pdf'):
+    """Entrega un PDF de `pdfs` según su estado; mientras se genera, el navegador reintenta con Refresh."""
+    web.header('Cache-Control', 'private, no-cache')
+    if estado == 'terminado':
+        web.header('Content-Type', 'application/pdf')
+        web.header('Content-Disposition', f'attachment; filename="{nombre}"')
+        return pdfs.leer(llave)
+    web.header('Content-Type', 'text/plain; charset=utf-8')
+    if estado == 'generando':
+        web.ctx.status = '202 Accepted'
+        web.header('Retry-After', '5')
+        web.header('Refresh', f'5; url=/reportes_pdf/{llave}')
+        return f"El reporte se está generando. La descarga empezará sola cuando esté listo (/reportes_pdf/{llave})."
+    if estado == 'error':
+        web.ctx.status = '500 Internal Server Error'
+        return f"No se pudo generar el reporte: {pdfs.error(llave)}"
+    raise web.notfound("El reporte ya no está disponible; vuelve a solicitarlo.")
+
+def encabezado_datos_al(conn):
+    """Fecha de la copia de la que `conn` lee los datos, en X-Datos-Al; devuelve la descripción completa."""
+    datos = replica.descripcion(conn)
+    web.header('X-Datos-Al', datos['datos_al'] or 'actual')
+    return datos
+
 class ReportesGenerales:
     @rol_requerido('Administrador', 'Enfermera')
     def GET(self):
@@ -573,12 +853,37 @@ class ReportesGenerales:
 
     @rol_requerido('Administrador', 'Enfermera')
     def POST(self):
-        data = web.input(formato=None)
-        conn = get_db()
-        total_lactantes = conn.execute("SELECT COUNT(*) FROM Lactantes;").fetchone()[0]
-        total_citas = conn.execute("SELECT COUNT(*) FROM Citas;").fetchone()[0]
+        data = web.input(formato=None, datos=None)
+
+        # Exportación completa de un dataset: se entrega por bloques sin cargarlo en memoria
+        if data.datos:
+            if data.datos not in exportaciones.DATASETS:
+                raise web.notfound("Datos no soportados")
+            if data.formato == 'csv':
+                web.header('Content-Type', 'text/csv; charset=utf-8')
+                web.header('Content-Disposition', f'attachment; filename="{data.datos}.csv"')
+                return exportaciones.exportar_csv(replica, data.datos, al_abrir=encabezado_datos_al)
+            elif data.formato == 'excel':
+                web.header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                web.header('Content-Disposition', f'attachment; filename="{data.datos}.xlsx"')
+                return exportaciones.exportar_excel(replica, data.datos, al_abrir=encabezado_datos_al)
+            raise web.notfound("Formato no soportado")
+
+        # Reportes PDF de varias páginas: se generan en la cola de trabajos y se guardan por versión de los datos
+        if data.get('reporte'):
+            if data.formato != 'pdf':
+                raise web.notfound("Formato no soportado")
+            return self._pdf(data.reporte, data)
+
+        with replica.conexion() as conn:
+            total_lactantes = estadisticas.total(conn, 'Lactantes')
+            total_citas = estadisticas.total(conn, 'Citas')
+            datos = encabezado_datos_al(conn)
+        datos_al = f"Datos al {datos['datos_al']}" if datos['datos_al'] else "Datos al momento de la descarga"
 
         if data.formato == 'excel':
+            from openpyxl import Workbook
+
             wb = Workbook()
             ws = wb.active
             ws.title = "Reporte General"
@@ -586,66 +891,46 @@ class ReportesGenerales:
             ws.append([""])
             ws.append(["Total de lactantes", total_lactantes])
             ws.append(["Total de citas", total_citas])
+            ws.append([""])
+            ws.append([datos_al])
             output = io.BytesIO()
             wb.save(output)
-            output.seek(0)
             web.header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
             web.header('Content-Disposition', 'attachment; filename="reporte_general.xlsx"')
-            return output.read()
+            return output.getvalue()
         elif data.formato == 'pdf':
             output = io.BytesIO()
-            c = canvas.Canvas(output, pagesize=letter)
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(100, 750, "Reporte General")
-            c.setFont("Helvetica", 12)
-            c.drawString(100, 700, f"Total de lactantes: {total_lactantes}")
-            c.drawString(100, 680, f"Total de citas: {total_citas}")
-            c.save()
-            output.seek(0)
+            reportes_pdf.generar_resumen(output, "Reporte General",
+                                         [("Total de lactantes", total_lactantes), ("Total de citas", total_citas)],
+                                         datos_al)
             web.header('Content-Type', 'application/pdf')
             web.header('Content-Disposition', 'attachment; filename="reporte_general.pdf"')
-            return output.read()
+            return output.getvalue()
         else:
             raise web.notfound("Formato no soportado")
-            # Generar reporte según formato
-            if data.formato == 'excel':
-                # Generar Excel en memoria
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Reporte General"
-                ws.append(["Reporte General"])
-                ws.append([""])
-                ws.append(["Total de lactantes", total_lactantes])
-                ws.append(["Total de citas", total_citas])
-                output = io.BytesIO()
-                wb.save(output)
-                output.seek(0)
-                web.header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                web.header('Content-Disposition', 'attachment; filename="reporte_general.xlsx"')
-                return output.read()
-            elif data.formato == 'pdf':
-                # Generar PDF en memoria
-                output = io.BytesIO()
-                c = canvas.Canvas(output, pagesize=letter)
-                c.setFont("Helvetica-Bold", 16)
-                c.drawString(100, 750, "Reporte General")
-                c.setFont("Helvetica", 12)
-                c.drawString(100, 700, f"Total de lactantes: {total_lactantes}")
-                c.drawString(100, 680, f"Total de citas: {total_citas}")
-                c.save()
-                output.seek(0)
-                web.header('Content-Type', 'application/pdf')
-                web.header('Content-Disposition', 'attachment; filename="reporte_general.pdf"')
-                return output.read()
-            else:
-                raise web.notfound("Formato no soportado")
-        (id_motivo_actual, fecha_cita_actual, hora_entrada_actual, subsecuente_actual, justificacion_actual) = info_actual
-        conn.execute("UPDATE citas SET id_motivo = ?, fecha_cita = ?, hora_de_entrada = ?, subsecuente = ?, justificacion = ? WHERE id_citas = ?", 
-        (data.get('motivo', '') or id_motivo_actual, data.get('fecha_cita', '') or fecha_cita_actual, data.get('hora_cita', '') or hora_entrada_actual, data.get('subsecuente', 0) or subsecuente_actual, data.get('justificacion', '').strip() or justificacion_actual, id_citas))
-        conn.commit()
 
-        return web.seeother('/visualizacion_citas')
-    
+    def _pdf(self, tipo, data):
+        try:
+            parametros = reportes_pdf.leer_parametros(tipo, data)
+        except reportes_pdf.ParametrosInvalidos as e:
+            raise web.badrequest(str(e))
+        with replica.conexion() as conn:
+            try:
+                reportes_pdf.comprobar(conn, tipo, parametros)
+            except reportes_pdf.RegistroInexistente as e:
+                raise web.notfound(str(e))
+            try:
+                llave, futuro = pdfs.solicitar(conn, tipo, parametros)
+            except ColaLlena as e:
+                raise web.HTTPError('503 Service Unavailable', {'Retry-After': '30'},
+                                    f"Demasiados reportes en proceso, intenta de nuevo. {e}")
+        return respuesta_pdf(llave, pdfs.esperar(llave, futuro, ESPERA_PDF), f"{tipo}.pdf")
+
+class DescargaPDF:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, llave):
+        return respuesta_pdf(llave, pdfs.estado(llave))
+
 class EliminarCita:
     def GET(self, id_cita):
         pass
@@ -657,6 +942,7 @@ class EliminarCita:
 
 class VisualizacionUsuarios:
     @rol_requerido('Administrador')
+    @condicional('Usuarios', 'Rol')
     def GET(self):
         usuarios = get_db().execute("""
             SELECT u.id_usuario, u.nombre, u.num_telefono, r.nombre AS rol_nombre
@@ -673,8 +959,7 @@ class EditarUsuario:
             INNER JOIN rol ON usuarios.id_rol = rol.id_rol
             WHERE id_usuario = ?""", (id_usuario,)
         ).fetchone()
-        roles = conn.execute("SELECT id_rol, nombre FROM rol").fetchall()
-
+        roles = catalogos.roles(get_db())
 
         return render.editar_usuario(info_actual, roles, message="")
     
@@ -683,7 +968,6 @@ class EditarUsuario:
         data = web.input()
         conn = get_db()
 
-        roles = conn.execute("SELECT id_rol, nombre FROM rol").fetchall()
         info_actual = conn.execute(
             """SELECT usuarios.nombre AS nombre, contraseña, num_telefono, usuarios.id_rol, rol.nombre AS rol_nombre
             FROM usuarios
@@ -706,8 +990,11 @@ class EliminarUsuario:
         pass
     def POST(self, id_usuario):
         conn = get_db()
-        conn.execute("DELETE FROM Usuarios WHERE id_usuario = ?", (id_usuario,))
+        # Con foreign_keys activo, primero se eliminan/desligan los registros que apuntan al usuario
         conn.execute("DELETE FROM Citas WHERE atendido_por_id_usuario = ?", (id_usuario,))
+        conn.execute("UPDATE Auditoria SET id_usuario = NULL WHERE id_usuario = ?", (id_usuario,))
+        conn.execute("UPDATE Reportes SET id_usuario = NULL WHERE id_usuario = ?", (id_usuario,))
+        conn.execute("DELETE FROM Usuarios WHERE id_usuario = ?", (id_usuario,))
         conn.commit()
 
         return web.seeother('/visualizacion_usuarios')
@@ -719,91 +1006,107 @@ class EliminarUsuario:
 class ReportesArea:
     @rol_requerido('Administrador', 'Enfermera')
     def GET(self):
-        return render.reportes()
+        return render.reportes(areas=catalogos.areas(get_db()))
 
     # (Definición funcional de la clase ya está arriba, este bloque se elimina)
 
 class ReportesPorLactante:
+    # El reporte se pide por GET (?id_lactante=) para que el navegador pueda revalidarlo con su ETag
     @rol_requerido('Administrador', 'Enfermera')
+    @condicional('Citas', 'Lactantes', 'Madres', 'Motivo', usa_replica=True)
     def GET(self):
-        conn = get_db()
-        lactantes = conn.execute("SELECT id_lactantes, apellido_paterno FROM Lactantes ORDER BY apellido_paterno").fetchall()
-        return render.reportes_por_lactante(lactantes=lactantes, reporte_data=None)
+        data = web.input(id_lactante='')
+        if not data.id_lactante.isdigit():
+            return render.reportes_por_lactante(lactante=None, reporte_data=None, datos=None)
+        with replica.conexion() as conn:
+            return self._reporte(conn, data.id_lactante)
+
+    def _reporte(self, conn, id_lactante):
+        lactante = conn.execute("""
+            SELECT l.id_lactantes, l.apellido_paterno, l.apellido_materno, l.fecha_nacimiento,
+                   (m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')) AS nombre_madre
+            FROM Lactantes l LEFT JOIN Madres m ON l.id_madres = m.id_madre
+            WHERE l.id_lactantes = ?
+        """, (id_lactante,)).fetchone()
+        if lactante is None:
+            raise web.notfound("Lactante no encontrado")
+        # Historia completa: citas de la base más las archivadas
+        archivo.adjuntar(conn)
+        query = """
+            SELECT  
+                T1.id_citas, T2.nombre AS nombre_madre, T3.apellido_paterno AS lactante_apellido, T4.nombre AS motivo, T1.fecha_cita
+            FROM CitasHistoricas AS T1
+            JOIN Lactantes AS T3 ON T1.id_lactantes = T3.id_lactantes
+            JOIN Motivo AS T4 ON T1.id_motivo = T4.id_motivo
+            LEFT JOIN Madres AS T2 ON T3.id_madres = T2.id_madre
+            WHERE T1.id_lactantes = ?
+            ORDER BY T1.fecha_cita DESC;
+        """
+        try:
+            with consultas_lentas.presupuesto(conn, PRESUPUESTO_REPORTES):
+                reporte_data = conn.execute(query, (id_lactante,)).fetchall()
+        except PresupuestoAgotado as e:
+            print(f"Reporte por lactante interrumpido: {e}")
+            raise web.HTTPError('503 Service Unavailable', {'Retry-After': '30'}, "El reporte tardó demasiado, intenta de nuevo.")
+        return render.reportes_por_lactante(lactante=lactante, reporte_data=[dict(row) for row in reporte_data],
+                                            datos=replica.descripcion(conn))
 
     @rol_requerido('Administrador', 'Enfermera')
     def POST(self):
-        conn = get_db()
-        data = web.input()
-        
-        id_lactante = data.get('id_lactante')
-        
-        reporte = None
-        if id_lactante:
-            query = """
-                SELECT  
-                    T1.id_citas, T2.nombre AS nombre_madre, T3.apellido_paterno AS lactante_apellido, T4.nombre AS motivo, T1.fecha_cita
-                FROM Citas AS T1
-                JOIN Lactantes AS T3 ON T1.id_lactantes = T3.id_lactantes
-                JOIN Motivo AS T4 ON T1.id_motivo = T4.id_motivo
-                LEFT JOIN Madres AS T2 ON T3.id_madres = T2.id_madre
-                WHERE T1.id_lactantes = ?
-                ORDER BY T1.fecha_cita DESC;
-            """
-            reporte_data = conn.execute(query, (id_lactante,)).fetchall()
-            reporte = [dict(row) for row in reporte_data]
-            
-        lactantes = conn.execute("SELECT id_lactantes, apellido_paterno FROM Lactantes ORDER BY apellido_paterno").fetchall()
-        return render.reportes_por_lactante(lactantes=lactantes, reporte_data=reporte)
+        # Formularios anteriores: se redirige al GET equivalente
+        id_lactante = web.input(id_lactante='').id_lactante
+        raise web.seeother('/reportes_por_lactante' + (f'?id_lactante={id_lactante}' if id_lactante.isdigit() else ''))
 
 class ReportesAPI:
+    # También protege el modo asíncrono: sin sesión se podría llenar la cola de trabajos
+    @rol_requerido('Administrador', 'Enfermera')
     def POST(self):
         try:
             data = json.loads(web.data())
             report_type = data.get('reportType')
             
             conn = get_db()
-            report_data = {}
-
-            if report_type == "estadistica":
-                query_madres = "SELECT COUNT(*) AS total_madres FROM Madres;"
-                query_lactantes = "SELECT COUNT(*) AS total_lactantes FROM Lactantes;"
-                
-                total_madres = conn.execute(query_madres).fetchone()['total_madres']
-                total_lactantes = conn.execute(query_lactantes).fetchone()['total_lactantes']
-
-                report_data = {
-                    "reporte": "Reporte de Estadísticas",
-                    "resultados": { "total_madres": total_madres, "total_lactantes": total_lactantes }
-                }
-            
-            elif report_type == "alojamiento_conjunto":
-                query = "SELECT T1.nombre AS nombre_madre, T1.apellido_paterno AS apellido_paterno_madre, T2.apellido_paterno AS apellido_paterno_lactante, T2.apellido_materno AS apellido_materno_lactante, T2.fecha_nacimiento FROM Madres AS T1 JOIN Lactantes AS T2 ON T1.id_madre = T2.id_madre;"
-                alojamiento_data = conn.execute(query).fetchall()
-                report_data = {
-                    "reporte": "Reporte de Alojamiento Conjunto",
-                    "resultados": [dict(row) for row in alojamiento_data]
-                }
-
-            elif report_type == "federal":
-                query_genero = "SELECT genero, COUNT(genero) AS total FROM Lactantes GROUP BY genero;"
-                query_citas = "SELECT COUNT(*) AS total_citas FROM Citas;"
-
-                genero_data = conn.execute(query_genero).fetchall()
-                total_citas = conn.execute(query_citas).fetchone()['total_citas']
-
-                report_data = {
-                    "reporte": "Reporte Federal",
-                    "resultados": {
-                        "total_citas": total_citas,
-                        "distribucion_genero": [dict(row) for row in genero_data]
-                    }
-                }
-            
-            else:
+            id_usuario = web.ctx.session.get('user_id')
+
+            # Modo asíncrono: se encola el trabajo y se responde de inmediato con su id
+            if data.get('async'):
+                web.header('Content-Type', 'application/json')
+                if report_type not in reportes.TIPOS_REPORTE:
+                    web.ctx.status = '400 Bad Request'
+                    return json.dumps({"error": "Tipo de reporte no válido."})
+                try:
+                    id_trabajo = cola_trabajos.enviar(conn, report_type, id_usuario)
+                except ColaLlena as e:
+                    web.ctx.status = '503 Service Unavailable'
+                    web.header('Retry-After', '5')
+                    return json.dumps({"error": f"Demasiados reportes en proceso. {e}"})
+                web.ctx.status = '202 Accepted'
+                return json.dumps({
+                    "id_trabajo": id_trabajo,
+                    "estado": "pendiente",
+                    "estado_url": f"/api/trabajos/{id_trabajo}",
+                    "resultado_url": f"/api/trabajos/{id_trabajo}/resultado"
+                })
+
+            try:
+                # Se calcula sobre la réplica; el registro en Reportes sí va a la base principal
+                with replica.conexion() as lectura, consultas_lentas.presupuesto(lectura, PRESUPUESTO_REPORTES):
+                    if report_type in reportes.TABLAS_POR_REPORTE:
+                        report_data = cache_reportes.obtener(
+                            lectura, ('reporte', report_type), reportes.TABLAS_POR_REPORTE[report_type],
+                            lambda: reportes.generar_reporte(lectura, report_type))
+                    else:
+                        report_data = reportes.generar_reporte(lectura, report_type)
+                    report_data = dict(report_data, datos=replica.descripcion(lectura))
+            except reportes.ReporteInvalido:
                 web.ctx.status = '400 Bad Request'
                 return json.dumps({"error": "Tipo de reporte no válido."})
+            except PresupuestoAgotado as e:
+                print(f"Reporte {report_type} interrumpido: {e}")
+                web.header('Content-Type', 'application/json')
+                web.ctx.status = '503 Service Unavailable'
+                return json.dumps({"error": "El reporte tardó demasiado. Usa el modo asíncrono.", "async_disponible": True})
 
-            id_usuario = web.ctx.session.get('user_id')
             contenido_json = json.dumps(report_data['resultados'])
             
             if id_usuario:
@@ -811,8 +1114,8 @@ class ReportesAPI:
                     "INSERT INTO Reportes (id_usuario, tipo, contenido) VALUES (?, ?, ?)",
                     (id_usuario, report_data['reporte'], contenido_json)
                 )
-                conn.commit()
                 log_auditoria(f"Generación de reporte: {report_data['reporte']}", "Reportes")
+                conn.commit()
 
             web.header('Content-Type', 'application/json')
             return json.dumps(report_data)
@@ -823,9 +1126,377 @@ class ReportesAPI:
             print(f"Error en ReportesAPI: {e}")
             return json.dumps({"error": "Ocurrió un error al generar el reporte."})
 
+class ReporteCitasAPI:
+    # Máximo de días por reporte con periodo 'dia'
+    MAX_DIAS_DETALLE = 366
+
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        data = web.input(desde='', hasta='', periodo='mes', por='area')
+        web.header('Content-Type', 'application/json')
+        hoy = datetime.date.today()
+        try:
+            desde = datetime.date.fromisoformat(data.desde) if data.desde else hoy.replace(month=1, day=1)
+            hasta = datetime.date.fromisoformat(data.hasta) if data.hasta else hoy
+        except ValueError:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "Las fechas deben tener el formato AAAA-MM-DD."})
+        por = tuple(dict.fromkeys(d.strip() for d in data.por.split(',') if d.strip()))
+        error = None
+        if desde > hasta:
+            error = "`desde` no puede ser posterior a `hasta`."
+        elif data.periodo not in resumen_diario.PERIODOS:
+            error = f"Periodo no válido; opciones: {', '.join(resumen_diario.PERIODOS)}."
+        elif any(d not in resumen_diario.DIMENSIONES for d in por):
+            error = f"Dimensión no válida; opciones: {', '.join(resumen_diario.DIMENSIONES)}."
+        elif data.periodo == 'dia' and (hasta - desde).days >= self.MAX_DIAS_DETALLE:
+            error = f"Con periodo 'dia' el rango no puede pasar de {self.MAX_DIAS_DETALLE} días."
+        if error:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": error})
+
+        try:
+            with replica.conexion() as lectura:
+                if lectura.generacion is None:
+                    # Sin réplica se lee la base principal: el resumen se pone al día antes
+                    resumenes.actualizar(get_db())
+                with consultas_lentas.presupuesto(lectura, PRESUPUESTO_REPORTES):
+                    clave = ('reporte_citas', desde.isoformat(), hasta.isoformat(), data.periodo, por)
+                    resultado = cache_reportes.obtener(
+                        lectura, clave, ('ResumenCitasDia', 'Area', 'Motivo'),
+                        lambda: resumen_diario.reporte(lectura, desde.isoformat(), hasta.isoformat(), data.periodo, por))
+                    resultado = dict(resultado, datos=replica.descripcion(lectura))
+        except PresupuestoAgotado as e:
+            print(f"Reporte de citas por periodo interrumpido: {e}")
+            web.ctx.status = '503 Service Unavailable'
+            web.header('Retry-After', '30')
+            return json.dumps({"error": "El reporte tardó demasiado, intenta de nuevo."})
+        return json.dumps(resultado)
+
+class TrabajoEstadoAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, id_trabajo):
+        web.header('Content-Type', 'application/json')
+        trabajo = consultar_trabajo(get_db(), id_trabajo)
+        if not trabajo:
+            web.ctx.status = '404 Not Found'
+            return json.dumps({"error": "Trabajo no encontrado."})
+        return json.dumps({
+            "id_trabajo": trabajo['id_trabajo'],
+            "tipo": trabajo['tipo'],
+            "estado": trabajo['estado'],
+            "error": trabajo['error'],
+            "creado": trabajo['creado'],
+            "iniciado": trabajo['iniciado'],
+            "terminado": trabajo['terminado'],
+            "id_reportes": trabajo['id_reportes']
+        })
+
+class TrabajoResultadoAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, id_trabajo):
+        web.header('Content-Type', 'application/json')
+        trabajo = consultar_trabajo(get_db(), id_trabajo)
+        if not trabajo:
+            web.ctx.status = '404 Not Found'
+            return json.dumps({"error": "Trabajo no encontrado."})
+        if trabajo['estado'] == 'error':
+            web.ctx.status = '500 Internal Server Error'
+            return json.dumps({"error": trabajo['error'], "estado": trabajo['estado']})
+        if trabajo['estado'] != 'terminado':
+            web.ctx.status = '202 Accepted'
+            return json.dumps({"estado": trabajo['estado']})
+        return json.dumps({"reporte": trabajo['reporte'], "resultados": json.loads(trabajo['contenido'])})
+
+class LactantesAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        filtros, cursor, limite = listados.leer_filtros(web.input())
+        lactantes, siguiente = listados.consultar_lactantes(get_db(), filtros, cursor, limite)
+        web.header('Content-Type', 'application/json')
+        return json.dumps({"resultados": [dict(row) for row in lactantes], "siguiente": siguiente})
+
+class LineaTiempoAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, id_lactante):
+        _filtros, cursor, limite = listados.leer_filtros(web.input())
+        resultado = lineas_tiempo.obtener(get_db(), int(id_lactante), cursor, limite)
+        web.header('Content-Type', 'application/json')
+        if resultado is None:
+            web.ctx.status = '404 Not Found'
+            return json.dumps({"error": "Lactante no encontrado."})
+        resultado["siguiente_url"] = listados.url_pagina(f"/api/lactantes/{id_lactante}/linea_tiempo", {},
+                                                         resultado["siguiente"], limite)
+        return json.dumps(resultado)
+
+class CitasAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        filtros, cursor, limite = listados.leer_filtros(web.input())
+        citas, siguiente = listados.consultar_citas(get_db(), filtros, cursor, limite)
+        web.header('Content-Type', 'application/json')
+        return json.dumps({"resultados": [dict(row) for row in citas], "siguiente": siguiente})
+
+class BusquedaAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        data = web.input(q='', tipo='', limite=None)
+        limite = busqueda.leer_limite(data.limite)
+        conn = get_db()
+        resultado = {}
+        if data.tipo in ('', 'madres'):
+            resultado["madres"] = [dict(row) for row in busqueda.buscar_madres(conn, data.q, limite)]
+        if data.tipo in ('', 'lactantes'):
+            resultado["lactantes"] = [dict(row) for row in busqueda.buscar_lactantes(conn, data.q, limite)]
+        web.header('Content-Type', 'application/json')
+        return json.dumps(resultado)
+
+class ImportarAPI:
+    @rol_requerido('Administrador')
+    def POST(self):
+        data = web.input(archivo={}, datos='', formato=None)
+        web.header('Content-Type', 'application/json')
+        archivo = data.archivo
+        if not getattr(archivo, 'filename', None) or data.datos not in importaciones.COLUMNAS:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "Se requieren 'archivo' y 'datos' (madres, lactantes o citas)."})
+        try:
+            formato = importaciones.formato_de(archivo.filename, data.formato)
+        except ValueError as e:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": str(e)})
+        try:
+            filas = importaciones.leer_filas(archivo.file, formato)
+        except importaciones.ArchivoInvalido as e:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": str(e)})
+        id_usuario = web.ctx.session.get('user_id')
+        importador = importaciones.Importador(
+            get_db(), data.datos, id_usuario,
+            auditar=lambda conn, accion, tabla: auditoria.registrar(conn, id_usuario, accion, tabla))
+        return json.dumps(importador.importar(filas))
+
+class MadresDuplicadasAPI:
+    @rol_requerido('Administrador')
+    def GET(self):
+        data = web.input(umbral='', limite='100')
+        web.header('Content-Type', 'application/json')
+        try:
+            umbral = float(data.umbral) if data.umbral else duplicados.umbral
+            limite = max(1, min(int(data.limite), 1000))
+        except ValueError:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "'umbral' y 'limite' deben ser numéricos."})
+        if not 0.5 <= umbral <= 1:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "El umbral debe estar entre 0.5 y 1."})
+        conn = get_db()
+        # Los grupos sólo cambian con Madres; el detalle (lactantes por madre) se lee cada vez
+        grupos = cache_reportes.obtener(conn, ('madres_duplicadas', umbral), ('Madres',),
+                                        lambda: duplicados.grupos(conn, umbral))
+        return json.dumps({"umbral": umbral, "total_grupos": len(grupos),
+                           "grupos": duplicados.detalle(conn, grupos[:limite])})
+
+class FusionMadresAPI:
+    @rol_requerido('Administrador')
+    def POST(self):
+        web.header('Content-Type', 'application/json')
+        try:
+            data = json.loads(web.data())
+            id_conservar = int(data['id_conservar'])
+            ids = [int(i) for i in data['ids']]
+        except (ValueError, TypeError, KeyError):
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "Se requieren 'id_conservar' y la lista 'ids' de madres a fusionar."})
+        conn = get_db()
+        try:
+            movidos = duplicados.fusionar(conn, id_conservar, ids)
+            log_auditoria(f"Fusión de madres {', '.join(map(str, sorted(set(ids) - {id_conservar})))} en {id_conservar}", "Madres")
+            conn.commit()
+        except madres_duplicadas.FusionInvalida as e:
+            conn.rollback()
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": str(e)})
+        except sqlite3.Error as e:
+            conn.rollback()
+            web.ctx.status = '500 Internal Server Error'
+            return json.dumps({"error": f"Error de base de datos: {e}"})
+        return json.dumps({"id_madre": id_conservar, "fusionadas": sorted(set(ids) - {id_conservar}),
+                           "lactantes_movidos": movidos})
+
+class ConsultasLentasAPI:
+    @rol_requerido('Administrador')
+    def GET(self):
+        data = web.input(n='20', orden='max')
+        try:
+            n = max(1, min(int(data.n), 200))
+        except ValueError:
+            n = 20
+        web.header('Content-Type', 'application/json')
+        return json.dumps({"estadisticas": consultas_lentas.estadisticas(),
+                           "consultas": consultas_lentas.top(n, 'total' if data.orden == 'total' else 'max')})
+
+class CrecimientoLactanteAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, id_lactante):
+        # Base principal: un control recién capturado debe verse de inmediato
+        conn = get_db()
+        web.header('Content-Type', 'application/json')
+        if conn.execute("SELECT 1 FROM Lactantes WHERE id_lactantes = ?", (id_lactante,)).fetchone() is None:
+            web.ctx.status = '404 Not Found'
+            return json.dumps({"error": "Lactante no encontrado."})
+        return json.dumps(motor_crecimiento.lactante(conn, int(id_lactante)))
+
+class CrecimientoAreaAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self, id_area):
+        web.header('Content-Type', 'application/json')
+        try:
+            with replica.conexion() as lectura, consultas_lentas.presupuesto(lectura, PRESUPUESTO_REPORTES):
+                if lectura.execute("SELECT 1 FROM Area WHERE id_area = ?", (id_area,)).fetchone() is None:
+                    web.ctx.status = '404 Not Found'
+                    return json.dumps({"error": "Área no encontrada."})
+                resultado = cache_reportes.obtener(
+                    lectura, ('crecimiento_area', int(id_area)), ('Controles', 'Lactantes'),
+                    lambda: motor_crecimiento.area(lectura, int(id_area)))
+                resultado = dict(resultado, datos=replica.descripcion(lectura))
+        except PresupuestoAgotado as e:
+            print(f"Curvas de crecimiento del área {id_area} interrumpidas: {e}")
+            web.ctx.status = '503 Service Unavailable'
+            web.header('Retry-After', '30')
+            return json.dumps({"error": "El cálculo tardó demasiado, intenta de nuevo."})
+        return json.dumps(resultado)
+
+class SincronizacionAPI:
+    @rol_requerido('Administrador', 'Enfermera')
+    def GET(self):
+        # Descarga: filas cambiadas desde el cursor de la tableta (0 = todo)
+        data = web.input(since='0', limite=None)
+        resultado = sincronizacion.cambios_desde(get_db(), sincronizacion.leer_cursor(data.since),
+                                                 sincronizacion.leer_limite(data.limite))
+        web.header('Content-Type', 'application/json')
+        web.header('Cache-Control', 'no-store')
+        return json.dumps(resultado, separators=(',', ':'))
+
+    @rol_requerido('Administrador', 'Enfermera')
+    def POST(self):
+        # Subida: {"id_lote": "...", "cambios": [...]} se aplica completo o no se aplica
+        web.header('Content-Type', 'application/json')
+        try:
+            data = json.loads(web.data())
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": "El cuerpo debe ser un objeto JSON."})
+        id_usuario = web.ctx.session.get('user_id')
+        aplicador = sincronizacion.Aplicador(
+            get_db(), id_usuario,
+            auditar=lambda conn, accion, tabla: auditoria.registrar(conn, id_usuario, accion, tabla))
+        try:
+            return json.dumps(aplicador.aplicar(data.get('cambios'), data.get('id_lote')))
+        except sincronizacion.ConflictoSincronizacion as e:
+            web.ctx.status = '409 Conflict'
+            return json.dumps({"error": "Hay cambios en conflicto; descarga los cambios y vuelve a intentar.",
+                               "conflictos": e.conflictos})
+        except sincronizacion.CambioInvalido as e:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({"error": e.mensaje, "indice": e.indice})
+
+class MetricasPrometheus:
+    def GET(self):
+        # Sin sesión (lo consulta Prometheus): con VINCULO_METRICAS_TOKEN se exige ese token,
+        # sin él sólo se atiende desde la propia máquina
+        token = os.environ.get('VINCULO_METRICAS_TOKEN')
+        if token:
+            if web.ctx.env.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+                raise web.HTTPError('401 Unauthorized', {'WWW-Authenticate': 'Bearer'}, "No autorizado.")
+        elif web.ctx.env.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+            raise web.forbidden()
+        web.header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        return perfilador.prometheus()
+
+def metricas_subsistemas():
+    """Medidores de los subsistemas para /metrics (además de los histogramas por ruta)."""
+    estadisticas_pool = pool.estadisticas()
+    cache = cache_reportes.estadisticas()
+    lentas = consultas_lentas.estadisticas()
+    antiguedad_replica = replica.antiguedad()
+    lineas = [
+        "# HELP vinculo_arranque_segundos Tiempo de arranque del módulo app por fase.",
+        "# TYPE vinculo_arranque_segundos gauge",
+    ] + [f'vinculo_arranque_segundos{{fase="{fase}"}} {segundos:.4f}' for fase, segundos in arranque.tiempos.fases.items()]
+    for nombre, tipo, ayuda, valor in (
+        ('vinculo_pool_conexiones_creadas', 'gauge', "Conexiones abiertas por el pool.", estadisticas_pool['creadas']),
+        ('vinculo_pool_conexiones_libres', 'gauge', "Conexiones libres en el pool.", estadisticas_pool['libres']),
+        ('vinculo_pool_checkouts_total', 'counter', "Conexiones tomadas del pool.", estadisticas_pool['checkouts']),
+        ('vinculo_pool_agotamientos_total', 'counter', "Veces que se esperó por una conexión.", estadisticas_pool['agotamientos']),
+        ('vinculo_cache_reportes_aciertos_total', 'counter', "Aciertos de la caché de reportes.", cache['aciertos']),
+        ('vinculo_cache_reportes_fallos_total', 'counter', "Fallos de la caché de reportes.", cache['fallos']),
+        ('vinculo_consultas_lentas_total', 'counter', "Sentencias que superaron el umbral de consulta lenta.", lentas['lentas']),
+        ('vinculo_consultas_interrumpidas_total', 'counter', "Consultas de reportes interrumpidas por tiempo.", lentas['interrumpidas']),
+        ('vinculo_resumen_cambios_procesados_total', 'counter', "Entradas de Cambios incorporadas a los resúmenes diarios.",
+         resumenes.estadisticas()['cambios_procesados']),
+        ('vinculo_pdf_generados_total', 'counter', "PDFs de varias páginas generados en la cola.", pdfs.estadisticas()['generados']),
+        ('vinculo_madres_fusionadas_total', 'counter', "Madres duplicadas fusionadas con otra.",
+         duplicados.estadisticas()['madres_fusionadas']),
+        ('vinculo_replica_antiguedad_segundos', 'gauge', "Antigüedad de la réplica de reportes (-1 sin réplica).",
+         -1 if antiguedad_replica is None else round(antiguedad_replica, 1)),
+    ):
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}", f"{nombre} {valor}"]
+    return lineas
+
+class MetricasAPI:
+    @rol_requerido('Administrador')
+    def GET(self):
+        web.header('Content-Type', 'application/json')
+        return json.dumps({"arranque": arranque.tiempos.estadisticas(),
+                           "pool": pool.estadisticas(), "trabajos": cola_trabajos.estadisticas(),
+                           "cache_reportes": cache_reportes.estadisticas(),
+                           "auditoria": auditoria.estadisticas(),
+                           "consultas_lentas": consultas_lentas.estadisticas(),
+                           "replica": replica.estadisticas(),
+                           "crecimiento": motor_crecimiento.estadisticas(),
+                           "linea_tiempo": lineas_tiempo.estadisticas(),
+                           "resumen_diario": resumenes.estadisticas(),
+                           "archivo": archivo.estadisticas(),
+                           "reportes_pdf": pdfs.estadisticas(),
+                           "madres_duplicadas": duplicados.estadisticas(),
+                           "catalogos": catalogos.estadisticas(),
+                           "estaticos": archivos_estaticos.estadisticas(),
+                           "plantillas": render.estadisticas(),
+                           "sesiones": almacen_sesiones.estadisticas() if hasattr(almacen_sesiones, 'estadisticas') else None})
+
 # --- Lógica de inicio del servidor ---
+# Se ejecuta al importar el módulo para que gunicorn también aplique las migraciones.
+# Con preload_app (gunicorn.conf.py) se hace una sola vez en el maestro; un proceso
+# que hereda la marca VINCULO_BD_VERIFICADA de su padre no vuelve a revisar la base.
+if not base_verificada(DB_FILE):
+    setup_database()
+arranque.tiempos.marcar('base_de_datos')
+
 app = web.application(urls, globals())
-session = web.session.Session(app, web.session.DiskStore('sessions'), initializer={'loggedin': False, 'rol_nombre': None})
+
+def ruta_actual():
+    """Clase de web.py que atiende la solicitud en curso (para agrupar métricas por ruta)."""
+    return app._match(app.mapping, web.ctx.path)[0] or 'sin_ruta'
+
+def ruta_de_consulta():
+    # Las consultas lentas también pueden venir de hilos sin solicitud (auditoría, sesiones)
+    medicion = perfilado.medicion_actual()
+    if medicion is not None:
+        return medicion.ruta
+    if web.ctx.get('path') is None:
+        return 'fuera_de_solicitud'
+    return ruta_actual()
+
+perfilador = perfilado.Perfilador(muestreo=MUESTREO_PERFILADO, resolver_ruta=ruta_actual)
+perfilador.agregar_colector(metricas_subsistemas)
+if MUESTREO_PERFILADO > 0:
+    # Primer procesador: la medición incluye la sesión y la toma de conexión
+    app.add_processor(perfilador.procesador)
+almacen_sesiones = crear_almacen_sesiones()
+session = web.session.Session(app, almacen_sesiones, initializer={'loggedin': False, 'rol_nombre': None})
 
 def session_processor(handler):
     web.ctx.session = session
@@ -834,17 +1505,30 @@ def session_processor(handler):
 app.add_processor(session_processor)
 
 def db_processor(handler):
-    web.ctx._db = get_db()
+    try:
+        web.ctx._db = get_db()
+    except PoolAgotado as e:
+        print(f"Pool de conexiones agotado: {e}")
+        raise web.HTTPError('503 Service Unavailable', {'Retry-After': '1'}, "Servidor ocupado, intenta de nuevo.")
     try:
         return handler()
     finally:
-        if hasattr(web.ctx, '_db'):
-            web.ctx._db.close()
+        db = getattr(web.ctx, '_db', None)
+        if db is not None:
+            del web.ctx._db
+            pool.devolver(db)
 
 app.add_processor(db_processor)
 
-application = app.wsgifunc()
+# Los estáticos se atienden antes de los procesadores de sesión y de base de datos
+archivos_estaticos = ArchivosEstaticos(app.wsgifunc(), STATIC_DIR)
+archivos_estaticos.precomprimir()
+# Bajo gunicorn.conf.py el hilo de la réplica se arranca en cada worker (post_worker_init):
+# un hilo creado en el maestro antes del fork dejaría sus bloqueos a medias en los hijos
+if os.environ.get('VINCULO_GUNICORN') != '1':
+    replica.iniciar()
+application = archivos_estaticos
+arranque.tiempos.marcar('aplicacion')
 
 if __name__ == "__main__":
-    setup_database()
     app.run()
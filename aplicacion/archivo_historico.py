@@ -0,0 +1,305 @@
+
+# archivo_historico.py
+# Archivo de la historia fría. Las Citas y los eventos de Auditoria más viejos
+# que el horizonte (VINCULO_ARCHIVO_HORIZONTE_DIAS) se mueven por lotes a un
+# archivo SQLite por año (archivo/vinculo_archivo_AAAA.db); la base principal,
+# sus índices y sus respaldos se quedan con lo reciente.
+#
+# Para leer la historia completa cada conexión adjunta (ATTACH) los archivos y
+# crea las vistas temporales CitasHistoricas y AuditoriaHistorica (UNION ALL
+# de la tabla principal y la de cada año). SQLite adjunta como máximo 10
+# bases por conexión (SQLITE_LIMIT_ATTACHED): son 10 años archivados.
+#
+# Cada lote se copia al archivo en una transacción y se borra de la principal
+# en otra (con WAL una transacción entre dos archivos no es atómica ante una
+# caída): si algo falla en medio queda una copia repetida que el siguiente
+# lote reemplaza. Una cita que cambió después de copiarse no se borra y su
+# copia se descarta. Lo archivado no se modifica: las bajas de lactantes o
+# usuarios sólo tocan la base principal. Para las tabletas una cita archivada
+# llega como baja (lápida en Cambios); los resúmenes diarios y el total de
+# citas del reporte federal sí la siguen contando.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+MAX_FILAS_POR_LOTE = 1000
+HORIZONTE_POR_DEFECTO = 730
+
+PATRON_ARCHIVO = re.compile(r'^vinculo_archivo_(\d{4})\.db$')
+
+# tabla -> llave, columna de fecha, columnas (las de la vista y las del archivo), esquema en el archivo
+TABLAS = {
+    'Citas': {
+        'llave': 'id_citas',
+        # Columna generada (ver agenda.py); en el archivo se guarda como columna normal
+        'fecha': 'inicio',
+        'vista': 'CitasHistoricas',
+        'columnas': ('id_citas', 'id_lactantes', 'id_motivo', 'atendido_por_id_usuario', 'fecha_cita', 'subsecuente',
+                     'justificacion', 'hora_de_entrada', 'inicio'),
+        'esquema': """
+            CREATE TABLE IF NOT EXISTS {esquema}.Citas (
+                id_citas INTEGER PRIMARY KEY, id_lactantes INTEGER, id_motivo INTEGER, atendido_por_id_usuario INTEGER,
+                fecha_cita TEXT NOT NULL, subsecuente INTEGER, justificacion TEXT, hora_de_entrada TEXT, inicio TEXT
+            );
+            CREATE INDEX IF NOT EXISTS {esquema}.idx_citas_lactante_inicio ON Citas(id_lactantes, inicio);
+            CREATE INDEX IF NOT EXISTS {esquema}.idx_citas_inicio ON Citas(inicio, atendido_por_id_usuario);
+        """,
+    },
+    'Auditoria': {
+        'llave': 'id_auditoria',
+        'fecha': 'fecha',
+        'vista': 'AuditoriaHistorica',
+        'columnas': ('id_auditoria', 'id_usuario', 'accion', 'tabla_afectada', 'fecha', 'id_lactantes'),
+        'esquema': """
+            CREATE TABLE IF NOT EXISTS {esquema}.Auditoria (
+                id_auditoria INTEGER PRIMARY KEY, id_usuario INTEGER, accion TEXT NOT NULL, tabla_afectada TEXT NOT NULL,
+                fecha TIMESTAMP, id_lactantes INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS {esquema}.idx_auditoria_lactante ON Auditoria(id_lactantes, fecha)
+                WHERE id_lactantes IS NOT NULL;
+        """,
+    },
+}
+
+# Filas archivadas por tabla y año (en la base principal: los totales de los reportes las suman)
+TABLA_CONTEO = """
+    CREATE TABLE IF NOT EXISTS ArchivoHistorico (
+        tabla TEXT NOT NULL,
+        anio TEXT NOT NULL,
+        filas INTEGER NOT NULL DEFAULT 0,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (tabla, anio)
+    ) WITHOUT ROWID;
+"""
+
+
+class ArchivoHistoricoError(Exception):
+    """Los archivos no se pueden adjuntar (p. ej. más años que bases adjuntas permitidas)."""
+
+
+def crear_tablas(conn):
+    """Tabla de conteos del archivo (migración)."""
+    conn.execute(TABLA_CONTEO)
+
+
+def esquema(anio):
+    return f"archivo_{anio}"
+
+
+def total_archivado(conn, tabla):
+    fila = conn.execute("SELECT IFNULL(SUM(filas), 0) FROM ArchivoHistorico WHERE tabla = ?", (tabla,)).fetchone()
+    return fila[0]
+
+
+def sql_vista(tabla, anios):
+    """CREATE TEMP VIEW de la tabla principal más la del archivo de cada año."""
+    datos = TABLAS[tabla]
+    columnas = ', '.join(datos['columnas'])
+    partes = [f"SELECT {columnas} FROM main.{tabla}"]
+    partes += [f"SELECT {columnas} FROM {esquema(anio)}.{tabla}" for anio in anios]
+    return f"CREATE TEMP VIEW {datos['vista']} AS " + " UNION ALL ".join(partes)
+
+
+def _sentencias(script):
+    return [sentencia.strip() for sentencia in script.split(';') if sentencia.strip()]
+
+
+def _por_bloques(valores, tamano=500):
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+class ArchivoHistorico:
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._listado = (None, ())
+        self._adjuntados = 0
+        self._movidas = {}
+        self._ultima_duracion = None
+
+    def ruta(self, anio):
+        return os.path.join(self.directorio, f"vinculo_archivo_{anio}.db")
+
+    def anios(self):
+        """Años con archivo, del más viejo al más nuevo (se vuelve a listar sólo si cambió el directorio)."""
+        try:
+            marca = os.stat(self.directorio).st_mtime_ns
+        except FileNotFoundError:
+            return ()
+        with self._lock:
+            if self._listado[0] == marca:
+                return self._listado[1]
+        anios = tuple(sorted(m.group(1) for m in map(PATRON_ARCHIVO.match, os.listdir(self.directorio)) if m))
+        with self._lock:
+            self._listado = (marca, anios)
+        return anios
+
+    # --- Lectura ---
+
+    def adjuntar(self, conn):
+        """Adjunta los archivos que falten y deja al día las vistas de historia completa de `conn`."""
+        anios = self.anios()
+        adjuntas = {fila[1] for fila in conn.execute("PRAGMA database_list")}
+        faltantes = [anio for anio in anios if esquema(anio) not in adjuntas]
+        if faltantes:
+            limite = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            if len(adjuntas - {'main', 'temp'}) + len(faltantes) > limite:
+                raise ArchivoHistoricoError(
+                    f"Hay {len(anios)} años archivados y SQLite sólo adjunta {limite} bases por conexión.")
+            if conn.execute("PRAGMA busy_timeout").fetchone()[0] == 0:
+                # Los archivos se escriben por lotes mientras otras conexiones los leen
+                conn.execute("PRAGMA busy_timeout = 5000")
+            for anio in faltantes:
+                conn.execute("ATTACH DATABASE ? AS " + esquema(anio), (self.ruta(anio),))
+            with self._lock:
+                self._adjuntados += len(faltantes)
+        for tabla, datos in TABLAS.items():
+            sql = sql_vista(tabla, anios)
+            actual = conn.execute("SELECT sql FROM temp.sqlite_master WHERE type = 'view' AND name = ?",
+                                  (datos['vista'],)).fetchone()
+            # SQLite guarda la definición sin TEMP
+            if actual is None or actual[0] != sql.replace("CREATE TEMP VIEW", "CREATE VIEW", 1):
+                conn.execute(f"DROP VIEW IF EXISTS temp.{datos['vista']}")
+                conn.execute(sql)
+        return anios
+
+    # --- Archivo ---
+
+    def _preparar_archivo(self, conn, anio):
+        """Crea (si hace falta) y adjunta el archivo de `anio` para escribir en él."""
+        os.makedirs(self.directorio, exist_ok=True)
+        if esquema(anio) not in {fila[1] for fila in conn.execute("PRAGMA database_list")}:
+            conn.execute("ATTACH DATABASE ? AS " + esquema(anio), (self.ruta(anio),))
+        for datos in TABLAS.values():
+            for sentencia in _sentencias(datos['esquema'].format(esquema=esquema(anio))):
+                conn.execute(sentencia)
+
+    def _quitar_repetidas(self, conn, tabla):
+        """Borra del archivo las copias de filas que siguen en la principal (lote interrumpido o fila cambiada)."""
+        llave = TABLAS[tabla]['llave']
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for anio in self.anios():
+                conn.execute(f"DELETE FROM {esquema(anio)}.{tabla} WHERE {llave} IN (SELECT {llave} FROM main.{tabla})")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def archivar_lote(self, conn, tabla, corte, limite=MAX_FILAS_POR_LOTE, resumenes=None):
+        """Mueve al archivo hasta `limite` filas de `tabla` anteriores a `corte`; devuelve cuántas se movieron."""
+        datos = TABLAS[tabla]
+        llave, fecha = datos['llave'], datos['fecha']
+        orden = fecha if tabla == 'Citas' else llave
+        filas = conn.execute(f"""
+            SELECT {llave}, substr({fecha}, 1, 4) FROM main.{tabla}
+            WHERE {fecha} < ? AND {fecha} IS NOT NULL ORDER BY {orden} LIMIT ?
+        """, (corte, limite)).fetchall()
+        if not filas:
+            return 0
+        por_anio = {}
+        for id_fila, anio in filas:
+            por_anio.setdefault(anio, []).append(id_fila)
+        # ATTACH no se permite dentro de una transacción
+        for anio in por_anio:
+            self._preparar_archivo(conn, anio)
+        columnas = ', '.join(datos['columnas'])
+
+        # 1. Copia (reemplaza la de un lote anterior interrumpido)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("SELECT IFNULL(MAX(version), 0) FROM Cambios").fetchone()[0]
+            for anio, ids in por_anio.items():
+                for bloque in _por_bloques(ids):
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO {esquema(anio)}.{tabla} ({columnas})
+                        SELECT {columnas} FROM main.{tabla}
+                        WHERE {llave} IN ({','.join('?' * len(bloque))}) AND substr({fecha}, 1, 4) = ?
+                    """, bloque + [anio])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        if tabla == 'Citas' and resumenes is not None:
+            # Los resúmenes diarios deben incluir el último cambio de cada cita antes de soltar su aporte
+            resumenes.actualizar(conn)
+
+        # 2. Borrado de la principal, sólo de lo que quedó copiado y no cambió desde la copia
+        movidas = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if tabla == 'Citas':
+                # Una cita con cambios que el resumen todavía no incorpora espera al siguiente lote
+                version = min(version, conn.execute(
+                    "SELECT version_cambios FROM ResumenCitasEstado WHERE id = 1").fetchone()[0])
+            for anio, ids in por_anio.items():
+                for bloque in _por_bloques(ids):
+                    marcas = ','.join('?' * len(bloque))
+                    sin_cambios = ""
+                    if tabla == 'Citas':
+                        sin_cambios = (f"AND IFNULL((SELECT version FROM Cambios WHERE tabla = 'Citas' "
+                                       f"AND id_fila = main.Citas.id_citas), 0) <= {int(version)}")
+                    borradas = conn.execute(f"""
+                        DELETE FROM main.{tabla}
+                        WHERE {llave} IN ({marcas}) {sin_cambios}
+                          AND {llave} IN (SELECT {llave} FROM {esquema(anio)}.{tabla} WHERE {llave} IN ({marcas}))
+                    """, bloque + bloque).rowcount
+                    # Las que siguen en la principal descartan su copia
+                    conn.execute(f"""
+                        DELETE FROM {esquema(anio)}.{tabla}
+                        WHERE {llave} IN ({marcas}) AND {llave} IN (SELECT {llave} FROM main.{tabla} WHERE {llave} IN ({marcas}))
+                    """, bloque + bloque)
+                    if tabla == 'Citas':
+                        # El resumen diario conserva lo que aportaban: la baja de Cambios ya no lo resta
+                        conn.execute(f"""
+                            DELETE FROM ResumenCitasAporte
+                            WHERE id_citas IN ({marcas}) AND id_citas NOT IN (SELECT id_citas FROM main.Citas WHERE id_citas IN ({marcas}))
+                        """, bloque + bloque)
+                    if borradas:
+                        conn.execute("""
+                            INSERT INTO ArchivoHistorico (tabla, anio, filas) VALUES (?, ?, ?)
+                            ON CONFLICT (tabla, anio) DO UPDATE SET filas = filas + excluded.filas, actualizado = CURRENT_TIMESTAMP
+                        """, (tabla, anio, borradas))
+                    movidas += borradas
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return movidas
+
+    def archivar(self, conn, horizonte_dias=HORIZONTE_POR_DEFECTO, limite=MAX_FILAS_POR_LOTE, resumenes=None):
+        """Mueve al archivo todo lo anterior al horizonte, por lotes; devuelve {tabla: filas movidas}."""
+        inicio = time.perf_counter()
+        corte = conn.execute("SELECT date('now', 'localtime', ?)", (f"-{int(horizonte_dias)} days",)).fetchone()[0]
+        self.adjuntar(conn)
+        movidas = {}
+        for tabla in TABLAS:
+            self._quitar_repetidas(conn, tabla)
+            total = 0
+            while True:
+                lote = self.archivar_lote(conn, tabla, corte, limite, resumenes)
+                total += lote
+                if lote == 0:
+                    break
+            movidas[tabla] = total
+        with self._lock:
+            for tabla, total in movidas.items():
+                self._movidas[tabla] = self._movidas.get(tabla, 0) + total
+            self._ultima_duracion = time.perf_counter() - inicio
+        return movidas
+
+    def estadisticas(self):
+        anios = self.anios()
+        with self._lock:
+            return {
+                "directorio": self.directorio,
+                "anios": list(anios),
+                "adjuntados": self._adjuntados,
+                "filas_movidas": dict(self._movidas),
+                "ultima_duracion_s": None if self._ultima_duracion is None else round(self._ultima_duracion, 3),
+            }
@@ -0,0 +1,107 @@
+
+# arranque.py
+# Tiempos de arranque por fase. app.py marca cada fase mientras se importa
+# (importaciones, plantillas, configuración, base de datos...) y /api/metricas
+# los muestra. `python comandos.py arranque` importa app en un proceso limpio
+# contra una base temporal y falla si el arranque supera un límite o si se
+# cargaron bibliotecas que sólo usan los reportes: así una importación pesada
+# que se cuele al inicio se detecta en CI.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Sólo las usan reportes, exportaciones y curvas de crecimiento: se importan en el primer uso
+BIBLIOTECAS_DIFERIDAS = ('openpyxl', 'reportlab', 'numpy')
+
+PREFIJO = 'ARRANQUE '
+
+# Se ejecuta en el proceso hijo: el tiempo incluye todo `import app`
+CODIGO_MEDICION = f"""
+import json, sys, time
+inicio = time.perf_counter()
+import app
+total = time.perf_counter() - inicio
+import arranque
+datos = arranque.tiempos.estadisticas()
+datos["import_app_ms"] = round(total * 1000, 1)
+print({PREFIJO!r} + json.dumps(datos))
+"""
+
+
+def bibliotecas_cargadas():
+    return [nombre for nombre in BIBLIOTECAS_DIFERIDAS if nombre in sys.modules]
+
+
+class TiemposArranque:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.inicio = time.time()
+        self._ultimo = time.perf_counter()
+        self.fases = {}
+
+    def marcar(self, fase):
+        """Cierra la fase `fase`: el tiempo transcurrido desde la marca anterior."""
+        ahora = time.perf_counter()
+        self.fases[fase] = self.fases.get(fase, 0.0) + (ahora - self._ultimo)
+        self._ultimo = ahora
+
+    def total(self):
+        return sum(self.fases.values())
+
+    def estadisticas(self):
+        return {
+            "fases_ms": {fase: round(segundos * 1000, 1) for fase, segundos in self.fases.items()},
+            "total_ms": round(self.total() * 1000, 1),
+            # Con preload_app el módulo se importó en el maestro de gunicorn y el worker lo heredó
+            "heredado_del_maestro": self.pid != os.getpid(),
+            "bibliotecas_cargadas": bibliotecas_cargadas(),
+        }
+
+
+# Una sola medición por proceso: empieza cuando app.py importa este módulo
+tiempos = TiemposArranque()
+
+
+def _importar_app(directorio, entorno):
+    salida = subprocess.run([sys.executable, '-c', CODIGO_MEDICION], cwd=directorio, env=entorno,
+                            capture_output=True, text=True, timeout=300)
+    for linea in salida.stdout.splitlines():
+        if linea.startswith(PREFIJO):
+            return json.loads(linea[len(PREFIJO):])
+    raise RuntimeError(f"No se pudo importar app (código {salida.returncode}):\n{salida.stderr[-2000:]}")
+
+
+def medir(directorio, repeticiones=3):
+    """Importa app `repeticiones` veces, cada una en un proceso nuevo, contra una base temporal.
+
+    La primera importación crea el esquema y se reporta aparte; las siguientes
+    son arranques normales con la base ya migrada, y de ellas se toma la mediana
+    de cada fase.
+    """
+    with tempfile.TemporaryDirectory(prefix='vinculo_arranque_') as temporal:
+        entorno = dict(os.environ,
+                       VINCULO_BD=os.path.join(temporal, 'arranque.db'),
+                       VINCULO_SESIONES='memoria',
+                       VINCULO_REPLICA=os.path.join(temporal, 'replica.db'),
+                       VINCULO_REPLICA_INTERVALO='0')
+        entorno.pop('VINCULO_BD_VERIFICADA', None)
+        base_nueva = _importar_app(directorio, entorno)
+        mediciones = [_importar_app(directorio, entorno) for _ in range(max(1, repeticiones))]
+
+    fases = {}
+    for medicion in mediciones:
+        for fase, ms in medicion['fases_ms'].items():
+            fases.setdefault(fase, []).append(ms)
+    return {
+        "repeticiones": len(mediciones),
+        "fases_ms": {fase: round(statistics.median(valores), 1) for fase, valores in fases.items()},
+        "total_ms": round(statistics.median(m['total_ms'] for m in mediciones), 1),
+        "import_app_ms": round(statistics.median(m['import_app_ms'] for m in mediciones), 1),
+        "base_nueva_ms": base_nueva['import_app_ms'],
+        "bibliotecas_cargadas": sorted({nombre for m in mediciones for nombre in m['bibliotecas_cargadas']}),
+    }
@@ -0,0 +1,164 @@
+
+# auditoria.py
+# Registro de eventos de auditoría fuera del camino crítico de la solicitud.
+#
+# Modo 'transaccion' (por defecto): el INSERT en Auditoria se ejecuta en la
+# misma transacción que el cambio de negocio y se confirma con su commit.
+# Modo 'segundo_plano': los eventos se guardan en la conexión de la solicitud
+# y, sólo si la transacción se confirma, pasan a un hilo que los inserta por
+# lotes con executemany bajo un único commit.
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from conexiones import abrir_conexion
+
+MODOS = ('transaccion', 'segundo_plano')
+
+INSERT_AUDITORIA = "INSERT INTO Auditoria (id_usuario, accion, tabla_afectada, fecha, id_lactantes) VALUES (?, ?, ?, ?, ?)"
+
+_FIN = object()
+
+
+class ConexionAuditada(sqlite3.Connection):
+    """Conexión que entrega sus eventos de auditoría pendientes al confirmar la transacción."""
+
+    auditoria = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.auditoria_pendiente = []
+
+    def commit(self):
+        super().commit()
+        if self.auditoria_pendiente:
+            eventos, self.auditoria_pendiente = self.auditoria_pendiente, []
+            self.auditoria.encolar(eventos)
+
+    def rollback(self):
+        super().rollback()
+        self.auditoria_pendiente = []
+
+
+class Auditoria:
+    def __init__(self, ruta_bd, modo='transaccion', tamano_lote=200, intervalo=1.0, max_cola=10000):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de auditoría no válido: {modo}")
+        self.ruta_bd = ruta_bd
+        self.modo = modo
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._registrados = 0
+        self._encolados = 0
+        self._descartados = 0
+        self._escritos = 0
+        self._lotes = 0
+        self._errores = 0
+        self._escritura_total = 0.0
+
+    def registrar(self, conn, id_usuario, accion, tabla_afectada, id_lactante=None):
+        """Registra un evento ligado a la transacción en curso de `conn` (sin hacer commit).
+
+        `id_lactante` liga el evento a la línea de tiempo de ese lactante.
+        """
+        evento = (id_usuario, accion, tabla_afectada, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), id_lactante)
+        if self.modo == 'segundo_plano' and isinstance(conn, ConexionAuditada):
+            conn.auditoria_pendiente.append(evento)
+        else:
+            conn.execute(INSERT_AUDITORIA, evento)
+        with self._lock:
+            self._registrados += 1
+
+    def encolar(self, eventos):
+        self._iniciar()
+        descartados = 0
+        for evento in eventos:
+            try:
+                self._cola.put_nowait(evento)
+            except queue.Full:
+                descartados += 1
+        with self._lock:
+            self._encolados += len(eventos) - descartados
+            self._descartados += descartados
+        if descartados:
+            print(f"Auditoría: cola llena, {descartados} eventos descartados.")
+
+    def _iniciar(self):
+        if self._hilo is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._hilo is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._ciclo, name='escritor-auditoria', daemon=True)
+                self._hilo.start()
+                atexit.register(self.detener)
+
+    def _ciclo(self):
+        conn = abrir_conexion(self.ruta_bd)
+        try:
+            terminar = False
+            while not terminar:
+                evento = self._cola.get()
+                if evento is _FIN:
+                    break
+                lote = [evento]
+                limite = time.monotonic() + self.intervalo
+                while len(lote) < self.tamano_lote:
+                    try:
+                        evento = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if evento is _FIN:
+                        terminar = True
+                        break
+                    lote.append(evento)
+                self._escribir(conn, lote)
+        finally:
+            conn.close()
+
+    def _escribir(self, conn, lote):
+        inicio = time.perf_counter()
+        try:
+            conn.executemany(INSERT_AUDITORIA, lote)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            with self._lock:
+                self._errores += 1
+            print(f"Error al registrar en auditoría: {e}")
+            return
+        with self._lock:
+            self._escritos += len(lote)
+            self._lotes += 1
+            self._escritura_total += time.perf_counter() - inicio
+
+    def detener(self, espera=5.0):
+        """Escribe lo que quede en la cola y detiene el hilo (al apagar el worker)."""
+        if self._hilo is None or self._pid != os.getpid():
+            return
+        self._cola.put(_FIN)
+        self._hilo.join(espera)
+        self._hilo = None
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "modo": self.modo,
+                "registrados": self._registrados,
+                "encolados": self._encolados,
+                "descartados": self._descartados,
+                "escritos": self._escritos,
+                "lotes": self._lotes,
+                "errores": self._errores,
+                "en_cola": self._cola.qsize(),
+                "lote_promedio": round(self._escritos / self._lotes, 2) if self._lotes else 0.0,
+                "escritura_total_ms": round(self._escritura_total * 1000, 3),
+            }
@@ -0,0 +1,33 @@
+# base_pruebas.py
+# Base SQLite en memoria para las pruebas (test_*.py): todas las migraciones y
+# los datos iniciales (roles, áreas 1-4, motivos 1-3, madre 'Desconocida' y los
+# usuarios Admin = 1, María López = 2 y Ana Pérez = 3).
+
+import contextlib
+import io
+import sqlite3
+
+import migraciones
+from conexiones import configurar_conexion
+
+ID_ENFERMERA = 2
+
+
+def base_en_memoria():
+    conn = configurar_conexion(sqlite3.connect(':memory:', check_same_thread=False))
+    with contextlib.redirect_stdout(io.StringIO()):
+        migraciones.preparar_base(conn)
+    return conn
+
+
+def insertar_lactante(conn, id_area=1, genero='Femenino', id_madre=1, apellido='Paz'):
+    cursor = conn.execute("""INSERT INTO Lactantes (id_madres, id_area, apellido_paterno, fecha_nacimiento, genero, estado)
+                             VALUES (?, ?, ?, '2025-01-02', ?, 'Activo')""", (id_madre, id_area, apellido, genero))
+    return cursor.lastrowid
+
+
+def insertar_cita(conn, id_lactante, fecha, hora='10:00', id_motivo=1, subsecuente=0):
+    cursor = conn.execute("""INSERT INTO Citas (id_lactantes, id_motivo, atendido_por_id_usuario, fecha_cita, subsecuente,
+                                                hora_de_entrada) VALUES (?, ?, ?, ?, ?, ?)""",
+                          (id_lactante, id_motivo, ID_ENFERMERA, fecha, subsecuente, hora))
+    return cursor.lastrowid
@@ -0,0 +1,506 @@
+
+# benchmark.py
+# Prueba de rendimiento de extremo a extremo: genera (una vez) una base de datos
+# sintética aparte y recorre todas las rutas de `urls` dentro del mismo proceso
+# llamando a `application` (WSGI), con sesiones de Administrador y de Enfermera.
+# Por ruta reporta p50/p95/p99, rendimiento (solicitudes/s) y memoria, en JSON.
+# Una ruta de `urls` sin escenario en ESCENARIOS hace fallar la corrida (código 2).
+#
+# Uso:
+#   python benchmark.py --bd /tmp/bench.db --lactantes 100000 --citas 1000000 \
+#          --controles 500000 --auditoria 5000000 --solicitudes 200 --concurrencia 4 \
+#          --salida resultados.json [--base resultados_anteriores.json]
+
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# ruta de `urls` -> escenarios (rol, método, ruta, datos, escritura). Los {marcadores}
+# se reemplazan en cada solicitud con ids reales de la base sintética; datos puede
+# ser un dict (formulario), ('json', dict) o ('csv', texto) para /api/importar. En
+# JSON, un valor que es sólo un marcador conserva su tipo (los ids quedan numéricos).
+# Un formulario que escribe debe responder 303: un 200 es el formulario devuelto con
+# un error (p. ej. un empalme de citas) y cuenta como falla.
+ESCENARIOS = {
+    '/': [(None, 'GET', '/', None, False)],
+    '/login': [(None, 'POST', '/login', {'username': 'María López', 'password': 'pass123'}, False)],
+    '/logout': [(None, 'GET', '/logout', None, False)],
+    '/administrador': [('Administrador', 'GET', '/administrador', None, False)],
+    '/administrador_registrar_usuario': [
+        ('Administrador', 'GET', '/administrador_registrar_usuario', None, False),
+        ('Administrador', 'POST', '/administrador_registrar_usuario',
+         {'nombre': 'Usuario Bench {n}', 'num_telefono': 'bench-{n}', 'contrasena': 'x', 'id_rol': '2'}, True),
+    ],
+    '/administrador_ver_usuarios': [('Administrador', 'GET', '/administrador_ver_usuarios', None, False)],
+    '/borrar_cita/(.*)': [('Administrador', 'POST', '/borrar_cita/{cita_desechable}', {}, True)],
+    '/borrar_usuario/(.*)': [('Administrador', 'POST', '/borrar_usuario/{usuario_desechable}', {}, True)],
+    '/editar_usuario/(.*)': [('Administrador', 'GET', '/editar_usuario/{usuario}', None, False)],
+    '/editar_cita/(.*)': [
+        ('Enfermera', 'GET', '/editar_cita/{cita}', None, False),
+        ('Enfermera', 'POST', '/editar_cita/{cita}', {'justificacion': 'Benchmark {n}'}, True),
+    ],
+    '/editar_lactante/(.*)': [('Enfermera', 'GET', '/editar_lactante/{lactante}', None, False)],
+    '/enfermeras': [('Enfermera', 'GET', '/enfermeras', None, False)],
+    '/registro_citas': [
+        ('Enfermera', 'GET', '/registro_citas', None, False),
+        ('Enfermera', 'POST', '/registro_citas', {'buscar': '1', 'id_madre': '{madre}'}, False),
+        ('Enfermera', 'POST', '/registro_citas', {'id_madre': '{madre}', 'id_lactante': '{lactante}', 'motivo': '1',
+                                                  'fecha_cita': '{fecha_libre}', 'hora_cita': '{hora_libre}'}, True),
+    ],
+    '/registro_lactantes': [
+        ('Enfermera', 'GET', '/registro_lactantes', None, False),
+        ('Enfermera', 'POST', '/registro_lactantes', {'apellido_paterno_lactante': 'Bench', 'fecha_nacimiento_lactante': '2025-01-01',
+                                                      'genero_lactante': 'F', 'area_lactante': 'UCIN', 'nombre_madre': 'Madre',
+                                                      'apellido_paterno_madre': 'Bench', 'apellido_materno_madre': '{n}'}, True),
+    ],
+    '/reportes': [('Enfermera', 'GET', '/reportes', None, False)],
+    '/reportes_generales': [
+        ('Enfermera', 'GET', '/reportes_generales', None, False),
+        ('Enfermera', 'POST', '/reportes_generales', {'reporte': 'lactantes_area', 'formato': 'pdf', 'id_area': '{area}'}, False),
+        ('Enfermera', 'POST', '/reportes_generales', {'formato': 'excel'}, False),
+        ('Enfermera', 'POST', '/reportes_generales', {'datos': 'citas', 'formato': 'csv'}, False),
+    ],
+    '/reportes_por_lactante': [
+        ('Enfermera', 'GET', '/reportes_por_lactante', None, False),
+        ('Enfermera', 'POST', '/reportes_por_lactante', {'id_lactante': '{lactante}'}, False),
+    ],
+    '/reportes_pdf/([0-9a-f]{40})': [('Enfermera', 'GET', '/reportes_pdf/{pdf}', None, False)],
+    '/visualizacion_citas': [('Enfermera', 'GET', '/visualizacion_citas', None, False)],
+    '/agenda': [
+        ('Enfermera', 'GET', '/agenda', None, False),
+        ('Enfermera', 'GET', '/agenda?vista=dia&enfermera={usuario}', None, False),
+    ],
+    '/visualizacion_lactantes': [('Enfermera', 'GET', '/visualizacion_lactantes', None, False)],
+    '/visualizacion_usuarios': [('Administrador', 'GET', '/visualizacion_usuarios', None, False)],
+    '/api/generate_report': [
+        ('Administrador', 'POST', '/api/generate_report', ('json', {'reportType': 'estadistica'}), False),
+        ('Administrador', 'POST', '/api/generate_report', ('json', {'reportType': 'federal'}), False),
+    ],
+    '/api/reportes/citas': [
+        ('Administrador', 'GET', '/api/reportes/citas', None, False),
+        ('Administrador', 'GET', '/api/reportes/citas?periodo=dia&por=area,motivo&desde=2025-01-01&hasta=2025-12-31', None, False),
+    ],
+    '/api/metricas': [('Administrador', 'GET', '/api/metricas', None, False)],
+    '/api/consultas_lentas': [
+        ('Administrador', 'GET', '/api/consultas_lentas', None, False),
+        ('Administrador', 'GET', '/api/consultas_lentas?n=200&orden=total', None, False),
+    ],
+    '/metrics': [(None, 'GET', '/metrics', None, False)],
+    '/api/lactantes': [('Enfermera', 'GET', '/api/lactantes?limite=50', None, False)],
+    '/api/citas': [('Enfermera', 'GET', '/api/citas?limite=50', None, False)],
+    r'/api/lactantes/(\d+)/linea_tiempo': [
+        ('Enfermera', 'GET', '/api/lactantes/{lactante}/linea_tiempo', None, False),
+        ('Enfermera', 'GET', '/api/lactantes/{lactante}/linea_tiempo?limite=200', None, False),
+    ],
+    '/api/agenda': [('Enfermera', 'GET', '/api/agenda?vista=semana&fecha={hoy}', None, False)],
+    '/api/agenda/carga': [('Enfermera', 'GET', '/api/agenda/carga?desde={hoy}', None, False)],
+    '/api/agenda/empalmes': [('Enfermera', 'GET', '/api/agenda/empalmes?fecha={hoy}&hora=10:00&id_lactante={lactante}&id_usuario={usuario}',
+                              None, False)],
+    '/api/madres/duplicados': [('Administrador', 'GET', '/api/madres/duplicados?limite=100', None, False)],
+    '/api/madres/fusionar': [('Administrador', 'POST', '/api/madres/fusionar',
+                              ('json', {'id_conservar': '{madre_final}', 'ids': ['{madre_desechable}']}), True)],
+    '/api/buscar': [('Enfermera', 'GET', '/api/buscar?q={prefijo}', None, False)],
+    '/api/sync': [
+        ('Enfermera', 'GET', '/api/sync?since=0&limite=500', None, False),
+        ('Enfermera', 'POST', '/api/sync', ('json', {'id_lote': 'bench-{n}', 'cambios': [
+            {'tabla': 'Lactantes', 'operacion': 'actualizar', 'id': '{lactante}', 'datos': {'peso': 3.2}},
+            {'tabla': 'Controles', 'operacion': 'insertar', 'datos': {'id_lactantes': '{lactante}', 'peso': 4.1, 'talla': 52,
+                                                                      'edad_meses': 1, 'estado_general': 'Bueno'}},
+        ]}), True),
+    ],
+    '/api/importar': [('Administrador', 'POST', '/api/importar',
+                       ('csv', "id_lactante,fecha_cita,hora_cita,motivo\n{lactante},2025-06-01,09:00,1\n"), True)],
+    r'/api/crecimiento/lactante/(\d+)': [('Enfermera', 'GET', '/api/crecimiento/lactante/{lactante}', None, False)],
+    r'/api/crecimiento/area/(\d+)': [('Enfermera', 'GET', '/api/crecimiento/area/{area}', None, False)],
+    r'/api/trabajos/(\d+)': [('Administrador', 'GET', '/api/trabajos/{trabajo}', None, False)],
+    r'/api/trabajos/(\d+)/resultado': [('Administrador', 'GET', '/api/trabajos/{trabajo}/resultado', None, False)],
+    '/static/(.*)': [(None, 'GET', '/static/form_helpers.js', None, False)],
+    '/eliminar_lactante/(.*)': [('Enfermera', 'GET', '/eliminar_lactante/{lactante_desechable}', None, True)],
+}
+
+# Horarios para citas nuevas sin empalmes: turnos seguidos de la duración de una cita a partir
+# de esta fecha, uno distinto por solicitud
+INICIO_CITAS_LIBRES = datetime.datetime(2040, 1, 1, 8, 0)
+TURNOS_CITAS_LIBRES = 200000
+
+PREFIJOS = ("her", "gar", "mar", "lop", "gonz", "per", "rod", "san", "ram", "cru", "flo", "gom", "maria jos", "ana r")
+
+
+def rutas_sin_escenario(urls):
+    """Patrones de `urls` que no tienen escenario en ESCENARIOS."""
+    return [urls[i] for i in range(0, len(urls), 2) if urls[i] not in ESCENARIOS]
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ordenada."""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100.0 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def rellenar(valor, valores):
+    """Reemplaza los {marcadores} dentro de un cuerpo JSON (dicts, listas y textos)."""
+    if isinstance(valor, dict):
+        return {llave: rellenar(v, valores) for llave, v in valor.items()}
+    if isinstance(valor, list):
+        return [rellenar(v, valores) for v in valor]
+    if isinstance(valor, str):
+        if valor.startswith('{') and valor.endswith('}') and valor[1:-1] in valores:
+            return valores[valor[1:-1]]
+        return valor.format_map(valores)
+    return valor
+
+
+def rss_actual_kb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def rss_maximo_kb():
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB; macOS en bytes
+    return maximo // 1024 if sys.platform == 'darwin' else maximo
+
+
+class Muestras:
+    """Ids reales (muestra fija que se recorre en ciclo) para los marcadores de las rutas."""
+
+    def __init__(self, conn, cantidad=200, semilla=1, minutos_turno=30):
+        azar = random.Random(semilla)
+        self.minutos_turno = minutos_turno
+
+        def muestra(sql):
+            ids = [fila[0] for fila in conn.execute(sql)]
+            return azar.sample(ids, min(cantidad, len(ids))) or [0]
+
+        self._ciclos = {
+            'lactante': itertools.cycle(muestra("SELECT id_lactantes FROM Lactantes")),
+            'cita': itertools.cycle(muestra("SELECT id_citas FROM Citas")),
+            'madre': itertools.cycle(muestra("SELECT id_madre FROM Madres")),
+            'usuario': itertools.cycle(muestra("SELECT id_usuario FROM Usuarios")),
+            'area': itertools.cycle(muestra("SELECT id_area FROM Area")),
+            'prefijo': itertools.cycle(PREFIJOS),
+        }
+        self._lock = threading.Lock()
+        self._contador = itertools.count(int(time.time()))
+        # Las fusiones de madres desechables se hacen sobre la última madre registrada
+        self.madre_final = conn.execute("SELECT MAX(id_madre) FROM Madres").fetchone()[0] or 0
+        self.trabajo = 0
+        self.pdf = ''
+
+    def valores(self):
+        with self._lock:
+            n = next(self._contador)
+            valores = {nombre: next(ciclo) for nombre, ciclo in self._ciclos.items()}
+            inicio = INICIO_CITAS_LIBRES + datetime.timedelta(minutes=n % TURNOS_CITAS_LIBRES * self.minutos_turno)
+            valores.update(fecha_libre=inicio.strftime('%Y-%m-%d'), hora_libre=inicio.strftime('%H:%M'))
+            valores.update(n=n, trabajo=self.trabajo, pdf=self.pdf, madre_final=self.madre_final,
+                           hoy=time.strftime('%Y-%m-%d'))
+            return valores
+
+
+class Benchmark:
+    def __init__(self, modulo, conn, args):
+        self.modulo = modulo
+        self.application = modulo.application
+        self.conn = conn
+        self.args = args
+        self.muestras = Muestras(conn, semilla=args.semilla, minutos_turno=modulo.DURACION_CITA)
+        self.cookies = {}
+        self._desechados = {'cita': 0, 'lactante': 0, 'usuario': 0, 'madre': 0}
+        self._lock = threading.Lock()
+
+    # --- Solicitudes WSGI en proceso ---
+    def solicitar(self, metodo, ruta, datos=None, cookie=None):
+        ruta, _, consulta = ruta.partition('?')
+        cuerpo, tipo = b'', None
+        if isinstance(datos, tuple) and datos[0] == 'json':
+            cuerpo, tipo = json.dumps(datos[1]).encode(), 'application/json'
+        elif isinstance(datos, tuple) and datos[0] == 'csv':
+            limite = 'benchmark'
+            cuerpo = (f'--{limite}\r\nContent-Disposition: form-data; name="datos"\r\n\r\ncitas\r\n'
+                      f'--{limite}\r\nContent-Disposition: form-data; name="archivo"; filename="bench.csv"\r\n'
+                      f'Content-Type: text/csv\r\n\r\n{datos[1]}\r\n--{limite}--\r\n').encode()
+            tipo = f'multipart/form-data; boundary={limite}'
+        elif datos is not None:
+            cuerpo, tipo = urlencode(datos).encode(), 'application/x-www-form-urlencoded'
+        entorno = {
+            'REQUEST_METHOD': metodo, 'PATH_INFO': ruta, 'QUERY_STRING': consulta, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '8080', 'HTTP_HOST': 'localhost:8080',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1', 'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(cuerpo), 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(cuerpo)), 'HTTP_ACCEPT_ENCODING': 'gzip',
+        }
+        if tipo:
+            entorno['CONTENT_TYPE'] = tipo
+        if cookie:
+            entorno['HTTP_COOKIE'] = cookie
+        respuesta = {}
+
+        def start_response(estado, encabezados, exc_info=None):
+            respuesta['estado'] = estado
+            respuesta['encabezados'] = encabezados
+
+        iterable = self.application(entorno, start_response)
+        try:
+            tamano = sum(len(bloque) for bloque in iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return respuesta['estado'], respuesta['encabezados'], tamano
+
+    def iniciar_sesiones(self):
+        for rol, usuario, contrasena in (('Administrador', 'Admin', '12345'), ('Enfermera', 'María López', 'pass123')):
+            estado, encabezados, _ = self.solicitar('POST', '/login', {'username': usuario, 'password': contrasena})
+            cookie = dict(encabezados).get('Set-Cookie', '').split(';')[0]
+            if not estado.startswith('303') or not cookie:
+                raise RuntimeError(f"No se pudo iniciar sesión como {rol}: {estado}")
+            self.cookies[rol] = cookie
+
+    def preparar_trabajo(self):
+        """Crea un trabajo de reporte asíncrono para las rutas /api/trabajos/..."""
+        estado, _, _ = self.solicitar('POST', '/api/generate_report', ('json', {'reportType': 'estadistica', 'async': True}),
+                                      self.cookies['Administrador'])
+        fila = self.conn.execute("SELECT MAX(id_trabajo) FROM TrabajosReporte").fetchone()
+        self.muestras.trabajo = fila[0] or 0
+        limite = time.monotonic() + 60
+        while time.monotonic() < limite:
+            estado_trabajo = self.conn.execute("SELECT estado FROM TrabajosReporte WHERE id_trabajo = ?",
+                                               (self.muestras.trabajo,)).fetchone()
+            if not estado_trabajo or estado_trabajo[0] in ('terminado', 'error'):
+                break
+            time.sleep(0.2)
+
+    def preparar_pdf(self):
+        """Genera un PDF (padrón de un área) para la ruta /reportes_pdf/..."""
+        pdfs = self.modulo.pdfs
+        id_area = self.conn.execute("SELECT MIN(id_area) FROM Area").fetchone()[0]
+        with self.modulo.replica.conexion() as lectura:
+            llave, futuro = pdfs.solicitar(lectura, 'lactantes_area', {'id_area': id_area})
+        estado = pdfs.esperar(llave, futuro, 600)
+        if estado != 'terminado':
+            raise RuntimeError(f"No se pudo generar el PDF de prueba: {estado}")
+        self.muestras.pdf = llave
+
+    def _desechable(self, tipo):
+        # Cada borrado usa un id nuevo (el siguiente al último usado) para no repetir 404s
+        consultas = {
+            'cita': "SELECT MIN(id_citas) FROM Citas WHERE id_citas > ?",
+            'lactante': "SELECT MIN(id_lactantes) FROM Lactantes WHERE id_lactantes > ?",
+            'usuario': "SELECT MIN(id_usuario) FROM Usuarios WHERE nombre LIKE 'Usuario Bench %' AND id_usuario > ?",
+            'madre': "SELECT MIN(id_madre) FROM Madres WHERE nombre <> 'Desconocida' AND id_madre > ?",
+        }
+        with self._lock:
+            fila = self.conn.execute(consultas[tipo], (self._desechados[tipo],)).fetchone()
+            self._desechados[tipo] = fila[0] or self._desechados[tipo]
+            return fila[0] or 0
+
+    def _preparar(self, escenario):
+        rol, metodo, ruta, datos, _escritura = escenario
+        valores = self.muestras.valores()
+        for tipo in ('cita', 'lactante', 'usuario', 'madre'):
+            if '{%s_desechable}' % tipo in ruta + repr(datos):
+                valores[f'{tipo}_desechable'] = self._desechable(tipo)
+        ruta = ruta.format_map(valores)
+        if isinstance(datos, dict):
+            datos = {k: v.format_map(valores) for k, v in datos.items()}
+        elif isinstance(datos, tuple) and datos[0] == 'csv':
+            datos = ('csv', datos[1].format_map(valores))
+        elif isinstance(datos, tuple) and datos[0] == 'json':
+            datos = ('json', rellenar(datos[1], valores))
+        return metodo, ruta, datos, self.cookies.get(rol)
+
+    def medir(self, escenario):
+        solicitudes, concurrencia = self.args.solicitudes, self.args.concurrencia
+        for _ in range(self.args.calentamiento):
+            self.solicitar(*self._preparar(escenario))
+
+        estados = {}
+        latencias = []
+        bytes_totales = [0]
+        lock = threading.Lock()
+
+        def una(_):
+            preparada = self._preparar(escenario)
+            inicio = time.perf_counter()
+            try:
+                estado, _, tamano = self.solicitar(*preparada)
+                codigo = estado.split(' ')[0]
+            except Exception as e:
+                codigo, tamano = f"excepcion:{type(e).__name__}", 0
+            duracion = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracion)
+                estados[codigo] = estados.get(codigo, 0) + 1
+                bytes_totales[0] += tamano
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+            list(ejecutor.map(una, range(solicitudes)))
+        total = time.perf_counter() - inicio
+
+        latencias.sort()
+        if escenario[4] and not isinstance(escenario[3], tuple):
+            errores = sum(n for codigo, n in estados.items() if codigo != '303')
+        else:
+            errores = sum(n for codigo, n in estados.items() if not codigo[:1] in ('2', '3'))
+        return {
+            "rol": escenario[0],
+            "metodo": escenario[1],
+            "ruta": escenario[2],
+            "solicitudes": solicitudes,
+            "concurrencia": concurrencia,
+            "estados": estados,
+            "errores": errores,
+            "p50_ms": round(percentil(latencias, 50) * 1000, 3),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 3),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 3),
+            "media_ms": round(sum(latencias) / len(latencias) * 1000, 3),
+            "max_ms": round(latencias[-1] * 1000, 3),
+            "solicitudes_por_segundo": round(solicitudes / total, 2),
+            "bytes_promedio": bytes_totales[0] // solicitudes,
+            "rss_kb": rss_actual_kb(),
+            "rss_max_kb": rss_maximo_kb(),
+        }
+
+    def correr(self):
+        urls = self.modulo.urls
+        patrones = [urls[i] for i in range(0, len(urls), 2)]
+        filtro = set(self.args.rutas.split(',')) if self.args.rutas else None
+        resultados = {}
+        # Primero las lecturas: los escenarios que escriben o borran alteran los datos
+        for escritura in (False, True):
+            if escritura and not self.args.incluir_escrituras:
+                continue
+            for patron in patrones:
+                if filtro and patron not in filtro:
+                    continue
+                for escenario in ESCENARIOS.get(patron, []):
+                    if escenario[4] != escritura:
+                        continue
+                    llave = f"{escenario[1]} {escenario[2]}" + (f" {json.dumps(escenario[3], ensure_ascii=False)}" if escenario[3] else "")
+                    resultados[llave] = dict(self.medir(escenario), patron=patron)
+                    r = resultados[llave]
+                    print(f"{llave[:90]:<90} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+                          f"{r['solicitudes_por_segundo']:>8.1f} sol/s  errores {r['errores']}", file=sys.stderr)
+        return resultados
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de (llave, p95 base, p95 actual, cambio) de las rutas que empeoraron más que `tolerancia`."""
+    regresiones = []
+    for llave, resultado in actual.items():
+        anterior = base.get(llave)
+        if not anterior or not anterior.get('p95_ms'):
+            continue
+        cambio = resultado['p95_ms'] / anterior['p95_ms'] - 1
+        if cambio > tolerancia:
+            regresiones.append((llave, anterior['p95_ms'], resultado['p95_ms'], round(cambio, 4)))
+    return regresiones
+
+
+def construir_parser():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo de Vínculo de Vida.")
+    parser.add_argument('--bd', default=os.path.join(DIRECTORIO, 'benchmark.db'),
+                        help="Base de datos sintética (se crea si no existe; por defecto: %(default)s)")
+    parser.add_argument('--lactantes', type=int, default=100000)
+    parser.add_argument('--citas', type=int, default=1000000)
+    parser.add_argument('--controles', type=int, default=500000)
+    parser.add_argument('--auditoria', type=int, default=5000000)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--solicitudes', type=int, default=100, help="Solicitudes medidas por escenario.")
+    parser.add_argument('--concurrencia', type=int, default=4, help="Hilos que envían solicitudes a la vez.")
+    parser.add_argument('--calentamiento', type=int, default=3, help="Solicitudes previas no medidas por escenario.")
+    parser.add_argument('--rutas', help="Sólo estos patrones de `urls`, separados por comas.")
+    parser.add_argument('--incluir-escrituras', action='store_true', help="Mide también los escenarios que insertan o borran.")
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto se escribe en la salida estándar).")
+    parser.add_argument('--base', help="Resultados anteriores (JSON) contra los que se compara el p95.")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Aumento de p95 aceptado frente a --base (por defecto: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    ruta_bd = os.path.abspath(args.bd)
+    # La aplicación se importa contra la base sintética y con sesiones propias
+    os.environ['VINCULO_BD'] = ruta_bd
+    os.environ.setdefault('VINCULO_SESIONES_BD', ruta_bd + '.sesiones')
+    os.environ.setdefault('VINCULO_REPLICA', ruta_bd + '.replica')
+    os.chdir(DIRECTORIO)
+    sys.path.insert(0, DIRECTORIO)
+
+    inicio = time.perf_counter()
+    import app as modulo
+    arranque = time.perf_counter() - inicio
+
+    # Toda ruta nueva debe traer su escenario: se falla antes de generar datos o medir
+    sin_escenario = rutas_sin_escenario(modulo.urls)
+    if sin_escenario:
+        for patron in sin_escenario:
+            print(f"SIN ESCENARIO: {patron}", file=sys.stderr)
+        modulo.cola_trabajos.cerrar()
+        return 2
+
+    import datos_sinteticos
+    from conexiones import abrir_conexion
+    conn = abrir_conexion(ruta_bd)
+    if conn.execute("SELECT COUNT(*) FROM Lactantes").fetchone()[0] < args.lactantes:
+        print(f"Generando datos sintéticos en {ruta_bd}...", file=sys.stderr)
+        datos_sinteticos.generar(conn, lactantes=args.lactantes, citas=args.citas, controles=args.controles,
+                                 auditoria=args.auditoria, semilla=args.semilla,
+                                 progreso=lambda mensaje: print(mensaje, file=sys.stderr))
+
+    benchmark = Benchmark(modulo, conn, args)
+    benchmark.iniciar_sesiones()
+    benchmark.preparar_trabajo()
+    benchmark.preparar_pdf()
+    resultados = benchmark.correr()
+    conteos = {tabla: conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+               for tabla in ('Madres', 'Lactantes', 'Citas', 'Controles', 'Auditoria')}
+    salida = {
+        "fecha": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ('salida', 'base')},
+        "datos": conteos,
+        "arranque_ms": round(arranque * 1000, 1),
+        "rss_max_kb": rss_maximo_kb(),
+        "rutas": resultados,
+    }
+    codigo = 0
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            regresiones = comparar(resultados, json.load(f).get('rutas', {}), args.tolerancia)
+        salida["regresiones"] = [dict(zip(('ruta', 'p95_base_ms', 'p95_ms', 'cambio'), r)) for r in regresiones]
+        for llave, antes, despues, cambio in regresiones:
+            print(f"REGRESIÓN {llave}: p95 {antes} ms -> {despues} ms (+{cambio:.0%})", file=sys.stderr)
+        codigo = 1 if regresiones else 0
+
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        print(texto)
+    modulo.cola_trabajos.cerrar()
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
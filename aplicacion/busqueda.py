@@ -0,0 +1,92 @@
+
+# busqueda.py
+# Búsqueda por nombre de madres y lactantes con índices FTS5 de contenido
+# externo. Los triggers mantienen los índices al día; el tokenizador ignora
+# mayúsculas y acentos ("Pérez" = "perez") y cada palabra se busca por prefijo.
+
+import re
+
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+
+# tabla FTS -> (tabla de origen, llave, columnas indexadas)
+INDICES = {
+    'BusquedaMadres': ('Madres', 'id_madre', ('nombre', 'apellido_paterno', 'apellido_materno')),
+    'BusquedaLactantes': ('Lactantes', 'id_lactantes', ('apellido_paterno', 'apellido_materno')),
+}
+
+
+def crear_indices(conn):
+    """Crea las tablas FTS5, sus triggers y las llena con los datos existentes (no hace commit)."""
+    for fts, (tabla, llave, columnas) in INDICES.items():
+        lista = ', '.join(columnas)
+        nuevos = ', '.join(f"NEW.{c}" for c in columnas)
+        viejos = ', '.join(f"OLD.{c}" for c in columnas)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {lista}, content='{tabla}', content_rowid='{llave}',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            );
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_ins AFTER INSERT ON {tabla} BEGIN
+                INSERT INTO {fts} (rowid, {lista}) VALUES (NEW.{llave}, {nuevos});
+            END;
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_del AFTER DELETE ON {tabla} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', OLD.{llave}, {viejos});
+            END;
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_upd AFTER UPDATE OF {lista} ON {tabla} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', OLD.{llave}, {viejos});
+                INSERT INTO {fts} (rowid, {lista}) VALUES (NEW.{llave}, {nuevos});
+            END;
+        """)
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild');")
+
+
+def consulta_fts(texto):
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura: cada palabra por prefijo."""
+    palabras = re.findall(r"\w+", texto or "")
+    if not palabras:
+        return None
+    return " ".join(f'"{palabra}"*' for palabra in palabras[:8])
+
+
+def leer_limite(valor):
+    try:
+        return max(1, min(int(valor), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_POR_DEFECTO
+
+
+def buscar_madres(conn, texto, limite=LIMITE_POR_DEFECTO):
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return []
+    return conn.execute("""
+        SELECT m.id_madre, m.nombre, m.apellido_paterno, m.apellido_materno
+        FROM BusquedaMadres b
+        JOIN Madres m ON m.id_madre = b.rowid
+        WHERE BusquedaMadres MATCH ?
+        ORDER BY b.rank
+        LIMIT ?
+    """, (consulta, limite)).fetchall()
+
+
+def buscar_lactantes(conn, texto, limite=LIMITE_POR_DEFECTO):
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return []
+    return conn.execute("""
+        SELECT l.id_lactantes, l.apellido_paterno, l.apellido_materno, l.fecha_nacimiento, l.genero,
+               l.id_madres, m.nombre AS nombre_madre
+        FROM BusquedaLactantes b
+        JOIN Lactantes l ON l.id_lactantes = b.rowid
+        LEFT JOIN Madres m ON m.id_madre = l.id_madres
+        WHERE BusquedaLactantes MATCH ?
+        ORDER BY b.rank
+        LIMIT ?
+    """, (consulta, limite)).fetchall()
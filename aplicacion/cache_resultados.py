@@ -0,0 +1,83 @@
+
+# cache_resultados.py
+# Caché en memoria (por proceso) para resultados de reportes. Cada entrada se
+# guarda junto con la versión de las tablas de las que depende (tabla
+# VersionDatos, mantenida por triggers); si alguna cambió, la entrada se descarta.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def leer_versiones(conn, tablas):
+    """Devuelve la versión actual de cada tabla como una tupla comparable."""
+    marcadores = ", ".join("?" for _ in tablas)
+    filas = conn.execute(f"SELECT tabla, version FROM VersionDatos WHERE tabla IN ({marcadores})", tuple(tablas)).fetchall()
+    return tuple(sorted((fila[0], fila[1]) for fila in filas))
+
+
+class CacheResultados:
+    """Caché LRU con TTL cuyas entradas se invalidan cuando cambian las tablas de origen."""
+
+    def __init__(self, max_entradas=256, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidados = 0
+        self._expirados = 0
+        self._desalojos = 0
+
+    def obtener(self, conn, clave, tablas, calcular):
+        """Devuelve el valor guardado para `clave` o lo calcula con `calcular()` si no es vigente."""
+        # La versión se lee antes de calcular: si hay una escritura en medio, la
+        # siguiente consulta verá otra versión y recalculará (nunca se sirve un dato viejo)
+        return self.obtener_version(clave, leer_versiones(conn, tablas), calcular)
+
+    def obtener_version(self, clave, version, calcular):
+        """Como obtener(), con una `version` ya calculada (p. ej. la de un solo lactante)."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                valor, version_guardada, expira = entrada
+                if version_guardada == version and expira > ahora:
+                    self._datos.move_to_end(clave)
+                    self._aciertos += 1
+                    return valor
+                if version_guardada != version:
+                    self._invalidados += 1
+                else:
+                    self._expirados += 1
+                del self._datos[clave]
+            self._fallos += 1
+
+        valor = calcular()
+        with self._lock:
+            self._datos[clave] = (valor, version, ahora + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self._desalojos += 1
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "aciertos": self._aciertos,
+                "fallos": self._fallos,
+                "tasa_aciertos": round(self._aciertos / consultas, 4) if consultas else 0.0,
+                "invalidados": self._invalidados,
+                "expirados": self._expirados,
+                "desalojos": self._desalojos,
+            }
@@ -0,0 +1,53 @@
+
+# catalogos.py
+# Datos de referencia (Rol, Area, Motivo) en memoria del proceso. Los
+# formularios y las búsquedas nombre -> id se sirven desde aquí; las tablas
+# están versionadas en VersionDatos, así que cualquier escritura invalida la copia.
+
+from cache_resultados import CacheResultados
+
+CONSULTAS = {
+    'Rol': "SELECT id_rol, nombre FROM Rol ORDER BY id_rol",
+    'Area': "SELECT id_area, nombre FROM Area ORDER BY id_area",
+    'Motivo': "SELECT id_motivo, nombre FROM Motivo ORDER BY id_motivo",
+}
+
+
+class Catalogo:
+    """Filas (id, nombre) de una tabla de referencia más su índice por nombre."""
+
+    def __init__(self, filas):
+        self.filas = tuple(filas)
+        self.por_nombre = {fila[1]: fila[0] for fila in self.filas}
+
+
+class Catalogos:
+    def __init__(self, ttl=3600):
+        self._cache = CacheResultados(max_entradas=len(CONSULTAS), ttl=ttl)
+
+    def obtener(self, conn, tabla):
+        return self._cache.obtener(conn, ('catalogo', tabla), (tabla,),
+                                   lambda: Catalogo(conn.execute(CONSULTAS[tabla]).fetchall()))
+
+    def filas(self, conn, tabla, excluir=None):
+        """Filas para un <select>; `excluir` omite el id que ya aparece como opción actual."""
+        filas = self.obtener(conn, tabla).filas
+        if excluir is None:
+            return filas
+        return tuple(fila for fila in filas if fila[0] != excluir)
+
+    def roles(self, conn, excluir=None):
+        return self.filas(conn, 'Rol', excluir)
+
+    def areas(self, conn, excluir=None):
+        return self.filas(conn, 'Area', excluir)
+
+    def motivos(self, conn, excluir=None):
+        return self.filas(conn, 'Motivo', excluir)
+
+    def id_por_nombre(self, conn, tabla, nombre):
+        """Id de la fila con ese nombre o None si no existe."""
+        return self.obtener(conn, tabla).por_nombre.get(nombre)
+
+    def estadisticas(self):
+        return self._cache.estadisticas()
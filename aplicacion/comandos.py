@@ -0,0 +1,277 @@
+
+# comandos.py
+# Tareas de mantenimiento desde la línea de comandos.
+# Uso: python comandos.py <comando> [opciones]   (ver: python comandos.py -h)
+
+import argparse
+import functools
+import os
+import sys
+
+import archivo_historico
+import arranque
+from conexiones import abrir_conexion
+from migraciones import aplicar_migraciones, preparar_base
+import estadisticas
+import importaciones
+import madres_duplicadas
+import reportes_pdf
+import resumen_diario
+from replica import ReplicaReportes
+
+DB_FILE = 'vinculo_de_vida.db'
+
+
+def _archivo(args):
+    return archivo_historico.ArchivoHistorico(
+        args.directorio_archivo or os.path.join(os.path.dirname(os.path.abspath(args.bd)), 'archivo'))
+
+
+def con_esquema(funcion):
+    """Aplica las migraciones pendientes (y los datos iniciales) antes de un comando que usa la base."""
+    @functools.wraps(funcion)
+    def envoltura(conn, args):
+        preparar_base(conn)
+        return funcion(conn, args)
+    return envoltura
+
+
+def cmd_migrar(conn, args):
+    aplicadas = aplicar_migraciones(conn)
+    print(f"Migraciones aplicadas: {', '.join(map(str, aplicadas)) or 'ninguna'}")
+    return 0
+
+
+@con_esquema
+def cmd_estadisticas(conn, args):
+    diferencias = estadisticas.verificar(conn)
+    for tabla, dimension, valor, guardado, real in diferencias:
+        etiqueta = f"{dimension}={valor}" if dimension else "total"
+        print(f"{tabla} [{etiqueta}]: guardado {guardado}, real {real}")
+    if args.accion == 'reconstruir':
+        estadisticas.reconstruir(conn)
+        conn.commit()
+        print(f"Estadísticas reconstruidas ({len(diferencias)} diferencias corregidas).")
+        return 0
+    print("Sin diferencias." if not diferencias else f"{len(diferencias)} diferencias encontradas.")
+    return 1 if diferencias else 0
+
+
+@con_esquema
+def cmd_resumenes(conn, args):
+    if args.accion == 'actualizar':
+        procesadas = resumen_diario.ResumenDiario(args.lote).actualizar(conn)
+        print(f"Resúmenes al día ({procesadas} cambios incorporados, versión {resumen_diario.version_procesada(conn)}).")
+        return 0
+    # Los conteos incluyen las citas archivadas
+    origen = archivo_historico.TABLAS['Citas']['vista']
+    _archivo(args).adjuntar(conn)
+    if args.accion == 'reconstruir':
+        total = resumen_diario.reconstruir(conn, args.desde, args.hasta, origen)
+        conn.commit()
+        print(f"Resúmenes reconstruidos con {total} citas.")
+        return 0
+    diferencias = resumen_diario.verificar(conn, args.desde, args.hasta, origen)
+    for dia, id_area, id_motivo, genero, subsecuente, guardado, real in diferencias[:50]:
+        print(f"{dia} área {id_area} motivo {id_motivo} género '{genero}' subsecuente {subsecuente}: "
+              f"guardado {guardado}, real {real}")
+    print("Sin diferencias." if not diferencias else f"{len(diferencias)} diferencias encontradas.")
+    return 1 if diferencias else 0
+
+
+@con_esquema
+def cmd_archivar(conn, args):
+    archivo = _archivo(args)
+    movidas = archivo.archivar(conn, args.horizonte_dias, args.lote, resumen_diario.ResumenDiario())
+    print(f"Archivadas {movidas['Citas']} citas y {movidas['Auditoria']} eventos de auditoría anteriores a "
+          f"{args.horizonte_dias} días en {archivo.directorio} ({archivo.estadisticas()['ultima_duracion_s']} s).")
+    for tabla, anio, filas in conn.execute("SELECT tabla, anio, filas FROM ArchivoHistorico ORDER BY tabla, anio"):
+        print(f"  {tabla} {anio}: {filas}")
+    if args.compactar and any(movidas.values()):
+        # Devuelve al sistema el espacio que dejaron las filas movidas
+        conn.execute("VACUUM")
+        print("Base principal compactada.")
+    return 0
+
+
+@con_esquema
+def cmd_duplicados(conn, args):
+    detector = madres_duplicadas.DetectorDuplicados(umbral=args.umbral)
+    if args.accion == 'fusionar':
+        if args.conservar is None or not args.ids:
+            print("Indica --conservar y los ids de las madres a fusionar.")
+            return 2
+        try:
+            movidos = detector.fusionar(conn, args.conservar, args.ids)
+        except madres_duplicadas.FusionInvalida as e:
+            conn.rollback()
+            print(f"ERROR: {e}")
+            return 1
+        conn.execute("INSERT INTO Auditoria (accion, tabla_afectada) VALUES (?, ?)",
+                     (f"Fusión de madres {', '.join(map(str, sorted(set(args.ids) - {args.conservar})))} en {args.conservar}", "Madres"))
+        conn.commit()
+        print(f"Madres fusionadas en {args.conservar}; {movidos} lactantes movidos.")
+        return 0
+    grupos = detector.grupos(conn)
+    for grupo in detector.detalle(conn, grupos[:args.limite]):
+        print(f"Similitud {grupo['similitud']}:")
+        for madre in grupo['madres']:
+            print(f"  {madre['id_madre']:>7}  {madre['nombre']} {madre['apellido_paterno']} {madre['apellido_materno'] or ''}"
+                  f"  ({madre['lactantes']} lactantes)")
+    ultima = detector.estadisticas()['ultima_busqueda']
+    print(f"{len(grupos)} grupos entre {ultima['madres']} madres ({ultima['comparaciones']} comparaciones en "
+          f"{ultima['bloques']} bloques, {ultima['duracion_s']} s).")
+    return 1 if grupos else 0
+
+
+@con_esquema
+def cmd_pdf(conn, args):
+    try:
+        parametros = reportes_pdf.leer_parametros(args.reporte, vars(args))
+        reportes_pdf.comprobar(conn, args.reporte, parametros)
+    except (reportes_pdf.ParametrosInvalidos, reportes_pdf.RegistroInexistente) as e:
+        print(f"ERROR: {e}")
+        return 2
+    # El historial y la bitácora incluyen las citas archivadas
+    _archivo(args).adjuntar(conn)
+    resultado = reportes_pdf.generar(conn, args.reporte, parametros, args.salida)
+    print(f"{args.salida}: {resultado['paginas']} páginas, {resultado['filas']} filas.")
+    return 0
+
+
+@con_esquema
+def cmd_importar(conn, args):
+    formato = importaciones.formato_de(args.archivo, args.formato)
+    importador = importaciones.Importador(
+        conn, args.datos, tamano_lote=args.lote,
+        auditar=lambda c, accion, tabla: c.execute("INSERT INTO Auditoria (accion, tabla_afectada) VALUES (?, ?)", (accion, tabla)))
+    with open(args.archivo, 'rb') as archivo:
+        try:
+            filas = importaciones.leer_filas(archivo, formato)
+        except importaciones.ArchivoInvalido as e:
+            print(f"ERROR: {e}")
+            return 2
+        resumen = importador.importar(filas)
+    print(f"{resumen['leidas']} filas leídas, {resumen['insertadas']} insertadas ({resumen['madres_creadas']} madres nuevas), "
+          f"{resumen['omitidas']} omitidas, {resumen['con_error']} con error en {resumen['segundos']} s.")
+    if args.errores:
+        with open(args.errores, 'w', newline='', encoding='utf-8') as destino:
+            importaciones.escribir_errores(resumen, destino)
+    else:
+        for error in resumen['errores']:
+            print(f"  fila {error['fila']}: {error['error']}")
+    return 1 if resumen['con_error'] else 0
+
+
+@con_esquema
+def cmd_replica(conn, args):
+    replica = ReplicaReportes(args.bd, args.destino, paginas=args.paginas,
+                              preparar=resumen_diario.ResumenDiario().actualizar)
+    if not replica.refrescar():
+        print("Otro proceso está refrescando la réplica.")
+        return 1
+    estadisticas_replica = replica.estadisticas()
+    print(f"Réplica {args.destino} actualizada en {estadisticas_replica['ultima_duracion_s']} s "
+          f"({estadisticas_replica['reinicios_backup']} reinicios del backup).")
+    return 0
+
+
+def cmd_arranque(conn, args):
+    resultado = arranque.medir(os.path.dirname(os.path.abspath(__file__)), args.repeticiones)
+    for fase, ms in resultado['fases_ms'].items():
+        print(f"  {fase:<15} {ms:>8.1f} ms")
+    print(f"Arranque: {resultado['total_ms']} ms medidos en app, {resultado['import_app_ms']} ms de `import app` "
+          f"(mediana de {resultado['repeticiones']}); con base nueva {resultado['base_nueva_ms']} ms.")
+    fallas = []
+    if resultado['bibliotecas_cargadas']:
+        fallas.append(f"bibliotecas de reportes cargadas al arrancar: {', '.join(resultado['bibliotecas_cargadas'])}")
+    if args.limite_ms and resultado['import_app_ms'] > args.limite_ms:
+        fallas.append(f"`import app` tardó {resultado['import_app_ms']} ms (límite {args.limite_ms:g} ms)")
+    for falla in fallas:
+        print(f"ERROR: {falla}")
+    return 1 if fallas else 0
+
+
+def construir_parser():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos de Vínculo de Vida.")
+    parser.add_argument('--bd', default=DB_FILE, help="Ruta de la base de datos (por defecto: %(default)s)")
+    parser.add_argument('--directorio-archivo', help="Directorio de los archivos por año (por defecto: archivo/ junto a la base)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('migrar', help="Aplica las migraciones pendientes.")
+    p.set_defaults(funcion=cmd_migrar)
+
+    p = sub.add_parser('estadisticas', help="Verifica o reconstruye los contadores agregados.")
+    p.add_argument('accion', choices=['verificar', 'reconstruir'])
+    p.set_defaults(funcion=cmd_estadisticas)
+
+    p = sub.add_parser('resumenes', help="Actualiza, verifica o reconstruye (carga histórica) los resúmenes diarios de citas.")
+    p.add_argument('accion', choices=['actualizar', 'verificar', 'reconstruir'])
+    p.add_argument('--desde', help="Primer día (AAAA-MM-DD) a verificar o reconstruir.")
+    p.add_argument('--hasta', help="Último día (AAAA-MM-DD) a verificar o reconstruir.")
+    p.add_argument('--lote', type=int, default=resumen_diario.MAX_CAMBIOS_POR_LOTE,
+                   help="Cambios por transacción al actualizar (por defecto: %(default)s)")
+    p.set_defaults(funcion=cmd_resumenes)
+
+    p = sub.add_parser('archivar', help="Mueve citas y auditoría anteriores al horizonte a un archivo por año.")
+    p.add_argument('--horizonte-dias', type=int, default=int(os.environ.get('VINCULO_ARCHIVO_HORIZONTE_DIAS',
+                                                                          archivo_historico.HORIZONTE_POR_DEFECTO)),
+                   help="Se archiva lo anterior a este número de días (por defecto: %(default)s)")
+    p.add_argument('--lote', type=int, default=archivo_historico.MAX_FILAS_POR_LOTE,
+                   help="Filas por transacción (por defecto: %(default)s)")
+    p.add_argument('--compactar', action='store_true', help="Ejecuta VACUUM al terminar.")
+    p.set_defaults(funcion=cmd_archivar)
+
+    p = sub.add_parser('duplicados', help="Busca madres posiblemente duplicadas o fusiona un grupo (fusionar IDS... --conservar ID).")
+    p.add_argument('accion', choices=['buscar', 'fusionar'])
+    p.add_argument('ids', nargs='*', type=int, help="Madres a fusionar en --conservar.")
+    p.add_argument('--conservar', type=int, help="Madre que se conserva al fusionar.")
+    p.add_argument('--umbral', type=float, default=float(os.environ.get('VINCULO_DUPLICADOS_UMBRAL',
+                                                                        madres_duplicadas.UMBRAL_POR_DEFECTO)),
+                   help="Similitud mínima entre nombres, de 0 a 1 (por defecto: %(default)s)")
+    p.add_argument('--limite', type=int, default=100, help="Grupos mostrados (por defecto: %(default)s)")
+    p.set_defaults(funcion=cmd_duplicados)
+
+    p = sub.add_parser('pdf', help="Genera un reporte PDF de varias páginas.")
+    p.add_argument('reporte', choices=sorted(reportes_pdf.REPORTES))
+    p.add_argument('salida', help="Archivo PDF de salida.")
+    p.add_argument('--id-area', help="Área del padrón de lactantes (por defecto: todas).")
+    p.add_argument('--mes', help="Mes (AAAA-MM) de la bitácora de citas.")
+    p.add_argument('--id-lactante', help="Lactante del historial.")
+    p.set_defaults(funcion=cmd_pdf)
+
+    p = sub.add_parser('importar', help="Importa madres, lactantes o citas desde CSV o Excel.")
+    p.add_argument('datos', choices=sorted(importaciones.COLUMNAS))
+    p.add_argument('archivo')
+    p.add_argument('--formato', choices=importaciones.FORMATOS, help="Por defecto se toma de la extensión.")
+    p.add_argument('--lote', type=int, default=importaciones.TAMANO_LOTE, help="Filas por transacción (por defecto: %(default)s)")
+    p.add_argument('--errores', help="Guarda el reporte de errores por fila en este CSV.")
+    p.set_defaults(funcion=cmd_importar)
+
+    p = sub.add_parser('replica', help="Refresca la réplica de solo lectura para reportes.")
+    p.add_argument('--destino', default='replica_reportes.db', help="Archivo de la réplica (por defecto: %(default)s)")
+    p.add_argument('--paginas', type=int, default=512, help="Páginas copiadas por paso (por defecto: %(default)s)")
+    p.set_defaults(funcion=cmd_replica)
+
+    p = sub.add_parser('arranque', help="Mide el arranque de app en procesos nuevos (para CI).")
+    p.add_argument('--repeticiones', type=int, default=3, help="Arranques medidos (por defecto: %(default)s)")
+    p.add_argument('--limite-ms', type=float, help="Falla si la mediana de `import app` supera este tiempo.")
+    # Trabaja sobre bases temporales propias: no abre --bd
+    p.set_defaults(funcion=cmd_arranque, usa_bd=False)
+
+    return parser
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    if not getattr(args, 'usa_bd', True):
+        return args.funcion(None, args)
+    conn = abrir_conexion(args.bd)
+    try:
+        return args.funcion(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+
+# conexiones.py
+# Pool de conexiones SQLite por proceso. Cada worker de gunicorn mantiene sus
+# propias conexiones abiertas y las reutiliza entre solicitudes en lugar de
+# abrir y cerrar una conexión por cada petición.
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolAgotado(Exception):
+    """Se lanza cuando no se obtuvo una conexión libre dentro del tiempo de espera."""
+
+
+def configurar_conexion(conn, busy_timeout_ms=5000):
+    """Aplica los PRAGMA que deben establecerse una sola vez por conexión."""
+    conn.row_factory = sqlite3.Row
+    # WAL permite que las lecturas de reportes no bloqueen las escrituras de las enfermeras
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)};")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
+
+def abrir_conexion(ruta, busy_timeout_ms=5000, cache_sentencias=128, factory=sqlite3.Connection):
+    """Abre una conexión configurada fuera del pool (scripts, procesos auxiliares)."""
+    conn = sqlite3.connect(ruta, timeout=busy_timeout_ms / 1000.0, factory=factory,
+                           cached_statements=cache_sentencias, check_same_thread=False)
+    return configurar_conexion(conn, busy_timeout_ms)
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones SQLite para el proceso actual.
+
+    Las conexiones se crean bajo demanda hasta `tamano`; cuando todas están en uso
+    la solicitud espera hasta `espera_max` segundos antes de lanzar PoolAgotado.
+    """
+
+    def __init__(self, ruta, tamano=5, espera_max=5.0, busy_timeout_ms=5000, cache_sentencias=128,
+                 factory=sqlite3.Connection):
+        self.ruta = ruta
+        self.factory = factory
+        self.tamano = tamano
+        self.espera_max = espera_max
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_sentencias = cache_sentencias
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._libres = queue.LifoQueue()
+        self._creadas = 0
+        self._checkouts = 0
+        self._espera_total = 0.0
+        self._espera_max_observada = 0.0
+        self._agotamientos = 0
+        self._tiempos_agotados = 0
+
+    def _verificar_fork(self):
+        # Tras un fork (gunicorn con preload_app) las conexiones del padre no se reutilizan
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reiniciar()
+
+    def _nueva_conexion(self):
+        return abrir_conexion(self.ruta, self.busy_timeout_ms, self.cache_sentencias, self.factory)
+
+    def obtener(self):
+        """Toma una conexión libre del pool (o crea una si aún hay cupo)."""
+        self._verificar_fork()
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crear = self._creadas < self.tamano
+                if crear:
+                    self._creadas += 1
+                else:
+                    self._agotamientos += 1
+            if crear:
+                try:
+                    conn = self._nueva_conexion()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._creadas -= 1
+                    raise
+            else:
+                try:
+                    conn = self._libres.get(timeout=self.espera_max)
+                except queue.Empty:
+                    with self._lock:
+                        self._tiempos_agotados += 1
+                    raise PoolAgotado(f"No hay conexiones libres tras {self.espera_max}s de espera.")
+
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_max_observada = max(self._espera_max_observada, espera)
+        return conn
+
+    def devolver(self, conn):
+        """Regresa la conexión al pool descartando cualquier transacción pendiente."""
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            # rollback() no hace nada si no hay transacción abierta
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+            return
+        self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self):
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def cerrar(self):
+        """Cierra las conexiones libres (al apagar el worker)."""
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+
+    def estadisticas(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "pid": self._pid,
+                "tamano": self.tamano,
+                "creadas": self._creadas,
+                "libres": self._libres.qsize(),
+                "checkouts": checkouts,
+                "espera_total_ms": round(self._espera_total * 1000, 3),
+                "espera_promedio_ms": round(self._espera_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "espera_max_ms": round(self._espera_max_observada * 1000, 3),
+                "agotamientos": self._agotamientos,
+                "tasa_agotamiento": round(self._agotamientos / checkouts, 4) if checkouts else 0.0,
+                "tiempos_agotados": self._tiempos_agotados,
+            }
@@ -0,0 +1,189 @@
+
+# consultas_lentas.py
+# Registro de consultas lentas. Cada sentencia que tarda más que el umbral
+# (ejecución más lectura de sus filas) se escribe en el log con sus parámetros
+# normalizados y la ruta que la emitió. La primera vez que aparece una
+# sentencia se guarda además su EXPLAIN QUERY PLAN. Se conserva un top de las
+# sentencias más lentas de la ventana reciente para /api/consultas_lentas.
+#
+# También incluye el presupuesto de tiempo para reportes: un progress handler
+# de SQLite que interrumpe la consulta cuando se agota.
+
+import contextlib
+import re
+import sqlite3
+import threading
+import time
+
+ESPACIOS = re.compile(r'\s+')
+# Literales de texto y números sueltos (no dentro de identificadores como T1)
+LITERALES = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLANIFICABLES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class PresupuestoAgotado(Exception):
+    """La consulta se interrumpió porque excedió su presupuesto de tiempo."""
+
+
+def normalizar_sql(sql):
+    """Forma canónica de la sentencia: espacios colapsados y literales reemplazados por ?."""
+    return LITERALES.sub('?', ESPACIOS.sub(' ', sql).strip().rstrip(';').strip())
+
+
+def normalizar_valor(valor):
+    # El texto puede tener datos personales (nombres, teléfonos): sólo se registra su longitud
+    if isinstance(valor, str):
+        return f"texto({len(valor)})"
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return f"blob({len(valor)})"
+    return valor
+
+
+def normalizar_parametros(parametros):
+    if parametros is None:
+        return None
+    if isinstance(parametros, dict):
+        return {llave: normalizar_valor(valor) for llave, valor in parametros.items()}
+    return [normalizar_valor(valor) for valor in parametros]
+
+
+def plan_consulta(conn, sql, parametros):
+    """EXPLAIN QUERY PLAN de la sentencia como líneas indentadas según el árbol del plan."""
+    if parametros is None:
+        # executemany: basta con la forma de la sentencia, los parámetros quedan en NULL
+        parametros = (None,) * sql.count('?')
+    # Cursor simple: el plan no debe volver a pasar por el registro
+    filas = conn.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", parametros).fetchall()
+    profundidad = {0: -1}
+    lineas = []
+    for id_nodo, padre, _libre, detalle in filas:
+        profundidad[id_nodo] = profundidad.get(padre, -1) + 1
+        lineas.append("  " * profundidad[id_nodo] + detalle)
+    return lineas
+
+
+def escaneo_completo(plan):
+    """True si el plan recorre alguna tabla completa (SCAN) en lugar de buscar por índice."""
+    # Las tablas FTS5 aparecen como SCAN ... VIRTUAL TABLE aunque usen su propio índice
+    return any(linea.strip().startswith('SCAN ') and 'CONSTANT ROW' not in linea and 'VIRTUAL TABLE' not in linea
+               for linea in plan or ())
+
+
+@contextlib.contextmanager
+def presupuesto(conn, segundos, pasos=10000):
+    """Interrumpe las consultas de `conn` que sigan corriendo después de `segundos`.
+
+    El handler se revisa cada `pasos` instrucciones de la VM de SQLite. Al
+    agotarse el tiempo la consulta falla y se lanza PresupuestoAgotado.
+    """
+    if not segundos:
+        yield
+        return
+    limite = time.monotonic() + segundos
+    conn.set_progress_handler(lambda: time.monotonic() > limite, pasos)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if 'interrupted' in str(e) and time.monotonic() > limite:
+            raise PresupuestoAgotado(f"La consulta excedió el límite de {segundos:g} s.") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, pasos)
+
+
+class RegistroConsultasLentas:
+    def __init__(self, umbral_ms=200, max_sentencias=200, ventana=86400, resolver_ruta=None, registrar=print):
+        self.umbral = umbral_ms / 1000.0
+        self.max_sentencias = max_sentencias
+        self.ventana = ventana
+        self.resolver_ruta = resolver_ruta
+        self.registrar = registrar
+        self._lock = threading.Lock()
+        self._sentencias = {}
+        self._lentas = 0
+        self._interrumpidas = 0
+
+    def observar(self, conn, sql, parametros, segundos):
+        """Llamado por perfilado.CursorMedido cuando una sentencia supera el umbral."""
+        llave = normalizar_sql(sql)
+        ruta = self._ruta()
+        ahora = time.time()
+        with self._lock:
+            self._lentas += 1
+            entrada = self._sentencias.get(llave)
+            if entrada is None:
+                if len(self._sentencias) >= self.max_sentencias:
+                    # Se descarta la sentencia que lleva más tiempo sin repetirse
+                    del self._sentencias[min(self._sentencias, key=lambda k: self._sentencias[k]['ultima'])]
+                entrada = self._sentencias[llave] = {
+                    "sql": llave, "veces": 0, "total": 0.0, "max": 0.0, "rutas": {},
+                    "parametros": None, "plan": None, "ultima": ahora,
+                }
+                capturar_plan = llave.split(' ', 1)[0].upper() in PLANIFICABLES
+            else:
+                capturar_plan = False
+            entrada["veces"] += 1
+            entrada["total"] += segundos
+            entrada["ultima"] = ahora
+            entrada["rutas"][ruta] = entrada["rutas"].get(ruta, 0) + 1
+            if segundos >= entrada["max"]:
+                entrada["max"] = segundos
+                entrada["parametros"] = normalizar_parametros(parametros)
+
+        self.registrar(f"Consulta lenta ({segundos * 1000:.1f} ms) en {ruta}: {llave} "
+                       f"parámetros={normalizar_parametros(parametros)}")
+        if capturar_plan:
+            try:
+                plan = plan_consulta(conn, sql, parametros)
+            except sqlite3.Error as e:
+                plan = [f"(plan no disponible: {e})"]
+            entrada["plan"] = plan
+            self.registrar("Plan de consulta:\n" + "\n".join(plan))
+
+    def _ruta(self):
+        if self.resolver_ruta is None:
+            return 'desconocida'
+        try:
+            return self.resolver_ruta()
+        except Exception:
+            return 'desconocida'
+
+    @contextlib.contextmanager
+    def presupuesto(self, conn, segundos):
+        """Como presupuesto(), contando las consultas interrumpidas."""
+        try:
+            with presupuesto(conn, segundos):
+                yield
+        except PresupuestoAgotado:
+            with self._lock:
+                self._interrumpidas += 1
+            raise
+
+    def top(self, n=20, orden='max'):
+        """Las `n` sentencias más lentas de la ventana, por tiempo máximo o total acumulado."""
+        desde = time.time() - self.ventana
+        with self._lock:
+            recientes = [dict(entrada, rutas=dict(entrada["rutas"])) for entrada in self._sentencias.values()
+                         if entrada["ultima"] >= desde]
+        recientes.sort(key=lambda entrada: entrada["total" if orden == 'total' else "max"], reverse=True)
+        return [{
+            "sql": entrada["sql"],
+            "veces": entrada["veces"],
+            "total_ms": round(entrada["total"] * 1000, 3),
+            "promedio_ms": round(entrada["total"] * 1000 / entrada["veces"], 3),
+            "max_ms": round(entrada["max"] * 1000, 3),
+            "rutas": entrada["rutas"],
+            "parametros": entrada["parametros"],
+            "plan": entrada["plan"],
+            "escaneo_completo": escaneo_completo(entrada["plan"]),
+            "ultima": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entrada["ultima"])),
+        } for entrada in recientes[:n]]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "umbral_ms": round(self.umbral * 1000, 3),
+                "lentas": self._lentas,
+                "sentencias": len(self._sentencias),
+                "interrumpidas": self._interrumpidas,
+            }
@@ -0,0 +1,346 @@
+
+# crecimiento.py
+# Curvas de crecimiento: puntajes z y percentiles de peso para la edad y de
+# longitud para la edad (patrones OMS 2006, 0 a 24 meses) de cada control de
+# la tabla Controles. Los controles se cargan de una sola consulta a arreglos
+# de NumPy y el método LMS se evalúa para todo el conjunto a la vez: un área
+# completa cuesta lo mismo que unos cuantos lactantes calculados fila por fila.
+#
+# numpy se importa dentro de las funciones de cálculo para que el arranque de
+# los workers no pague su carga (ver arranque.py).
+
+import csv
+import threading
+
+# Días promedio por mes, como en las tablas de la OMS
+DIAS_POR_MES = 30.4375
+EDAD_MAXIMA_MESES = 24
+
+# Umbrales de alerta en puntaje z; un cambio mayor a 0.67 entre dos controles
+# equivale a cruzar una de las líneas principales de percentiles
+Z_BAJO = -2.0
+Z_MUY_BAJO = -3.0
+Z_ALTO = 2.0
+CRUCE_PERCENTILES = 0.67
+
+# Patrones de crecimiento de la OMS (2006), valores L, M, S por mes cumplido (0 a 24).
+# peso en kg, talla (longitud acostado) en cm; sexo 'M' niños, 'F' niñas.
+TABLAS_OMS = {
+    ('peso', 'M'): (
+        (0.3487, 3.3464, 0.14602), (0.2297, 4.4709, 0.13395), (0.1970, 5.5675, 0.12385), (0.1738, 6.3762, 0.11727),
+        (0.1553, 7.0023, 0.11316), (0.1395, 7.5105, 0.11080), (0.1257, 7.9340, 0.10958), (0.1134, 8.2970, 0.10902),
+        (0.1021, 8.6151, 0.10882), (0.0917, 8.9014, 0.10881), (0.0820, 9.1649, 0.10891), (0.0730, 9.4122, 0.10906),
+        (0.0644, 9.6479, 0.10925), (0.0563, 9.8749, 0.10949), (0.0487, 10.0953, 0.10976), (0.0413, 10.3108, 0.11007),
+        (0.0343, 10.5228, 0.11041), (0.0275, 10.7319, 0.11079), (0.0211, 10.9385, 0.11119), (0.0148, 11.1430, 0.11164),
+        (0.0087, 11.3462, 0.11211), (0.0029, 11.5486, 0.11261), (-0.0028, 11.7504, 0.11314), (-0.0083, 11.9514, 0.11369),
+        (-0.0137, 12.1515, 0.11426),
+    ),
+    ('peso', 'F'): (
+        (0.3809, 3.2322, 0.14171), (0.1714, 4.1873, 0.13724), (0.0962, 5.1282, 0.13000), (0.0402, 5.8458, 0.12619),
+        (-0.0050, 6.4237, 0.12402), (-0.0430, 6.8985, 0.12274), (-0.0756, 7.2970, 0.12204), (-0.1039, 7.6422, 0.12178),
+        (-0.1288, 7.9487, 0.12181), (-0.1507, 8.2254, 0.12199), (-0.1700, 8.4800, 0.12223), (-0.1872, 8.7192, 0.12247),
+        (-0.2024, 8.9481, 0.12268), (-0.2158, 9.1699, 0.12283), (-0.2278, 9.3870, 0.12294), (-0.2384, 9.6008, 0.12299),
+        (-0.2478, 9.8124, 0.12303), (-0.2562, 10.0226, 0.12306), (-0.2637, 10.2315, 0.12309), (-0.2703, 10.4393, 0.12315),
+        (-0.2762, 10.6464, 0.12323), (-0.2815, 10.8534, 0.12335), (-0.2862, 11.0608, 0.12350), (-0.2903, 11.2688, 0.12369),
+        (-0.2941, 11.4775, 0.12390),
+    ),
+    ('talla', 'M'): (
+        (1, 49.8842, 0.03795), (1, 54.7244, 0.03557), (1, 58.4249, 0.03424), (1, 61.4292, 0.03328),
+        (1, 63.8860, 0.03257), (1, 65.9026, 0.03204), (1, 67.6236, 0.03165), (1, 69.1645, 0.03139),
+        (1, 70.5994, 0.03124), (1, 71.9687, 0.03117), (1, 73.2812, 0.03118), (1, 74.5388, 0.03125),
+        (1, 75.7488, 0.03137), (1, 76.9186, 0.03154), (1, 78.0497, 0.03174), (1, 79.1458, 0.03197),
+        (1, 80.2113, 0.03222), (1, 81.2487, 0.03250), (1, 82.2587, 0.03279), (1, 83.2418, 0.03310),
+        (1, 84.1996, 0.03342), (1, 85.1348, 0.03376), (1, 86.0477, 0.03410), (1, 86.9410, 0.03445),
+        (1, 87.8161, 0.03479),
+    ),
+    ('talla', 'F'): (
+        (1, 49.1477, 0.03790), (1, 53.6872, 0.03640), (1, 57.0673, 0.03568), (1, 59.8029, 0.03520),
+        (1, 62.0899, 0.03486), (1, 64.0301, 0.03463), (1, 65.7311, 0.03448), (1, 67.2873, 0.03441),
+        (1, 68.7498, 0.03440), (1, 70.1435, 0.03444), (1, 71.4818, 0.03452), (1, 72.7710, 0.03464),
+        (1, 74.0150, 0.03479), (1, 75.2176, 0.03496), (1, 76.3817, 0.03514), (1, 77.5099, 0.03534),
+        (1, 78.6055, 0.03555), (1, 79.6710, 0.03576), (1, 80.7079, 0.03598), (1, 81.7182, 0.03620),
+        (1, 82.7036, 0.03643), (1, 83.6654, 0.03666), (1, 84.6040, 0.03688), (1, 85.5202, 0.03711),
+        (1, 86.4153, 0.03734),
+    ),
+}
+
+INDICADORES = ('peso', 'talla')
+SEXOS = ('M', 'F')
+
+CONSULTA_CONTROLES = """
+    SELECT c.id_controles, c.id_lactantes, l.genero, c.fecha_control, c.edad_meses, c.peso, c.talla,
+           julianday(c.fecha_control) - julianday(l.fecha_nacimiento) AS dias
+    FROM Controles c
+    JOIN Lactantes l ON l.id_lactantes = c.id_lactantes
+    WHERE {filtro}
+    ORDER BY c.id_lactantes, c.fecha_control, c.id_controles
+"""
+
+# Identifica el estado de los controles de un lactante: cambia con cada alta, edición o
+# baja de sus controles (versión en Cambios, ver sincronizacion.py) y con cada edición
+# del propio lactante (fecha de nacimiento, género)
+CONSULTA_VERSION_LACTANTE = """
+    SELECT (SELECT COUNT(*) FROM Controles WHERE id_lactantes = :id),
+           (SELECT MAX(ca.version) FROM Controles c
+            JOIN Cambios ca ON ca.tabla = 'Controles' AND ca.id_fila = c.id_controles
+            WHERE c.id_lactantes = :id),
+           (SELECT version FROM Cambios WHERE tabla = 'Lactantes' AND id_fila = :id)
+"""
+
+
+def leer_tablas_csv(ruta):
+    """Tablas LMS desde un CSV con columnas indicador, sexo, mes, L, M, S (reemplazan a las incluidas)."""
+    filas = {}
+    with open(ruta, newline='', encoding='utf-8') as archivo:
+        for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+            try:
+                llave = (fila['indicador'].strip().lower(), fila['sexo'].strip().upper())
+                if llave[0] not in INDICADORES or llave[1] not in SEXOS:
+                    raise ValueError(f"indicador/sexo no soportado: {llave}")
+                filas.setdefault(llave, []).append(
+                    (float(fila['mes']), float(fila['L']), float(fila['M']), float(fila['S'])))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"{ruta}, línea {numero}: {e}") from e
+    faltantes = [llave for llave in TABLAS_OMS if llave not in filas]
+    if faltantes:
+        raise ValueError(f"{ruta}: faltan las tablas {faltantes}")
+    return {llave: sorted(valores) for llave, valores in filas.items()}
+
+
+def codigo_sexo(genero):
+    """0 niños, 1 niñas, -1 sin dato ('M'/'Masculino' y 'F'/'Femenino')."""
+    inicial = (genero or '').strip()[:1].upper()
+    return SEXOS.index(inicial) if inicial in SEXOS else -1
+
+
+def _redondear(valor, decimales):
+    # NaN (sin dato o fuera de rango) se entrega como null
+    return None if valor != valor else round(float(valor), decimales)
+
+
+class Referencia:
+    """Tablas LMS como arreglos, interpoladas por edad en meses."""
+
+    def __init__(self, ruta_csv=None):
+        self.origen = ruta_csv or 'OMS 2006'
+        if ruta_csv:
+            self._tablas = leer_tablas_csv(ruta_csv)
+        else:
+            self._tablas = {llave: [(mes,) + lms for mes, lms in enumerate(filas)] for llave, filas in TABLAS_OMS.items()}
+        self._arreglos = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        import numpy as np
+
+        with self._lock:
+            if self._arreglos is None:
+                self._arreglos = {llave: np.array(filas, dtype=float).T for llave, filas in self._tablas.items()}
+        return self._arreglos
+
+    def lms(self, indicador, sexos, edades):
+        """L, M y S para cada (sexo, edad); NaN si falta el sexo o la edad está fuera de la tabla."""
+        import numpy as np
+
+        arreglos = self._cargar()
+        resultado = np.full((3, len(edades)), np.nan)
+        for codigo, sexo in enumerate(SEXOS):
+            meses, *columnas = arreglos[(indicador, sexo)]
+            seleccion = (sexos == codigo) & (edades >= meses[0]) & (edades <= meses[-1])
+            for i, columna in enumerate(columnas):
+                resultado[i, seleccion] = np.interp(edades[seleccion], meses, columna)
+        return resultado
+
+
+def puntaje_z(valores, L, M, S, restringido=False):
+    """Puntaje z por el método LMS.
+
+    Con `restringido` (peso para la edad) los valores más allá de ±3 DE se miden
+    con la distancia entre las curvas de 2 y 3 DE, como indica la OMS, para que la
+    asimetría de la distribución no exagere los extremos.
+    """
+    import numpy as np
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        razon = valores / M
+        casi_cero = np.abs(L) < 1e-9
+        z = np.where(casi_cero, np.log(razon) / S, (np.power(razon, L) - 1) / (L * S))
+        if restringido:
+            def curva(sd):
+                return M * np.power(1 + L * S * sd, 1 / L)
+            sd3 = curva(3)
+            z = np.where(z > 3, 3 + (valores - sd3) / (sd3 - curva(2)), z)
+            sd3n = curva(-3)
+            z = np.where(z < -3, -3 + (valores - sd3n) / (curva(-2) - sd3n), z)
+    return z
+
+
+def percentil(z):
+    """Percentil (0-100) de la normal estándar; erf con la aproximación 7.1.26 de Abramowitz y Stegun."""
+    import numpy as np
+
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    polinomio = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = np.sign(z) * (1 - polinomio * np.exp(-x * x))
+    return 50 * (1 + erf)
+
+
+def cargar_controles(conn, filtro, parametros):
+    """Controles (con sexo y edad del lactante) como arreglos, ordenados por lactante y fecha."""
+    import numpy as np
+
+    filas = conn.execute(CONSULTA_CONTROLES.format(filtro=filtro), parametros).fetchall()
+    ids, lactantes, generos, fechas, edad_meses, peso, talla, dias = zip(*filas) if filas else ((),) * 8
+    return {
+        "id_control": np.array(ids, dtype=np.int64),
+        "id_lactante": np.array(lactantes, dtype=np.int64),
+        "sexo": np.array([codigo_sexo(genero) for genero in generos], dtype=np.int8),
+        "fecha_control": list(fechas),
+        "edad_meses": np.array(edad_meses, dtype=float),
+        "peso": np.array(peso, dtype=float),
+        "talla": np.array(talla, dtype=float),
+        "dias": np.array(dias, dtype=float),
+    }
+
+
+def evaluar(datos, referencia):
+    """Agrega a `datos` la edad usada, los puntajes z, percentiles y alertas de cada control."""
+    import numpy as np
+
+    # Edad exacta por fechas; si falta la fecha de nacimiento se usa la edad capturada en meses
+    edad = np.where(np.isnan(datos["dias"]) | (datos["dias"] < 0), datos["edad_meses"], datos["dias"] / DIAS_POR_MES)
+    datos["edad"] = edad
+    for indicador in INDICADORES:
+        valores = np.where(datos[indicador] > 0, datos[indicador], np.nan)
+        L, M, S = referencia.lms(indicador, datos["sexo"], edad)
+        z = puntaje_z(valores, L, M, S, restringido=indicador == 'peso')
+        datos[f"z_{indicador}"] = z
+        datos[f"percentil_{indicador}"] = percentil(z)
+
+    # Cambio de z de peso respecto al control anterior del mismo lactante
+    cambio = np.full(len(edad), np.nan)
+    if len(edad) > 1:
+        mismo = datos["id_lactante"][1:] == datos["id_lactante"][:-1]
+        cambio[1:] = np.where(mismo, np.diff(datos["z_peso"]), np.nan)
+    datos["cambio_z_peso"] = cambio
+
+    z_peso, z_talla = datos["z_peso"], datos["z_talla"]
+    datos["alertas"] = {
+        "peso_bajo": (z_peso < Z_BAJO) & (z_peso >= Z_MUY_BAJO),
+        "peso_muy_bajo": z_peso < Z_MUY_BAJO,
+        "peso_alto": z_peso > Z_ALTO,
+        "talla_baja": (z_talla < Z_BAJO) & (z_talla >= Z_MUY_BAJO),
+        "talla_muy_baja": z_talla < Z_MUY_BAJO,
+        "cruce_percentiles": np.abs(cambio) > CRUCE_PERCENTILES,
+    }
+    return datos
+
+
+def _alertas_en(datos, i):
+    return [nombre for nombre, mascara in datos["alertas"].items() if mascara[i]]
+
+
+def _control(datos, i):
+    return {
+        "id_control": int(datos["id_control"][i]),
+        "fecha_control": datos["fecha_control"][i],
+        "edad_meses": _redondear(datos["edad"][i], 2),
+        "peso": _redondear(datos["peso"][i], 3),
+        "talla": _redondear(datos["talla"][i], 1),
+        "z_peso": _redondear(datos["z_peso"][i], 2),
+        "percentil_peso": _redondear(datos["percentil_peso"][i], 1),
+        "z_talla": _redondear(datos["z_talla"][i], 2),
+        "percentil_talla": _redondear(datos["percentil_talla"][i], 1),
+        "cambio_z_peso": _redondear(datos["cambio_z_peso"][i], 2),
+        "alertas": _alertas_en(datos, i),
+    }
+
+
+def _distribucion(z):
+    import numpy as np
+
+    medidos = z[~np.isnan(z)]
+    return {
+        "evaluados": int(len(medidos)),
+        "media_z": _redondear(medidos.mean(), 2) if len(medidos) else None,
+        "menor_a_-3": int((medidos < -3).sum()),
+        "entre_-3_y_-2": int(((medidos >= -3) & (medidos < -2)).sum()),
+        "entre_-2_y_2": int(((medidos >= -2) & (medidos <= 2)).sum()),
+        "mayor_a_2": int((medidos > 2).sum()),
+    }
+
+
+class MotorCrecimiento:
+    def __init__(self, referencia=None, cache=None):
+        self.referencia = referencia or Referencia()
+        # Caché por lactante (CacheResultados), invalidada con su versión de controles
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._lactantes = 0
+        self._areas = 0
+        self._controles = 0
+
+    def version_lactante(self, conn, id_lactante):
+        return tuple(conn.execute(CONSULTA_VERSION_LACTANTE, {"id": id_lactante}).fetchone())
+
+    def lactante(self, conn, id_lactante):
+        """Curva de un lactante: todos sus controles con z, percentiles y alertas."""
+        if self.cache is None:
+            return self._calcular_lactante(conn, id_lactante)
+        return self.cache.obtener_version(('crecimiento', id_lactante), self.version_lactante(conn, id_lactante),
+                                          lambda: self._calcular_lactante(conn, id_lactante))
+
+    def _calcular_lactante(self, conn, id_lactante):
+        datos = evaluar(cargar_controles(conn, "c.id_lactantes = ?", (id_lactante,)), self.referencia)
+        controles = [_control(datos, i) for i in range(len(datos["id_control"]))]
+        self._contar('_lactantes', len(controles))
+        return {
+            "id_lactante": id_lactante,
+            "referencia": self.referencia.origen,
+            "controles": controles,
+            "alertas_actuales": controles[-1]["alertas"] if controles else [],
+        }
+
+    def area(self, conn, id_area, limite=200):
+        """Resumen de un área: distribución de z del último control de cada lactante y lactantes con alertas."""
+        import numpy as np
+
+        datos = evaluar(cargar_controles(conn, "l.id_area = ?", (id_area,)), self.referencia)
+        total = len(datos["id_control"])
+        self._contar('_areas', total)
+        # Último control de cada lactante: el siguiente renglón ya es de otro lactante
+        ultimos = np.flatnonzero(np.append(datos["id_lactante"][1:] != datos["id_lactante"][:-1], True)) if total else \
+            np.array([], dtype=np.int64)
+
+        alertas = {nombre: int(mascara[ultimos].sum()) for nombre, mascara in datos["alertas"].items()}
+        con_alerta = ultimos[np.any([mascara[ultimos] for mascara in datos["alertas"].values()], axis=0)] if total else ultimos
+        # Primero los casos más graves (menor z de peso o de talla)
+        gravedad = np.fmin(datos["z_peso"][con_alerta], datos["z_talla"][con_alerta])
+        con_alerta = con_alerta[np.argsort(np.nan_to_num(gravedad, nan=np.inf), kind='stable')]
+        return {
+            "id_area": id_area,
+            "referencia": self.referencia.origen,
+            "controles": total,
+            "lactantes": int(len(ultimos)),
+            "peso_para_la_edad": _distribucion(datos["z_peso"][ultimos]),
+            "talla_para_la_edad": _distribucion(datos["z_talla"][ultimos]),
+            "alertas": alertas,
+            "lactantes_con_alertas": [dict(_control(datos, i), id_lactante=int(datos["id_lactante"][i]))
+                                      for i in con_alerta[:limite]],
+        }
+
+    def _contar(self, atributo, controles):
+        with self._lock:
+            setattr(self, atributo, getattr(self, atributo) + 1)
+            self._controles += controles
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "referencia": self.referencia.origen,
+                "lactantes_calculados": self._lactantes,
+                "areas_calculadas": self._areas,
+                "controles_evaluados": self._controles,
+                "cache": self.cache.estadisticas() if self.cache is not None else None,
+            }
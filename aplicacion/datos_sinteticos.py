@@ -0,0 +1,126 @@
+
+# datos_sinteticos.py
+# Generador de datos sintéticos realistas para pruebas de rendimiento. Se usa
+# siempre sobre una base de datos aparte (nunca sobre vinculo_de_vida.db) que
+# ya tenga el esquema y los catálogos iniciales.
+
+import datetime
+import hashlib
+import random
+import time
+
+TAMANO_LOTE = 20000
+
+NOMBRES = ("María", "Ana", "Guadalupe", "Juana", "Rosa", "Verónica", "Leticia", "Alejandra", "Patricia",
+           "Gabriela", "Daniela", "Fernanda", "Sofía", "Valeria", "Ximena", "Brenda", "Karla", "Itzel",
+           "Yesenia", "Araceli", "Lucía", "Mónica", "Elena", "Claudia", "Adriana", "Citlali", "Nayeli")
+APELLIDOS = ("Hernández", "García", "Martínez", "López", "González", "Pérez", "Rodríguez", "Sánchez",
+             "Ramírez", "Cruz", "Flores", "Gómez", "Morales", "Vázquez", "Reyes", "Jiménez", "Torres",
+             "Díaz", "Gutiérrez", "Ruiz", "Mendoza", "Aguilar", "Ortiz", "Moreno", "Castillo", "Romero",
+             "Álvarez", "Méndez", "Chávez", "Rivera", "Juárez", "Ramos", "Domínguez", "Herrera", "Medina",
+             "Castro", "Vargas", "Guzmán", "Velázquez", "Muñoz", "Rojas", "Contreras", "Salazar", "Núñez")
+DISCAPACIDADES = ("Ninguna",) * 18 + ("Auditiva", "Motriz")
+ESTADOS = ("Activo",) * 8 + ("Alta", "Inactivo")
+ESTADOS_GENERALES = ("Bueno", "Bueno", "Bueno", "Regular", "Malo")
+ACCIONES = (("Registro de nueva cita", "Citas"), ("Registro de nuevo lactante", "Lactantes"),
+            ("Registro de nueva madre", "Madres"), ("Actualización lactante", "Lactantes"),
+            ("Eliminación de cita", "Citas"), ("Reporte generado", "Reportes"))
+
+
+def _lotes(conn, sql, filas, tamano=TAMANO_LOTE):
+    """Inserta con executemany en transacciones de `tamano` filas; devuelve el total insertado."""
+    total = 0
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            conn.executemany(sql, lote)
+            conn.commit()
+            total += len(lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+        conn.commit()
+        total += len(lote)
+    return total
+
+
+def _maximo(conn, tabla, llave):
+    return conn.execute(f"SELECT IFNULL(MAX({llave}), 0) FROM {tabla}").fetchone()[0]
+
+
+def generar(conn, lactantes=100000, citas=1000000, controles=500000, auditoria=5000000, enfermeras=20,
+            semilla=1, progreso=print):
+    """Agrega datos sintéticos a `conn`; requiere Rol, Area y Motivo ya cargados."""
+    azar = random.Random(semilla)
+    hoy = datetime.date.today()
+    areas = [fila[0] for fila in conn.execute("SELECT id_area FROM Area")]
+    motivos = [fila[0] for fila in conn.execute("SELECT id_motivo FROM Motivo")]
+    rol = conn.execute("SELECT id_rol FROM Rol WHERE nombre = 'Enfermera'").fetchone()
+    if not areas or not motivos or rol is None:
+        raise RuntimeError("La base de datos no tiene los catálogos iniciales (Rol, Area, Motivo).")
+
+    # synchronous = OFF sólo durante la carga: la base es desechable
+    conn.execute("PRAGMA synchronous = OFF;")
+    resumen = {}
+
+    def etapa(nombre, funcion):
+        inicio = time.perf_counter()
+        resumen[nombre] = funcion()
+        progreso(f"{nombre}: {resumen[nombre]} filas en {time.perf_counter() - inicio:.1f} s")
+
+    contrasena = hashlib.sha256("pass123".encode('utf-8')).hexdigest()
+    base_usuarios = _maximo(conn, 'Usuarios', 'id_usuario')
+    etapa('usuarios', lambda: _lotes(conn, "INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES (?, ?, ?, ?)",
+                                     ((f"Enfermera Sintética {base_usuarios + i}", f"sint-{base_usuarios + i}", contrasena, rol[0])
+                                      for i in range(1, enfermeras + 1))))
+    usuarios = [fila[0] for fila in conn.execute("SELECT id_usuario FROM Usuarios")]
+
+    num_madres = max(1, int(lactantes * 0.8))
+    base_madres = _maximo(conn, 'Madres', 'id_madre')
+    etapa('madres', lambda: _lotes(conn, "INSERT INTO Madres (nombre, apellido_paterno, apellido_materno, discapacidad, id_motivo) VALUES (?, ?, ?, ?, ?)",
+                                   ((azar.choice(NOMBRES), azar.choice(APELLIDOS), azar.choice(APELLIDOS),
+                                     azar.choice(DISCAPACIDADES), azar.choice(motivos)) for _ in range(num_madres))))
+
+    def lactante():
+        nacimiento = hoy - datetime.timedelta(days=azar.randint(0, 3 * 365))
+        return (base_madres + azar.randint(1, num_madres), azar.choice(areas), azar.choice(APELLIDOS), azar.choice(APELLIDOS),
+                nacimiento.isoformat(), azar.choice("MF"), azar.choice(ESTADOS), azar.choice(DISCAPACIDADES),
+                round(azar.uniform(1.8, 5.2), 2))
+
+    base_lactantes = _maximo(conn, 'Lactantes', 'id_lactantes')
+    etapa('lactantes', lambda: _lotes(conn, """INSERT INTO Lactantes (id_madres, id_area, apellido_paterno, apellido_materno, fecha_nacimiento, genero, estado, discapacidad, peso)
+                                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", (lactante() for _ in range(lactantes))))
+    ultimo_lactante = base_lactantes + lactantes
+
+    def cita():
+        fecha = hoy - datetime.timedelta(days=azar.randint(-30, 2 * 365))
+        return (azar.randint(base_lactantes + 1, ultimo_lactante), azar.choice(motivos), azar.choice(usuarios), fecha.isoformat(),
+                azar.randint(0, 1), "", f"{azar.randint(7, 19):02d}:{azar.choice((0, 15, 30, 45)):02d}")
+
+    if lactantes:
+        etapa('citas', lambda: _lotes(conn, """INSERT INTO Citas (id_lactantes, id_motivo, atendido_por_id_usuario, fecha_cita, subsecuente, justificacion, hora_de_entrada)
+                                             VALUES (?, ?, ?, ?, ?, ?, ?)""", (cita() for _ in range(citas))))
+
+    def control():
+        edad = azar.randint(0, 36)
+        fecha = datetime.datetime.combine(hoy, datetime.time(9)) - datetime.timedelta(days=azar.randint(0, 2 * 365))
+        return (azar.randint(base_lactantes + 1, ultimo_lactante), round(3.3 + edad * 0.35 + azar.gauss(0, 0.6), 2),
+                round(50 + edad * 1.3 + azar.gauss(0, 2), 1), edad, azar.choice(ESTADOS_GENERALES),
+                fecha.strftime('%Y-%m-%d %H:%M:%S'), "")
+
+    if lactantes:
+        etapa('controles', lambda: _lotes(conn, """INSERT INTO Controles (id_lactantes, peso, talla, edad_meses, estado_general, fecha_control, observaciones)
+                                                 VALUES (?, ?, ?, ?, ?, ?, ?)""", (control() for _ in range(controles))))
+
+    def evento():
+        accion, tabla = azar.choice(ACCIONES)
+        fecha = datetime.datetime.combine(hoy, datetime.time()) - datetime.timedelta(seconds=azar.randint(0, 2 * 365 * 86400))
+        return (azar.choice(usuarios), accion, tabla, fecha.strftime('%Y-%m-%d %H:%M:%S'))
+
+    etapa('auditoria', lambda: _lotes(conn, "INSERT INTO Auditoria (id_usuario, accion, tabla_afectada, fecha) VALUES (?, ?, ?, ?)",
+                                      (evento() for _ in range(auditoria))))
+
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("ANALYZE;")
+    return resumen
@@ -0,0 +1,75 @@
+
+# estadisticas.py
+# Contadores agregados (tabla Estadisticas) mantenidos por triggers para que
+# los totales de los reportes sean una búsqueda por llave y no un COUNT(*).
+
+# tabla -> dimensiones contadas además del total ('' = total de la tabla)
+DIMENSIONES = {
+    'Lactantes': ('genero', 'id_area', 'estado'),
+    'Madres': (),
+    'Citas': (),
+    'Controles': (),
+}
+
+
+def _sumar(tabla, dimension, expresion, delta):
+    return (f"INSERT INTO Estadisticas (tabla, dimension, valor, total) VALUES ('{tabla}', '{dimension}', {expresion}, {delta}) "
+            f"ON CONFLICT (tabla, dimension, valor) DO UPDATE SET total = total + ({delta});")
+
+
+def sql_triggers():
+    """Sentencias CREATE TRIGGER que mantienen la tabla Estadisticas."""
+    sentencias = []
+    for tabla, dimensiones in DIMENSIONES.items():
+        nombre = tabla.lower()
+        alta = [_sumar(tabla, '', "''", 1)] + [_sumar(tabla, d, f"IFNULL(NEW.{d}, '')", 1) for d in dimensiones]
+        baja = [_sumar(tabla, '', "''", -1)] + [_sumar(tabla, d, f"IFNULL(OLD.{d}, '')", -1) for d in dimensiones]
+        sentencias.append(f"CREATE TRIGGER IF NOT EXISTS trg_estadisticas_{nombre}_ins AFTER INSERT ON {tabla} BEGIN {' '.join(alta)} END;")
+        sentencias.append(f"CREATE TRIGGER IF NOT EXISTS trg_estadisticas_{nombre}_del AFTER DELETE ON {tabla} BEGIN {' '.join(baja)} END;")
+        if dimensiones:
+            cambio = [_sumar(tabla, d, f"IFNULL(OLD.{d}, '')", -1) for d in dimensiones] + \
+                     [_sumar(tabla, d, f"IFNULL(NEW.{d}, '')", 1) for d in dimensiones]
+            sentencias.append(f"CREATE TRIGGER IF NOT EXISTS trg_estadisticas_{nombre}_upd AFTER UPDATE OF {', '.join(dimensiones)} ON {tabla} "
+                              f"BEGIN {' '.join(cambio)} END;")
+    return sentencias
+
+
+def _conteos_reales(conn):
+    """Conteos calculados directamente de las tablas: {(tabla, dimension, valor): total}."""
+    conteos = {}
+    for tabla, dimensiones in DIMENSIONES.items():
+        conteos[(tabla, '', '')] = conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+        for d in dimensiones:
+            for valor, total in conn.execute(f"SELECT IFNULL({d}, ''), COUNT(*) FROM {tabla} GROUP BY 1"):
+                conteos[(tabla, d, str(valor))] = total
+    return conteos
+
+
+def reconstruir(conn):
+    """Recalcula la tabla completa (no hace commit)."""
+    conn.execute("DELETE FROM Estadisticas;")
+    conn.executemany("INSERT INTO Estadisticas (tabla, dimension, valor, total) VALUES (?, ?, ?, ?)",
+                     [llave + (total,) for llave, total in _conteos_reales(conn).items()])
+
+
+def verificar(conn):
+    """Lista de diferencias (tabla, dimension, valor, guardado, real) entre los contadores y los datos."""
+    guardados = {(t, d, v): total for t, d, v, total in conn.execute("SELECT tabla, dimension, valor, total FROM Estadisticas")}
+    reales = _conteos_reales(conn)
+    diferencias = []
+    for llave in sorted(set(guardados) | set(reales)):
+        guardado, real = guardados.get(llave, 0), reales.get(llave, 0)
+        if guardado != real:
+            diferencias.append(llave + (guardado, real))
+    return diferencias
+
+
+def total(conn, tabla):
+    fila = conn.execute("SELECT total FROM Estadisticas WHERE tabla = ? AND dimension = '' AND valor = ''", (tabla,)).fetchone()
+    return fila[0] if fila else 0
+
+
+def distribucion(conn, tabla, dimension):
+    """[(valor, total)] con total > 0; el valor '' representa NULL."""
+    return conn.execute("SELECT valor, total FROM Estadisticas WHERE tabla = ? AND dimension = ? AND total > 0 ORDER BY valor",
+                        (tabla, dimension)).fetchall()
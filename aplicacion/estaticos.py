@@ -0,0 +1,267 @@
+
+# estaticos.py
+# Archivos de /static/ servidos desde memoria con validadores HTTP.
+#
+# Los archivos pequeños se guardan en memoria (junto con sus variantes .gz/.br
+# comprimidas al arrancar) y se recargan cuando cambia su mtime. Los grandes se
+# envían con wsgi.file_wrapper (sendfile) sin pasar por la caché. Se usa como
+# middleware WSGI delante de la aplicación para que los estáticos no pasen por
+# los procesadores de sesión y de base de datos.
+
+import functools
+import gzip
+import mimetypes
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIPOS_EXTRA = {
+    '.js': 'text/javascript',
+    '.mjs': 'text/javascript',
+    '.css': 'text/css',
+    '.svg': 'image/svg+xml',
+    '.json': 'application/json',
+    '.webp': 'image/webp',
+    '.woff2': 'font/woff2',
+    '.ico': 'image/x-icon',
+}
+
+COMPRIMIBLES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# app.3f9a2b1c.js, logo-5d41402abc4b2a76.png: el nombre cambia con el contenido
+HUELLA = re.compile(r'[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+
+ENCABEZADO_HUELLA = 'public, max-age=31536000, immutable'
+ENCABEZADO_NORMAL = 'no-cache'
+
+TAMANO_BLOQUE = 64 * 1024
+
+# Variantes precomprimidas en orden de preferencia cuando el cliente les da el mismo peso
+PREFERENCIA_CODIFICACION = ('br', 'gzip')
+
+
+@functools.lru_cache(maxsize=256)
+def elegir_codificacion(aceptadas, disponibles):
+    """Codificación de `disponibles` con mayor q > 0 en Accept-Encoding (RFC 9110), o None."""
+    pesos = {}
+    for elemento in aceptadas.split(','):
+        nombre, _, parametros = elemento.partition(';')
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        for parametro in parametros.split(';'):
+            llave, _, valor = parametro.partition('=')
+            if llave.strip().lower() == 'q':
+                try:
+                    q = float(valor.strip())
+                except ValueError:
+                    q = 0.0
+        # x-gzip es un alias de gzip
+        pesos['gzip' if nombre == 'x-gzip' else nombre] = q
+    comodin = pesos.get('*', 0.0)
+    mejor, mejor_q = None, 0.0
+    for candidata in PREFERENCIA_CODIFICACION:
+        q = pesos.get(candidata, comodin)
+        if candidata in disponibles and q > mejor_q:
+            mejor, mejor_q = candidata, q
+    return mejor
+
+
+class Archivo:
+    """Contenido y validadores de un archivo estático en un mtime dado."""
+
+    def __init__(self, ruta, stat):
+        self.ruta = ruta
+        self.mtime_ns = stat.st_mtime_ns
+        self.tamano = stat.st_size
+        self.etag = f'"{self.tamano:x}-{self.mtime_ns:x}"'
+        self.ultima_modificacion = formatdate(stat.st_mtime, usegmt=True)
+        self.segundos = int(stat.st_mtime)
+        extension = os.path.splitext(ruta)[1].lower()
+        tipo = TIPOS_EXTRA.get(extension) or mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+        if tipo.startswith('text/') or tipo in ('application/json', 'image/svg+xml'):
+            tipo += '; charset=utf-8'
+        self.tipo = tipo
+        self.datos = None
+        self.variantes = {}
+        self.revisado = time.monotonic()
+
+    def cargar(self, comprimir):
+        with open(self.ruta, 'rb') as f:
+            self.datos = f.read()
+        if not comprimir or not self.tipo.startswith(COMPRIMIBLES):
+            return
+        # Una variante ya presente en disco (generada al desplegar) tiene prioridad
+        for codificacion, sufijo in (('br', '.br'), ('gzip', '.gz')):
+            try:
+                if os.stat(self.ruta + sufijo).st_mtime_ns >= self.mtime_ns:
+                    with open(self.ruta + sufijo, 'rb') as f:
+                        self.variantes[codificacion] = f.read()
+            except OSError:
+                pass
+        if 'gzip' not in self.variantes:
+            self.variantes['gzip'] = gzip.compress(self.datos, compresslevel=9, mtime=0)
+        if 'br' not in self.variantes and brotli is not None:
+            self.variantes['br'] = brotli.compress(self.datos)
+        # Sólo se conservan las variantes que realmente ahorran bytes
+        self.variantes = {c: v for c, v in self.variantes.items() if len(v) < len(self.datos)}
+
+
+class ArchivosEstaticos:
+    """Middleware WSGI (y servicio reutilizable) para los archivos de `directorio`."""
+
+    def __init__(self, aplicacion, directorio, prefijo='/static/', max_memoria=256 * 1024,
+                 revisar_cada=1.0, comprimir_min=1024):
+        self.aplicacion = aplicacion
+        self.directorio = os.path.realpath(directorio)
+        self.prefijo = prefijo
+        self.max_memoria = max_memoria
+        self.revisar_cada = revisar_cada
+        self.comprimir_min = comprimir_min
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._metricas = dict.fromkeys(('solicitudes', 'no_modificados', 'comprimidos', 'desde_memoria',
+                                        'file_wrapper', 'recargas', 'no_encontrados'), 0)
+
+    def _contar(self, metrica):
+        with self._lock:
+            self._metricas[metrica] += 1
+
+    def _resolver(self, relativa):
+        ruta = os.path.realpath(os.path.join(self.directorio, relativa.lstrip('/')))
+        if os.path.commonpath([ruta, self.directorio]) != self.directorio:
+            return None
+        return ruta
+
+    def archivo(self, relativa):
+        """Archivo vigente para la ruta relativa o None si no existe (o sale del directorio)."""
+        ruta = self._resolver(relativa)
+        if ruta is None:
+            return None
+        ahora = time.monotonic()
+        archivo = self._cache.get(ruta)
+        if archivo is not None and ahora - archivo.revisado < self.revisar_cada:
+            return archivo
+        try:
+            stat = os.stat(ruta)
+        except OSError:
+            with self._lock:
+                self._cache.pop(ruta, None)
+            return None
+        if not os.path.isfile(ruta):
+            return None
+        if archivo is not None and archivo.mtime_ns == stat.st_mtime_ns and archivo.tamano == stat.st_size:
+            archivo.revisado = ahora
+            return archivo
+        archivo = Archivo(ruta, stat)
+        if archivo.tamano <= self.max_memoria:
+            archivo.cargar(comprimir=archivo.tamano >= self.comprimir_min)
+            with self._lock:
+                self._cache[ruta] = archivo
+                self._metricas['recargas'] += 1
+        return archivo
+
+    def precomprimir(self):
+        """Carga en memoria (y comprime) todos los archivos pequeños; se llama al arrancar."""
+        total = 0
+        for raiz, _dirs, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if nombre.endswith(('.gz', '.br')):
+                    continue
+                relativa = os.path.relpath(os.path.join(raiz, nombre), self.directorio)
+                if self.archivo(relativa) is not None:
+                    total += 1
+        return total
+
+    def respuesta(self, relativa, environ):
+        """(status, encabezados, cuerpo) para la ruta; cuerpo es bytes o un iterable."""
+        self._contar('solicitudes')
+        metodo = environ.get('REQUEST_METHOD', 'GET')
+        if metodo not in ('GET', 'HEAD'):
+            return '405 Method Not Allowed', [('Allow', 'GET, HEAD')], b''
+        archivo = self.archivo(relativa)
+        if archivo is None:
+            self._contar('no_encontrados')
+            return '404 Not Found', [('Content-Type', 'text/plain')], b'not found'
+
+        datos, codificacion, etag = archivo.datos, None, archivo.etag
+        if archivo.variantes:
+            codificacion = elegir_codificacion(environ.get('HTTP_ACCEPT_ENCODING', ''), frozenset(archivo.variantes))
+            if codificacion:
+                datos = archivo.variantes[codificacion]
+                etag = archivo.etag[:-1] + '-' + codificacion + '"'
+
+        cache_control = ENCABEZADO_HUELLA if HUELLA.search(relativa) else ENCABEZADO_NORMAL
+        encabezados = [('ETag', etag), ('Last-Modified', archivo.ultima_modificacion), ('Cache-Control', cache_control)]
+        if archivo.variantes:
+            encabezados.append(('Vary', 'Accept-Encoding'))
+
+        if self._no_modificado(environ, archivo, etag):
+            self._contar('no_modificados')
+            return '304 Not Modified', encabezados, b''
+
+        encabezados.append(('Content-Type', archivo.tipo))
+        if codificacion:
+            encabezados.append(('Content-Encoding', codificacion))
+            self._contar('comprimidos')
+        tamano = len(datos) if datos is not None else archivo.tamano
+        encabezados.append(('Content-Length', str(tamano)))
+        if metodo == 'HEAD':
+            return '200 OK', encabezados, b''
+        if datos is not None:
+            self._contar('desde_memoria')
+            return '200 OK', encabezados, datos
+        return '200 OK', encabezados, self._flujo(archivo.ruta, environ)
+
+    def _no_modificado(self, environ, archivo, etag):
+        si_no_coincide = environ.get('HTTP_IF_NONE_MATCH')
+        if si_no_coincide:
+            # If-None-Match manda sobre If-Modified-Since (RFC 9110); se compara en forma débil
+            etiquetas = {e.strip().removeprefix('W/') for e in si_no_coincide.split(',')}
+            return '*' in etiquetas or etag in etiquetas
+        desde = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if desde:
+            try:
+                return archivo.segundos <= parsedate_to_datetime(desde).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _flujo(self, ruta, environ):
+        f = open(ruta, 'rb')
+        envoltura = environ.get('wsgi.file_wrapper')
+        if envoltura is not None:
+            self._contar('file_wrapper')
+            return envoltura(f, TAMANO_BLOQUE)
+        return self._bloques(f)
+
+    @staticmethod
+    def _bloques(f):
+        with f:
+            while True:
+                bloque = f.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                yield bloque
+
+    def __call__(self, environ, start_response):
+        ruta = environ.get('PATH_INFO', '')
+        if not ruta.startswith(self.prefijo):
+            return self.aplicacion(environ, start_response)
+        status, encabezados, cuerpo = self.respuesta(ruta[len(self.prefijo):], environ)
+        start_response(status, encabezados)
+        return [cuerpo] if isinstance(cuerpo, bytes) else cuerpo
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._metricas, en_memoria=len(self._cache),
+                        bytes_en_memoria=sum(a.tamano for a in self._cache.values()),
+                        brotli=brotli is not None)
@@ -0,0 +1,31 @@
+
+# etags.py
+# ETags débiles para las páginas de listados y reportes. La etiqueta se arma
+# con la versión de las tablas que muestra la página (VersionDatos, mantenida
+# por triggers), el usuario, su rol y los parámetros de la consulta: leerla
+# cuesta una búsqueda por llave primaria, así que un navegador que ya tiene la
+# página recibe 304 sin que se ejecuten los joins ni el render.
+
+import hashlib
+from urllib.parse import parse_qsl
+
+from cache_resultados import leer_versiones
+
+
+def parametros_normalizados(query):
+    """Parámetros de la URL ordenados, para que ?a=1&b=2 y ?b=2&a=1 den la misma etiqueta."""
+    return tuple(sorted(parse_qsl(query.lstrip('?'), keep_blank_values=True)))
+
+
+def etag_debil(conn, tablas, *partes):
+    """W/"..." que cambia cuando cambia alguna de `tablas` o alguna de las `partes`."""
+    contenido = repr((leer_versiones(conn, tablas),) + partes).encode('utf-8')
+    return f'W/"{hashlib.sha1(contenido).hexdigest()[:24]}"'
+
+
+def coincide(si_no_coincide, etag):
+    """Comparación débil de If-None-Match (RFC 9110): se ignora el prefijo W/."""
+    if not si_no_coincide:
+        return False
+    etiquetas = {e.strip().removeprefix('W/') for e in si_no_coincide.split(',')}
+    return '*' in etiquetas or etag.removeprefix('W/') in etiquetas
@@ -0,0 +1,120 @@
+
+# exportaciones.py
+# Exportaciones completas (fila por fila) de Lactantes, Citas y Controles en
+# CSV o Excel. Los datos se leen con fetchmany y se entregan como un iterador
+# WSGI por bloques, así la memoria no crece con el número de filas.
+#
+# La conexión se toma al empezar a iterar; `al_abrir(conn)` se llama con ella
+# antes del primer bloque (web.py lee ese bloque antes de enviar los encabezados,
+# así que ahí todavía se pueden agregar, p. ej. la fecha de la réplica leída).
+
+import csv
+import io
+import tempfile
+
+TAMANO_LOTE = 1000
+TAMANO_BLOQUE = 64 * 1024
+
+# nombre -> (título de la hoja, encabezados, consulta)
+DATASETS = {
+    'lactantes': (
+        "Lactantes",
+        ["ID", "Apellido paterno", "Apellido materno", "Fecha de nacimiento", "Género", "Estado",
+         "Discapacidad", "Peso", "Madre", "Área"],
+        """
+            SELECT l.id_lactantes, l.apellido_paterno, l.apellido_materno, l.fecha_nacimiento, l.genero, l.estado,
+                   l.discapacidad, l.peso,
+                   (m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')) AS madre,
+                   a.nombre AS area
+            FROM Lactantes l
+            LEFT JOIN Madres m ON l.id_madres = m.id_madre
+            LEFT JOIN Area a ON l.id_area = a.id_area
+            ORDER BY l.id_lactantes;
+        """,
+    ),
+    'citas': (
+        "Citas",
+        ["ID", "Fecha", "Hora de entrada", "ID lactante", "Apellido lactante", "Motivo", "Subsecuente",
+         "Justificación", "Atendido por"],
+        """
+            SELECT c.id_citas, c.fecha_cita, c.hora_de_entrada, c.id_lactantes, l.apellido_paterno,
+                   m.nombre AS motivo, c.subsecuente, c.justificacion, u.nombre AS atendido_por
+            FROM Citas c
+            LEFT JOIN Lactantes l ON c.id_lactantes = l.id_lactantes
+            LEFT JOIN Motivo m ON c.id_motivo = m.id_motivo
+            LEFT JOIN Usuarios u ON c.atendido_por_id_usuario = u.id_usuario
+            ORDER BY c.id_citas;
+        """,
+    ),
+    'controles': (
+        "Controles",
+        ["ID", "ID lactante", "Apellido lactante", "Peso", "Talla", "Edad (meses)", "Estado general",
+         "Fecha de control", "Observaciones"],
+        """
+            SELECT co.id_controles, co.id_lactantes, l.apellido_paterno, co.peso, co.talla, co.edad_meses,
+                   co.estado_general, co.fecha_control, co.observaciones
+            FROM Controles co
+            LEFT JOIN Lactantes l ON co.id_lactantes = l.id_lactantes
+            ORDER BY co.id_controles;
+        """,
+    ),
+}
+
+
+def lotes(conn, sql, parametros=(), tamano=TAMANO_LOTE):
+    """Itera los resultados de `sql` en bloques de `tamano` filas."""
+    cursor = conn.execute(sql, parametros)
+    while True:
+        bloque = cursor.fetchmany(tamano)
+        if not bloque:
+            break
+        yield bloque
+
+
+def exportar_csv(pool, dataset, tamano_lote=TAMANO_LOTE, al_abrir=None):
+    """Genera el CSV del dataset por bloques de bytes (UTF-8 con BOM para Excel)."""
+    _titulo, encabezados, sql = DATASETS[dataset]
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')
+    escritor.writerow(encabezados)
+    with pool.conexion() as conn:
+        if al_abrir is not None:
+            al_abrir(conn)
+        for bloque in lotes(conn, sql, tamano=tamano_lote):
+            escritor.writerows(tuple(fila) for fila in bloque)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def exportar_excel(pool, dataset, tamano_lote=TAMANO_LOTE, al_abrir=None):
+    """Genera el .xlsx del dataset con un libro write-only y lo entrega por bloques.
+
+    En modo write-only openpyxl escribe cada fila a disco al agregarla, por lo que
+    la memoria no depende del número de filas; el archivo final se lee por bloques.
+    """
+    titulo, encabezados, sql = DATASETS[dataset]
+    # openpyxl se importa aquí: los workers que nunca exportan no pagan su carga
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo)
+    ws.append(encabezados)
+    with pool.conexion() as conn:
+        if al_abrir is not None:
+            al_abrir(conn)
+        for bloque in lotes(conn, sql, tamano=tamano_lote):
+            for fila in bloque:
+                ws.append(list(fila))
+
+    with tempfile.TemporaryFile() as archivo:
+        wb.save(archivo)
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            yield bloque
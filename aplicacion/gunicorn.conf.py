@@ -0,0 +1,57 @@
+
+# gunicorn.conf.py
+# Uso (desde aplicacion/): gunicorn app:application
+#
+# Con preload_app el maestro importa app una sola vez: las migraciones y la
+# verificación del esquema, la precompilación de plantillas y los estáticos
+# comprimidos se hacen antes del fork, y cada worker nuevo (también los que
+# reemplazan a uno reiniciado) arranca sin repetir ese trabajo.
+
+import os
+import sys
+
+bind = os.environ.get('VINCULO_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('VINCULO_WORKERS', 2))
+threads = int(os.environ.get('VINCULO_HILOS', 4))
+# VINCULO_PRECARGA=0 vuelve a importar app en cada worker (útil con --reload en desarrollo)
+preload_app = os.environ.get('VINCULO_PRECARGA', '1') == '1'
+max_requests = int(os.environ.get('VINCULO_MAX_SOLICITUDES', 0))
+max_requests_jitter = max_requests // 10
+
+# app.py no arranca hilos al importarse; se arrancan en cada worker (ver post_worker_init)
+os.environ['VINCULO_GUNICORN'] = '1'
+
+# VINCULO_PRECARGAR_REPORTES=1 importa openpyxl y reportlab en el maestro: los workers
+# las comparten (copy-on-write) y el primer reporte de cada uno no paga la importación
+PRECARGAR_REPORTES = os.environ.get('VINCULO_PRECARGAR_REPORTES', '0') == '1'
+
+
+def on_starting(server):
+    # Sin preload_app el maestro verifica la base una vez; los workers heredan la marca
+    if preload_app:
+        return
+    import migraciones
+    from conexiones import abrir_conexion
+
+    ruta = os.environ.get('VINCULO_BD', 'vinculo_de_vida.db')
+    if not migraciones.base_verificada(ruta):
+        conn = abrir_conexion(ruta)
+        try:
+            migraciones.preparar_base(conn)
+        finally:
+            conn.close()
+        migraciones.marcar_verificada(ruta)
+
+
+def when_ready(server):
+    if PRECARGAR_REPORTES and preload_app:
+        import openpyxl  # noqa: F401
+        import reportlab.pdfgen.canvas  # noqa: F401
+        server.log.info("Bibliotecas de reportes precargadas en el maestro.")
+    if 'app' in sys.modules:
+        tiempos = sys.modules['arranque'].tiempos.estadisticas()
+        server.log.info("Arranque de app: %s ms %s", tiempos['total_ms'], tiempos['fases_ms'])
+
+
+def post_worker_init(worker):
+    sys.modules['app'].replica.iniciar()
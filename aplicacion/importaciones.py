@@ -0,0 +1,445 @@
+
+# importaciones.py
+# Importación masiva de madres, lactantes y citas desde CSV o Excel.
+#
+# El archivo se lee fila por fila; las filas se validan por lotes y cada lote
+# se inserta con executemany en su propia transacción corta. Las madres se
+# deduplican contra un índice en memoria construido una vez por importación.
+# Una fila inválida no detiene la importación: se anota en el reporte de errores.
+#
+# Los CSV se decodifican línea por línea como UTF-8 y, si no lo son, como
+# cp1252 (lo que guarda Excel en Windows): una línea que no es ninguna de las
+# dos queda como error de su fila. Un archivo cuyo encabezado no se puede leer
+# se rechaza completo (ArchivoInvalido) antes de insertar nada.
+
+import csv
+import datetime
+import io
+import sqlite3
+import time
+import unicodedata
+import zipfile
+
+import madres_duplicadas
+
+TAMANO_LOTE = 500
+FORMATOS = ('csv', 'xlsx')
+
+COLUMNAS = {
+    'madres': ('nombre', 'apellido_paterno', 'apellido_materno', 'discapacidad', 'motivo'),
+    'lactantes': ('apellido_paterno', 'apellido_materno', 'fecha_nacimiento', 'genero', 'area', 'estado',
+                  'discapacidad', 'peso', 'nombre_madre', 'apellido_paterno_madre', 'apellido_materno_madre',
+                  'discapacidad_madre'),
+    'citas': ('id_lactante', 'fecha_cita', 'hora_cita', 'motivo', 'subsecuente', 'justificacion'),
+}
+
+INSERT_MADRE = "INSERT INTO Madres (id_madre, nombre, apellido_paterno, apellido_materno, discapacidad, id_motivo) VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_LACTANTE = """INSERT INTO Lactantes (id_madres, id_area, apellido_paterno, apellido_materno, fecha_nacimiento, genero, estado, discapacidad, peso)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+INSERT_CITA = """INSERT INTO Citas (id_lactantes, id_motivo, atendido_por_id_usuario, fecha_cita, subsecuente, justificacion, hora_de_entrada)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+
+ENCODINGS_CSV = ('utf-8', 'cp1252')
+
+
+class ArchivoInvalido(ValueError):
+    """No se pudo leer el encabezado: el archivo está dañado o no es del formato indicado."""
+
+
+class FilaInvalida(ValueError):
+    pass
+
+
+class FilaOmitida(FilaInvalida):
+    """La fila ya existe en la base de datos; no es un error del archivo."""
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y con espacios simples: llave para comparar nombres."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').strip().casefold())
+    return ' '.join(''.join(c for c in texto if not unicodedata.combining(c)).split())
+
+
+def _columna(encabezado):
+    return normalizar(encabezado).replace(' ', '_')
+
+
+class _LineasCSV:
+    """Líneas de texto de un CSV en bytes; `con_error` marca si alguna no se pudo decodificar."""
+
+    def __init__(self, archivo):
+        self._archivo = archivo
+        self._primera = True
+        self.con_error = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        linea = next(self._archivo)
+        if self._primera:
+            linea = linea.removeprefix(b'\xef\xbb\xbf')
+            self._primera = False
+        for encoding in ENCODINGS_CSV:
+            try:
+                return linea.decode(encoding)
+            except UnicodeDecodeError:
+                pass
+        self.con_error = True
+        return linea.decode('utf-8', errors='replace')
+
+
+def leer_filas(archivo, formato):
+    """Iterador de (número de fila, {columna: valor}) sin cargar el archivo completo.
+
+    Lee el encabezado de inmediato (ArchivoInvalido si no se puede). Una fila que
+    no se puede leer llega como (número, FilaInvalida) para el reporte de errores.
+    """
+    if formato == 'csv':
+        lineas = _LineasCSV(archivo)
+        lector = csv.reader(lineas)
+        try:
+            encabezados = next(lector, None)
+        except csv.Error as e:
+            raise ArchivoInvalido(f"No se pudo leer el encabezado del CSV: {e}") from e
+        if lineas.con_error:
+            raise ArchivoInvalido("El encabezado del CSV no está en UTF-8 ni en cp1252.")
+        if encabezados is None:
+            return iter(())
+        return _filas_csv(lector, lineas, [_columna(e) for e in encabezados])
+    if formato == 'xlsx':
+        from openpyxl import load_workbook
+        try:
+            libro = load_workbook(archivo, read_only=True, data_only=True)
+            filas = libro.worksheets[0].iter_rows(values_only=True)
+            encabezados = next(filas, None)
+        except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+            raise ArchivoInvalido(f"No es un archivo de Excel (.xlsx) válido: {e}") from e
+        if encabezados is None:
+            return iter(())
+        return _filas_xlsx(filas, [_columna(e) for e in encabezados])
+    raise ValueError(f"Formato no soportado: {formato}")
+
+
+def _fila(columnas, valores):
+    if not any(v not in (None, '') for v in valores):
+        return None
+    return {c: v for c, v in zip(columnas, valores) if c}
+
+
+def _filas_csv(lector, lineas, columnas):
+    numero = 1
+    while True:
+        numero += 1
+        lineas.con_error = False
+        try:
+            valores = next(lector)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield numero, FilaInvalida(f"No se pudo leer la fila: {e}")
+            continue
+        if lineas.con_error:
+            yield numero, FilaInvalida("La fila no está en UTF-8 ni en cp1252.")
+            continue
+        fila = _fila(columnas, valores)
+        if fila is not None:
+            yield numero, fila
+
+
+def _filas_xlsx(filas, columnas):
+    numero = 1
+    try:
+        for numero, valores in enumerate(filas, start=2):
+            fila = _fila(columnas, valores)
+            if fila is not None:
+                yield numero, fila
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        # El libro se lee en flujo: lo que sigue a la parte dañada ya no se puede leer
+        yield numero + 1, FilaInvalida(f"El archivo está dañado a partir de esta fila: {e}")
+
+
+def _texto(fila, columna, obligatorio=False, defecto=None):
+    valor = fila.get(columna)
+    valor = str(valor).strip() if valor is not None else ''
+    if not valor:
+        if obligatorio:
+            raise FilaInvalida(f"Falta '{columna}'.")
+        return defecto
+    return valor
+
+
+def _fecha(fila, columna):
+    valor = fila.get(columna)
+    if isinstance(valor, datetime.datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    texto = _texto(fila, columna, obligatorio=True)
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            pass
+    raise FilaInvalida(f"Fecha no válida en '{columna}': {texto}")
+
+
+def _hora(fila, columna):
+    valor = fila.get(columna)
+    if isinstance(valor, (datetime.time, datetime.datetime)):
+        return valor.strftime('%H:%M')
+    texto = _texto(fila, columna, obligatorio=True)
+    for formato in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(texto, formato).strftime('%H:%M')
+        except ValueError:
+            pass
+    raise FilaInvalida(f"Hora no válida en '{columna}': {texto}")
+
+
+def _numero(fila, columna):
+    texto = _texto(fila, columna)
+    if texto is None:
+        return None
+    try:
+        return float(texto.replace(',', '.'))
+    except ValueError:
+        raise FilaInvalida(f"Número no válido en '{columna}': {texto}")
+
+
+class Importador:
+    """Importa un conjunto de datos (madres, lactantes o citas) sobre una conexión."""
+
+    def __init__(self, conn, datos, id_usuario=None, tamano_lote=TAMANO_LOTE, auditar=None):
+        if datos not in COLUMNAS:
+            raise ValueError(f"Datos no soportados: {datos}")
+        self.conn = conn
+        self.datos = datos
+        self.id_usuario = id_usuario
+        self.tamano_lote = tamano_lote
+        self.auditar = auditar
+        self.leidas = 0
+        self.insertadas = 0
+        self.omitidas = 0
+        self.madres_creadas = 0
+        self.lotes = 0
+        self.errores = []
+        self._cargar_referencias()
+
+    def _cargar_referencias(self):
+        conn = self.conn
+        self.areas = {normalizar(n): i for i, n in conn.execute("SELECT id_area, nombre FROM Area")}
+        self.motivos = {normalizar(n): i for i, n in conn.execute("SELECT id_motivo, nombre FROM Motivo")}
+        self.ids_motivo = set(self.motivos.values())
+        self.madres = {}
+        self.id_desconocida = None
+        if self.datos in ('madres', 'lactantes'):
+            # Misma llave que el registro de lactantes (Madres.llave_nombre)
+            for id_madre, llave in conn.execute("SELECT id_madre, llave_nombre FROM Madres ORDER BY id_madre"):
+                self.madres.setdefault(llave, id_madre)
+            fila = conn.execute("SELECT id_madre FROM Madres WHERE nombre = 'Desconocida'").fetchone()
+            self.id_desconocida = fila[0] if fila else None
+        # Se conservan hasta el commit del lote: si el lote falla se descartan
+        self._madres_pendientes = {}
+
+    def _motivo(self, fila, columna='motivo', obligatorio=False):
+        texto = _texto(fila, columna, obligatorio=obligatorio)
+        if texto is None:
+            return None
+        if texto.isdigit() and int(texto) in self.ids_motivo:
+            return int(texto)
+        id_motivo = self.motivos.get(normalizar(texto))
+        if id_motivo is None:
+            raise FilaInvalida(f"El motivo '{texto}' no existe.")
+        return id_motivo
+
+    # --- Validación: cada fila se convierte en (número, madre nueva o None, parámetros del INSERT) ---
+    def _madre(self, nombre, paterno, materno, discapacidad, id_motivo):
+        """Id de la madre (existente o reservada para este lote) y la fila a insertar si es nueva."""
+        llave = madres_duplicadas.llave(nombre, paterno, materno)
+        id_madre = self.madres.get(llave) or self._madres_pendientes.get(llave)
+        if id_madre is not None:
+            return id_madre, None
+        id_madre = self._siguiente_id_madre
+        self._siguiente_id_madre += 1
+        self._madres_pendientes[llave] = id_madre
+        return id_madre, (id_madre, nombre, paterno, materno, discapacidad, id_motivo)
+
+    def _validar_madres(self, numero, fila):
+        nombre = _texto(fila, 'nombre', obligatorio=True)
+        paterno = _texto(fila, 'apellido_paterno', obligatorio=True)
+        materno = _texto(fila, 'apellido_materno', defecto='')
+        id_madre, nueva = self._madre(nombre, paterno, materno, _texto(fila, 'discapacidad', defecto=''),
+                                      self._motivo(fila) or 1)
+        if nueva is None:
+            raise FilaOmitida(f"La madre ya está registrada (id {id_madre}); se omite.")
+        return numero, nueva, None
+
+    def _validar_lactantes(self, numero, fila):
+        paterno = _texto(fila, 'apellido_paterno', obligatorio=True)
+        fecha = _fecha(fila, 'fecha_nacimiento')
+        genero = _texto(fila, 'genero', obligatorio=True)
+        area = _texto(fila, 'area', obligatorio=True)
+        id_area = self.areas.get(normalizar(area))
+        if id_area is None:
+            raise FilaInvalida(f"El área '{area}' no existe.")
+        peso = _numero(fila, 'peso')
+        nombre_madre = _texto(fila, 'nombre_madre')
+        paterno_madre = _texto(fila, 'apellido_paterno_madre')
+        materno_madre = _texto(fila, 'apellido_materno_madre')
+        # La madre se reserva al final: una fila inválida no deja una madre pendiente sin insertar
+        nueva = None
+        if nombre_madre and paterno_madre and materno_madre:
+            id_madre, nueva = self._madre(nombre_madre, paterno_madre, materno_madre,
+                                          _texto(fila, 'discapacidad_madre', defecto=''), 1)
+        elif self.id_desconocida is not None:
+            id_madre = self.id_desconocida
+        else:
+            raise FilaInvalida("Faltan los datos de la madre y no existe la madre 'Desconocida'.")
+        return numero, nueva, (id_madre, id_area, paterno, _texto(fila, 'apellido_materno', defecto=''), fecha, genero,
+                               _texto(fila, 'estado', defecto='Activo'), _texto(fila, 'discapacidad', defecto='Ninguna'),
+                               peso)
+
+    def _validar_citas(self, numero, fila):
+        texto = _texto(fila, 'id_lactante', obligatorio=True)
+        if not texto.isdigit():
+            raise FilaInvalida(f"id_lactante no válido: {texto}")
+        subsecuente = normalizar(_texto(fila, 'subsecuente', defecto='0'))
+        if subsecuente not in ('0', '1', 'si', 'no'):
+            raise FilaInvalida(f"Valor no válido en 'subsecuente': {subsecuente}")
+        return numero, None, (int(texto), self._motivo(fila, obligatorio=True), self.id_usuario, _fecha(fila, 'fecha_cita'),
+                              1 if subsecuente in ('1', 'si') else 0, _texto(fila, 'justificacion', defecto=''),
+                              _hora(fila, 'hora_cita'))
+
+    # --- Inserción por lotes ---
+    def _procesar_lote(self, lote):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._siguiente_id_madre = self.conn.execute("SELECT IFNULL(MAX(id_madre), 0) + 1 FROM Madres").fetchone()[0]
+            self._madres_pendientes = {}
+            validas = []
+            for numero, fila in lote:
+                if isinstance(fila, FilaInvalida):
+                    self._anotar(numero, str(fila))
+                    continue
+                try:
+                    validas.append(getattr(self, '_validar_' + self.datos)(numero, fila))
+                except FilaInvalida as e:
+                    self._anotar(numero, str(e), omitida=isinstance(e, FilaOmitida))
+            if self.datos == 'citas':
+                validas = self._filtrar_lactantes_inexistentes(validas)
+            try:
+                self._insertar(validas)
+            except sqlite3.Error:
+                # Algún registro viola una restricción: se repite fila por fila para aislarlo
+                self.conn.rollback()
+                self.conn.execute("BEGIN IMMEDIATE")
+                validas = self._insertar_por_fila(validas)
+            if self.auditar and validas:
+                self.auditar(self.conn, f"Importación masiva: {len(validas)} {self.datos}", self.datos.capitalize())
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.madres.update(self._madres_pendientes)
+        self.insertadas += len(validas)
+        self.madres_creadas += len(self._madres_pendientes)
+        self.lotes += 1
+
+    def _filtrar_lactantes_inexistentes(self, validas):
+        ids = sorted({params[0] for _, _, params in validas})
+        if not ids:
+            return validas
+        marcadores = ", ".join("?" for _ in ids)
+        existentes = {fila[0] for fila in self.conn.execute(
+            f"SELECT id_lactantes FROM Lactantes WHERE id_lactantes IN ({marcadores})", ids)}
+        resultado = []
+        for registro in validas:
+            if registro[2][0] in existentes:
+                resultado.append(registro)
+            else:
+                self._anotar(registro[0], f"El lactante {registro[2][0]} no existe.")
+        return resultado
+
+    def _insertar(self, validas):
+        madres = {m[0]: m for _, m, _ in validas if m is not None}
+        if madres:
+            self.conn.executemany(INSERT_MADRE, list(madres.values()))
+        if self.datos == 'lactantes':
+            self.conn.executemany(INSERT_LACTANTE, [params for _, _, params in validas])
+        elif self.datos == 'citas':
+            self.conn.executemany(INSERT_CITA, [params for _, _, params in validas])
+
+    def _insertar_por_fila(self, validas):
+        insertadas, madres_insertadas = [], set()
+        madres = {m[0]: m for _, m, _ in validas if m is not None}
+        for registro in validas:
+            numero, madre, params = registro
+            # Si falla la fila que trae a una madre nueva, la inserta la siguiente fila de esa madre
+            id_madre = madre[0] if madre is not None else params[0] if self.datos == 'lactantes' else None
+            self.conn.execute("SAVEPOINT fila")
+            try:
+                if id_madre in madres and id_madre not in madres_insertadas:
+                    self.conn.execute(INSERT_MADRE, madres[id_madre])
+                if self.datos == 'lactantes':
+                    self.conn.execute(INSERT_LACTANTE, params)
+                elif self.datos == 'citas':
+                    self.conn.execute(INSERT_CITA, params)
+            except sqlite3.Error as e:
+                self.conn.execute("ROLLBACK TO fila")
+                self._anotar(numero, f"Error de base de datos: {e}")
+            else:
+                if id_madre in madres:
+                    madres_insertadas.add(id_madre)
+                insertadas.append(registro)
+            self.conn.execute("RELEASE fila")
+        # Las madres de filas fallidas que no llegaron a insertarse no entran al índice
+        self._madres_pendientes = {k: v for k, v in self._madres_pendientes.items() if v in madres_insertadas}
+        return insertadas
+
+    def _anotar(self, numero, mensaje, omitida=False):
+        if omitida:
+            self.omitidas += 1
+        self.errores.append((numero, mensaje))
+
+    def importar(self, filas):
+        inicio = time.perf_counter()
+        lote = []
+        for numero, fila in filas:
+            self.leidas += 1
+            lote.append((numero, fila))
+            if len(lote) >= self.tamano_lote:
+                self._procesar_lote(lote)
+                lote = []
+        if lote:
+            self._procesar_lote(lote)
+        return self.resumen(time.perf_counter() - inicio)
+
+    def resumen(self, segundos=0.0):
+        return {
+            "datos": self.datos,
+            "leidas": self.leidas,
+            "insertadas": self.insertadas,
+            "madres_creadas": self.madres_creadas,
+            "omitidas": self.omitidas,
+            "con_error": len(self.errores) - self.omitidas,
+            "lotes": self.lotes,
+            "segundos": round(segundos, 3),
+            "errores": [{"fila": numero, "error": mensaje} for numero, mensaje in sorted(self.errores)],
+        }
+
+
+def formato_de(nombre_archivo, formato=None):
+    formato = (formato or nombre_archivo.rsplit('.', 1)[-1]).lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato} (use csv o xlsx)")
+    return formato
+
+
+def escribir_errores(resumen, destino):
+    """Guarda el reporte de errores por fila como CSV."""
+    escritor = csv.writer(destino)
+    escritor.writerow(["fila", "error"])
+    for error in resumen["errores"]:
+        escritor.writerow([error["fila"], error["error"]])
@@ -0,0 +1,147 @@
+
+# linea_tiempo.py
+# Línea de tiempo clínica de un lactante: citas, controles de crecimiento y
+# eventos de auditoría en un solo orden cronológico (más reciente primero).
+# Cada fuente se lee con una consulta por su índice (id_lactantes, fecha) y la
+# vista combinada se guarda en caché por lactante. La versión de la entrada
+# sale de Cambios (filas del lactante, sus citas y controles) y del último
+# evento de auditoría: cualquier escritura que lo toque la invalida. Las citas
+# y la auditoría se leen de las vistas con la historia archivada
+# (archivo_historico.py).
+
+from bisect import bisect_left
+
+from cache_resultados import leer_versiones
+from listados import codificar_cursor, decodificar_cursor
+
+CONSULTA_LACTANTE = """
+    SELECT l.id_lactantes, l.apellido_paterno, l.apellido_materno, l.fecha_nacimiento, l.genero, l.estado,
+           a.nombre AS area,
+           (m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')) AS nombre_madre
+    FROM Lactantes l
+    LEFT JOIN Area a ON a.id_area = l.id_area
+    LEFT JOIN Madres m ON m.id_madre = l.id_madres
+    WHERE l.id_lactantes = ?
+"""
+
+# tipo -> consulta (una por fuente, todas por índice sobre id_lactantes en cada tabla de la vista)
+FUENTES = {
+    'cita': """
+        SELECT c.id_citas AS id, c.fecha_cita AS fecha, c.hora_de_entrada AS hora, m.nombre AS motivo,
+               c.subsecuente, c.justificacion, u.nombre AS atendido_por
+        FROM CitasHistoricas c
+        LEFT JOIN Motivo m ON m.id_motivo = c.id_motivo
+        LEFT JOIN Usuarios u ON u.id_usuario = c.atendido_por_id_usuario
+        WHERE c.id_lactantes = ?
+    """,
+    'control': """
+        SELECT id_controles AS id, fecha_control AS fecha, peso, talla, edad_meses, estado_general, observaciones
+        FROM Controles
+        WHERE id_lactantes = ?
+    """,
+    'auditoria': """
+        SELECT a.id_auditoria AS id, a.fecha, a.accion, a.tabla_afectada, u.nombre AS usuario
+        FROM AuditoriaHistorica a
+        LEFT JOIN Usuarios u ON u.id_usuario = a.id_usuario
+        WHERE a.id_lactantes = ?
+    """,
+}
+
+# Filas del lactante en Cambios (cada alta, edición o baja sube su versión), número de citas
+# y controles (una baja no deja fila que consultar) y último evento de auditoría
+CONSULTA_VERSION = """
+    SELECT (SELECT version FROM Cambios WHERE tabla = 'Lactantes' AND id_fila = :id),
+           (SELECT COUNT(*) FROM Citas WHERE id_lactantes = :id),
+           (SELECT MAX(ca.version) FROM Citas c
+            JOIN Cambios ca ON ca.tabla = 'Citas' AND ca.id_fila = c.id_citas
+            WHERE c.id_lactantes = :id),
+           (SELECT COUNT(*) FROM Controles WHERE id_lactantes = :id),
+           (SELECT MAX(ca.version) FROM Controles c
+            JOIN Cambios ca ON ca.tabla = 'Controles' AND ca.id_fila = c.id_controles
+            WHERE c.id_lactantes = :id),
+           (SELECT MAX(id_auditoria) FROM Auditoria WHERE id_lactantes = :id)
+"""
+
+# Nombres que se muestran en los eventos (motivo, usuario, área)
+TABLAS_CATALOGO = ('Motivo', 'Usuarios', 'Area', 'Madres')
+
+
+def normalizar_fecha(fecha, hora=None):
+    """'AAAA-MM-DD HH:MM:SS' comparable entre fuentes (las citas guardan fecha y hora por separado)."""
+    fecha = str(fecha or '').strip().replace('T', ' ')
+    if len(fecha) == 10:
+        hora = str(hora or '').strip()
+        fecha += ' ' + (hora if len(hora) in (5, 8) and hora[2:3] == ':' else '00:00')
+    if len(fecha) == 16:
+        fecha += ':00'
+    return fecha[:19]
+
+
+def version(conn, id_lactante):
+    return (tuple(conn.execute(CONSULTA_VERSION, {"id": id_lactante}).fetchone())
+            + leer_versiones(conn, TABLAS_CATALOGO))
+
+
+def construir(conn, id_lactante):
+    """Lactante y sus eventos en orden ascendente por (fecha, tipo, id), o None si no existe."""
+    lactante = conn.execute(CONSULTA_LACTANTE, (id_lactante,)).fetchone()
+    if lactante is None:
+        return None
+    eventos = []
+    for tipo, sql in FUENTES.items():
+        for fila in conn.execute(sql, (id_lactante,)):
+            evento = dict(fila)
+            evento['fecha'] = normalizar_fecha(evento['fecha'], evento.pop('hora', None))
+            evento['tipo'] = tipo
+            eventos.append(evento)
+    eventos.sort(key=lambda evento: (evento['fecha'], evento['tipo'], evento['id']))
+    return {
+        "lactante": dict(lactante),
+        "eventos": eventos,
+        "claves": [(evento['fecha'], evento['tipo'], evento['id']) for evento in eventos],
+    }
+
+
+def _clave_valida(valores):
+    fecha, tipo, id_evento = valores
+    return (isinstance(fecha, str) and isinstance(tipo, str)
+            and isinstance(id_evento, int) and not isinstance(id_evento, bool))
+
+
+def pagina(vista, cursor, limite):
+    """Los `limite` eventos anteriores al cursor (más recientes primero) y el cursor de la siguiente página."""
+    valores = decodificar_cursor(cursor, 3)
+    if valores is not None and not _clave_valida(valores):
+        # Un cursor con otros tipos no se puede comparar con las claves: se trata como inválido
+        valores = None
+    fin = len(vista["claves"]) if valores is None else bisect_left(vista["claves"], tuple(valores))
+    inicio = max(0, fin - limite)
+    eventos = vista["eventos"][inicio:fin][::-1]
+    siguiente = codificar_cursor(vista["claves"][inicio]) if inicio > 0 else None
+    return eventos, siguiente
+
+
+class LineaTiempo:
+    def __init__(self, cache, archivo):
+        # CacheResultados por lactante, con la versión de CONSULTA_VERSION
+        self.cache = cache
+        # ArchivoHistorico que define las vistas CitasHistoricas y AuditoriaHistorica
+        self.archivo = archivo
+
+    def obtener(self, conn, id_lactante, cursor=None, limite=50):
+        """Página de la línea de tiempo, o None si el lactante no existe."""
+        self.archivo.adjuntar(conn)
+        vista = self.cache.obtener_version(('linea_tiempo', id_lactante), version(conn, id_lactante),
+                                           lambda: construir(conn, id_lactante))
+        if vista is None:
+            return None
+        eventos, siguiente = pagina(vista, cursor, limite)
+        return {
+            "lactante": vista["lactante"],
+            "total_eventos": len(vista["eventos"]),
+            "eventos": eventos,
+            "siguiente": siguiente,
+        }
+
+    def estadisticas(self):
+        return self.cache.estadisticas()
@@ -0,0 +1,147 @@
+
+# listados.py
+# Consultas paginadas (keyset / seek) y filtros del lado del servidor para los
+# listados de lactantes y citas. El costo de cada página depende del tamaño de
+# página y no del tamaño de la tabla.
+
+import base64
+import json
+from urllib.parse import urlencode
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
+
+CAMPOS_FILTRO = ('area', 'estado', 'genero', 'desde', 'hasta')
+
+
+def codificar_cursor(valores):
+    """Convierte la llave de orden de la última fila en un cursor opaco para la URL."""
+    texto = json.dumps(list(valores), separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor, longitud):
+    """Devuelve la lista de valores del cursor, o None si no viene o es inválido."""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != longitud:
+        return None
+    return valores
+
+
+def leer_filtros(data):
+    """Extrae los filtros y parámetros de paginación de web.input()."""
+    filtros = {campo: (data.get(campo) or '').strip() for campo in CAMPOS_FILTRO}
+    try:
+        limite = int(data.get('limite') or LIMITE_POR_DEFECTO)
+    except ValueError:
+        limite = LIMITE_POR_DEFECTO
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    return filtros, data.get('cursor') or None, limite
+
+
+def url_pagina(ruta, filtros, cursor, limite):
+    """URL de la página indicada por `cursor` conservando los filtros activos."""
+    if not cursor:
+        return None
+    parametros = {campo: valor for campo, valor in filtros.items() if valor}
+    parametros['cursor'] = cursor
+    if limite != LIMITE_POR_DEFECTO:
+        parametros['limite'] = limite
+    return ruta + '?' + urlencode(parametros)
+
+
+def _condiciones_lactante(filtros, prefijo='l'):
+    condiciones, parametros = [], []
+    if filtros.get('area'):
+        condiciones.append(f"{prefijo}.id_area = ?")
+        parametros.append(filtros['area'])
+    if filtros.get('estado'):
+        condiciones.append(f"{prefijo}.estado = ?")
+        parametros.append(filtros['estado'])
+    if filtros.get('genero'):
+        condiciones.append(f"{prefijo}.genero = ?")
+        parametros.append(filtros['genero'])
+    return condiciones, parametros
+
+
+def _pagina(filas, limite, llave):
+    """Separa la fila extra (si existe) y calcula el cursor de la página siguiente."""
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(llave(filas[-1]))
+    return filas, siguiente
+
+
+def consultar_lactantes(conn, filtros, cursor=None, limite=LIMITE_POR_DEFECTO):
+    """Página de lactantes ordenada por apellidos; devuelve (filas, cursor_siguiente)."""
+    condiciones, parametros = _condiciones_lactante(filtros)
+    if filtros.get('desde'):
+        condiciones.append("l.fecha_nacimiento >= ?")
+        parametros.append(filtros['desde'])
+    if filtros.get('hasta'):
+        condiciones.append("l.fecha_nacimiento <= ?")
+        parametros.append(filtros['hasta'])
+
+    llave = decodificar_cursor(cursor, 3)
+    if llave:
+        # Misma expresión que el ORDER BY y el índice idx_lactantes_orden
+        condiciones.append("(l.apellido_paterno, IFNULL(l.apellido_materno, ''), l.id_lactantes) > (?, ?, ?)")
+        parametros.extend(llave)
+
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    filas = conn.execute(f"""
+        SELECT
+            l.id_lactantes,
+            l.apellido_paterno,
+            l.apellido_materno,
+            l.fecha_nacimiento,
+            l.genero,
+            l.discapacidad,
+            l.peso,
+            l.estado,
+            (m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')) AS nombre_completo_madre,
+            a.nombre AS area_nombre
+        FROM Lactantes l
+        LEFT JOIN Madres m ON l.id_madres = m.id_madre
+        LEFT JOIN Area a ON l.id_area = a.id_area
+        {where}
+        ORDER BY l.apellido_paterno, IFNULL(l.apellido_materno, ''), l.id_lactantes
+        LIMIT ?;
+    """, parametros + [limite + 1]).fetchall()
+    return _pagina(filas, limite, lambda f: (f['apellido_paterno'], f['apellido_materno'] or '', f['id_lactantes']))
+
+
+def consultar_citas(conn, filtros, cursor=None, limite=LIMITE_POR_DEFECTO):
+    """Página de citas de la más reciente a la más antigua; devuelve (filas, cursor_siguiente)."""
+    condiciones, parametros = _condiciones_lactante(filtros)
+    if filtros.get('desde'):
+        condiciones.append("c.fecha_cita >= ?")
+        parametros.append(filtros['desde'])
+    if filtros.get('hasta'):
+        condiciones.append("c.fecha_cita <= ?")
+        parametros.append(filtros['hasta'])
+
+    llave = decodificar_cursor(cursor, 2)
+    if llave:
+        condiciones.append("(c.fecha_cita, c.id_citas) < (?, ?)")
+        parametros.extend(llave)
+
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    filas = conn.execute(f"""
+        SELECT c.id_citas, c.fecha_cita, c.hora_de_entrada, l.apellido_paterno AS lactante_apellido,
+               m.nombre AS motivo_nombre, u.nombre AS atendido_por
+        FROM Citas c
+        JOIN Lactantes l ON c.id_lactantes = l.id_lactantes
+        JOIN Motivo m ON c.id_motivo = m.id_motivo
+        JOIN Usuarios u ON c.atendido_por_id_usuario = u.id_usuario
+        {where}
+        ORDER BY c.fecha_cita DESC, c.id_citas DESC
+        LIMIT ?;
+    """, parametros + [limite + 1]).fetchall()
+    return _pagina(filas, limite, lambda f: (f['fecha_cita'], f['id_citas']))
@@ -0,0 +1,264 @@
+
+# madres_duplicadas.py
+# Madres registradas más de una vez. La columna generada Madres.llave_nombre
+# guarda nombre y apellidos en minúsculas, sin acentos y con espacios simples
+# (indexada): el registro de lactantes encuentra a la madre aunque se capture
+# "MARIA Lopez" en lugar de "María López", y la importación usa la misma llave.
+#
+# Las variantes con errores de captura se buscan por bloques: cada madre entra
+# en tres bloques según el código fonético de dos de sus tres campos (nombre y
+# paterno, nombre y materno, paterno y materno), y sólo se comparan las madres
+# de un mismo bloque. Un error en un campo deja a la pareja junta en el bloque
+# que no lo usa; dos campos con errores ya no se detectan. Los pares parecidos
+# (difflib) se agrupan con union-find.
+#
+# fusionar() mueve los lactantes de las duplicadas a la madre que se conserva
+# y borra las demás en la misma transacción. La madre 'Desconocida' nunca se
+# compara ni se fusiona.
+
+import difflib
+import threading
+import time
+
+UMBRAL_POR_DEFECTO = 0.88
+# Los bloques más grandes (apellidos muy comunes) se comparan sólo con sus vecinos en orden alfabético
+MAX_BLOQUE = 200
+VENTANA = 20
+NOMBRE_DESCONOCIDA = 'Desconocida'
+CAMPOS = ('nombre', 'apellido_paterno', 'apellido_materno')
+
+# Letras acentuadas del español -> sin acento; lower() de SQLite sólo convierte A-Z. Son pocas a
+# propósito: cada una es un replace() anidado y el parser de SQLite tiene una profundidad máxima
+ACENTOS = dict(zip('áéíóúüñÁÉÍÓÚÜÑ', 'aeiouunAEIOUUN'))
+_TRADUCCION = str.maketrans({**{origen: destino.lower() for origen, destino in ACENTOS.items()},
+                             **{chr(c): chr(c + 32) for c in range(ord('A'), ord('Z') + 1)}})
+# Tres pasadas reducen hasta 8 espacios seguidos a uno
+PASADAS_ESPACIOS = 3
+
+# Variantes de escritura con el mismo sonido (en orden: 'ce' antes que 'c')
+SUSTITUCIONES_FONETICAS = (('ch', 'x'), ('qu', 'k'), ('ll', 'y'), ('ce', 'se'), ('ci', 'si'), ('ge', 'je'), ('gi', 'ji'),
+                           ('c', 'k'), ('z', 's'), ('v', 'b'), ('w', 'u'), ('h', ''))
+
+
+class FusionInvalida(ValueError):
+    pass
+
+
+def _sql_normalizar(expresion):
+    """Misma normalización que normalizar_campo() (sin el trim), en SQL."""
+    for origen, destino in ACENTOS.items():
+        expresion = f"replace({expresion}, '{origen}', '{destino}')"
+    expresion = f"lower({expresion})"
+    for _ in range(PASADAS_ESPACIOS):
+        expresion = f"replace({expresion}, '  ', ' ')"
+    return expresion
+
+
+# Los tres campos se recortan y se unen antes de normalizar: los replace() se anidan una sola vez
+EXPRESION_LLAVE = _sql_normalizar(" || '|' || ".join(f"trim(IFNULL({campo}, ''))" for campo in CAMPOS))
+
+
+def crear_llave(conn):
+    """Columna generada Madres.llave_nombre con su índice (migración)."""
+    conn.execute(f"ALTER TABLE Madres ADD COLUMN llave_nombre TEXT GENERATED ALWAYS AS ({EXPRESION_LLAVE}) VIRTUAL;")
+    # Sustituye a la búsqueda exacta por idx_madres_apellidos en RegistroLactantes.POST
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_madres_llave ON Madres(llave_nombre);")
+
+
+def normalizar_campo(texto):
+    texto = (texto or '').translate(_TRADUCCION).strip(' ')
+    for _ in range(PASADAS_ESPACIOS):
+        texto = texto.replace('  ', ' ')
+    return texto
+
+
+def llave(nombre, paterno, materno):
+    """Valor de Madres.llave_nombre para estos datos."""
+    return '|'.join(normalizar_campo(campo) for campo in (nombre, paterno, materno))
+
+
+def buscar(conn, nombre, paterno, materno):
+    """Id de la madre registrada con el mismo nombre normalizado (la más antigua), o None."""
+    fila = conn.execute("SELECT id_madre FROM Madres WHERE llave_nombre = ? ORDER BY id_madre LIMIT 1",
+                        (llave(nombre, paterno, materno),)).fetchone()
+    return fila[0] if fila else None
+
+
+def codigo_fonetico(campo, largo=4):
+    """Primera letra y consonantes siguientes de un campo normalizado, unificando letras del mismo sonido."""
+    texto = campo.replace(' ', '')
+    for origen, destino in SUSTITUCIONES_FONETICAS:
+        texto = texto.replace(origen, destino)
+    if not texto:
+        return ''
+    codigo = texto[0]
+    for letra in texto[1:]:
+        if letra not in 'aeiou' and letra != codigo[-1]:
+            codigo += letra
+    return codigo[:largo]
+
+
+def _llaves_bloque(llave_madre):
+    nombre, paterno, materno = (codigo_fonetico(campo) for campo in llave_madre.split('|'))
+    return (('np', nombre, paterno), ('nm', nombre, materno), ('pm', paterno, materno))
+
+
+class _Grupos:
+    """Union-find sobre ids de madres."""
+
+    def __init__(self):
+        self.padre = {}
+
+    def raiz(self, x):
+        self.padre.setdefault(x, x)
+        while self.padre[x] != x:
+            self.padre[x] = self.padre[self.padre[x]]
+            x = self.padre[x]
+        return x
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.padre[max(ra, rb)] = min(ra, rb)
+
+
+class DetectorDuplicados:
+    def __init__(self, umbral=UMBRAL_POR_DEFECTO, max_bloque=MAX_BLOQUE, ventana=VENTANA):
+        self.umbral = umbral
+        self.max_bloque = max_bloque
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._ejecuciones = 0
+        self._comparaciones = 0
+        self._fusiones = 0
+        self._lactantes_movidos = 0
+        self._ultimo = None
+
+    def grupos(self, conn, umbral=None):
+        """Grupos de posibles duplicadas: [(ids ordenados, similitud mínima entre pares unidos)]."""
+        umbral = self.umbral if umbral is None else umbral
+        inicio = time.perf_counter()
+        # Las llaves idénticas se comparan una sola vez
+        ids_por_llave = {}
+        for id_madre, llave_madre in conn.execute("SELECT id_madre, llave_nombre FROM Madres WHERE nombre <> ?",
+                                                  (NOMBRE_DESCONOCIDA,)):
+            ids_por_llave.setdefault(llave_madre, []).append(id_madre)
+
+        grupos = _Grupos()
+        similitud = {}
+        for ids in ids_por_llave.values():
+            for id_madre in ids[1:]:
+                grupos.unir(ids[0], id_madre)
+                similitud[ids[0]] = similitud[id_madre] = 1.0
+
+        bloques = {}
+        for llave_madre in ids_por_llave:
+            for llave_bloque in _llaves_bloque(llave_madre):
+                bloques.setdefault(llave_bloque, []).append(llave_madre)
+
+        comparadas = set()
+        comparaciones = 0
+        comparador = difflib.SequenceMatcher(autojunk=False)
+        for miembros in bloques.values():
+            if len(miembros) < 2:
+                continue
+            miembros.sort()
+            alcance = len(miembros) if len(miembros) <= self.max_bloque else self.ventana + 1
+            for i, a in enumerate(miembros):
+                # SequenceMatcher guarda el análisis de seq2: se fija una vez por madre
+                comparador.set_seq2(a)
+                for b in miembros[i + 1:i + alcance]:
+                    if (a, b) in comparadas:
+                        continue
+                    comparadas.add((a, b))
+                    comparaciones += 1
+                    comparador.set_seq1(b)
+                    if comparador.real_quick_ratio() < umbral or comparador.quick_ratio() < umbral:
+                        continue
+                    razon = comparador.ratio()
+                    if razon >= umbral:
+                        id_a, id_b = ids_por_llave[a][0], ids_por_llave[b][0]
+                        grupos.unir(id_a, id_b)
+                        for id_madre in (id_a, id_b):
+                            similitud[id_madre] = min(similitud.get(id_madre, 1.0), razon)
+
+        miembros_por_raiz = {}
+        for id_madre in grupos.padre:
+            miembros_por_raiz.setdefault(grupos.raiz(id_madre), []).append(id_madre)
+        resultado = sorted(((sorted(ids), round(min(similitud[i] for i in ids), 4))
+                            for ids in miembros_por_raiz.values() if len(ids) > 1),
+                           key=lambda grupo: (-len(grupo[0]), grupo[0][0]))
+        with self._lock:
+            self._ejecuciones += 1
+            self._comparaciones += comparaciones
+            self._ultimo = {
+                "madres": sum(len(ids) for ids in ids_por_llave.values()),
+                "bloques": len(bloques),
+                "comparaciones": comparaciones,
+                "grupos": len(resultado),
+                "duracion_s": round(time.perf_counter() - inicio, 3),
+            }
+        return resultado
+
+    def detalle(self, conn, grupos):
+        """Datos de cada madre de los grupos, con cuántos lactantes tiene (para elegir cuál conservar)."""
+        ids = [id_madre for miembros, _similitud in grupos for id_madre in miembros]
+        madres = {}
+        # Por partes: SQLite limita los parámetros por sentencia
+        for i in range(0, len(ids), 500):
+            parte = ids[i:i + 500]
+            marcadores = ", ".join("?" for _ in parte)
+            for fila in conn.execute(f"""
+                SELECT m.id_madre, m.nombre, m.apellido_paterno, m.apellido_materno, m.discapacidad,
+                       (SELECT COUNT(*) FROM Lactantes l WHERE l.id_madres = m.id_madre) AS lactantes
+                FROM Madres m WHERE m.id_madre IN ({marcadores})
+            """, parte):
+                madres[fila['id_madre']] = dict(fila)
+        return [{"similitud": similitud, "madres": [madres[i] for i in miembros if i in madres]}
+                for miembros, similitud in grupos]
+
+    def fusionar(self, conn, id_conservar, ids_fusionar):
+        """Mueve los lactantes de `ids_fusionar` a `id_conservar` y borra esas madres (sin commit).
+
+        Devuelve el número de lactantes movidos. Los datos que falten en la madre
+        conservada (apellido materno, discapacidad) se toman de las duplicadas.
+        """
+        ids = sorted(set(ids_fusionar) - {id_conservar})
+        if not ids:
+            raise FusionInvalida("Indica al menos una madre distinta de la que se conserva.")
+        todas = [id_conservar] + ids
+        marcadores = ", ".join("?" for _ in ids)
+        filas = dict(conn.execute(f"SELECT id_madre, nombre FROM Madres WHERE id_madre IN (?, {marcadores})", todas).fetchall())
+        faltantes = [str(i) for i in todas if i not in filas]
+        if faltantes:
+            raise FusionInvalida(f"No existen las madres: {', '.join(faltantes)}.")
+        if NOMBRE_DESCONOCIDA in filas.values():
+            raise FusionInvalida(f"La madre '{NOMBRE_DESCONOCIDA}' no se puede fusionar.")
+
+        for columna in ('apellido_materno', 'discapacidad'):
+            conn.execute(f"""
+                UPDATE Madres SET {columna} = (
+                    SELECT d.{columna} FROM Madres d WHERE d.id_madre IN ({marcadores}) AND IFNULL(d.{columna}, '') <> ''
+                    ORDER BY d.id_madre LIMIT 1)
+                WHERE id_madre = ? AND IFNULL({columna}, '') = ''
+                  AND EXISTS (SELECT 1 FROM Madres d WHERE d.id_madre IN ({marcadores}) AND IFNULL(d.{columna}, '') <> '')
+            """, ids + [id_conservar] + ids)
+        movidos = conn.execute(f"UPDATE Lactantes SET id_madres = ? WHERE id_madres IN ({marcadores})",
+                               [id_conservar] + ids).rowcount
+        conn.execute(f"DELETE FROM Madres WHERE id_madre IN ({marcadores})", ids)
+        with self._lock:
+            self._fusiones += len(ids)
+            self._lactantes_movidos += movidos
+        return movidos
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "umbral": self.umbral,
+                "max_bloque": self.max_bloque,
+                "ejecuciones": self._ejecuciones,
+                "comparaciones": self._comparaciones,
+                "madres_fusionadas": self._fusiones,
+                "lactantes_movidos": self._lactantes_movidos,
+                "ultima_busqueda": self._ultimo,
+            }
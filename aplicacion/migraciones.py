@@ -0,0 +1,266 @@
+
+# migraciones.py
+# Migraciones versionadas del esquema. La versión aplicada se guarda en
+# PRAGMA user_version; cada migración se ejecuta una sola vez y en orden.
+
+import hashlib
+import os
+import sqlite3
+
+import agenda
+import archivo_historico
+import busqueda
+import estadisticas
+import madres_duplicadas
+import resumen_diario
+import sincronizacion
+
+
+ESQUEMA_BASE = """
+    CREATE TABLE IF NOT EXISTS Rol (id_rol INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, permiso TEXT);
+    CREATE TABLE IF NOT EXISTS Usuarios (id_usuario INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, num_telefono TEXT UNIQUE, contraseña TEXT NOT NULL, id_rol INTEGER, FOREIGN KEY (id_rol) REFERENCES Rol(id_rol));
+    CREATE TABLE IF NOT EXISTS Auditoria (id_auditoria INTEGER PRIMARY KEY AUTOINCREMENT, id_usuario INTEGER, accion TEXT NOT NULL, tabla_afectada TEXT NOT NULL, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario));
+    CREATE TABLE IF NOT EXISTS Reportes (id_reportes INTEGER PRIMARY KEY AUTOINCREMENT, id_usuario INTEGER, tipo TEXT NOT NULL, fecha_generado TIMESTAMP DEFAULT CURRENT_TIMESTAMP, contenido TEXT, FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario));
+    CREATE TABLE IF NOT EXISTS Motivo (id_motivo INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, tipo_de_motivo TEXT);
+    CREATE TABLE IF NOT EXISTS Madres (id_madre INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, apellido_paterno TEXT NOT NULL, apellido_materno TEXT, discapacidad TEXT, id_motivo INTEGER, FOREIGN KEY (id_motivo) REFERENCES Motivo(id_motivo));
+    CREATE TABLE IF NOT EXISTS Area (id_area INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL UNIQUE, tipo_de_area TEXT);
+    CREATE TABLE IF NOT EXISTS Lactantes (id_lactantes INTEGER PRIMARY KEY AUTOINCREMENT, id_madres INTEGER, id_area INTEGER, apellido_paterno TEXT NOT NULL, apellido_materno TEXT, fecha_nacimiento DATE, genero TEXT, estado TEXT, discapacidad TEXT, peso REAL, FOREIGN KEY (id_madres) REFERENCES Madres(id_madre), FOREIGN KEY (id_area) REFERENCES Area(id_area));
+    CREATE TABLE IF NOT EXISTS Citas (id_citas INTEGER PRIMARY KEY AUTOINCREMENT, id_lactantes INTEGER, id_motivo INTEGER, atendido_por_id_usuario INTEGER, fecha_cita TEXT NOT NULL, subsecuente INTEGER, justificacion TEXT, hora_de_entrada TEXT, FOREIGN KEY (id_lactantes) REFERENCES Lactantes(id_lactantes) ON DELETE CASCADE, FOREIGN KEY (id_motivo) REFERENCES Motivo(id_motivo), FOREIGN KEY (atendido_por_id_usuario) REFERENCES Usuarios(id_usuario));
+    CREATE TABLE IF NOT EXISTS Controles (id_controles INTEGER PRIMARY KEY AUTOINCREMENT, id_lactantes INTEGER, peso REAL, talla REAL, edad_meses INTEGER, estado_general TEXT, fecha_control TIMESTAMP DEFAULT CURRENT_TIMESTAMP, observaciones TEXT, FOREIGN KEY (id_lactantes) REFERENCES Lactantes(id_lactantes) ON DELETE CASCADE);
+"""
+
+INDICES_BUSQUEDA = """
+    -- Login.POST: WHERE nombre = ? (cubre id_rol y contraseña, id_usuario es el rowid)
+    CREATE INDEX IF NOT EXISTS idx_usuarios_nombre ON Usuarios(nombre, id_rol, contraseña);
+    -- RegistroLactantes.POST (búsqueda por nombre completo) y RegistroCitas.GET (orden por apellido)
+    CREATE INDEX IF NOT EXISTS idx_madres_apellidos ON Madres(apellido_paterno, nombre, apellido_materno);
+    -- RegistroCitas.POST: lactantes de una madre ordenados por apellidos
+    CREATE INDEX IF NOT EXISTS idx_lactantes_madre ON Lactantes(id_madres, apellido_paterno, apellido_materno);
+    -- VisualizacionLactantes: orden por apellidos
+    CREATE INDEX IF NOT EXISTS idx_lactantes_apellidos ON Lactantes(apellido_paterno, apellido_materno);
+    -- ReportesPorLactante: citas de un lactante ordenadas por fecha
+    CREATE INDEX IF NOT EXISTS idx_citas_lactante_fecha ON Citas(id_lactantes, fecha_cita);
+    -- VisualizacionCitas: orden por fecha
+    CREATE INDEX IF NOT EXISTS idx_citas_fecha ON Citas(fecha_cita);
+    -- EliminarUsuario: citas atendidas por el usuario
+    CREATE INDEX IF NOT EXISTS idx_citas_atendido_por ON Citas(atendido_por_id_usuario);
+    CREATE INDEX IF NOT EXISTS idx_controles_lactante_fecha ON Controles(id_lactantes, fecha_control);
+"""
+
+INDICES_PAGINACION = """
+    -- Paginación keyset de VisualizacionLactantes: misma expresión que el ORDER BY
+    DROP INDEX IF EXISTS idx_lactantes_apellidos;
+    CREATE INDEX IF NOT EXISTS idx_lactantes_orden ON Lactantes(apellido_paterno, IFNULL(apellido_materno, ''));
+"""
+
+TRABAJOS_REPORTE = """
+    CREATE TABLE IF NOT EXISTS TrabajosReporte (
+        id_trabajo INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_usuario INTEGER,
+        tipo TEXT NOT NULL,
+        estado TEXT NOT NULL DEFAULT 'pendiente',
+        id_reportes INTEGER,
+        error TEXT,
+        creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        iniciado TIMESTAMP,
+        terminado TIMESTAMP,
+        FOREIGN KEY (id_usuario) REFERENCES Usuarios(id_usuario),
+        FOREIGN KEY (id_reportes) REFERENCES Reportes(id_reportes)
+    );
+"""
+
+AUDITORIA_LACTANTE = """
+    -- Línea de tiempo por lactante: eventos de auditoría ligados a un lactante
+    ALTER TABLE Auditoria ADD COLUMN id_lactantes INTEGER;
+    -- Los eventos anteriores guardaban el id en el texto ("Actualización lactante ID 12")
+    UPDATE Auditoria SET id_lactantes = CAST(substr(accion, instr(accion, 'ID ') + 3) AS INTEGER)
+    WHERE tabla_afectada = 'Lactantes' AND instr(accion, 'ID ') > 0;
+    CREATE INDEX IF NOT EXISTS idx_auditoria_lactante ON Auditoria(id_lactantes, fecha) WHERE id_lactantes IS NOT NULL;
+"""
+
+def _version_datos(conn):
+    """Contador de cambios por tabla mantenido por triggers (marcador barato para invalidar cachés)."""
+    tablas = ('Lactantes', 'Madres', 'Citas', 'Controles', 'Usuarios', 'Rol', 'Area', 'Motivo')
+    conn.execute("CREATE TABLE IF NOT EXISTS VersionDatos (tabla TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID;")
+    _contar_versiones(conn, tablas)
+
+def _contar_versiones(conn, tablas):
+    """Fila en VersionDatos y triggers que la incrementan con cada escritura en `tablas`."""
+    for tabla in tablas:
+        conn.execute("INSERT OR IGNORE INTO VersionDatos (tabla, version) VALUES (?, 0);", (tabla,))
+        for sufijo, evento in (('ins', 'INSERT'), ('upd', 'UPDATE'), ('del', 'DELETE')):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_version_{tabla.lower()}_{sufijo} AFTER {evento} ON {tabla}
+                BEGIN
+                    UPDATE VersionDatos SET version = version + 1 WHERE tabla = '{tabla}';
+                END;
+            """)
+
+def _estadisticas(conn):
+    """Contadores agregados mantenidos por triggers, con su carga inicial."""
+    conn.execute("CREATE TABLE IF NOT EXISTS Estadisticas (tabla TEXT NOT NULL, dimension TEXT NOT NULL, valor TEXT NOT NULL, total INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (tabla, dimension, valor)) WITHOUT ROWID;")
+    for sentencia in estadisticas.sql_triggers():
+        conn.execute(sentencia)
+    estadisticas.reconstruir(conn)
+
+def _busqueda(conn):
+    """Índices FTS5 para buscar madres y lactantes por nombre."""
+    busqueda.crear_indices(conn)
+
+def _sincronizacion(conn):
+    """Registro de cambios por fila (con lápidas) para la sincronización de tabletas."""
+    sincronizacion.crear_registro(conn)
+
+def _agenda(conn):
+    """Inicio normalizado de cada cita (columna generada) con índices por rango."""
+    agenda.crear_columna_inicio(conn)
+
+def _resumen_diario(conn):
+    """Resúmenes diarios de citas para los reportes por periodo, con su carga inicial."""
+    resumen_diario.crear_tablas(conn)
+    # Los reportes en caché se invalidan cuando cambia el resumen
+    _contar_versiones(conn, ('ResumenCitasDia',))
+    resumen_diario.reconstruir(conn)
+
+def _archivo_historico(conn):
+    """Conteo de las filas movidas a los archivos por año."""
+    archivo_historico.crear_tablas(conn)
+
+def _madres_duplicadas(conn):
+    """Nombre normalizado de cada madre (columna generada e índice) para encontrar duplicadas."""
+    madres_duplicadas.crear_llave(conn)
+
+# (versión, descripción, script SQL o función que recibe la conexión)
+MIGRACIONES = [
+    (1, "Esquema base", ESQUEMA_BASE),
+    (2, "Índices para las búsquedas frecuentes", INDICES_BUSQUEDA),
+    (3, "Índice para la paginación de lactantes", INDICES_PAGINACION),
+    (4, "Cola de trabajos de reportes", TRABAJOS_REPORTE),
+    (5, "Versiones de datos por tabla", _version_datos),
+    (6, "Contadores agregados para los reportes", _estadisticas),
+    (7, "Búsqueda de texto completo de madres y lactantes", _busqueda),
+    (8, "Registro de cambios para sincronización", _sincronizacion),
+    (9, "Lactante de cada evento de auditoría", AUDITORIA_LACTANTE),
+    (10, "Inicio normalizado de las citas para la agenda", _agenda),
+    (11, "Resúmenes diarios de citas para reportes por periodo", _resumen_diario),
+    (12, "Archivo por año de citas y auditoría antiguas", _archivo_historico),
+    (13, "Nombre normalizado de las madres para detectar duplicadas", _madres_duplicadas),
+]
+
+
+def _sentencias(script):
+    """Divide un script en sentencias completas (respeta los BEGIN ... END de los triggers)."""
+    actual = ""
+    for linea in script.splitlines(keepends=True):
+        if not actual and linea.strip().startswith("--"):
+            continue
+        actual += linea
+        if sqlite3.complete_statement(actual):
+            if actual.strip():
+                yield actual.strip()
+            actual = ""
+    if actual.strip():
+        yield actual.strip()
+
+
+def version_actual(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def version_objetivo():
+    return MIGRACIONES[-1][0]
+
+
+def aplicar_migraciones(conn):
+    """Aplica las migraciones pendientes en una sola transacción y devuelve las versiones aplicadas.
+
+    Es seguro llamarla desde varios workers a la vez: la versión se vuelve a leer
+    después de tomar el bloqueo de escritura.
+    """
+    if version_actual(conn) >= version_objetivo():
+        return []
+
+    nivel_anterior = conn.isolation_level
+    conn.isolation_level = None
+    aplicadas = []
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            actual = version_actual(conn)
+            for version, descripcion, migracion in MIGRACIONES:
+                if version <= actual:
+                    continue
+                if callable(migracion):
+                    migracion(conn)
+                else:
+                    for sentencia in _sentencias(migracion):
+                        conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {int(version)};")
+                aplicadas.append(version)
+                print(f"Migración {version} aplicada: {descripcion}")
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        if aplicadas:
+            # Actualiza las estadísticas del planificador para los índices nuevos
+            conn.execute("ANALYZE;")
+    finally:
+        conn.isolation_level = nivel_anterior
+    return aplicadas
+
+
+def insertar_datos_iniciales(conn):
+    """Roles, catálogos y usuarios iniciales si la base está vacía."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(id_rol) FROM Rol")
+    if cursor.fetchone()[0] != 0:
+        return
+    # Bloqueo de escritura para que dos workers no inserten los datos a la vez
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT COUNT(id_rol) FROM Rol")
+    if cursor.fetchone()[0] == 0:
+        print("Insertando datos iniciales...")
+        contrasena_admin_hash = hashlib.sha256("12345".encode('utf-8')).hexdigest()
+        contrasena_enfermera_hash = hashlib.sha256("pass123".encode('utf-8')).hexdigest()
+
+        initial_data = [
+            "INSERT INTO Rol (nombre, permiso) VALUES ('Administrador', 'all'), ('Enfermera', 'read_write_patients');",
+            "INSERT INTO Motivo (nombre, tipo_de_motivo) VALUES ('Chequeo de rutina', 'Control'), ('Donación de leche', 'Lactancia Materna'), ('Lactancia Materna', 'Apoyo');",
+            "INSERT INTO Area (nombre, tipo_de_area) VALUES ('UCIN', 'Médica'), ('UTIN', 'Médica'), ('Crecimiento y desarrollo', 'Médica'), ('Foraneos', 'No Médica');",
+            "INSERT INTO Madres (nombre, apellido_paterno, id_motivo) VALUES ('Desconocida', 'Desconocido', 1);",
+            f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('Admin', '555-0000', '{contrasena_admin_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Administrador'));",
+            f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('María López', '555-1234', '{contrasena_enfermera_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Enfermera'));",
+            f"INSERT INTO Usuarios (nombre, num_telefono, contraseña, id_rol) VALUES ('Ana Pérez', '555-5678', '{contrasena_enfermera_hash}', (SELECT id_rol FROM Rol WHERE nombre = 'Enfermera'));"
+        ]
+
+        for statement in initial_data:
+            cursor.execute(statement)
+        print("Datos iniciales insertados.")
+    conn.commit()
+
+
+def preparar_base(conn):
+    """Migraciones pendientes más datos iniciales: lo que necesita la base antes de atender solicitudes."""
+    aplicadas = aplicar_migraciones(conn)
+    insertar_datos_iniciales(conn)
+    return aplicadas
+
+
+# --- Verificación única al arrancar ---
+# El maestro de gunicorn (o el primer proceso) verifica el esquema y deja la marca en el
+# entorno; los workers que hereden ese entorno ya no abren la base para revisarlo.
+
+VARIABLE_VERIFICADA = 'VINCULO_BD_VERIFICADA'
+
+
+def _marca(ruta):
+    return f"{os.path.abspath(ruta)}@{version_objetivo()}"
+
+
+def base_verificada(ruta):
+    return os.environ.get(VARIABLE_VERIFICADA) == _marca(ruta)
+
+
+def marcar_verificada(ruta):
+    os.environ[VARIABLE_VERIFICADA] = _marca(ruta)
@@ -0,0 +1,292 @@
+
+# perfilado.py
+# Perfilado por solicitud: tiempo total, tiempo en SQL, número de consultas,
+# filas leídas, tiempo de plantillas y tamaño de la respuesta por ruta. Se
+# exportan como histogramas en formato de texto de Prometheus (/metrics).
+#
+# Con VINCULO_PERFILADO=0 no se instala nada. Con un valor entre 0 y 1 sólo se
+# mide esa fracción de las solicitudes (muestreo para pruebas de carga). Cada
+# worker exporta sus propias métricas. CursorMedido también alimenta el
+# registro de consultas lentas (consultas_lentas.py).
+
+import random
+import sqlite3
+import threading
+import time
+
+import web
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_FILAS = (1, 10, 100, 1000, 10000, 100000)
+BUCKETS_BYTES = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# nombre -> (ayuda, buckets, atributo de Medicion)
+HISTOGRAMAS = {
+    'vinculo_solicitud_segundos': ("Tiempo total de la solicitud.", BUCKETS_SEGUNDOS, 'duracion'),
+    'vinculo_sql_segundos': ("Tiempo en SQLite (execute y lectura de filas) por solicitud.", BUCKETS_SEGUNDOS, 'sql'),
+    'vinculo_sql_consultas': ("Sentencias SQL ejecutadas por solicitud.", BUCKETS_CONSULTAS, 'consultas'),
+    'vinculo_sql_filas': ("Filas leídas por solicitud.", BUCKETS_FILAS, 'filas'),
+    'vinculo_plantilla_segundos': ("Tiempo de render de plantillas por solicitud.", BUCKETS_SEGUNDOS, 'plantillas'),
+    'vinculo_respuesta_bytes': ("Tamaño del cuerpo de la respuesta.", BUCKETS_BYTES, 'bytes'),
+}
+
+_local = threading.local()
+
+
+class Medicion:
+    __slots__ = ('ruta', 'inicio', 'duracion', 'sql', 'consultas', 'filas', 'plantillas', 'bytes', 'estado')
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.inicio = time.perf_counter()
+        self.duracion = self.sql = self.plantillas = 0.0
+        self.consultas = self.filas = 0
+        self.bytes = None
+        self.estado = '200'
+
+
+def medicion_actual():
+    return getattr(_local, 'medicion', None)
+
+
+def registrar_plantilla(segundos):
+    medicion = medicion_actual()
+    if medicion is not None:
+        medicion.plantillas += segundos
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que suma a la medición en curso el tiempo de ejecución y de lectura de filas.
+
+    Si hay un `observador` (el registro de consultas lentas) también acumula el
+    tiempo de cada sentencia, de execute hasta la última fila leída, y se lo
+    reporta cuando supera `umbral` segundos.
+    """
+
+    observador = None
+    umbral = float('inf')
+    _sentencia = None
+
+    def execute(self, sql, *args):
+        return self._ejecutar(super().execute, sql, args[0] if args else (), *args)
+
+    def executemany(self, sql, *args):
+        # Los parámetros de executemany pueden ser un generador: no se conservan
+        return self._ejecutar(super().executemany, sql, None, *args)
+
+    def _ejecutar(self, metodo, sql, parametros, *args):
+        medicion = medicion_actual()
+        if medicion is None and self.observador is None:
+            return metodo(sql, *args)
+        if self._sentencia is not None:
+            self._cerrar_sentencia()
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        finally:
+            segundos = time.perf_counter() - inicio
+            if medicion is not None:
+                medicion.sql += segundos
+                medicion.consultas += 1
+            if self.observador is not None:
+                self._sentencia = (sql, parametros, segundos)
+                if self.description is None:
+                    # Sin filas por leer (INSERT, UPDATE...): la sentencia ya terminó
+                    self._cerrar_sentencia()
+
+    def _cerrar_sentencia(self):
+        sql, parametros, segundos = self._sentencia
+        self._sentencia = None
+        if segundos >= self.umbral and self.observador is not None:
+            self.observador(self.connection, sql, parametros, segundos)
+
+    def _leer(self, metodo, *args):
+        medicion = medicion_actual()
+        if medicion is None and self._sentencia is None:
+            return metodo(*args)
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args)
+        except StopIteration:
+            self._sumar(medicion, time.perf_counter() - inicio)
+            if self._sentencia is not None:
+                self._cerrar_sentencia()
+            raise
+        self._sumar(medicion, time.perf_counter() - inicio)
+        if isinstance(resultado, list):
+            if medicion is not None:
+                medicion.filas += len(resultado)
+            # fetchall, o fetchmany que devolvió menos filas de las pedidas: no quedan más
+            if self._sentencia is not None and (metodo.__name__ == 'fetchall' or len(resultado) < (args[0] if args else self.arraysize)):
+                self._cerrar_sentencia()
+        elif resultado is not None:
+            if medicion is not None:
+                medicion.filas += 1
+        elif self._sentencia is not None:
+            self._cerrar_sentencia()
+        return resultado
+
+    def _sumar(self, medicion, segundos):
+        if medicion is not None:
+            medicion.sql += segundos
+        if self._sentencia is not None:
+            sql, parametros, acumulado = self._sentencia
+            self._sentencia = (sql, parametros, acumulado + segundos)
+
+    def fetchone(self):
+        return self._leer(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._leer(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._leer(super().fetchall)
+
+    def __next__(self):
+        return self._leer(super().__next__)
+
+    def close(self):
+        if self._sentencia is not None:
+            self._cerrar_sentencia()
+        super().close()
+
+    def __del__(self):
+        # Cursores que no se leyeron hasta el final (fetchone de una sola fila)
+        if self._sentencia is not None:
+            try:
+                self._cerrar_sentencia()
+            except Exception:
+                pass
+
+
+def conexion_medida(base):
+    """Subclase de la fábrica de conexiones `base` cuyos cursores se miden."""
+
+    class ConexionMedida(base):
+        def cursor(self, factory=CursorMedido):
+            return super().cursor(factory)
+
+        def execute(self, *args):
+            return self.cursor().execute(*args)
+
+        def executemany(self, *args):
+            return self.cursor().executemany(*args)
+
+    return ConexionMedida
+
+
+class Histograma:
+    __slots__ = ('buckets', 'conteos', 'suma', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+
+class Perfilador:
+    def __init__(self, muestreo=1.0, resolver_ruta=None):
+        self.muestreo = muestreo
+        self.resolver_ruta = resolver_ruta
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._solicitudes = {}
+        self._colectores = []
+
+    def agregar_colector(self, funcion):
+        """`funcion()` devuelve líneas de texto Prometheus adicionales (métricas de otros subsistemas)."""
+        self._colectores.append(funcion)
+
+    def procesador(self, handler):
+        """Procesador de web.py: se agrega antes que los demás para medir la solicitud completa."""
+        if self.muestreo < 1.0 and random.random() >= self.muestreo:
+            return handler()
+        medicion = Medicion(self.resolver_ruta() if self.resolver_ruta else web.ctx.path)
+        _local.medicion = medicion
+        try:
+            resultado = handler()
+        except Exception as e:
+            # web.seeother/notfound son HTTPError y ya fijaron web.ctx.status; lo demás será un 500
+            medicion.estado = str(web.ctx.status).split(' ')[0] if isinstance(e, web.HTTPError) else '500'
+            _local.medicion = None
+            self._terminar(medicion)
+            raise
+        _local.medicion = None
+        medicion.estado = str(web.ctx.status).split(' ')[0]
+        if hasattr(resultado, '__next__'):
+            return self._flujo(resultado, medicion)
+        if isinstance(resultado, bytes):
+            medicion.bytes = len(resultado)
+        elif resultado is not None:
+            medicion.bytes = len(str(resultado).encode('utf-8'))
+        self._terminar(medicion)
+        return resultado
+
+    def _flujo(self, iterable, medicion):
+        # Respuestas por bloques: el tamaño y la duración se registran al terminar de enviarlas
+        total = 0
+        iterador = iter(iterable)
+        try:
+            while True:
+                # El SQL que se ejecuta mientras se generan los bloques también cuenta
+                _local.medicion = medicion
+                try:
+                    bloque = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    _local.medicion = None
+                total += len(bloque)
+                yield bloque
+        finally:
+            medicion.bytes = total
+            self._terminar(medicion)
+
+    def _terminar(self, medicion):
+        medicion.duracion = time.perf_counter() - medicion.inicio
+        with self._lock:
+            llave = (medicion.ruta, medicion.estado)
+            self._solicitudes[llave] = self._solicitudes.get(llave, 0) + 1
+            for nombre, (_ayuda, buckets, atributo) in HISTOGRAMAS.items():
+                valor = getattr(medicion, atributo)
+                if valor is None:
+                    continue
+                histograma = self._histogramas.get((nombre, medicion.ruta))
+                if histograma is None:
+                    histograma = self._histogramas[(nombre, medicion.ruta)] = Histograma(buckets)
+                histograma.observar(valor)
+
+    def prometheus(self):
+        """Todas las métricas en formato de texto de Prometheus 0.0.4."""
+        lineas = []
+        with self._lock:
+            lineas.append("# HELP vinculo_solicitudes_total Solicitudes medidas por ruta y estado HTTP.")
+            lineas.append("# TYPE vinculo_solicitudes_total counter")
+            for (ruta, estado), total in sorted(self._solicitudes.items()):
+                lineas.append(f'vinculo_solicitudes_total{{ruta="{ruta}",estado="{estado}"}} {total}')
+            for nombre, (ayuda, buckets, _atributo) in HISTOGRAMAS.items():
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} histogram")
+                for (n, ruta), histograma in sorted(self._histogramas.items()):
+                    if n != nombre:
+                        continue
+                    acumulado = 0
+                    for limite, conteo in zip(buckets, histograma.conteos):
+                        acumulado += conteo
+                        lineas.append(f'{nombre}_bucket{{ruta="{ruta}",le="{limite}"}} {acumulado}')
+                    lineas.append(f'{nombre}_bucket{{ruta="{ruta}",le="+Inf"}} {histograma.total}')
+                    lineas.append(f'{nombre}_sum{{ruta="{ruta}"}} {round(histograma.suma, 6)}')
+                    lineas.append(f'{nombre}_count{{ruta="{ruta}"}} {histograma.total}')
+        for colector in self._colectores:
+            lineas.extend(colector())
+        return "\n".join(lineas) + "\n"
@@ -0,0 +1,94 @@
+
+# plantillas.py
+# Render de plantillas con modo producción: todas las plantillas se compilan
+# una sola vez al arrancar el worker y no se vuelven a revisar en disco. En
+# desarrollo web.py sigue recompilando cuando cambian. En ambos modos se mide
+# el tiempo de render de cada plantilla.
+
+import hashlib
+import os
+import threading
+import time
+
+import web
+
+import perfilado
+
+
+class Plantillas:
+    def __init__(self, directorio, produccion=True, globals=None):
+        self.directorio = directorio
+        self.produccion = produccion
+        self._render = web.template.render(directorio, cache=produccion, globals=globals or {})
+        self._medidas = {}
+        self._envueltas = {}
+        self._lock = threading.Lock()
+        self._huella = None
+
+    def nombres(self):
+        return sorted(os.path.splitext(nombre)[0] for nombre in os.listdir(self.directorio)
+                      if nombre.endswith('.html'))
+
+    def precompilar(self):
+        """Compila todas las plantillas; devuelve (cantidad, milisegundos)."""
+        inicio = time.perf_counter()
+        nombres = self.nombres()
+        for nombre in nombres:
+            getattr(self, nombre)
+        return len(nombres), round((time.perf_counter() - inicio) * 1000, 3)
+
+    def huella(self):
+        """Cambia cuando cambia alguna plantilla (para las ETags de las páginas renderizadas)."""
+        if self._huella is not None:
+            return self._huella
+        marcas = sorted((nombre, os.stat(os.path.join(self.directorio, nombre)).st_mtime_ns)
+                        for nombre in os.listdir(self.directorio) if nombre.endswith('.html'))
+        huella = hashlib.sha1(repr(marcas).encode('utf-8')).hexdigest()[:12]
+        # En producción las plantillas no se vuelven a leer de disco: basta calcularla una vez
+        if self.produccion:
+            self._huella = huella
+        return huella
+
+    def __getattr__(self, nombre):
+        if nombre.startswith('_'):
+            raise AttributeError(nombre)
+        envuelta = self._envueltas.get(nombre)
+        if envuelta is not None:
+            return envuelta
+        plantilla = getattr(self._render, nombre)
+
+        def renderizar(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return plantilla(*args, **kwargs)
+            finally:
+                self._medir(nombre, time.perf_counter() - inicio)
+
+        # En desarrollo no se guarda: web.py debe poder recompilar la plantilla si cambia
+        if self.produccion:
+            self._envueltas[nombre] = renderizar
+        return renderizar
+
+    def _medir(self, nombre, segundos):
+        perfilado.registrar_plantilla(segundos)
+        with self._lock:
+            medida = self._medidas.setdefault(nombre, [0, 0.0, 0.0])
+            medida[0] += 1
+            medida[1] += segundos
+            medida[2] = max(medida[2], segundos)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "produccion": self.produccion,
+                "compiladas": len(self._envueltas),
+                "plantillas": {
+                    nombre: {
+                        "renders": renders,
+                        "total_ms": round(total * 1000, 3),
+                        "promedio_ms": round(total * 1000 / renders, 3),
+                        "max_ms": round(maximo * 1000, 3),
+                    }
+                    for nombre, (renders, total, maximo) in sorted(self._medidas.items())
+                },
+            }
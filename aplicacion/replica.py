@@ -0,0 +1,253 @@
+
+# replica.py
+# Copia de solo lectura de la base de datos para los reportes. Se reconstruye
+# cada `intervalo` segundos con la API de backup de SQLite, copiando `paginas`
+# páginas por paso y soltando la base principal entre pasos, sobre un archivo
+# temporal que luego reemplaza a la réplica con os.replace. Las consultas
+# largas de los reportes ya no compiten con las escrituras de las enfermeras.
+#
+# Con varios workers sólo uno reconstruye a la vez (flock sobre un archivo de
+# bloqueo); los demás abren la réplica nueva cuando cambia el archivo. Las
+# conexiones abiertas sobre la réplica anterior siguen viendo su copia hasta
+# que se cierran.
+#
+# `preparar(conn)` se llama sobre la base principal antes de cada copia (p. ej.
+# para poner al día los resúmenes diarios y que la réplica los lleve).
+#
+# Sin réplica (desactivada o aún no creada) los reportes leen de la base
+# principal con un pool propio de `tamano_principal` conexiones, aparte del de
+# las escrituras: no se abre una conexión por reporte.
+
+import datetime
+import fcntl
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from conexiones import PoolConexiones
+
+
+class ReplicaReiniciada(Exception):
+    """El backup volvió a empezar demasiadas veces porque la base principal seguía cambiando."""
+
+
+def abrir_lectura(ruta, factory=sqlite3.Connection):
+    """Conexión de solo lectura a una réplica (immutable: el archivo nunca cambia una vez publicado)."""
+    conn = sqlite3.connect(f"file:{os.path.abspath(ruta)}?mode=ro&immutable=1", uri=True, check_same_thread=False,
+                           factory=factory)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ReplicaReportes:
+    def __init__(self, ruta_origen, ruta_replica, intervalo=300, paginas=512, pausa=0.005, max_reinicios=3,
+                 tamano=2, factory=sqlite3.Connection, preparar=None, tamano_principal=4, espera_max=5.0):
+        self.ruta_origen = ruta_origen
+        self.ruta = ruta_replica
+        self.intervalo = intervalo
+        self.paginas = paginas
+        self.pausa = pausa
+        self.max_reinicios = max_reinicios
+        self.tamano = tamano
+        self.preparar = preparar
+
+        class ConexionReplica(factory):
+            generacion = None
+
+        self._factory = ConexionReplica
+        # Las conexiones de este pool no tienen generación: descripcion() las reporta como "principal"
+        self._principal = PoolConexiones(ruta_origen, tamano=tamano_principal, espera_max=espera_max,
+                                         factory=ConexionReplica)
+        self._lock = threading.Lock()
+        self._libres = queue.LifoQueue()
+        self._generacion = None
+        self._hilo = None
+        self._pid = None
+        self._refrescos = 0
+        self._fallidos = 0
+        self._reinicios = 0
+        self._ultima_duracion = None
+        self._lecturas_principal = 0
+
+    @property
+    def activa(self):
+        return self.intervalo > 0
+
+    def generacion(self):
+        """Identifica el archivo de réplica publicado (None si todavía no existe)."""
+        try:
+            stat = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def creada(self):
+        """Momento en que se tomó la réplica actual, o None si no hay."""
+        generacion = self.generacion()
+        return None if generacion is None else generacion[1] / 1e9
+
+    def antiguedad(self):
+        creada = self.creada()
+        return None if creada is None else max(0.0, time.time() - creada)
+
+    def descripcion(self, conn=None):
+        """Datos de la réplica para mostrar junto al reporte (los de la copia que leyó `conn`, si se indica)."""
+        if conn is not None:
+            creada = None if conn.generacion is None else conn.generacion[1] / 1e9
+        else:
+            creada = self.creada()
+        if creada is None:
+            return {"origen": "principal", "datos_al": None, "antiguedad_segundos": 0}
+        return {
+            "origen": "replica",
+            "datos_al": datetime.datetime.fromtimestamp(creada).strftime('%Y-%m-%d %H:%M:%S'),
+            "antiguedad_segundos": int(time.time() - creada),
+        }
+
+    # --- Reconstrucción ---
+
+    def refrescar(self):
+        """Copia la base principal a la réplica; devuelve False si otro proceso ya lo está haciendo."""
+        with open(self.ruta + '.lock', 'w') as bloqueo:
+            try:
+                fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            inicio = time.perf_counter()
+            temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            try:
+                self._copiar(temporal)
+                os.replace(temporal, self.ruta)
+            except BaseException:
+                with self._lock:
+                    self._fallidos += 1
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+                raise
+            with self._lock:
+                self._refrescos += 1
+                self._ultima_duracion = time.perf_counter() - inicio
+            return True
+
+    def _copiar(self, destino):
+        origen = sqlite3.connect(self.ruta_origen, timeout=5)
+        copia = sqlite3.connect(destino)
+        try:
+            if self.preparar is not None:
+                try:
+                    self.preparar(origen)
+                except sqlite3.Error as e:
+                    # La copia sigue siendo útil aunque los datos derivados queden atrasados
+                    print(f"Error al preparar la base antes de copiar la réplica: {e}")
+            try:
+                origen.backup(copia, pages=self.paginas, progress=self._vigilar_reinicios(), sleep=self.pausa)
+            except ReplicaReiniciada:
+                # Con escrituras constantes el backup por pasos no termina: se copia en un solo paso
+                origen.backup(copia, pages=-1)
+            # La réplica se abre con immutable=1: no debe quedar en modo WAL
+            copia.execute("PRAGMA journal_mode = DELETE;")
+        finally:
+            copia.close()
+            origen.close()
+
+    def _vigilar_reinicios(self):
+        anterior = None
+        reinicios = 0
+
+        def progreso(_estado, restantes, _total):
+            nonlocal anterior, reinicios
+            # Si las páginas restantes suben, otra conexión escribió y el backup empezó de nuevo
+            if anterior is not None and restantes > anterior:
+                reinicios += 1
+                with self._lock:
+                    self._reinicios += 1
+                if reinicios >= self.max_reinicios:
+                    raise ReplicaReiniciada()
+            anterior = restantes
+        return progreso
+
+    def iniciar(self):
+        """Arranca (una vez por proceso) el hilo que mantiene la réplica al día."""
+        if not self.activa:
+            return
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._ciclo, name='replica-reportes', daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            antiguedad = self.antiguedad()
+            if antiguedad is None or antiguedad >= self.intervalo:
+                try:
+                    self.refrescar()
+                except Exception as e:
+                    print(f"Error al refrescar la réplica de reportes: {e}")
+            time.sleep(min(self.intervalo / 4, 30))
+
+    # --- Lectura ---
+
+    def obtener(self):
+        """Conexión a la réplica vigente; sin réplica (desactivada o aún no creada) se usa la principal."""
+        self.iniciar()
+        generacion = self.generacion() if self.activa else None
+        if generacion is None:
+            with self._lock:
+                self._lecturas_principal += 1
+            return self._principal.obtener()
+        with self._lock:
+            if generacion != self._generacion:
+                # Réplica nueva: las conexiones libres apuntan al archivo anterior
+                self._generacion = generacion
+                while not self._libres.empty():
+                    self._libres.get_nowait()[1].close()
+        try:
+            gen_conexion, conn = self._libres.get_nowait()
+            if gen_conexion == generacion:
+                return conn
+            conn.close()
+        except queue.Empty:
+            pass
+        conn = abrir_lectura(self.ruta, self._factory)
+        conn.generacion = generacion
+        return conn
+
+    def devolver(self, conn):
+        generacion = getattr(conn, 'generacion', None)
+        if generacion is None:
+            self._principal.devolver(conn)
+            return
+        if generacion != self._generacion or self._libres.qsize() >= self.tamano:
+            conn.close()
+            return
+        self._libres.put((generacion, conn))
+
+    @contextmanager
+    def conexion(self):
+        """Misma interfaz que PoolConexiones.conexion(), para exportaciones.py."""
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def estadisticas(self):
+        antiguedad = self.antiguedad()
+        with self._lock:
+            return {
+                "activa": self.activa,
+                "intervalo": self.intervalo,
+                "antiguedad_segundos": None if antiguedad is None else round(antiguedad, 1),
+                "refrescos": self._refrescos,
+                "fallidos": self._fallidos,
+                "reinicios_backup": self._reinicios,
+                "ultima_duracion_s": None if self._ultima_duracion is None else round(self._ultima_duracion, 3),
+                "lecturas_en_principal": self._lecturas_principal,
+                "conexiones_libres": self._libres.qsize(),
+                "pool_principal": self._principal.estadisticas(),
+            }
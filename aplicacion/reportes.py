@@ -0,0 +1,55 @@
+
+# reportes.py
+# Cálculo de los reportes de /api/generate_report. No depende de web.py para
+# que también pueda ejecutarse en los procesos de la cola de trabajos.
+
+import estadisticas
+from archivo_historico import total_archivado
+
+TIPOS_REPORTE = ('estadistica', 'alojamiento_conjunto', 'federal')
+
+# Tablas de las que depende cada reporte agregado (para invalidar su caché)
+TABLAS_POR_REPORTE = {
+    'estadistica': ('Madres', 'Lactantes'),
+    'federal': ('Lactantes', 'Citas'),
+}
+
+
+class ReporteInvalido(ValueError):
+    """El tipo de reporte solicitado no existe."""
+
+
+def generar_reporte(conn, report_type):
+    """Calcula el reporte indicado y devuelve {"reporte": nombre, "resultados": datos}."""
+    if report_type == "estadistica":
+        # Totales leídos de la tabla Estadisticas (mantenida por triggers)
+        total_madres = estadisticas.total(conn, 'Madres')
+        total_lactantes = estadisticas.total(conn, 'Lactantes')
+
+        return {
+            "reporte": "Reporte de Estadísticas",
+            "resultados": {"total_madres": total_madres, "total_lactantes": total_lactantes}
+        }
+
+    elif report_type == "alojamiento_conjunto":
+        query = "SELECT T1.nombre AS nombre_madre, T1.apellido_paterno AS apellido_paterno_madre, T2.apellido_paterno AS apellido_paterno_lactante, T2.apellido_materno AS apellido_materno_lactante, T2.fecha_nacimiento FROM Madres AS T1 JOIN Lactantes AS T2 ON T1.id_madre = T2.id_madres;"
+        alojamiento_data = conn.execute(query).fetchall()
+        return {
+            "reporte": "Reporte de Alojamiento Conjunto",
+            "resultados": [dict(row) for row in alojamiento_data]
+        }
+
+    elif report_type == "federal":
+        genero_data = estadisticas.distribucion(conn, 'Lactantes', 'genero')
+        # Las citas archivadas ya no están en Citas pero siguen contando
+        total_citas = estadisticas.total(conn, 'Citas') + total_archivado(conn, 'Citas')
+
+        return {
+            "reporte": "Reporte Federal",
+            "resultados": {
+                "total_citas": total_citas,
+                "distribucion_genero": [{"genero": valor or None, "total": total} for valor, total in genero_data]
+            }
+        }
+
+    raise ReporteInvalido(report_type)
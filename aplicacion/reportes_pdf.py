@@ -0,0 +1,545 @@
+
+# reportes_pdf.py
+# Reportes PDF de varias páginas: padrón de lactantes por área, bitácora de
+# citas de un mes e historial de un lactante. Las filas se leen con fetchmany
+# y se dibujan en tablas paginadas (encabezado de columnas repetido, título y
+# pie con número de página); cada página se cierra con showPage en cuanto se
+# llena. reportlab escribe el archivo al final (save()): de las páginas
+# terminadas sólo guarda su flujo de dibujo, nunca las filas leídas.
+#
+# Los reportes largos se generan en la cola de trabajos (procesos aparte) y se
+# guardan en un directorio con un nombre que sale del tipo, los parámetros y
+# la versión de las tablas de origen (VersionDatos): mientras los datos no
+# cambien se vuelve a servir el mismo archivo. Con varios workers, un flock
+# por archivo evita que dos procesos generen el mismo PDF.
+#
+# reportlab se importa al generar, no al arrancar el worker.
+
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+from archivo_historico import ArchivoHistorico
+from cache_resultados import leer_versiones
+from conexiones import abrir_conexion
+from consultas_lentas import presupuesto as presupuesto_consultas
+from exportaciones import TAMANO_BLOQUE, lotes
+from replica import abrir_lectura
+
+# Cambia cuando cambia el diseño de los reportes: los archivos anteriores dejan de servirse
+FORMATO = 1
+MAX_ARCHIVOS = 200
+TAMANO_LOTE = 500
+
+MARGEN = 36
+ALTO_FILA = 13
+TAMANO_LETRA = 7.5
+MAX_AJUSTADOS = 4096
+
+
+class ParametrosInvalidos(ValueError):
+    pass
+
+
+class RegistroInexistente(LookupError):
+    pass
+
+
+class DocumentoPDF:
+    """Tablas paginadas sobre un canvas de reportlab (hoja carta horizontal)."""
+
+    def __init__(self, destino, titulo, subtitulo=''):
+        from reportlab.lib.pagesizes import landscape, letter
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.pdfgen import canvas
+
+        self._medir = stringWidth
+        self.ancho, self.alto = landscape(letter)
+        self.canvas = canvas.Canvas(destino, pagesize=(self.ancho, self.alto), pageCompression=1)
+        self.canvas.setTitle(titulo)
+        self.canvas.setAuthor("Vínculo de Vida")
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        self.paginas = 0
+        self.filas = 0
+        self._y = None
+        self._seccion = None
+        self._columnas = []
+        self._filas_seccion = 0
+        # Textos ya recortados (motivos, nombres de enfermeras y áreas se repiten en muchas filas)
+        self._ajustados = {}
+
+    # --- Páginas ---
+
+    def _abrir_pagina(self):
+        c = self.canvas
+        self.paginas += 1
+        c.setFont("Helvetica-Bold", 13)
+        c.drawString(MARGEN, self.alto - MARGEN, self.titulo)
+        c.setFont("Helvetica", 8)
+        c.drawRightString(self.ancho - MARGEN, self.alto - MARGEN, self.subtitulo)
+        c.setLineWidth(0.5)
+        c.line(MARGEN, self.alto - MARGEN - 6, self.ancho - MARGEN, self.alto - MARGEN - 6)
+        c.setFont("Helvetica", 7)
+        c.drawString(MARGEN, MARGEN - 16, f"Vínculo de Vida · {self.titulo}")
+        c.drawRightString(self.ancho - MARGEN, MARGEN - 16, f"Página {self.paginas}")
+        self._y = self.alto - MARGEN - 22
+        if self._seccion is not None:
+            self._encabezado(continuacion=True)
+
+    def _cerrar_pagina(self):
+        if self._y is not None:
+            self.canvas.showPage()
+            self._y = None
+
+    def _espacio(self, alto):
+        """Abre una página nueva si en la actual no caben `alto` puntos."""
+        if self._y is None or self._y - alto < MARGEN:
+            self._cerrar_pagina()
+            self._abrir_pagina()
+            return False
+        return True
+
+    # --- Tablas ---
+
+    def seccion(self, titulo, columnas, nueva_pagina=False):
+        """Empieza una tabla; `columnas` es [(encabezado, fracción del ancho)]."""
+        if nueva_pagina:
+            self._cerrar_pagina()
+        ancho_util = self.ancho - 2 * MARGEN
+        total = sum(fraccion for _encabezado, fraccion in columnas)
+        self._columnas = []
+        x = MARGEN
+        for encabezado, fraccion in columnas:
+            ancho = ancho_util * fraccion / total
+            self._columnas.append((encabezado, x, ancho))
+            x += ancho
+        self._seccion = titulo
+        self._filas_seccion = 0
+        # Título, encabezado de columnas y al menos dos filas en la misma página
+        if self._espacio(2 * ALTO_FILA + 24):
+            self._encabezado()
+
+    def _encabezado(self, continuacion=False):
+        c = self.canvas
+        self._y -= 4
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(MARGEN, self._y - 10, self._seccion + (" (continuación)" if continuacion else ""))
+        self._y -= 16
+        c.setFillGray(0.85)
+        c.rect(MARGEN, self._y - ALTO_FILA, self.ancho - 2 * MARGEN, ALTO_FILA, stroke=0, fill=1)
+        c.setFillGray(0)
+        c.setFont("Helvetica-Bold", TAMANO_LETRA)
+        for encabezado, x, ancho in self._columnas:
+            c.drawString(x + 2, self._y - ALTO_FILA + 4, self._ajustar(encabezado, ancho - 4, "Helvetica-Bold"))
+        self._y -= ALTO_FILA
+
+    def fila(self, valores):
+        self._espacio(ALTO_FILA)
+        c = self.canvas
+        if self._filas_seccion % 2:
+            c.setFillGray(0.95)
+            c.rect(MARGEN, self._y - ALTO_FILA, self.ancho - 2 * MARGEN, ALTO_FILA, stroke=0, fill=1)
+            c.setFillGray(0)
+        c.setFont("Helvetica", TAMANO_LETRA)
+        for (_encabezado, x, ancho), valor in zip(self._columnas, valores):
+            c.drawString(x + 2, self._y - ALTO_FILA + 4, self._ajustar(_texto(valor), ancho - 4))
+        self._y -= ALTO_FILA
+        self.filas += 1
+        self._filas_seccion += 1
+
+    def filas_de(self, conn, sql, parametros=(), tamano=TAMANO_LOTE):
+        """Dibuja las filas de una consulta leídas por bloques; devuelve cuántas fueron."""
+        antes = self.filas
+        for bloque in lotes(conn, sql, parametros, tamano):
+            for fila in bloque:
+                self.fila(tuple(fila))
+        if self.filas == antes:
+            self.nota("Sin registros.")
+        return self.filas - antes
+
+    def nota(self, texto):
+        self._espacio(ALTO_FILA)
+        self.canvas.setFont("Helvetica-Oblique", TAMANO_LETRA)
+        self.canvas.drawString(MARGEN + 2, self._y - ALTO_FILA + 4, texto)
+        self._y -= ALTO_FILA
+
+    def _ajustar(self, texto, ancho, fuente="Helvetica"):
+        """Recorta el texto (con '…') para que quepa en la columna."""
+        llave = (texto, ancho, fuente)
+        ajustado = self._ajustados.get(llave)
+        if ajustado is not None:
+            return ajustado
+        medida = self._medir(texto, fuente, TAMANO_LETRA)
+        ajustado = texto
+        if medida > ancho:
+            # Primer corte proporcional al exceso; luego se quitan las letras que aún sobren
+            ajustado = texto[:int(len(texto) * ancho / medida)]
+            while ajustado and self._medir(ajustado + "…", fuente, TAMANO_LETRA) > ancho:
+                ajustado = ajustado[:-1]
+            ajustado += "…"
+        if len(self._ajustados) >= MAX_AJUSTADOS:
+            self._ajustados.clear()
+        self._ajustados[llave] = ajustado
+        return ajustado
+
+    def cerrar(self):
+        if self.paginas == 0:
+            self._abrir_pagina()
+            self.nota("Sin registros.")
+        self._cerrar_pagina()
+        self.canvas.save()
+        return {"paginas": self.paginas, "filas": self.filas}
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float):
+        return f"{valor:g}"
+    return str(valor)
+
+
+# --- Reportes ---
+
+COLUMNAS_LACTANTES = [("ID", 0.5), ("Apellidos", 2.2), ("Nacimiento", 1), ("Género", 0.8), ("Estado", 0.9),
+                      ("Discapacidad", 1.2), ("Peso", 0.6), ("Madre", 2.6)]
+COLUMNAS_CITAS = [("Fecha y hora", 1.1), ("ID lactante", 0.7), ("Lactante", 1.8), ("Motivo", 1.6),
+                  ("Subsecuente", 0.7), ("Atendido por", 1.4), ("Justificación", 2.5)]
+
+
+def _lactantes_area(doc, conn, parametros):
+    condicion, valores = ("WHERE id_area = ?", (parametros['id_area'],)) if parametros['id_area'] else ("", ())
+    areas = conn.execute(f"SELECT id_area, nombre FROM Area {condicion} ORDER BY nombre", valores).fetchall()
+    for i, (id_area, nombre) in enumerate(areas):
+        # Cada área empieza en su propia página
+        doc.seccion(f"Área: {nombre}", COLUMNAS_LACTANTES, nueva_pagina=i > 0)
+        doc.filas_de(conn, """
+            SELECT l.id_lactantes, l.apellido_paterno || ' ' || IFNULL(l.apellido_materno, ''), l.fecha_nacimiento,
+                   l.genero, l.estado, l.discapacidad, l.peso,
+                   m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '')
+            FROM Lactantes l LEFT JOIN Madres m ON m.id_madre = l.id_madres
+            WHERE l.id_area = ?
+            ORDER BY l.apellido_paterno, l.apellido_materno, l.id_lactantes
+        """, (id_area,))
+
+
+def _citas_mes(doc, conn, parametros):
+    desde = datetime.date.fromisoformat(parametros['mes'] + '-01')
+    hasta = (desde + datetime.timedelta(days=32)).replace(day=1)
+    doc.seccion(f"Citas de {parametros['mes']}", COLUMNAS_CITAS)
+    # CitasHistoricas incluye las citas archivadas; el rango usa los índices sobre `inicio`
+    doc.filas_de(conn, """
+        SELECT c.inicio, c.id_lactantes, l.apellido_paterno || ' ' || IFNULL(l.apellido_materno, ''), mo.nombre,
+               CASE WHEN c.subsecuente THEN 'Sí' ELSE 'No' END, u.nombre, c.justificacion
+        FROM CitasHistoricas c
+        LEFT JOIN Lactantes l ON l.id_lactantes = c.id_lactantes
+        LEFT JOIN Motivo mo ON mo.id_motivo = c.id_motivo
+        LEFT JOIN Usuarios u ON u.id_usuario = c.atendido_por_id_usuario
+        WHERE c.inicio >= ? AND c.inicio < ?
+        ORDER BY c.inicio, c.id_citas
+    """, (f"{desde} 00:00", f"{hasta} 00:00"))
+
+
+def _historial_lactante(doc, conn, parametros):
+    id_lactante = parametros['id_lactante']
+    lactante = conn.execute("""
+        SELECT l.id_lactantes, l.apellido_paterno || ' ' || IFNULL(l.apellido_materno, '') AS apellidos,
+               l.fecha_nacimiento, l.genero, l.estado, l.discapacidad, l.peso, a.nombre AS area,
+               m.nombre || ' ' || m.apellido_paterno || ' ' || IFNULL(m.apellido_materno, '') AS madre
+        FROM Lactantes l
+        LEFT JOIN Area a ON a.id_area = l.id_area
+        LEFT JOIN Madres m ON m.id_madre = l.id_madres
+        WHERE l.id_lactantes = ?
+    """, (id_lactante,)).fetchone()
+    if lactante is None:
+        raise ParametrosInvalidos(f"El lactante {id_lactante} no existe.")
+    doc.seccion("Datos del lactante", [("Dato", 1), ("Valor", 4)])
+    for etiqueta, columna in (("ID", 'id_lactantes'), ("Apellidos", 'apellidos'), ("Nacimiento", 'fecha_nacimiento'),
+                              ("Género", 'genero'), ("Estado", 'estado'), ("Discapacidad", 'discapacidad'),
+                              ("Peso", 'peso'), ("Área", 'area'), ("Madre", 'madre')):
+        doc.fila((etiqueta, lactante[columna]))
+    doc.seccion("Citas", [(encabezado, fraccion) for encabezado, fraccion in COLUMNAS_CITAS
+                          if encabezado not in ("ID lactante", "Lactante")])
+    doc.filas_de(conn, """
+        SELECT c.inicio, mo.nombre, CASE WHEN c.subsecuente THEN 'Sí' ELSE 'No' END, u.nombre, c.justificacion
+        FROM CitasHistoricas c
+        LEFT JOIN Motivo mo ON mo.id_motivo = c.id_motivo
+        LEFT JOIN Usuarios u ON u.id_usuario = c.atendido_por_id_usuario
+        WHERE c.id_lactantes = ?
+        ORDER BY c.inicio, c.id_citas
+    """, (id_lactante,))
+    doc.seccion("Controles", [("Fecha", 1.2), ("Edad (meses)", 0.8), ("Peso", 0.6), ("Talla", 0.6),
+                              ("Estado general", 1.6), ("Observaciones", 4)])
+    doc.filas_de(conn, """
+        SELECT fecha_control, edad_meses, peso, talla, estado_general, observaciones
+        FROM Controles WHERE id_lactantes = ? ORDER BY fecha_control, id_controles
+    """, (id_lactante,))
+
+
+# tipo -> (título, tablas de las que depende, función que dibuja)
+REPORTES = {
+    'lactantes_area': ("Padrón de lactantes por área", ('Lactantes', 'Madres', 'Area'), _lactantes_area),
+    'citas_mes': ("Bitácora de citas del mes", ('Citas', 'Lactantes', 'Motivo', 'Usuarios'), _citas_mes),
+    'historial_lactante': ("Historial del lactante", ('Citas', 'Controles', 'Lactantes', 'Madres', 'Motivo', 'Usuarios', 'Area'),
+                           _historial_lactante),
+}
+
+
+def leer_parametros(tipo, datos):
+    """Parámetros normalizados del reporte a partir del formulario; ParametrosInvalidos si faltan o no son válidos."""
+    if tipo not in REPORTES:
+        raise ParametrosInvalidos("Tipo de reporte no válido.")
+    if tipo == 'lactantes_area':
+        id_area = (datos.get('id_area') or '').strip()
+        if id_area and not id_area.isdigit():
+            raise ParametrosInvalidos("Área no válida.")
+        return {'id_area': int(id_area) if id_area else None}
+    if tipo == 'citas_mes':
+        mes = (datos.get('mes') or '').strip()
+        try:
+            datetime.datetime.strptime(mes, '%Y-%m')
+        except ValueError:
+            raise ParametrosInvalidos("El mes debe tener el formato AAAA-MM.") from None
+        return {'mes': mes}
+    id_lactante = (datos.get('id_lactante') or '').strip()
+    if not id_lactante.isdigit():
+        raise ParametrosInvalidos("Indica el id del lactante.")
+    return {'id_lactante': int(id_lactante)}
+
+
+def comprobar(conn, tipo, parametros):
+    """RegistroInexistente si el área o el lactante del reporte no existen (antes de encolarlo)."""
+    if tipo == 'lactantes_area' and parametros['id_area'] is not None:
+        if conn.execute("SELECT 1 FROM Area WHERE id_area = ?", (parametros['id_area'],)).fetchone() is None:
+            raise RegistroInexistente(f"El área {parametros['id_area']} no existe.")
+    elif tipo == 'historial_lactante':
+        if conn.execute("SELECT 1 FROM Lactantes WHERE id_lactantes = ?", (parametros['id_lactante'],)).fetchone() is None:
+            raise RegistroInexistente(f"El lactante {parametros['id_lactante']} no existe.")
+
+
+def generar(conn, tipo, parametros, destino, subtitulo=''):
+    """Dibuja el reporte en `destino` (ruta o archivo); `conn` debe tener adjunto el archivo histórico."""
+    titulo, _tablas, dibujar = REPORTES[tipo]
+    doc = DocumentoPDF(destino, titulo, subtitulo)
+    dibujar(doc, conn, parametros)
+    return doc.cerrar()
+
+
+def generar_resumen(destino, titulo, renglones, subtitulo=''):
+    """PDF de una página con pares (indicador, valor), p. ej. el reporte general."""
+    doc = DocumentoPDF(destino, titulo, subtitulo)
+    doc.seccion("Indicadores", [("Indicador", 3), ("Valor", 1)])
+    for renglon in renglones:
+        doc.fila(renglon)
+    return doc.cerrar()
+
+
+def generar_archivo(ruta_bd, ruta_lectura, directorio_archivo, tipo, parametros, destino, presupuesto=None):
+    """Punto de entrada del proceso de la cola: genera `destino` si nadie más lo está generando.
+
+    Lee de la réplica si existe. Si falla deja el mensaje en `destino`.error.
+    """
+    with open(destino + '.lock', 'w') as bloqueo:
+        try:
+            fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            if os.path.exists(destino):
+                return None
+            if ruta_lectura and os.path.exists(ruta_lectura):
+                conn = abrir_lectura(ruta_lectura)
+                datos_al = datetime.datetime.fromtimestamp(os.path.getmtime(ruta_lectura))
+            else:
+                conn = abrir_conexion(ruta_bd)
+                datos_al = datetime.datetime.now()
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            try:
+                ArchivoHistorico(directorio_archivo).adjuntar(conn)
+                with presupuesto_consultas(conn, presupuesto):
+                    resultado = generar(conn, tipo, parametros, temporal,
+                                        f"Datos al {datos_al.strftime('%Y-%m-%d %H:%M')}")
+                os.replace(temporal, destino)
+                return resultado
+            except Exception as e:
+                with open(destino + '.error', 'w', encoding='utf-8') as error:
+                    error.write(str(e))
+                raise
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+                conn.close()
+        finally:
+            os.remove(destino + '.lock')
+
+
+def _bloqueado(ruta):
+    try:
+        with open(ruta, 'r') as bloqueo:
+            try:
+                fcntl.flock(bloqueo, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            return False
+    except FileNotFoundError:
+        return False
+
+
+class PDFsGenerados:
+    """PDFs terminados en `directorio`, generados en `cola` y conservados (los `max_archivos` más recientes)."""
+
+    def __init__(self, directorio, cola, ruta_bd, ruta_lectura, directorio_archivo, max_archivos=MAX_ARCHIVOS):
+        self.directorio = directorio
+        self.cola = cola
+        self.ruta_bd = ruta_bd
+        self.ruta_lectura = ruta_lectura
+        self.directorio_archivo = directorio_archivo
+        self.max_archivos = max_archivos
+        self._lock = threading.Lock()
+        self._en_curso = {}
+        self._aciertos = 0
+        self._generados = 0
+        self._fallidos = 0
+        self._desalojados = 0
+        self._ultima_duracion = None
+
+    def llave(self, conn, tipo, parametros):
+        """Nombre del archivo: cambia con el tipo, los parámetros, el diseño y la versión de los datos."""
+        version = leer_versiones(conn, REPORTES[tipo][1])
+        texto = json.dumps([FORMATO, tipo, sorted(parametros.items()), version])
+        return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+    def ruta(self, llave):
+        return os.path.join(self.directorio, llave + '.pdf')
+
+    def estado(self, llave):
+        """'terminado', 'generando', 'error' o None si no se conoce."""
+        ruta = self.ruta(llave)
+        if os.path.exists(ruta):
+            return 'terminado'
+        with self._lock:
+            if llave in self._en_curso:
+                return 'generando'
+        # En otro worker: el proceso que lo genera tiene el flock
+        if _bloqueado(ruta + '.lock'):
+            return 'generando'
+        if os.path.exists(ruta + '.error'):
+            return 'error'
+        return None
+
+    def error(self, llave):
+        try:
+            with open(self.ruta(llave) + '.error', encoding='utf-8') as error:
+                return error.read()
+        except FileNotFoundError:
+            return None
+
+    def solicitar(self, conn, tipo, parametros):
+        """(llave, futuro): el futuro es None si el PDF ya existe. Puede lanzar ColaLlena."""
+        llave = self.llave(conn, tipo, parametros)
+        ruta = self.ruta(llave)
+        if os.path.exists(ruta):
+            with self._lock:
+                self._aciertos += 1
+            try:
+                # La fecha de modificación ordena el desalojo (el más usado se conserva)
+                os.utime(ruta)
+            except FileNotFoundError:
+                pass
+            else:
+                return llave, None
+        with self._lock:
+            futuro = self._en_curso.get(llave)
+        if futuro is not None:
+            return llave, futuro
+        os.makedirs(self.directorio, exist_ok=True)
+        if os.path.exists(ruta + '.error'):
+            # Un error anterior no impide volver a intentarlo
+            os.remove(ruta + '.error')
+        inicio = time.perf_counter()
+        futuro = self.cola.enviar_funcion(generar_archivo, self.ruta_bd, self.ruta_lectura, self.directorio_archivo,
+                                          tipo, parametros, ruta, self.cola.presupuesto)
+        with self._lock:
+            self._en_curso[llave] = futuro
+        futuro.add_done_callback(lambda f: self._terminado(llave, f, inicio))
+        return llave, futuro
+
+    def _terminado(self, llave, futuro, inicio):
+        fallo = futuro.cancelled() or futuro.exception() is not None
+        with self._lock:
+            self._en_curso.pop(llave, None)
+            if fallo:
+                self._fallidos += 1
+            elif futuro.result() is not None:
+                self._generados += 1
+                self._ultima_duracion = time.perf_counter() - inicio
+        if not fallo:
+            self.limpiar()
+
+    def esperar(self, llave, futuro, segundos):
+        """Espera hasta `segundos` a que termine el PDF y devuelve su estado."""
+        if futuro is not None and segundos > 0:
+            try:
+                futuro.result(timeout=segundos)
+            except Exception:
+                # El error queda en el archivo .error (o el trabajo sigue corriendo)
+                pass
+        return self.estado(llave)
+
+    def leer(self, llave):
+        """Contenido del PDF por bloques (el archivo sigue abierto aunque se desaloje mientras tanto)."""
+        with open(self.ruta(llave), 'rb') as archivo:
+            while True:
+                bloque = archivo.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                yield bloque
+
+    def limpiar(self):
+        """Borra los PDFs menos usados que excedan `max_archivos`."""
+        try:
+            nombres = [nombre for nombre in os.listdir(self.directorio) if nombre.endswith('.pdf')]
+        except FileNotFoundError:
+            return 0
+        if len(nombres) <= self.max_archivos:
+            return 0
+        archivos = []
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                archivos.append((os.path.getmtime(ruta), ruta))
+            except FileNotFoundError:
+                pass
+        archivos.sort()
+        borrados = 0
+        for _mtime, ruta in archivos[:len(archivos) - self.max_archivos]:
+            try:
+                os.remove(ruta)
+                borrados += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._desalojados += borrados
+        return borrados
+
+    def estadisticas(self):
+        try:
+            archivos = sum(1 for nombre in os.listdir(self.directorio) if nombre.endswith('.pdf'))
+        except FileNotFoundError:
+            archivos = 0
+        with self._lock:
+            return {
+                "archivos": archivos,
+                "max_archivos": self.max_archivos,
+                "en_curso": len(self._en_curso),
+                "aciertos": self._aciertos,
+                "generados": self._generados,
+                "fallidos": self._fallidos,
+                "desalojados": self._desalojados,
+                "ultima_duracion_s": None if self._ultima_duracion is None else round(self._ultima_duracion, 3),
+            }
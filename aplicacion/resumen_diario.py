@@ -0,0 +1,272 @@
+
+# resumen_diario.py
+# Resúmenes diarios de citas para los reportes por periodo (federal y por
+# área). ResumenCitasDia guarda cuántas citas hubo cada día por área, motivo,
+# género y primera vez/subsecuente; un reporte de cualquier rango suma los días
+# del rango (búsqueda por la llave, que empieza por el día) en lugar de agrupar
+# todas las Citas.
+#
+# Los resúmenes se ponen al día con el registro de Cambios (ver
+# sincronizacion.py): cada cita cambiada, o de un lactante cambiado, resta lo
+# que aportaba (ResumenCitasAporte) y suma lo que aporta ahora. Se actualizan
+# antes de cada copia de la réplica, antes de leer la base principal y con
+# `python comandos.py resumenes actualizar` (tarea nocturna).
+
+import threading
+import time
+
+MAX_CAMBIOS_POR_LOTE = 5000
+
+# dimensión -> (columna del resumen, expresión del nombre, join con su catálogo)
+DIMENSIONES = {
+    'area': ('r.id_area', 'a.nombre', "LEFT JOIN Area a ON a.id_area = r.id_area"),
+    'motivo': ('r.id_motivo', 'mo.nombre', "LEFT JOIN Motivo mo ON mo.id_motivo = r.id_motivo"),
+    'genero': ('r.genero', "NULLIF(r.genero, '')", ""),
+    'subsecuente': ('r.subsecuente', "CASE r.subsecuente WHEN 1 THEN 'subsecuente' ELSE 'primera_vez' END", ""),
+}
+
+# periodo -> expresión sobre el día ('AAAA-MM-DD'); la semana empieza en lunes
+PERIODOS = {
+    'dia': "r.dia",
+    'semana': "date(r.dia, '-6 days', 'weekday 1')",
+    'mes': "substr(r.dia, 1, 7)",
+    'trimestre': "substr(r.dia, 1, 4) || '-T' || ((CAST(substr(r.dia, 6, 2) AS INTEGER) + 2) / 3)",
+    'anio': "substr(r.dia, 1, 4)",
+    'total': "'total'",
+}
+
+# Lo que aporta cada cita hoy; sin fecha válida (inicio NULL) no se cuenta.
+# Las llaves no admiten NULL: 0 y '' representan "sin área/motivo/género"
+APORTE_ACTUAL = """
+    SELECT c.id_citas, substr(c.inicio, 1, 10) AS dia, IFNULL(l.id_area, 0) AS id_area,
+           IFNULL(c.id_motivo, 0) AS id_motivo, IFNULL(l.genero, '') AS genero,
+           CASE WHEN IFNULL(c.subsecuente, 0) IN (0, '0', '') THEN 0 ELSE 1 END AS subsecuente
+    FROM Citas c
+    LEFT JOIN Lactantes l ON l.id_lactantes = c.id_lactantes
+    WHERE c.inicio IS NOT NULL
+"""
+
+COLUMNAS = "dia, id_area, id_motivo, genero, subsecuente"
+
+
+def crear_tablas(conn):
+    """Tablas del resumen (migración); la carga inicial la hace reconstruir()."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS ResumenCitasDia (
+            dia TEXT NOT NULL, id_area INTEGER NOT NULL, id_motivo INTEGER NOT NULL, genero TEXT NOT NULL,
+            subsecuente INTEGER NOT NULL, citas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({COLUMNAS})
+        ) WITHOUT ROWID;
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS ResumenCitasAporte (
+            id_citas INTEGER PRIMARY KEY,
+            dia TEXT NOT NULL, id_area INTEGER NOT NULL, id_motivo INTEGER NOT NULL, genero TEXT NOT NULL,
+            subsecuente INTEGER NOT NULL
+        );
+    """)
+    # Reconstrucción por rango de fechas
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_resumen_aporte_dia ON ResumenCitasAporte(dia);")
+    # Última versión de Cambios incorporada
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ResumenCitasEstado (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version_cambios INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    conn.execute("INSERT OR IGNORE INTO ResumenCitasEstado (id, version_cambios) VALUES (1, 0);")
+
+
+def _por_bloques(valores, tamano=500):
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def _rango(desde, hasta):
+    """Condiciones sobre el día (en el resumen y en Citas.inicio, para usar su índice) y sus parámetros."""
+    resumen, citas, parametros = ["1"], ["1"], []
+    if desde:
+        resumen.append("dia >= ?")
+        citas.append("c.inicio >= ?")
+        parametros.append(desde)
+    if hasta:
+        resumen.append("dia <= ?")
+        citas.append("c.inicio <= ? || ' 23:59'")
+        parametros.append(hasta)
+    return ' AND '.join(resumen), ' AND '.join(citas), parametros
+
+
+def _sumar_aportes(conn, condicion, parametros, signo):
+    """Suma (signo 1) o resta (signo -1) a ResumenCitasDia los aportes que cumplen `condicion`."""
+    conn.execute(f"""
+        INSERT INTO ResumenCitasDia ({COLUMNAS}, citas)
+        SELECT {COLUMNAS}, {int(signo)} * COUNT(*) FROM ResumenCitasAporte WHERE {condicion}
+        GROUP BY {COLUMNAS}
+        ON CONFLICT ({COLUMNAS}) DO UPDATE SET citas = citas + excluded.citas
+    """, parametros)
+
+
+def _recalcular(conn, ids_citas):
+    """Cambia el aporte de estas citas por el que tienen ahora (las borradas dejan de aportar)."""
+    for bloque in _por_bloques(sorted(ids_citas)):
+        marcas = ','.join('?' * len(bloque))
+        _sumar_aportes(conn, f"id_citas IN ({marcas})", bloque, -1)
+        conn.execute(f"DELETE FROM ResumenCitasAporte WHERE id_citas IN ({marcas})", bloque)
+        conn.execute(f"INSERT INTO ResumenCitasAporte (id_citas, {COLUMNAS}) {APORTE_ACTUAL} AND c.id_citas IN ({marcas})",
+                     bloque)
+        _sumar_aportes(conn, f"id_citas IN ({marcas})", bloque, 1)
+
+
+def version_procesada(conn):
+    return conn.execute("SELECT version_cambios FROM ResumenCitasEstado WHERE id = 1").fetchone()[0]
+
+
+def pendiente(conn):
+    """True si hay cambios de Citas o Lactantes que el resumen todavía no incorpora (sin bloquear)."""
+    return conn.execute("""
+        SELECT EXISTS (SELECT 1 FROM Cambios WHERE version > (SELECT version_cambios FROM ResumenCitasEstado WHERE id = 1)
+                       AND tabla IN ('Citas', 'Lactantes'))
+    """).fetchone()[0] == 1
+
+
+def actualizar_lote(conn, limite=MAX_CAMBIOS_POR_LOTE):
+    """Incorpora hasta `limite` entradas de Cambios en una transacción; devuelve (entradas, citas recalculadas)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        desde = version_procesada(conn)
+        entradas = conn.execute("""
+            SELECT version, tabla, id_fila FROM Cambios
+            WHERE version > ? AND tabla IN ('Citas', 'Lactantes') ORDER BY version LIMIT ?
+        """, (desde, limite)).fetchall()
+        if not entradas:
+            conn.rollback()
+            return 0, 0
+        ids_citas = {id_fila for _version, tabla, id_fila in entradas if tabla == 'Citas'}
+        # Un lactante cambiado (área o género) mueve todas sus citas de grupo
+        lactantes = sorted({id_fila for _version, tabla, id_fila in entradas if tabla == 'Lactantes'})
+        for bloque in _por_bloques(lactantes):
+            ids_citas.update(fila[0] for fila in conn.execute(
+                f"SELECT id_citas FROM Citas WHERE id_lactantes IN ({','.join('?' * len(bloque))})", bloque))
+        _recalcular(conn, ids_citas)
+        conn.execute("UPDATE ResumenCitasEstado SET version_cambios = ? WHERE id = 1", (entradas[-1][0],))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(entradas), len(ids_citas)
+
+
+def _aportes(origen):
+    """APORTE_ACTUAL leyendo las citas de `origen` (p. ej. la vista con las citas archivadas)."""
+    return APORTE_ACTUAL.replace("FROM Citas c", f"FROM {origen} c")
+
+
+def reconstruir(conn, desde=None, hasta=None, origen='Citas'):
+    """Recalcula desde Citas los días entre `desde` y `hasta` (inclusive; sin ellos, todo). No hace commit.
+
+    Es la carga de datos históricos: puede repetirse sin duplicar conteos. Los
+    aportes son sólo de la tabla Citas; los conteos incluyen las citas de `origen`
+    (CitasHistoricas para no perder las archivadas).
+    """
+    condicion, condicion_citas, parametros = _rango(desde, hasta)
+    if desde is None and hasta is None:
+        # Lo que haya en Cambios hasta aquí queda incluido
+        conn.execute("UPDATE ResumenCitasEstado SET version_cambios = (SELECT IFNULL(MAX(version), 0) FROM Cambios)")
+    conn.execute(f"DELETE FROM ResumenCitasDia WHERE {condicion}", parametros)
+    conn.execute(f"DELETE FROM ResumenCitasAporte WHERE {condicion}", parametros)
+    total = conn.execute(f"INSERT INTO ResumenCitasAporte (id_citas, {COLUMNAS}) {APORTE_ACTUAL} AND {condicion_citas}",
+                         parametros).rowcount
+    conn.execute(f"""
+        INSERT INTO ResumenCitasDia ({COLUMNAS}, citas)
+        SELECT {COLUMNAS}, COUNT(*) FROM ({_aportes(origen)} AND {condicion_citas}) GROUP BY {COLUMNAS}
+    """, parametros)
+    return total
+
+
+def verificar(conn, desde=None, hasta=None, origen='Citas'):
+    """Diferencias (día, área, motivo, género, subsecuente, guardado, real) entre el resumen y las citas de `origen`."""
+    condicion, condicion_citas, parametros = _rango(desde, hasta)
+    guardados = {tuple(fila[:5]): fila[5] for fila in conn.execute(
+        f"SELECT {COLUMNAS}, citas FROM ResumenCitasDia WHERE {condicion} AND citas <> 0", parametros)}
+    reales = {tuple(fila[:5]): fila[5] for fila in conn.execute(
+        f"SELECT {COLUMNAS}, COUNT(*) FROM ({_aportes(origen)} AND {condicion_citas}) GROUP BY {COLUMNAS}", parametros)}
+    diferencias = []
+    for llave in sorted(set(guardados) | set(reales)):
+        guardado, real = guardados.get(llave, 0), reales.get(llave, 0)
+        if guardado != real:
+            diferencias.append(llave + (guardado, real))
+    return diferencias
+
+
+def reporte(conn, desde, hasta, periodo='mes', por=('area',)):
+    """Citas entre `desde` y `hasta` (inclusive) por periodo y por las dimensiones de `por`."""
+    expresion = PERIODOS[periodo]
+    campos, grupos, joins = [f"{expresion} AS periodo"], [expresion], []
+    for dimension in por:
+        columna, nombre, join = DIMENSIONES[dimension]
+        campos.append(f"{nombre} AS {dimension}")
+        grupos.append(columna)
+        if join:
+            joins.append(join)
+    filas = conn.execute(f"""
+        SELECT {', '.join(campos)}, SUM(r.citas) AS citas
+        FROM ResumenCitasDia r {' '.join(joins)}
+        WHERE r.dia >= ? AND r.dia <= ?
+        GROUP BY {', '.join(grupos)}
+        HAVING SUM(r.citas) > 0
+        ORDER BY {', '.join(grupos)}
+    """, (desde, hasta)).fetchall()
+
+    periodos = {}
+    for fila in filas:
+        resumen = periodos.setdefault(fila['periodo'], {"periodo": fila['periodo'], "total_citas": 0, "grupos": []})
+        resumen["total_citas"] += fila['citas']
+        resumen["grupos"].append({dimension: fila[dimension] for dimension in por} | {"citas": fila['citas']})
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "periodo": periodo,
+        "por": list(por),
+        "total_citas": sum(resumen["total_citas"] for resumen in periodos.values()),
+        "periodos": list(periodos.values()),
+    }
+
+
+class ResumenDiario:
+    """Puesta al día de los resúmenes con sus contadores para /api/metricas."""
+
+    def __init__(self, tamano_lote=MAX_CAMBIOS_POR_LOTE):
+        self.tamano_lote = tamano_lote
+        self._lock = threading.Lock()
+        self._actualizaciones = 0
+        self._cambios = 0
+        self._citas = 0
+        self._ultima_duracion = None
+
+    def actualizar(self, conn):
+        """Incorpora todo lo pendiente en Cambios, por lotes; devuelve las entradas procesadas."""
+        if not pendiente(conn):
+            return 0
+        inicio = time.perf_counter()
+        procesadas = citas = 0
+        while True:
+            entradas, recalculadas = actualizar_lote(conn, self.tamano_lote)
+            procesadas += entradas
+            citas += recalculadas
+            if entradas < self.tamano_lote:
+                break
+        with self._lock:
+            self._actualizaciones += 1
+            self._cambios += procesadas
+            self._citas += citas
+            self._ultima_duracion = time.perf_counter() - inicio
+        return procesadas
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "actualizaciones": self._actualizaciones,
+                "cambios_procesados": self._cambios,
+                "citas_recalculadas": self._citas,
+                "ultima_duracion_s": None if self._ultima_duracion is None else round(self._ultima_duracion, 4),
+            }
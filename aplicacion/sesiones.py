@@ -0,0 +1,237 @@
+
+# sesiones.py
+# Almacenes de sesión para web.py que reemplazan a DiskStore.
+#
+# AlmacenSesionesSQLite guarda todas las sesiones en una sola tabla SQLite
+# (archivo propio, modo WAL) y puede compartirse entre workers de gunicorn.
+# Opcionalmente mantiene una caché LRU en memoria; cada lectura valida la
+# versión de la fila, así un cambio hecho por otro worker nunca se pierde.
+#
+# Cada hilo de solicitud usa a lo más una conexión a la vez, más la del hilo de
+# barrido: `tamano_pool` debe ser de al menos hilos + 1 (ver app.py). Si aun así
+# se agota, la solicitud responde 503 como cuando se agota el pool principal.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import web
+
+from conexiones import PoolAgotado, PoolConexiones
+
+
+class AlmacenSesionesSQLite(web.session.Store):
+    def __init__(self, ruta, timeout=86400, cache_entradas=1024, intervalo_toque=60,
+                 intervalo_barrido=300, lote_barrido=500, tamano_pool=5, espera_max=5.0):
+        self.timeout = timeout
+        self.cache_entradas = cache_entradas
+        self.intervalo_toque = intervalo_toque
+        self.intervalo_barrido = intervalo_barrido
+        self.lote_barrido = lote_barrido
+        self._pool = PoolConexiones(ruta, tamano=tamano_pool, espera_max=espera_max)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hilo_barrido = None
+        self._pid_barrido = None
+        self._metricas = dict.fromkeys(('lecturas', 'aciertos_cache', 'escrituras', 'toques',
+                                        'escrituras_omitidas', 'barridos', 'eliminadas'), 0)
+        with self._pool.conexion() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS Sesiones (id TEXT PRIMARY KEY, datos BLOB NOT NULL, version INTEGER NOT NULL DEFAULT 1, atime REAL NOT NULL);")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_atime ON Sesiones(atime);")
+            conn.commit()
+
+    @contextmanager
+    def _conexion(self):
+        """Conexión del pool para la solicitud; agotado responde 503 (web.py convertiría PoolAgotado en 500)."""
+        try:
+            conn = self._pool.obtener()
+        except PoolAgotado as e:
+            print(f"Pool de sesiones agotado: {e}")
+            raise web.HTTPError('503 Service Unavailable', {'Retry-After': '1'}, "Servidor ocupado, intenta de nuevo.")
+        try:
+            yield conn
+        finally:
+            self._pool.devolver(conn)
+
+    def _contar(self, metrica, n=1):
+        with self._lock:
+            self._metricas[metrica] += n
+
+    # --- Caché LRU: id -> (version, datos codificados, valor, atime) ---
+    def _cache_get(self, key):
+        with self._lock:
+            entrada = self._cache.get(key)
+            if entrada is not None:
+                self._cache.move_to_end(key)
+            return entrada
+
+    def _cache_put(self, key, entrada):
+        if not self.cache_entradas:
+            return
+        with self._lock:
+            self._cache[key] = entrada
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entradas:
+                self._cache.popitem(last=False)
+
+    def _cache_del(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _leer(self, key):
+        """Devuelve (version, datos, valor, atime) o None; usa la caché si la versión coincide."""
+        self._contar('lecturas')
+        with self._conexion() as conn:
+            entrada = self._cache_get(key)
+            if entrada is not None:
+                fila = conn.execute("SELECT version, atime FROM Sesiones WHERE id = ?", (key,)).fetchone()
+                if fila is None:
+                    self._cache_del(key)
+                    return None
+                if fila['version'] == entrada[0]:
+                    self._contar('aciertos_cache')
+                    entrada = (entrada[0], entrada[1], entrada[2], fila['atime'])
+                    self._cache_put(key, entrada)
+                    return entrada
+            fila = conn.execute("SELECT version, datos, atime FROM Sesiones WHERE id = ?", (key,)).fetchone()
+        if fila is None:
+            self._cache_del(key)
+            return None
+        entrada = (fila['version'], bytes(fila['datos']), self.decode(fila['datos']), fila['atime'])
+        self._cache_put(key, entrada)
+        return entrada
+
+    def __contains__(self, key):
+        # web.py pregunta primero si existe y luego lee: se conserva la lectura para __getitem__
+        entrada = self._leer(key)
+        self._local.ultima = (key, entrada)
+        return entrada is not None
+
+    def __getitem__(self, key):
+        ultima = getattr(self._local, 'ultima', None)
+        self._local.ultima = None
+        entrada = ultima[1] if ultima and ultima[0] == key else self._leer(key)
+        if entrada is None:
+            raise KeyError(key)
+        self._local.conocida = (key, entrada)
+        return entrada[2]
+
+    def __setitem__(self, key, value):
+        datos = self.encode(value)
+        ahora = time.time()
+        conocida = getattr(self._local, 'conocida', None)
+        self._local.conocida = None
+        entrada = conocida[1] if conocida and conocida[0] == key else self._cache_get(key)
+
+        with self._conexion() as conn:
+            if entrada is not None and entrada[1] == datos:
+                # Sin cambios: sólo se renueva atime de vez en cuando
+                if ahora - entrada[3] < self.intervalo_toque:
+                    self._contar('escrituras_omitidas')
+                    return
+                conn.execute("UPDATE Sesiones SET atime = ? WHERE id = ?", (ahora, key))
+                conn.commit()
+                self._cache_put(key, (entrada[0], datos, entrada[2], ahora))
+                self._contar('toques')
+                return
+            fila = conn.execute("""
+                INSERT INTO Sesiones (id, datos, version, atime) VALUES (?, ?, 1, ?)
+                ON CONFLICT (id) DO UPDATE SET datos = excluded.datos, version = version + 1, atime = excluded.atime
+                RETURNING version
+            """, (key, datos, ahora)).fetchone()
+            conn.commit()
+        self._cache_put(key, (fila['version'], datos, value, ahora))
+        self._contar('escrituras')
+
+    def __delitem__(self, key):
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM Sesiones WHERE id = ?", (key,))
+            conn.commit()
+        self._cache_del(key)
+
+    def cleanup(self, timeout):
+        # web.py llama aquí en la primera solicitud del proceso; a partir de entonces
+        # barre el hilo de fondo y la solicitud no paga el DELETE
+        if self.intervalo_barrido:
+            self.iniciar_barrido()
+        else:
+            self.barrer(timeout)
+
+    def barrer(self, timeout=None):
+        """Elimina las sesiones expiradas por lotes pequeños para no retener el bloqueo de escritura."""
+        limite = time.time() - (timeout or self.timeout)
+        total = 0
+        with self._pool.conexion() as conn:
+            while True:
+                eliminadas = conn.execute(
+                    "DELETE FROM Sesiones WHERE id IN (SELECT id FROM Sesiones WHERE atime < ? LIMIT ?)",
+                    (limite, self.lote_barrido)).rowcount
+                conn.commit()
+                total += eliminadas
+                if eliminadas < self.lote_barrido:
+                    break
+        with self._lock:
+            self._metricas['barridos'] += 1
+            self._metricas['eliminadas'] += total
+            for key in [k for k, e in self._cache.items() if e[3] < limite]:
+                del self._cache[key]
+        return total
+
+    def iniciar_barrido(self):
+        """Arranca (una vez por proceso) el hilo que barre las sesiones expiradas cada `intervalo_barrido` segundos."""
+        with self._lock:
+            if self._hilo_barrido is not None and self._pid_barrido == os.getpid():
+                return
+            self._pid_barrido = os.getpid()
+            self._hilo_barrido = threading.Thread(target=self._ciclo_barrido, name='barrido-sesiones', daemon=True)
+            self._hilo_barrido.start()
+
+    def _ciclo_barrido(self):
+        while True:
+            try:
+                self.barrer()
+            except Exception as e:
+                print(f"Error al barrer sesiones: {e}")
+            time.sleep(self.intervalo_barrido)
+
+    def estadisticas(self):
+        with self._lock:
+            metricas = dict(self._metricas, entradas_cache=len(self._cache), backend='sqlite')
+        return dict(metricas, pool=self._pool.estadisticas())
+
+
+class AlmacenSesionesMemoria(web.session.Store):
+    """Sesiones en memoria del proceso. Sólo sirve con un único worker (desarrollo/pruebas)."""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._datos
+
+    def __getitem__(self, key):
+        with self._lock:
+            valor, _atime = self._datos[key]
+            self._datos[key] = (valor, time.time())
+            return valor
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._datos[key] = (dict(value), time.time())
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def cleanup(self, timeout):
+        limite = time.time() - timeout
+        with self._lock:
+            for key in [k for k, (_v, atime) in self._datos.items() if atime < limite]:
+                del self._datos[key]
+
+    def estadisticas(self):
+        return {"backend": "memoria", "sesiones": len(self._datos)}
@@ -0,0 +1,278 @@
+
+# sincronizacion.py
+# Sincronización incremental para las tabletas de UCIN/UTIN. Los triggers
+# guardan en Cambios la última operación de cada fila de Madres, Lactantes,
+# Citas y Controles con una versión creciente (AUTOINCREMENT nunca reutiliza
+# valores); los borrados quedan como lápidas. Una tableta pide los cambios con
+# versión mayor a su cursor y recibe sólo esas filas.
+#
+# Como SQLite tiene un solo escritor a la vez, las versiones se confirman en
+# orden: un cliente nunca ve la versión N sin haber podido ver las anteriores.
+
+import json
+import sqlite3
+
+LIMITE_POR_DEFECTO = 500
+LIMITE_MAXIMO = 5000
+MAX_CAMBIOS_POR_LOTE = 1000
+
+# tabla -> (llave primaria, columnas que se sincronizan)
+TABLAS = {
+    'Madres': ('id_madre', ('nombre', 'apellido_paterno', 'apellido_materno', 'discapacidad', 'id_motivo')),
+    'Lactantes': ('id_lactantes', ('id_madres', 'id_area', 'apellido_paterno', 'apellido_materno', 'fecha_nacimiento',
+                                   'genero', 'estado', 'discapacidad', 'peso')),
+    'Citas': ('id_citas', ('id_lactantes', 'id_motivo', 'atendido_por_id_usuario', 'fecha_cita', 'subsecuente',
+                           'justificacion', 'hora_de_entrada')),
+    'Controles': ('id_controles', ('id_lactantes', 'peso', 'talla', 'edad_meses', 'estado_general', 'fecha_control',
+                                   'observaciones')),
+}
+
+# Columnas que apuntan a otra tabla sincronizada: en una subida pueden traer el id temporal
+# que el cliente le dio a una fila insertada antes en el mismo lote
+REFERENCIAS = {
+    ('Lactantes', 'id_madres'): 'Madres',
+    ('Citas', 'id_lactantes'): 'Lactantes',
+    ('Controles', 'id_lactantes'): 'Lactantes',
+}
+
+# Tipos que una columna acepta en 'datos' (bool es un int: se guarda como 0/1)
+ESCALARES = (str, int, float, type(None))
+
+# Las mismas eliminaciones que permite la interfaz (EliminarLactante, EliminarCita)
+ELIMINABLES = ('Lactantes', 'Citas')
+
+
+class CambioInvalido(ValueError):
+    def __init__(self, indice, mensaje):
+        super().__init__(f"Cambio {indice}: {mensaje}")
+        self.indice = indice
+        self.mensaje = mensaje
+
+
+class ConflictoSincronizacion(Exception):
+    """Alguna fila cambió en el servidor después de la versión que el cliente editó."""
+
+    def __init__(self, conflictos):
+        super().__init__(f"{len(conflictos)} cambios en conflicto")
+        self.conflictos = conflictos
+
+
+def crear_registro(conn):
+    """Crea Cambios con sus triggers y registra las filas existentes (no hace commit)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Cambios (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            id_fila INTEGER NOT NULL,
+            operacion TEXT NOT NULL CHECK (operacion IN ('U', 'D'))
+        );
+    """)
+    # Una sola entrada por fila: cada cambio reemplaza la anterior con una versión nueva
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cambios_fila ON Cambios(tabla, id_fila);")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS LotesSincronizacion (
+            id_lote TEXT PRIMARY KEY,
+            id_usuario INTEGER,
+            resultado TEXT NOT NULL,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    for tabla, (llave, _columnas) in TABLAS.items():
+        for sufijo, evento, fila, operacion in (('ins', 'INSERT', 'NEW', 'U'), ('upd', 'UPDATE', 'NEW', 'U'),
+                                                ('del', 'DELETE', 'OLD', 'D')):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_cambios_{tabla.lower()}_{sufijo} AFTER {evento} ON {tabla} BEGIN
+                    INSERT OR REPLACE INTO Cambios (tabla, id_fila, operacion) VALUES ('{tabla}', {fila}.{llave}, '{operacion}');
+                END;
+            """)
+        conn.execute(f"INSERT OR IGNORE INTO Cambios (tabla, id_fila, operacion) SELECT '{tabla}', {llave}, 'U' FROM {tabla};")
+
+
+def leer_cursor(valor):
+    try:
+        return max(0, int(valor or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def leer_limite(valor):
+    try:
+        return max(1, min(int(valor), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_POR_DEFECTO
+
+
+def _por_bloques(valores, tamano=500):
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def cambios_desde(conn, desde, limite=LIMITE_POR_DEFECTO):
+    """Filas cambiadas con versión mayor a `desde`, agrupadas por tabla en forma compacta.
+
+    Cada tabla trae sus columnas una vez y las filas como listas ([versión, llave,
+    columnas...]); los borrados se mandan como [versión, llave]. `cursor` es la
+    versión que el cliente debe mandar en la siguiente llamada.
+    """
+    # Una sola transacción de lectura: Cambios y las filas se leen del mismo estado
+    propia = not conn.in_transaction
+    if propia:
+        conn.execute("BEGIN")
+    try:
+        entradas = conn.execute(
+            "SELECT version, tabla, id_fila, operacion FROM Cambios WHERE version > ? ORDER BY version LIMIT ?",
+            (desde, limite + 1)).fetchall()
+        hay_mas = len(entradas) > limite
+        entradas = entradas[:limite]
+        versiones = {}
+        eliminados = {}
+        for version, tabla, id_fila, operacion in entradas:
+            if operacion == 'D':
+                eliminados.setdefault(tabla, []).append([version, id_fila])
+            else:
+                versiones.setdefault(tabla, {})[id_fila] = version
+
+        tablas = {}
+        for tabla, (llave, columnas) in TABLAS.items():
+            filas = []
+            ids = list(versiones.get(tabla, ()))
+            for bloque in _por_bloques(ids):
+                marcadores = ", ".join("?" for _ in bloque)
+                for fila in conn.execute(f"SELECT {llave}, {', '.join(columnas)} FROM {tabla} WHERE {llave} IN ({marcadores})",
+                                         bloque):
+                    filas.append([versiones[tabla][fila[0]]] + list(fila))
+            if filas or tabla in eliminados:
+                filas.sort(key=lambda fila: fila[0])
+                tablas[tabla] = {
+                    "columnas": ["_version", llave] + list(columnas),
+                    "filas": filas,
+                    "eliminados": eliminados.get(tabla, []),
+                }
+    finally:
+        if propia:
+            conn.rollback()
+    return {
+        "cursor": entradas[-1][0] if entradas else desde,
+        "hay_mas": hay_mas,
+        "tablas": tablas,
+    }
+
+
+def version_actual(conn, tabla, id_fila):
+    fila = conn.execute("SELECT version, operacion FROM Cambios WHERE tabla = ? AND id_fila = ?", (tabla, id_fila)).fetchone()
+    return (None, None) if fila is None else (fila[0], fila[1])
+
+
+class Aplicador:
+    """Aplica un lote de cambios de una tableta en una sola transacción (todo o nada)."""
+
+    def __init__(self, conn, id_usuario, auditar=None):
+        self.conn = conn
+        self.id_usuario = id_usuario
+        self.auditar = auditar
+
+    def aplicar(self, cambios, id_lote=None):
+        if not isinstance(cambios, list):
+            raise CambioInvalido(None, "'cambios' debe ser una lista")
+        if len(cambios) > MAX_CAMBIOS_POR_LOTE:
+            raise CambioInvalido(None, f"el lote excede {MAX_CAMBIOS_POR_LOTE} cambios")
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if id_lote:
+                # Reintento de un lote que ya se aplicó (la respuesta se perdió): misma respuesta
+                previo = self.conn.execute("SELECT resultado FROM LotesSincronizacion WHERE id_lote = ?", (id_lote,)).fetchone()
+                if previo is not None:
+                    self.conn.rollback()
+                    return dict(json.loads(previo[0]), repetido=True)
+            ids_temporales = {}
+            conflictos = []
+            aplicados = {}
+            for indice, cambio in enumerate(cambios):
+                self._aplicar(indice, cambio, ids_temporales, conflictos, aplicados)
+            if conflictos:
+                raise ConflictoSincronizacion(conflictos)
+            resultado = {"aplicados": len(cambios), "ids": ids_temporales,
+                         "cursor": self.conn.execute("SELECT IFNULL(MAX(version), 0) FROM Cambios").fetchone()[0]}
+            if self.auditar:
+                for tabla, total in aplicados.items():
+                    self.auditar(self.conn, f"Sincronización: {total} cambios", tabla)
+            if id_lote:
+                self.conn.execute("INSERT INTO LotesSincronizacion (id_lote, id_usuario, resultado) VALUES (?, ?, ?)",
+                                  (id_lote, self.id_usuario, json.dumps(resultado)))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return dict(resultado, repetido=False)
+
+    def _aplicar(self, indice, cambio, ids_temporales, conflictos, aplicados):
+        if not isinstance(cambio, dict):
+            raise CambioInvalido(indice, "cada cambio debe ser un objeto")
+        tabla = cambio.get('tabla')
+        operacion = cambio.get('operacion')
+        if tabla not in TABLAS:
+            raise CambioInvalido(indice, f"tabla no sincronizable: {tabla}")
+        llave, columnas = TABLAS[tabla]
+        datos = cambio.get('datos') or {}
+        if not isinstance(datos, dict):
+            raise CambioInvalido(indice, "'datos' debe ser un objeto")
+        compuestas = [columna for columna, valor in datos.items() if not isinstance(valor, ESCALARES)]
+        if compuestas:
+            raise CambioInvalido(indice, f"valores no escalares en: {', '.join(sorted(map(str, compuestas)))}")
+        desconocidas = set(datos) - set(columnas)
+        if desconocidas:
+            raise CambioInvalido(indice, f"columnas no permitidas: {', '.join(sorted(desconocidas))}")
+        datos = {columna: self._resolver(indice, tabla, columna, valor, ids_temporales) for columna, valor in datos.items()}
+
+        try:
+            if operacion == 'insertar':
+                if tabla == 'Citas' and datos.get('atendido_por_id_usuario') is None:
+                    datos['atendido_por_id_usuario'] = self.id_usuario
+                if not datos:
+                    raise CambioInvalido(indice, "insertar requiere 'datos'")
+                nombres = list(datos)
+                cursor = self.conn.execute(
+                    f"INSERT INTO {tabla} ({', '.join(nombres)}) VALUES ({', '.join('?' for _ in nombres)})",
+                    [datos[n] for n in nombres])
+                if cambio.get('id_cliente') is not None:
+                    ids_temporales[str(cambio['id_cliente'])] = cursor.lastrowid
+            elif operacion in ('actualizar', 'eliminar'):
+                id_fila = cambio.get('id')
+                if not isinstance(id_fila, int):
+                    raise CambioInvalido(indice, f"'{operacion}' requiere el 'id' numérico de la fila")
+                version, estado = version_actual(self.conn, tabla, id_fila)
+                if version is None or estado == 'D':
+                    conflictos.append({"indice": indice, "tabla": tabla, "id": id_fila, "motivo": "eliminada",
+                                       "version_actual": version})
+                    return
+                base = cambio.get('version_base')
+                if base is not None and version > base:
+                    conflictos.append({"indice": indice, "tabla": tabla, "id": id_fila, "motivo": "modificada",
+                                       "version_actual": version})
+                    return
+                if operacion == 'actualizar':
+                    if not datos:
+                        raise CambioInvalido(indice, "actualizar requiere 'datos'")
+                    self.conn.execute(f"UPDATE {tabla} SET {', '.join(f'{n} = ?' for n in datos)} WHERE {llave} = ?",
+                                      list(datos.values()) + [id_fila])
+                else:
+                    if tabla not in ELIMINABLES:
+                        raise CambioInvalido(indice, f"no se permite eliminar en {tabla}")
+                    if tabla == 'Lactantes':
+                        self.conn.execute("DELETE FROM Citas WHERE id_lactantes = ?", (id_fila,))
+                    self.conn.execute(f"DELETE FROM {tabla} WHERE {llave} = ?", (id_fila,))
+            else:
+                raise CambioInvalido(indice, f"operación no válida: {operacion}")
+        except sqlite3.IntegrityError as e:
+            raise CambioInvalido(indice, f"restricción violada: {e}") from e
+        aplicados[tabla] = aplicados.get(tabla, 0) + 1
+
+    @staticmethod
+    def _resolver(indice, tabla, columna, valor, ids_temporales):
+        # Un texto en una columna de referencia es el id temporal de una fila del mismo lote
+        if (tabla, columna) in REFERENCIAS and isinstance(valor, str):
+            if valor not in ids_temporales:
+                raise CambioInvalido(indice, f"{columna} apunta a '{valor}', que no se insertó antes en el lote")
+            return ids_temporales[valor]
+        return valor
@@ -0,0 +1,128 @@
+# test_archivo_historico.py
+# Pruebas del archivo de la historia fría (archivo_historico): mover las citas
+# viejas al archivo por año no cambia la historia completa (CitasHistoricas),
+# ni los resúmenes diarios comparados con ella, ni el total del reporte federal.
+#
+# Uso (desde aplicacion/):  python -m unittest test_archivo_historico   (o pytest)
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import resumen_diario
+from archivo_historico import ArchivoHistorico
+from base_pruebas import base_en_memoria, insertar_cita, insertar_lactante
+from reportes import generar_reporte
+
+FECHAS_VIEJAS = ('2019-03-04', '2019-03-04', '2019-11-30', '2020-01-15', '2020-07-08')
+
+
+class ResumenQueEditaUnaCita(resumen_diario.ResumenDiario):
+    """Edita una cita entre la copia al archivo y el borrado de la principal (otra conexión, en la práctica)."""
+
+    def __init__(self, id_cita):
+        super().__init__()
+        self.id_cita = id_cita
+
+    def actualizar(self, conn):
+        if self.id_cita is not None:
+            conn.execute("UPDATE Citas SET justificacion = 'Editada' WHERE id_citas = ?", (self.id_cita,))
+            conn.commit()
+            self.id_cita = None
+        return super().actualizar(conn)
+
+
+class PruebaArchivoHistorico(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.archivo = ArchivoHistorico(self.directorio)
+        self.conn = base_en_memoria()
+        hoy = datetime.date.today().isoformat()
+        primero = insertar_lactante(self.conn, id_area=1, genero='Femenino')
+        segundo = insertar_lactante(self.conn, id_area=2, genero='Masculino', apellido='Luna')
+        self.viejas = [insertar_cita(self.conn, (primero, segundo)[i % 2], fecha, id_motivo=1 + i % 3, subsecuente=i % 2)
+                       for i, fecha in enumerate(FECHAS_VIEJAS)]
+        self.recientes = [insertar_cita(self.conn, primero, hoy), insertar_cita(self.conn, segundo, hoy, id_motivo=2)]
+        self.conn.execute("INSERT INTO Auditoria (id_usuario, accion, tabla_afectada, fecha) "
+                          "VALUES (1, 'Alta de cita', 'Citas', '2019-03-04 10:00')")
+        self.conn.commit()
+        resumen_diario.reconstruir(self.conn)
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def historia(self):
+        """Lo que un reporte ve de la historia completa."""
+        self.archivo.adjuntar(self.conn)
+        return {
+            'citas': [tuple(fila) for fila in self.conn.execute("SELECT * FROM CitasHistoricas ORDER BY id_citas")],
+            'auditoria': [tuple(fila) for fila in self.conn.execute("SELECT * FROM AuditoriaHistorica ORDER BY id_auditoria")],
+            'resumen': self.conn.execute(f"SELECT {resumen_diario.COLUMNAS}, citas FROM ResumenCitasDia "
+                                         f"WHERE citas <> 0 ORDER BY {resumen_diario.COLUMNAS}").fetchall(),
+            'federal': generar_reporte(self.conn, 'federal'),
+        }
+
+    def en_principal(self, ids):
+        marcas = ','.join('?' * len(ids))
+        return self.conn.execute(f"SELECT COUNT(*) FROM main.Citas WHERE id_citas IN ({marcas})", ids).fetchone()[0]
+
+    def test_archivar_no_cambia_la_historia(self):
+        # Una edición que el resumen todavía no incorpora se incorpora antes de archivar
+        self.conn.execute("UPDATE Citas SET id_motivo = 3 WHERE id_citas = ?", (self.viejas[0],))
+        self.conn.commit()
+        resumen_diario.ResumenDiario().actualizar(self.conn)
+        antes = self.historia()
+        self.assertEqual(resumen_diario.verificar(self.conn, origen='CitasHistoricas'), [])
+
+        movidas = self.archivo.archivar(self.conn, limite=2, resumenes=resumen_diario.ResumenDiario())
+        self.assertEqual(movidas, {'Citas': len(self.viejas), 'Auditoria': 1})
+        self.assertEqual(self.en_principal(self.viejas), 0)
+        self.assertEqual(self.en_principal(self.recientes), len(self.recientes))
+        self.assertEqual(list(self.archivo.anios()), ['2019', '2020'])
+        self.assertTrue(os.path.exists(self.archivo.ruta('2019')))
+
+        self.assertEqual(self.historia(), antes)
+        self.assertEqual(resumen_diario.verificar(self.conn, origen='CitasHistoricas'), [])
+        # Sin las archivadas el resumen ya no coincide con la tabla principal
+        self.assertNotEqual(resumen_diario.verificar(self.conn), [])
+
+        # Archivar otra vez no mueve nada ni cambia los conteos
+        self.assertEqual(self.archivo.archivar(self.conn, resumenes=resumen_diario.ResumenDiario()),
+                         {'Citas': 0, 'Auditoria': 0})
+        self.assertEqual(self.historia(), antes)
+
+    def test_reconstruir_desde_la_historia_completa(self):
+        antes = self.historia()
+        self.archivo.archivar(self.conn, resumenes=resumen_diario.ResumenDiario())
+        self.archivo.adjuntar(self.conn)
+        resumen_diario.reconstruir(self.conn, origen='CitasHistoricas')
+        self.conn.commit()
+        self.assertEqual(self.historia(), antes)
+
+    def test_cita_editada_despues_de_copiarse_espera(self):
+        editada = self.viejas[2]
+        movidas = self.archivo.archivar_lote(self.conn, 'Citas', '2021-01-01', resumenes=ResumenQueEditaUnaCita(editada))
+        self.assertEqual(movidas, len(self.viejas) - 1)
+        # Se queda en la principal y su copia vieja se descarta
+        self.assertEqual(self.en_principal([editada]), 1)
+        self.archivo.adjuntar(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM CitasHistoricas WHERE id_citas = ?",
+                                           (editada,)).fetchone()[0], 1)
+        self.assertEqual(resumen_diario.verificar(self.conn, origen='CitasHistoricas'), [])
+
+        # El siguiente lote la mueve con la edición
+        self.assertEqual(self.archivo.archivar(self.conn, resumenes=resumen_diario.ResumenDiario())['Citas'], 1)
+        self.archivo.adjuntar(self.conn)
+        self.assertEqual(self.conn.execute("SELECT justificacion FROM CitasHistoricas WHERE id_citas = ?",
+                                           (editada,)).fetchone()[0], 'Editada')
+        self.assertEqual(resumen_diario.verificar(self.conn, origen='CitasHistoricas'), [])
+        self.assertEqual(generar_reporte(self.conn, 'federal')['resultados']['total_citas'],
+                         len(self.viejas) + len(self.recientes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+# test_importaciones.py
+# Pruebas de la importación masiva (importaciones.Importador): un CSV con filas
+# válidas e inválidas, una fila que viola una restricción al insertar (el lote se
+# repite fila por fila), madres repetidas dentro de un lote, CSV en cp1252 y el
+# reporte de errores.
+#
+# Uso (desde aplicacion/):  python -m unittest test_importaciones   (o pytest)
+
+import io
+import unittest
+
+import importaciones
+from base_pruebas import ID_ENFERMERA, base_en_memoria, insertar_lactante
+from importaciones import ArchivoInvalido, Importador
+
+ENCABEZADO_LACTANTES = ("Apellido paterno,Apellido materno,Fecha nacimiento,Género,Área,Peso,"
+                        "Nombre madre,Apellido paterno madre,Apellido materno madre\n")
+
+
+def filas_csv(texto, encoding='utf-8'):
+    return importaciones.leer_filas(io.BytesIO(texto.encode(encoding) if isinstance(texto, str) else texto), 'csv')
+
+
+class PruebaImportaciones(unittest.TestCase):
+    def setUp(self):
+        self.conn = base_en_memoria()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def importar(self, datos, texto, tamano_lote=importaciones.TAMANO_LOTE):
+        return Importador(self.conn, datos, id_usuario=ID_ENFERMERA, tamano_lote=tamano_lote).importar(filas_csv(texto))
+
+    def contar(self, tabla, condicion="1", parametros=()):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {tabla} WHERE {condicion}", parametros).fetchone()[0]
+
+    def errores(self, resumen):
+        return [error['fila'] for error in resumen['errores']]
+
+    # --- Filas válidas e inválidas ---
+
+    def test_csv_con_filas_validas_e_invalidas(self):
+        resumen = self.importar('lactantes', ENCABEZADO_LACTANTES + (
+            "Paz,Luna,2025-01-02,Femenino,UCIN,3.1,Ana,Luna,Vega\n"      # 2
+            "Paz,Luna,2025-01-02,Femenino,Inexistente,,Ana,Luna,Vega\n"  # 3: área
+            ",Luna,2025-01-02,Femenino,UCIN,,Ana,Luna,Vega\n"            # 4: falta el apellido
+            "\n"                                                         # 5: vacía, no cuenta
+            "Ríos,Mar,31/12/2024,Masculino,utin,,,,\n"                   # 6: madre 'Desconocida'
+            "Ríos,Mar,2024-13-01,Masculino,UTIN,,Rosa,Mar,Sol\n"         # 7: fecha
+            "Paz,Sol,2025-02-03,Masculino,UCIN,tres,Rosa,Mar,Sol\n"      # 8: peso
+            "Paz,Sol,2025-02-03,Masculino,UCIN,3,ANA,LUNA,VEGA\n"        # 9
+            "Luz,Sol,2025-02-03,Masculino,UCIN,3,Rosa,Mar,Sol\n"         # 10
+        ), tamano_lote=3)
+        self.assertEqual(resumen['leidas'], 8)
+        self.assertEqual(resumen['insertadas'], 4)
+        self.assertEqual(resumen['con_error'], 4)
+        self.assertEqual(resumen['omitidas'], 0)
+        self.assertEqual(self.errores(resumen), [3, 4, 7, 8])
+        self.assertEqual(resumen['lotes'], 3)
+        # Una fila inválida no reserva a su madre: la registra la siguiente fila válida
+        self.assertEqual(resumen['madres_creadas'], 2)
+        self.assertEqual(self.contar('Lactantes', "id_madres = (SELECT id_madre FROM Madres WHERE nombre = 'Rosa')"), 1)
+        self.assertEqual(self.contar('Lactantes', "id_madres = (SELECT id_madre FROM Madres WHERE nombre = 'Ana')"), 2)
+
+    def test_madres_repetidas_en_el_lote_y_en_la_base(self):
+        self.conn.execute("INSERT INTO Madres (nombre, apellido_paterno, apellido_materno, id_motivo) "
+                          "VALUES ('Rosa', 'Mar', 'Sol', 1)")
+        self.conn.commit()
+        resumen = self.importar('madres', "Nombre,Apellido paterno,Apellido materno,Motivo\n"
+                                          "Ana,Luna,Vega,1\n"
+                                          "ANA,LUNA,VEGA,1\n"
+                                          "  Ána , Luna,Vega,\n"
+                                          "rosa,mar,sol,1\n"
+                                          "Eva,Sol,,Inexistente\n")
+        self.assertEqual((resumen['insertadas'], resumen['madres_creadas']), (1, 1))
+        self.assertEqual((resumen['omitidas'], resumen['con_error']), (3, 1))
+        self.assertEqual(self.contar('Madres', "llave_nombre = 'ana|luna|vega'"), 1)
+
+    def test_madre_repetida_entre_lotes(self):
+        resumen = self.importar('lactantes', ENCABEZADO_LACTANTES + (
+            "Paz,Luna,2025-01-02,Femenino,UCIN,,Ana,Luna,Vega\n" * 5), tamano_lote=2)
+        self.assertEqual((resumen['insertadas'], resumen['madres_creadas'], resumen['lotes']), (5, 1, 3))
+        self.assertEqual(self.contar('Madres', "llave_nombre = 'ana|luna|vega'"), 1)
+
+    # --- Restricciones al insertar ---
+
+    def test_fila_que_viola_una_restriccion_se_aisla(self):
+        self.conn.execute("""CREATE TEMP TRIGGER peso_negativo BEFORE INSERT ON Lactantes WHEN NEW.peso < 0
+                             BEGIN SELECT RAISE(ABORT, 'peso negativo'); END""")
+        resumen = self.importar('lactantes', ENCABEZADO_LACTANTES + (
+            "Paz,Luna,2025-01-02,Femenino,UCIN,3,Ana,Luna,Vega\n"   # 2
+            "Paz,Mar,2025-01-02,Femenino,UCIN,-1,Rosa,Mar,Sol\n"    # 3: la restricción
+            "Paz,Sol,2025-01-02,Femenino,UCIN,3,Rosa,Mar,Sol\n"     # 4: misma madre nueva que la 3
+            "Paz,Luna,2025-01-02,Femenino,UCIN,3,Ana,Luna,Vega\n"   # 5
+        ))
+        self.assertEqual(resumen['insertadas'], 3)
+        self.assertEqual(self.errores(resumen), [3])
+        self.assertIn('peso negativo', resumen['errores'][0]['error'])
+        self.assertEqual(resumen['madres_creadas'], 2)
+        self.assertEqual(self.contar('Madres', "llave_nombre IN ('ana|luna|vega', 'rosa|mar|sol')"), 2)
+        self.assertEqual(self.contar('Lactantes', "apellido_materno = 'Sol'"), 1)
+        self.assertFalse(self.conn.in_transaction)
+
+        # El índice de madres de la importación quedó bien: otra importación la reutiliza
+        resumen = self.importar('lactantes', ENCABEZADO_LACTANTES + "Luz,Mar,2025-01-02,Femenino,UCIN,3,Rosa,Mar,Sol\n")
+        self.assertEqual((resumen['insertadas'], resumen['madres_creadas']), (1, 0))
+
+    def test_citas_de_lactantes_inexistentes(self):
+        id_lactante = insertar_lactante(self.conn)
+        self.conn.commit()
+        resumen = self.importar('citas', "id_lactante,fecha_cita,hora_cita,motivo,subsecuente\n"
+                                         f"{id_lactante},2025-03-04,10:00,1,no\n"
+                                         "999,2025-03-04,10:30,1,0\n"
+                                         f"{id_lactante},2025-03-04,25:00,1,0\n"
+                                         f"{id_lactante},2025-03-05,09:00:00,1,si\n")
+        self.assertEqual(resumen['insertadas'], 2)
+        self.assertEqual(self.errores(resumen), [3, 4])
+        self.assertIn('999', resumen['errores'][0]['error'])
+        self.assertEqual(self.contar('Citas', "atendido_por_id_usuario = ? AND subsecuente = 1", (ID_ENFERMERA,)), 1)
+
+    # --- Lectura del archivo ---
+
+    def test_csv_en_cp1252(self):
+        texto = (ENCABEZADO_LACTANTES + "Peña,Núñez,2025-01-02,Femenino,UCIN,,María,Peña,Ibáñez\n").encode('cp1252')
+        resumen = Importador(self.conn, 'lactantes').importar(filas_csv(texto))
+        self.assertEqual(resumen['insertadas'], 1)
+        self.assertEqual(self.contar('Madres', "llave_nombre = 'maria|pena|ibanez'"), 1)
+        self.assertEqual(self.contar('Lactantes', "apellido_paterno = 'Peña'"), 1)
+
+    def test_linea_ilegible_queda_como_error_de_su_fila(self):
+        texto = (ENCABEZADO_LACTANTES.encode() + b"Paz,Luna,2025-01-02,Femenino,UCIN,,,,\n"
+                 b"Paz,\x81\x8d,2025-01-02,Femenino,UCIN,,,,\n"
+                 b"\xef\xbb\xbfRios,Luna,2025-01-02,Femenino,UCIN,,,,\n")
+        resumen = Importador(self.conn, 'lactantes').importar(filas_csv(texto))
+        self.assertEqual(resumen['insertadas'], 2)
+        self.assertEqual(self.errores(resumen), [3])
+
+    def test_bom_en_el_encabezado(self):
+        filas = list(filas_csv(b"\xef\xbb\xbf" + ENCABEZADO_LACTANTES.encode() + b"Paz,,2025-01-02,Femenino,UCIN,,,,\n"))
+        self.assertEqual(filas[0][0], 2)
+        self.assertEqual(filas[0][1]['apellido_paterno'], 'Paz')
+
+    def test_encabezado_ilegible(self):
+        with self.assertRaises(ArchivoInvalido):
+            filas_csv(b"Nombre,\x81\x8d\nAna,Luna\n")
+        with self.assertRaises(ArchivoInvalido):
+            importaciones.leer_filas(io.BytesIO(b"no es un libro de Excel"), 'xlsx')
+
+    def test_reporte_de_errores(self):
+        resumen = self.importar('madres', "nombre,apellido_paterno\nAna,Luna\n,Luna\nAna,Luna\n")
+        destino = io.StringIO()
+        importaciones.escribir_errores(resumen, destino)
+        id_madre = self.conn.execute("SELECT id_madre FROM Madres WHERE nombre = 'Ana'").fetchone()[0]
+        self.assertEqual(destino.getvalue().splitlines(),
+                         ['fila,error', "3,Falta 'nombre'.", f"4,La madre ya está registrada (id {id_madre}); se omite."])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# test_madres_duplicadas.py
+# Pruebas de madres_duplicadas: la llave de la columna generada
+# Madres.llave_nombre (SQL) es la misma que llave() en Python con acentos,
+# mayúsculas y espacios; grupos() encuentra las variantes con errores de captura
+# y fusionar() mueve los lactantes, completa datos y respeta a 'Desconocida'.
+#
+# Uso (desde aplicacion/):  python -m unittest test_madres_duplicadas   (o pytest)
+
+import unittest
+
+import madres_duplicadas
+from base_pruebas import base_en_memoria, insertar_lactante
+from madres_duplicadas import DetectorDuplicados, FusionInvalida
+
+# (nombre, paterno, materno) con variantes de escritura de la misma madre
+VARIANTES = [
+    ('María', 'López', 'Núñez'),
+    ('MARIA', 'LOPEZ', 'NUÑEZ'),
+    ('  maría ', 'lópez  ', 'núñez'),
+    ('María  José', 'Güemes', None),
+    ('MARÍA JOSÉ', 'GÜEMES', ''),
+    ('Ángela', 'Ñañez', 'Íñiguez'),
+    ('Zoé', 'Úrsula', 'Éboli'),
+]
+
+
+class PruebaMadresDuplicadas(unittest.TestCase):
+    def setUp(self):
+        self.conn = base_en_memoria()
+        self.detector = DetectorDuplicados()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def insertar_madre(self, nombre, paterno, materno=None, discapacidad=None):
+        return self.conn.execute("INSERT INTO Madres (nombre, apellido_paterno, apellido_materno, discapacidad, id_motivo) "
+                                 "VALUES (?, ?, ?, ?, 1)", (nombre, paterno, materno, discapacidad)).lastrowid
+
+    def madre(self, id_madre):
+        return self.conn.execute("SELECT * FROM Madres WHERE id_madre = ?", (id_madre,)).fetchone()
+
+    def id_desconocida(self):
+        return self.conn.execute("SELECT id_madre FROM Madres WHERE nombre = ?",
+                                 (madres_duplicadas.NOMBRE_DESCONOCIDA,)).fetchone()[0]
+
+    # --- Llave normalizada ---
+
+    def test_llave_sql_igual_a_python(self):
+        for campos in VARIANTES:
+            id_madre = self.insertar_madre(*campos)
+            self.assertEqual(self.madre(id_madre)['llave_nombre'], madres_duplicadas.llave(*campos), campos)
+
+    def test_variantes_de_acentos_y_mayusculas(self):
+        self.assertEqual(madres_duplicadas.llave(*VARIANTES[0]), 'maria|lopez|nunez')
+        self.assertEqual(len({madres_duplicadas.llave(*campos) for campos in VARIANTES[:3]}), 1)
+        self.assertEqual(madres_duplicadas.llave(*VARIANTES[3]), madres_duplicadas.llave(*VARIANTES[4]))
+        self.assertEqual(madres_duplicadas.llave(*VARIANTES[3]), 'maria jose|guemes|')
+
+    def test_buscar(self):
+        primera = self.insertar_madre('María', 'López', 'Núñez')
+        self.insertar_madre('MARIA', 'LOPEZ', 'NUNEZ')
+        self.assertEqual(madres_duplicadas.buscar(self.conn, ' maria', 'López', 'nuñez'), primera)
+        self.assertIsNone(madres_duplicadas.buscar(self.conn, 'María', 'López', None))
+
+    # --- Grupos ---
+
+    def test_grupos_con_errores_de_captura(self):
+        iguales = [self.insertar_madre(*campos) for campos in VARIANTES[:3]]
+        con_error = self.insertar_madre('Maira', 'López', 'Núñez')
+        otra = self.insertar_madre('Rosa', 'Luna', 'Vega')
+        self.insertar_madre('Rosa', 'Martínez', 'Ortiz')
+
+        grupos = self.detector.grupos(self.conn)
+        self.assertEqual(len(grupos), 1)
+        ids, similitud = grupos[0]
+        self.assertEqual(ids, sorted(iguales + [con_error]))
+        self.assertGreaterEqual(similitud, self.detector.umbral)
+        self.assertLess(similitud, 1.0)
+        self.assertNotIn(otra, ids)
+
+    def test_grupos_no_incluyen_a_desconocida(self):
+        # Dos registros 'Desconocida' con la misma llave no forman grupo
+        otra = self.insertar_madre(madres_duplicadas.NOMBRE_DESCONOCIDA, 'Desconocida')
+        self.insertar_madre('Desconocido', 'Desconocida')
+        for grupo, _similitud in self.detector.grupos(self.conn):
+            self.assertNotIn(self.id_desconocida(), grupo)
+            self.assertNotIn(otra, grupo)
+
+    # --- Fusión ---
+
+    def test_fusionar_mueve_lactantes_y_borra_duplicadas(self):
+        conservar = self.insertar_madre('María', 'López')
+        duplicadas = [self.insertar_madre('MARIA', 'LOPEZ'), self.insertar_madre('Maira', 'López')]
+        lactantes = [insertar_lactante(self.conn, id_madre=id_madre) for id_madre in [conservar] + duplicadas * 2]
+
+        movidos = self.detector.fusionar(self.conn, conservar, duplicadas + [conservar])
+        self.conn.commit()
+        self.assertEqual(movidos, 4)
+        for id_lactante in lactantes:
+            self.assertEqual(self.conn.execute("SELECT id_madres FROM Lactantes WHERE id_lactantes = ?",
+                                               (id_lactante,)).fetchone()[0], conservar)
+        for id_madre in duplicadas:
+            self.assertIsNone(self.madre(id_madre))
+        self.assertEqual(self.detector.estadisticas()['madres_fusionadas'], 2)
+
+    def test_fusionar_completa_datos_faltantes(self):
+        conservar = self.insertar_madre('María', 'López', None, 'Auditiva')
+        vacia = self.insertar_madre('MARIA', 'LOPEZ', '', '')
+        completa = self.insertar_madre('Maria', 'Lopez', 'Núñez', 'Motriz')
+        self.detector.fusionar(self.conn, conservar, [vacia, completa])
+        madre = self.madre(conservar)
+        # Lo que falta se toma de la primera duplicada que lo tiene; lo que ya hay no se reemplaza
+        self.assertEqual(madre['apellido_materno'], 'Núñez')
+        self.assertEqual(madre['discapacidad'], 'Auditiva')
+        self.assertEqual(madre['llave_nombre'], 'maria|lopez|nunez')
+
+    def test_no_fusiona_a_desconocida(self):
+        madre = self.insertar_madre('María', 'López')
+        id_lactante = insertar_lactante(self.conn, id_madre=self.id_desconocida())
+        for conservar, ids in ((madre, [self.id_desconocida()]), (self.id_desconocida(), [madre])):
+            with self.assertRaises(FusionInvalida):
+                self.detector.fusionar(self.conn, conservar, ids)
+        self.assertIsNotNone(self.madre(madre))
+        self.assertEqual(self.conn.execute("SELECT id_madres FROM Lactantes WHERE id_lactantes = ?",
+                                           (id_lactante,)).fetchone()[0], self.id_desconocida())
+
+    def test_fusion_invalida(self):
+        madre = self.insertar_madre('María', 'López')
+        with self.assertRaises(FusionInvalida):
+            self.detector.fusionar(self.conn, madre, [madre])
+        with self.assertRaises(FusionInvalida):
+            self.detector.fusionar(self.conn, madre, [madre + 100])
+        self.assertIsNotNone(self.madre(madre))
+
+
+if __name__ == '__main__':
+    unittest.main()
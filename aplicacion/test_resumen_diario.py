@@ -0,0 +1,144 @@
+# test_resumen_diario.py
+# Pruebas de los resúmenes diarios de citas (resumen_diario): después de altas,
+# ediciones y bajas, ResumenDiario.actualizar() debe dejar ResumenCitasDia igual
+# a lo que cuenta verificar() sobre Citas; un lactante que cambia de área o de
+# género mueve todas sus citas, y reconstruir() puede repetirse sin duplicar.
+#
+# Uso (desde aplicacion/):  python -m unittest test_resumen_diario   (o pytest)
+
+import unittest
+
+import resumen_diario
+from base_pruebas import base_en_memoria, insertar_cita, insertar_lactante
+
+
+class PruebaResumenDiario(unittest.TestCase):
+    def setUp(self):
+        self.conn = base_en_memoria()
+        self.resumenes = resumen_diario.ResumenDiario()
+        self.lactante = insertar_lactante(self.conn, id_area=1, genero='Femenino')
+        self.otro = insertar_lactante(self.conn, id_area=2, genero='Masculino')
+        self.citas = [insertar_cita(self.conn, self.lactante, '2025-03-0%d' % dia) for dia in (1, 2, 2, 3)]
+        self.citas.append(insertar_cita(self.conn, self.otro, '2025-03-02', subsecuente=1))
+        self.conn.commit()
+        resumen_diario.reconstruir(self.conn)
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def al_dia(self):
+        """Incorpora los cambios pendientes y comprueba que el resumen coincide con Citas."""
+        self.conn.commit()
+        self.resumenes.actualizar(self.conn)
+        self.assertFalse(resumen_diario.pendiente(self.conn))
+        self.assertEqual(resumen_diario.verificar(self.conn), [])
+
+    def citas_por(self, dimension, desde='2025-01-01', hasta='2025-12-31'):
+        reporte = resumen_diario.reporte(self.conn, desde, hasta, periodo='total', por=(dimension,))
+        return {grupo[dimension]: grupo['citas'] for periodo in reporte['periodos'] for grupo in periodo['grupos']}
+
+    def filas_resumen(self):
+        return self.conn.execute(f"SELECT {resumen_diario.COLUMNAS}, citas FROM ResumenCitasDia "
+                                 f"WHERE citas <> 0 ORDER BY {resumen_diario.COLUMNAS}").fetchall()
+
+    # --- Actualización incremental ---
+
+    def test_carga_inicial(self):
+        self.assertEqual(resumen_diario.verificar(self.conn), [])
+        self.assertFalse(resumen_diario.pendiente(self.conn))
+        self.assertEqual(self.citas_por('area'), {'UCIN': 4, 'UTIN': 1})
+
+    def test_altas(self):
+        insertar_cita(self.conn, self.lactante, '2025-03-02')
+        insertar_cita(self.conn, self.otro, '2025-04-10', id_motivo=2)
+        self.conn.commit()
+        self.assertTrue(resumen_diario.pendiente(self.conn))
+        self.assertNotEqual(resumen_diario.verificar(self.conn), [])
+        self.al_dia()
+        self.assertEqual(self.citas_por('area'), {'UCIN': 5, 'UTIN': 2})
+
+    def test_ediciones(self):
+        # Cambio de día, de motivo y de primera vez a subsecuente
+        self.conn.execute("UPDATE Citas SET fecha_cita = '2025-05-20' WHERE id_citas = ?", (self.citas[0],))
+        self.conn.execute("UPDATE Citas SET id_motivo = 3 WHERE id_citas = ?", (self.citas[1],))
+        self.conn.execute("UPDATE Citas SET subsecuente = 1 WHERE id_citas = ?", (self.citas[2],))
+        self.al_dia()
+        self.assertEqual(self.citas_por('subsecuente'), {'primera_vez': 3, 'subsecuente': 2})
+        self.assertEqual(sum(self.citas_por('area', '2025-05-01', '2025-05-31').values()), 1)
+
+    def test_bajas(self):
+        self.conn.execute("DELETE FROM Citas WHERE id_citas IN (?, ?)", (self.citas[1], self.citas[4]))
+        self.al_dia()
+        self.assertEqual(self.citas_por('area'), {'UCIN': 3})
+
+    def test_alta_edicion_y_baja_de_la_misma_cita(self):
+        id_cita = insertar_cita(self.conn, self.otro, '2025-03-04')
+        self.conn.execute("UPDATE Citas SET fecha_cita = '2025-03-05' WHERE id_citas = ?", (id_cita,))
+        self.conn.execute("DELETE FROM Citas WHERE id_citas = ?", (id_cita,))
+        self.al_dia()
+        self.assertEqual(self.citas_por('area'), {'UCIN': 4, 'UTIN': 1})
+
+    def test_lactante_cambia_de_area_y_genero(self):
+        self.conn.execute("UPDATE Lactantes SET id_area = 3, genero = 'Masculino' WHERE id_lactantes = ?",
+                          (self.lactante,))
+        self.al_dia()
+        area = self.conn.execute("SELECT nombre FROM Area WHERE id_area = 3").fetchone()[0]
+        self.assertEqual(self.citas_por('area'), {area: 4, 'UTIN': 1})
+        self.assertEqual(self.citas_por('genero'), {'Masculino': 5})
+        # Sus citas dejan el grupo anterior por completo
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM ResumenCitasAporte WHERE id_area = 1").fetchone()[0], 0)
+
+    def test_lotes_pequenos_restan_y_vuelven_a_sumar(self):
+        # La misma cita cambia en varios lotes: cada uno resta su aporte anterior
+        id_cita = self.citas[0]
+        for dia in ('2025-03-10', '2025-03-11', '2025-03-12'):
+            self.conn.execute("UPDATE Citas SET fecha_cita = ? WHERE id_citas = ?", (dia, id_cita))
+            self.conn.commit()
+            entradas, recalculadas = resumen_diario.actualizar_lote(self.conn, limite=1)
+            self.assertEqual((entradas, recalculadas), (1, 1))
+            self.assertEqual(resumen_diario.verificar(self.conn), [])
+        self.assertEqual(self.conn.execute("SELECT citas FROM ResumenCitasDia WHERE dia = '2025-03-10'").fetchone()[0], 0)
+        self.assertEqual(resumen_diario.actualizar_lote(self.conn, limite=1), (0, 0))
+
+        # Varios cambios mezclados, de a dos entradas por lote
+        self.conn.execute("UPDATE Lactantes SET id_area = 2 WHERE id_lactantes = ?", (self.lactante,))
+        insertar_cita(self.conn, self.otro, '2025-03-03')
+        self.conn.execute("DELETE FROM Citas WHERE id_citas = ?", (self.citas[3],))
+        self.conn.commit()
+        while resumen_diario.actualizar_lote(self.conn, limite=2)[0]:
+            pass
+        self.assertEqual(resumen_diario.verificar(self.conn), [])
+        self.assertEqual(self.citas_por('area'), {'UTIN': 5})
+
+    # --- Reconstrucción ---
+
+    def test_reconstruir_es_idempotente(self):
+        antes = self.filas_resumen()
+        for _vez in range(2):
+            resumen_diario.reconstruir(self.conn)
+            self.conn.commit()
+            self.assertEqual(self.filas_resumen(), antes)
+            self.assertEqual(resumen_diario.verificar(self.conn), [])
+
+    def test_reconstruir_un_rango(self):
+        # Un resumen desfasado en un día se corrige sin tocar los demás
+        self.conn.execute("UPDATE ResumenCitasDia SET citas = citas + 7 WHERE dia = '2025-03-02'")
+        self.conn.execute("UPDATE ResumenCitasDia SET citas = citas + 1 WHERE dia = '2025-03-03'")
+        resumen_diario.reconstruir(self.conn, desde='2025-03-02', hasta='2025-03-02')
+        self.conn.commit()
+        self.assertEqual(resumen_diario.verificar(self.conn, '2025-03-02', '2025-03-02'), [])
+        self.assertEqual(len(resumen_diario.verificar(self.conn)), 1)
+
+    def test_reconstruir_no_duplica_cambios_ya_incluidos(self):
+        insertar_cita(self.conn, self.lactante, '2025-03-01')
+        self.conn.commit()
+        resumen_diario.reconstruir(self.conn)
+        self.conn.commit()
+        self.assertFalse(resumen_diario.pendiente(self.conn))
+        self.al_dia()
+        self.assertEqual(self.citas_por('area'), {'UCIN': 5, 'UTIN': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+# test_sincronizacion.py
+# Pruebas de la subida de cambios de las tabletas (sincronizacion.Aplicador) sobre
+# una base SQLite en memoria con todas las migraciones: conflictos, lotes
+# repetidos (id_lote) y lápidas de las citas que se mueven al archivo histórico.
+#
+# Uso (desde aplicacion/):  python -m unittest test_sincronizacion   (o pytest)
+
+import shutil
+import tempfile
+import unittest
+
+import resumen_diario
+import sincronizacion
+from archivo_historico import ArchivoHistorico
+from base_pruebas import ID_ENFERMERA, base_en_memoria
+
+
+class PruebaSincronizacion(unittest.TestCase):
+    def setUp(self):
+        self.conn = base_en_memoria()
+        self.aplicador = sincronizacion.Aplicador(self.conn, ID_ENFERMERA)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def insertar_lactante(self):
+        resultado = self.aplicador.aplicar([
+            {'tabla': 'Madres', 'operacion': 'insertar', 'id_cliente': 'm1',
+             'datos': {'nombre': 'Ana', 'apellido_paterno': 'Paz', 'id_motivo': 1}},
+            {'tabla': 'Lactantes', 'operacion': 'insertar', 'id_cliente': 'l1',
+             'datos': {'id_madres': 'm1', 'id_area': 1, 'apellido_paterno': 'Paz', 'fecha_nacimiento': '2025-01-02',
+                       'genero': 'Femenino', 'estado': 'Activo', 'peso': 3.1}},
+        ])
+        return resultado['ids']['l1']
+
+    def insertar_cita(self, id_lactante, fecha):
+        cursor = self.conn.execute(
+            "INSERT INTO Citas (id_lactantes, id_motivo, atendido_por_id_usuario, fecha_cita, hora_de_entrada) VALUES (?, 1, ?, ?, '10:00')",
+            (id_lactante, ID_ENFERMERA, fecha))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def peso(self, id_lactante):
+        return self.conn.execute("SELECT peso FROM Lactantes WHERE id_lactantes = ?", (id_lactante,)).fetchone()[0]
+
+    def contar(self, tabla):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+
+    # --- Ids temporales ---
+
+    def test_ids_temporales_del_mismo_lote(self):
+        id_lactante = self.insertar_lactante()
+        id_madre = self.conn.execute("SELECT id_madres FROM Lactantes WHERE id_lactantes = ?", (id_lactante,)).fetchone()[0]
+        nombre = self.conn.execute("SELECT nombre FROM Madres WHERE id_madre = ?", (id_madre,)).fetchone()[0]
+        self.assertEqual(nombre, 'Ana')
+
+    def test_referencia_a_id_temporal_desconocido(self):
+        with self.assertRaises(sincronizacion.CambioInvalido) as error:
+            self.aplicador.aplicar([{'tabla': 'Citas', 'operacion': 'insertar',
+                                     'datos': {'id_lactantes': 'l9', 'id_motivo': 1, 'fecha_cita': '2025-06-01'}}])
+        self.assertEqual(error.exception.indice, 0)
+
+    def test_datos_que_no_son_objeto_o_no_escalares(self):
+        madres = self.contar('Madres')
+        for datos in ([1, 2], 'Ana', {'nombre': {'texto': 'Ana'}}, {'nombre': ['Ana'], 'apellido_paterno': 'Paz'}):
+            with self.assertRaises(sincronizacion.CambioInvalido):
+                self.aplicador.aplicar([{'tabla': 'Madres', 'operacion': 'insertar', 'datos': datos}])
+        self.assertEqual(self.contar('Madres'), madres)
+        self.assertFalse(self.conn.in_transaction)
+
+    # --- Conflictos ---
+
+    def test_version_base_al_dia_se_aplica(self):
+        id_lactante = self.insertar_lactante()
+        version, _operacion = sincronizacion.version_actual(self.conn, 'Lactantes', id_lactante)
+        self.aplicador.aplicar([{'tabla': 'Lactantes', 'operacion': 'actualizar', 'id': id_lactante,
+                                 'version_base': version, 'datos': {'peso': 3.4}}])
+        self.assertEqual(self.peso(id_lactante), 3.4)
+
+    def test_fila_modificada_en_el_servidor_es_conflicto(self):
+        id_lactante = self.insertar_lactante()
+        version, _operacion = sincronizacion.version_actual(self.conn, 'Lactantes', id_lactante)
+        # Otra enfermera la edita desde la interfaz web
+        self.conn.execute("UPDATE Lactantes SET peso = 3.2 WHERE id_lactantes = ?", (id_lactante,))
+        self.conn.commit()
+
+        with self.assertRaises(sincronizacion.ConflictoSincronizacion) as error:
+            self.aplicador.aplicar([{'tabla': 'Lactantes', 'operacion': 'actualizar', 'id': id_lactante,
+                                     'version_base': version, 'datos': {'peso': 3.9}}])
+        conflicto, = error.exception.conflictos
+        self.assertEqual((conflicto['tabla'], conflicto['id'], conflicto['motivo']), ('Lactantes', id_lactante, 'modificada'))
+        self.assertGreater(conflicto['version_actual'], version)
+        self.assertEqual(self.peso(id_lactante), 3.2)
+
+    def test_conflicto_no_aplica_el_resto_del_lote(self):
+        id_lactante = self.insertar_lactante()
+        version, _operacion = sincronizacion.version_actual(self.conn, 'Lactantes', id_lactante)
+        self.conn.execute("UPDATE Lactantes SET peso = 3.2 WHERE id_lactantes = ?", (id_lactante,))
+        self.conn.commit()
+        madres = self.contar('Madres')
+
+        lote = [
+            {'tabla': 'Madres', 'operacion': 'insertar', 'datos': {'nombre': 'Rosa', 'apellido_paterno': 'Luna', 'id_motivo': 1}},
+            {'tabla': 'Lactantes', 'operacion': 'actualizar', 'id': id_lactante, 'version_base': version, 'datos': {'peso': 3.9}},
+        ]
+        with self.assertRaises(sincronizacion.ConflictoSincronizacion):
+            self.aplicador.aplicar(lote, id_lote='tableta-1-7')
+        self.assertEqual(self.contar('Madres'), madres)
+        # El lote rechazado no queda registrado: al reintentarlo se vuelve a revisar
+        self.assertEqual(self.contar('LotesSincronizacion'), 0)
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_fila_eliminada_es_conflicto(self):
+        id_lactante = self.insertar_lactante()
+        id_cita = self.insertar_cita(id_lactante, '2025-06-01')
+        self.conn.execute("DELETE FROM Citas WHERE id_citas = ?", (id_cita,))
+        self.conn.commit()
+
+        with self.assertRaises(sincronizacion.ConflictoSincronizacion) as error:
+            self.aplicador.aplicar([{'tabla': 'Citas', 'operacion': 'actualizar', 'id': id_cita,
+                                     'datos': {'justificacion': 'Reprogramada'}}])
+        self.assertEqual(error.exception.conflictos[0]['motivo'], 'eliminada')
+
+    # --- Lotes repetidos ---
+
+    def test_lote_repetido_devuelve_la_misma_respuesta(self):
+        lote = [{'tabla': 'Madres', 'operacion': 'insertar', 'id_cliente': 'm1',
+                 'datos': {'nombre': 'Rosa', 'apellido_paterno': 'Luna', 'id_motivo': 1}}]
+        primera = self.aplicador.aplicar(lote, id_lote='tableta-1-8')
+        madres = self.contar('Madres')
+        cursor = self.conn.execute("SELECT MAX(version) FROM Cambios").fetchone()[0]
+
+        segunda = self.aplicador.aplicar(lote, id_lote='tableta-1-8')
+        self.assertFalse(primera['repetido'])
+        self.assertTrue(segunda['repetido'])
+        self.assertEqual(segunda['ids'], primera['ids'])
+        self.assertEqual(segunda['cursor'], primera['cursor'])
+        self.assertEqual(self.contar('Madres'), madres)
+        self.assertEqual(self.conn.execute("SELECT MAX(version) FROM Cambios").fetchone()[0], cursor)
+
+    def test_sin_id_lote_se_aplica_de_nuevo(self):
+        lote = [{'tabla': 'Madres', 'operacion': 'insertar', 'datos': {'nombre': 'Rosa', 'apellido_paterno': 'Luna', 'id_motivo': 1}}]
+        madres = self.contar('Madres')
+        self.aplicador.aplicar(lote)
+        self.aplicador.aplicar(lote)
+        self.assertEqual(self.contar('Madres'), madres + 2)
+
+
+class PruebaCitasArchivadas(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.conn = base_en_memoria()
+        self.archivo = ArchivoHistorico(self.directorio)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def test_cita_archivada_llega_como_lapida(self):
+        aplicador = sincronizacion.Aplicador(self.conn, ID_ENFERMERA)
+        ids = aplicador.aplicar([{'tabla': 'Lactantes', 'operacion': 'insertar', 'id_cliente': 'l1',
+                                  'datos': {'id_madres': 1, 'id_area': 1, 'apellido_paterno': 'Paz',
+                                            'fecha_nacimiento': '2019-01-02', 'genero': 'Femenino', 'estado': 'Activo'}},
+                                 {'tabla': 'Citas', 'operacion': 'insertar', 'id_cliente': 'vieja',
+                                  'datos': {'id_lactantes': 'l1', 'id_motivo': 1, 'fecha_cita': '2019-03-04',
+                                            'hora_de_entrada': '10:00'}},
+                                 {'tabla': 'Citas', 'operacion': 'insertar', 'id_cliente': 'reciente',
+                                  'datos': {'id_lactantes': 'l1', 'id_motivo': 1, 'fecha_cita': '2099-03-04',
+                                            'hora_de_entrada': '10:00'}}])['ids']
+        cursor = sincronizacion.cambios_desde(self.conn, 0, sincronizacion.LIMITE_MAXIMO)['cursor']
+
+        movidas = self.archivo.archivar(self.conn, resumenes=resumen_diario.ResumenDiario())
+        self.assertEqual(movidas['Citas'], 1)
+
+        cambios = sincronizacion.cambios_desde(self.conn, cursor)
+        citas = cambios['tablas']['Citas']
+        self.assertEqual([id_fila for _version, id_fila in citas['eliminados']], [ids['vieja']])
+        self.assertEqual(citas['filas'], [])
+        self.assertGreater(cambios['cursor'], cursor)
+
+        # Una tableta que todavía tenía la cita no puede editarla
+        with self.assertRaises(sincronizacion.ConflictoSincronizacion) as error:
+            aplicador.aplicar([{'tabla': 'Citas', 'operacion': 'actualizar', 'id': ids['vieja'],
+                                'datos': {'justificacion': 'Reprogramada'}}])
+        self.assertEqual(error.exception.conflictos[0]['motivo'], 'eliminada')
+        # La cita sigue en la historia completa
+        self.archivo.adjuntar(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM CitasHistoricas WHERE id_citas = ?",
+                                           (ids['vieja'],)).fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+
+# trabajos.py
+# Cola de trabajos para generar reportes fuera del hilo de la solicitud. Los
+# reportes se ejecutan en un pool local de procesos; el estado de cada trabajo
+# vive en la tabla TrabajosReporte para que cualquier worker pueda consultarlo.
+
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from conexiones import abrir_conexion
+from consultas_lentas import presupuesto as presupuesto_consultas
+from replica import abrir_lectura
+import reportes
+
+
+class ColaLlena(Exception):
+    """Se alcanzó el número máximo de trabajos pendientes en este proceso."""
+
+
+def ejecutar_trabajo(ruta_bd, id_trabajo, report_type, id_usuario, presupuesto=None, ruta_lectura=None):
+    """Punto de entrada del proceso hijo: calcula el reporte y guarda el resultado en Reportes.
+
+    Con `presupuesto` (segundos) el cálculo se interrumpe si lo excede y el trabajo queda en error.
+    Con `ruta_lectura` el reporte se calcula sobre la réplica de reportes si ya existe.
+    """
+    conn = abrir_conexion(ruta_bd)
+    lectura = abrir_lectura(ruta_lectura) if ruta_lectura and os.path.exists(ruta_lectura) else conn
+    try:
+        conn.execute("UPDATE TrabajosReporte SET estado = 'ejecutando', iniciado = CURRENT_TIMESTAMP WHERE id_trabajo = ?", (id_trabajo,))
+        conn.commit()
+        try:
+            with presupuesto_consultas(lectura, presupuesto):
+                report_data = reportes.generar_reporte(lectura, report_type)
+            cursor = conn.execute(
+                "INSERT INTO Reportes (id_usuario, tipo, contenido) VALUES (?, ?, ?)",
+                (id_usuario, report_data['reporte'], json.dumps(report_data['resultados']))
+            )
+            if id_usuario:
+                conn.execute("INSERT INTO Auditoria (id_usuario, accion, tabla_afectada) VALUES (?, ?, ?)",
+                             (id_usuario, f"Generación de reporte: {report_data['reporte']}", "Reportes"))
+            conn.execute("UPDATE TrabajosReporte SET estado = 'terminado', id_reportes = ?, terminado = CURRENT_TIMESTAMP WHERE id_trabajo = ?",
+                         (cursor.lastrowid, id_trabajo))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            marcar_error(conn, id_trabajo, e)
+            raise
+    finally:
+        if lectura is not conn:
+            lectura.close()
+        conn.close()
+
+
+def marcar_error(conn, id_trabajo, error):
+    conn.execute("UPDATE TrabajosReporte SET estado = 'error', error = ?, terminado = CURRENT_TIMESTAMP WHERE id_trabajo = ?",
+                 (str(error), id_trabajo))
+    conn.commit()
+
+
+class ColaTrabajos:
+    """Pool de procesos con límite de concurrencia (`procesos`) y de profundidad de cola (`max_cola`)."""
+
+    def __init__(self, ruta_bd, procesos=2, max_cola=8, presupuesto=None, ruta_lectura=None):
+        self.ruta_bd = ruta_bd
+        self.procesos = procesos
+        self.max_cola = max_cola
+        self.presupuesto = presupuesto
+        self.ruta_lectura = ruta_lectura
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._enviados = 0
+        self._rechazados = 0
+        self._fallidos = 0
+
+    def _obtener_executor(self):
+        if self._executor is None:
+            # spawn: los procesos hijos no heredan los hilos ni las conexiones del servidor
+            contexto = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto)
+            atexit.register(self.cerrar)
+        return self._executor
+
+    def enviar(self, conn, report_type, id_usuario):
+        """Registra el trabajo como 'pendiente', lo encola y devuelve su id."""
+        with self._lock:
+            if self._pendientes >= self.max_cola:
+                self._rechazados += 1
+                raise ColaLlena(f"Hay {self._pendientes} trabajos pendientes (máximo {self.max_cola}).")
+            self._pendientes += 1
+        try:
+            cursor = conn.execute("INSERT INTO TrabajosReporte (id_usuario, tipo, estado) VALUES (?, ?, 'pendiente')",
+                                  (id_usuario, report_type))
+            conn.commit()
+            id_trabajo = cursor.lastrowid
+            futuro = self._obtener_executor().submit(ejecutar_trabajo, self.ruta_bd, id_trabajo, report_type, id_usuario,
+                                                      self.presupuesto, self.ruta_lectura)
+        except BaseException:
+            with self._lock:
+                self._pendientes -= 1
+            raise
+        futuro.add_done_callback(lambda f: self._terminado(f, id_trabajo))
+        with self._lock:
+            self._enviados += 1
+        return id_trabajo
+
+    def enviar_funcion(self, funcion, *args):
+        """Encola `funcion(*args)` (de nivel de módulo, p. ej. un PDF) con el mismo límite de cola; devuelve el futuro."""
+        with self._lock:
+            if self._pendientes >= self.max_cola:
+                self._rechazados += 1
+                raise ColaLlena(f"Hay {self._pendientes} trabajos pendientes (máximo {self.max_cola}).")
+            self._pendientes += 1
+        try:
+            futuro = self._obtener_executor().submit(funcion, *args)
+        except BaseException:
+            with self._lock:
+                self._pendientes -= 1
+            raise
+        futuro.add_done_callback(self._funcion_terminada)
+        with self._lock:
+            self._enviados += 1
+        return futuro
+
+    def _funcion_terminada(self, futuro):
+        error = futuro.exception() if not futuro.cancelled() else None
+        with self._lock:
+            self._pendientes -= 1
+            if error is not None:
+                self._fallidos += 1
+        if error is not None:
+            print(f"Error en trabajo en segundo plano: {error}")
+
+    def _terminado(self, futuro, id_trabajo):
+        with self._lock:
+            self._pendientes -= 1
+        error = futuro.exception() if not futuro.cancelled() else None
+        if error is not None:
+            with self._lock:
+                self._fallidos += 1
+            print(f"Error en trabajo de reporte {id_trabajo}: {error}")
+            # Si el proceso hijo murió antes de registrar el error, se marca desde aquí
+            conn = abrir_conexion(self.ruta_bd)
+            try:
+                estado = conn.execute("SELECT estado FROM TrabajosReporte WHERE id_trabajo = ?", (id_trabajo,)).fetchone()
+                if estado and estado['estado'] != 'error':
+                    marcar_error(conn, id_trabajo, error)
+            finally:
+                conn.close()
+
+    def cerrar(self):
+        """Cancela lo que siga en cola y espera a los procesos; se puede llamar más de una vez."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            # Sin esperar, el hook de salida de concurrent.futures encuentra los pipes ya cerrados (EBADF)
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "procesos": self.procesos,
+                "max_cola": self.max_cola,
+                "pendientes": self._pendientes,
+                "enviados": self._enviados,
+                "rechazados": self._rechazados,
+                "fallidos": self._fallidos,
+            }
+
+
+def consultar_trabajo(conn, id_trabajo):
+    return conn.execute("""
+        SELECT t.id_trabajo, t.id_usuario, t.tipo, t.estado, t.error, t.creado, t.iniciado, t.terminado,
+               t.id_reportes, r.tipo AS reporte, r.contenido
+        FROM TrabajosReporte t
+        LEFT JOIN Reportes r ON t.id_reportes = r.id_reportes
+        WHERE t.id_trabajo = ?
+    """, (id_trabajo,)).fetchone()